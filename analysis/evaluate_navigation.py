@@ -0,0 +1,117 @@
+"""Compares navigation strategies by driving many randomized simulated laps
+of a course. Run this from the root directory as
+python -m analysis.evaluate_navigation sparkfun-avc-2016.kml --runs 1000
+"""
+import argparse
+import multiprocessing
+import time
+
+from control.test import monte_carlo
+from control.test import simulator
+
+
+def make_parser():
+    """Builds and returns an argument parser."""
+    parser = argparse.ArgumentParser(
+        description='Drives randomized simulated laps of a course with each'
+        ' navigation strategy and reports percentiles of the results.'
+    )
+
+    parser.add_argument(
+        'kml_file',
+        help='The KML course file, relative to the paths directory.',
+    )
+
+    parser.add_argument(
+        '--strategies',
+        dest='strategies',
+        help='Comma separated strategies to compare, from {}.'.format(
+            ', '.join(monte_carlo.STRATEGIES)
+        ),
+        default=','.join(monte_carlo.STRATEGIES),
+    )
+
+    parser.add_argument(
+        '--runs',
+        dest='runs',
+        help='The number of laps for each strategy.',
+        default=100,
+        type=int,
+    )
+
+    parser.add_argument(
+        '--seed',
+        dest='seed',
+        help='The seed for generating the trials.',
+        default=0,
+        type=int,
+    )
+
+    parser.add_argument(
+        '--timeout',
+        dest='timeout_s',
+        help='Simulated seconds before a lap is abandoned.',
+        default=simulator.DEFAULT_TIMEOUT_S,
+        type=float,
+    )
+
+    parser.add_argument(
+        '--processes',
+        dest='processes',
+        help='The number of processes to use.',
+        default=multiprocessing.cpu_count(),
+        type=int,
+    )
+
+    return parser
+
+
+def _format(values, precision):
+    """Formats a list of percentile values."""
+    return ', '.join(
+        'n/a' if value is None else '{:.{}f}'.format(value, precision)
+        for value in values
+    )
+
+
+def main():
+    """Main function."""
+    args = make_parser().parse_args()
+    trials = monte_carlo.random_trials(args.runs, args.seed)
+
+    for strategy in args.strategies.split(','):
+        start = time.time()
+        results = monte_carlo.evaluate(
+            args.kml_file,
+            strategy,
+            trials,
+            processes=args.processes,
+            timeout_s=args.timeout_s
+        )
+        summary = monte_carlo.summarize(results)
+        print(
+            '{}: {} laps in {:.1f} s, {:.1%} finished, {:.1%} hit an'
+            ' obstacle'.format(
+                strategy,
+                summary['runs'],
+                time.time() - start,
+                summary['finished_fraction'],
+                summary['collision_fraction']
+            )
+        )
+        print('    percentiles      {}'.format(
+            ', '.join(str(value) for value in summary['percentiles'])
+        ))
+        print('    lap time s       {}'.format(
+            _format(summary['lap_time_s'], 1)
+        ))
+        print('    cross track m    {}'.format(
+            _format(summary['max_cross_track_m'], 2)
+        ))
+        print('    collisions       {}'.format(
+            _format(summary['collisions'], 1)
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,45 +1,40 @@
-"""Plots the accelerometer readings for x, y, and z."""
+"""Plots the accelerometer readings for x, y, and z. Run this from the root
+directory as python -m analysis.plot_accelerometer <log file or run log>
+[run number]. Run logs are memory mapped instead of parsed, and can be
+limited to one run.
+"""
 
 from dateutil import parser as dateparser
 from matplotlib import pyplot
 import json
+import os
 import sys
 
+from control import run_log
 
 
 def main():
     if sys.version_info.major <= 2:
         print('Please use Python 3')
         sys.exit(1)
-    if len(sys.argv) != 2:
-        print('Usage: plot_accelerometer.py <log file>')
+    if len(sys.argv) not in (2, 3):
+        print('Usage: plot_accelerometer.py <log file or run log> [run number]')
         sys.exit(1)
 
-    with open(sys.argv[1]) as file_:
-        lines = file_.readlines()
-
-    first_stamp = timestamp(lines[0])
-    acceleration_g_x = []
-    acceleration_g_y = []
-    acceleration_g_z = []
-    acceleration_times = []
-    not_moving_times = []
-    run_times = []
-    stop_times = []
-
-    for line in lines:
-        if 'acceleration_g_x' in line:
-            data = json.loads(line[line.find('{'):])
-            acceleration_g_x.append(data['acceleration_g_x'])
-            acceleration_g_y.append(data['acceleration_g_y'])
-            acceleration_g_z.append(data['acceleration_g_z'])
-            acceleration_times.append(timestamp(line) - first_stamp)
-        elif 'not moving according' in line:
-            not_moving_times.append(timestamp(line) - first_stamp)
-        elif 'Received run command' in line:
-            run_times.append(timestamp(line) - first_stamp)
-        elif 'Received stop command' in line or 'No waypoints, stopping' in line:
-            stop_times.append(timestamp(line) - first_stamp)
+    if os.path.isdir(sys.argv[1]):
+        run_index = int(sys.argv[2]) - 1 if len(sys.argv) > 2 else None
+        data = read_run_log(sys.argv[1], run_index)
+    else:
+        data = read_log(sys.argv[1])
+    (
+        acceleration_g_x,
+        acceleration_g_y,
+        acceleration_g_z,
+        acceleration_times,
+        not_moving_times,
+        run_times,
+        stop_times,
+    ) = data
 
     pyplot.scatter(acceleration_times, acceleration_g_x)
     pyplot.scatter(not_moving_times, [0.25] * len(not_moving_times), marker='x', color='blue')
@@ -76,6 +71,81 @@ def main():
 
 
 
+def read_log(file_name):
+    """Returns the x, y and z accelerations and their times, and the not
+    moving, run and stop times from a text log.
+    """
+    with open(file_name) as file_:
+        lines = file_.readlines()
+
+    first_stamp = timestamp(lines[0])
+    acceleration_g_x = []
+    acceleration_g_y = []
+    acceleration_g_z = []
+    acceleration_times = []
+    not_moving_times = []
+    run_times = []
+    stop_times = []
+
+    for line in lines:
+        if 'acceleration_g_x' in line:
+            data = json.loads(line[line.find('{'):])
+            acceleration_g_x.append(data['acceleration_g_x'])
+            acceleration_g_y.append(data['acceleration_g_y'])
+            acceleration_g_z.append(data['acceleration_g_z'])
+            acceleration_times.append(timestamp(line) - first_stamp)
+        elif 'not moving according' in line:
+            not_moving_times.append(timestamp(line) - first_stamp)
+        elif 'Received run command' in line:
+            run_times.append(timestamp(line) - first_stamp)
+        elif 'Received stop command' in line or 'No waypoints, stopping' in line:
+            stop_times.append(timestamp(line) - first_stamp)
+
+    return (
+        acceleration_g_x,
+        acceleration_g_y,
+        acceleration_g_z,
+        acceleration_times,
+        not_moving_times,
+        run_times,
+        stop_times,
+    )
+
+
+def read_run_log(directory, run_index=None):
+    """Returns the same values as read_log from a run log, optionally from
+    only one run.
+    """
+    accelerometer = run_log.load_stream(directory, run_log.ACCELEROMETER)
+    events = run_log.load_stream(directory, run_log.EVENT)
+    if run_index is not None:
+        run = run_log.load_runs(directory)[run_index]
+        accelerometer = accelerometer[run[run_log.ACCELEROMETER]]
+        in_run = events['time_s'] >= run['start_s']
+        if run['stop_s'] is not None:
+            in_run &= events['time_s'] <= run['stop_s']
+        events = events[in_run]
+
+    first_s = min(
+        accelerometer['time_s'][:1].tolist() + events['time_s'][:1].tolist()
+        or [0.0]
+    )
+
+    def event_times(event):
+        """Returns the times of one type of event."""
+        return events['time_s'][events['event'] == event] - first_s
+
+    return (
+        accelerometer['acceleration_g_x'],
+        accelerometer['acceleration_g_y'],
+        accelerometer['acceleration_g_z'],
+        accelerometer['time_s'] - first_s,
+        event_times(run_log.STUCK),
+        event_times(run_log.START),
+        event_times(run_log.STOP),
+    )
+
+
 def timestamp(line):
     """Returns the timestamp of a log line."""
     dt = dateparser.parse(line[:line.find(',')])
@@ -1,12 +1,19 @@
-"""Plots the speed readings."""
+"""Plots the speed readings. Run this from the root directory as
+python -m analysis.plot_speeds <log file or run log> [run number]. Run logs
+are memory mapped instead of parsed, and can be limited to one run.
+"""
 
 #from dateutil import parser as dateparser
 from matplotlib import pyplot
 import collections
 import datetime
 import json
+import numpy
+import os
 import sys
 
+from control import run_log
+
 
 
 def main():
@@ -14,17 +21,37 @@ def main():
     if sys.version_info.major <= 2:
         print('Please use Python 3')
         sys.exit(1)
-    if len(sys.argv) != 2:
-        print('Usage: {} <log file>'.format(sys.argv[0]))
+    if len(sys.argv) not in (2, 3):
+        print('Usage: {} <log file or run log> [run number]'.format(sys.argv[0]))
         sys.exit(1)
 
-    with open(sys.argv[1]) as file_:
+    if os.path.isdir(sys.argv[1]):
+        run_index = int(sys.argv[2]) - 1 if len(sys.argv) > 2 else None
+        data = read_run_log(sys.argv[1], run_index)
+    else:
+        data = read_log(sys.argv[1])
+    speeds, times, not_moving_times, run_times, stop_times = data
+
+    for device, speeds in speeds.items():
+        pyplot.scatter(times[device], speeds)
+        pyplot.scatter(not_moving_times, [0.25] * len(not_moving_times), marker='x', color='blue')
+        pyplot.scatter(run_times, [0.3] * len(run_times), marker='x', color='green')
+        pyplot.scatter(stop_times, [0.35] * len(stop_times), marker='x', color='red')
+        pyplot.title(device)
+        pyplot.draw()
+        pyplot.show()
+
+
+def read_log(file_name):
+    """Returns the speeds and times for each device, and the not moving, run
+    and stop times from a text log.
+    """
+    with open(file_name) as file_:
         lines = file_.readlines()
 
     first_stamp = timestamp(lines[0])
     speeds = collections.defaultdict(lambda: [])
     times = collections.defaultdict(lambda: [])
-    acceleration_times = []
     not_moving_times = []
     run_times = []
     stop_times = []
@@ -41,14 +68,44 @@ def main():
         elif 'Received stop command' in line or 'No waypoints, stopping' in line:
             stop_times.append(timestamp(line) - first_stamp)
 
-    for device, speeds in speeds.items():
-        pyplot.scatter(times[device], speeds)
-        pyplot.scatter(not_moving_times, [0.25] * len(not_moving_times), marker='x', color='blue')
-        pyplot.scatter(run_times, [0.3] * len(run_times), marker='x', color='green')
-        pyplot.scatter(stop_times, [0.35] * len(stop_times), marker='x', color='red')
-        pyplot.title(device)
-        pyplot.draw()
-        pyplot.show()
+    return speeds, times, not_moving_times, run_times, stop_times
+
+
+def read_run_log(directory, run_index=None):
+    """Returns the same values as read_log from a run log, optionally from
+    only one run.
+    """
+    gps = run_log.load_stream(directory, run_log.GPS)
+    events = run_log.load_stream(directory, run_log.EVENT)
+    if run_index is not None:
+        run = run_log.load_runs(directory)[run_index]
+        gps = gps[run[run_log.GPS]]
+        in_run = events['time_s'] >= run['start_s']
+        if run['stop_s'] is not None:
+            in_run &= events['time_s'] <= run['stop_s']
+        events = events[in_run]
+
+    first_s = min(
+        gps['time_s'][:1].tolist() + events['time_s'][:1].tolist() or [0.0]
+    )
+    speeds = {}
+    times = {}
+    for device_id in numpy.unique(gps['device_id']):
+        device = gps[gps['device_id'] == device_id]
+        speeds[device_id.decode('utf-8')] = device['speed_m_s']
+        times[device_id.decode('utf-8')] = device['time_s'] - first_s
+
+    def event_times(event):
+        """Returns the times of one type of event."""
+        return events['time_s'][events['event'] == event] - first_s
+
+    return (
+        speeds,
+        times,
+        event_times(run_log.STUCK),
+        event_times(run_log.START),
+        event_times(run_log.STOP),
+    )
 
 
 def timestamp(line):
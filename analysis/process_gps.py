@@ -1,11 +1,18 @@
-"""Formats GPS log messages into a path KMZ file that Google Earth can read."""
+"""Formats GPS log messages into a path KMZ file that Google Earth can read.
+Run this from the root directory as
+python -m analysis.process_gps <log file or run log> [output file].
+"""
 #!/bin/env python
 
 import collections
 import json
+import os
 import sys
 
-from plot_points import get_kml
+import numpy
+
+from analysis.plot_points import get_kml
+from control import run_log
 
 
 def main():
@@ -17,9 +24,12 @@ def main():
     in_file_name = sys.argv[1]
     name = in_file_name[:in_file_name.rfind('.')]
     out_file_name = sys.argv[2] if len(sys.argv) > 2 else 'out.kml'
-    with open(in_file_name) as in_stream:
-        lines = in_stream.readlines()
-    runs = process_lines(iter(lines))
+    if os.path.isdir(in_file_name):
+        runs = process_run_log(in_file_name)
+    else:
+        with open(in_file_name) as in_stream:
+            lines = in_stream.readlines()
+        runs = process_lines(iter(lines))
     with open(out_file_name, 'w') as out_stream:
         out_stream.write(get_kml(runs, name))
 
@@ -36,6 +46,32 @@ def process_lines(in_stream):
     return runs
 
 
+def process_run_log(directory):
+    """Returns the points in each run from a run log."""
+    gps = run_log.load_stream(directory, run_log.GPS)
+    runs = []
+    for run_count, run in enumerate(run_log.load_runs(directory), 1):
+        print('Starting run {}'.format(run_count))
+        readings = gps[run[run_log.GPS]]
+        # Ignore early bad estimates
+        readings = readings[readings['latitude_d'] > 1]
+        points = {}
+        for device_id in numpy.unique(readings['device_id']):
+            device = readings[readings['device_id'] == device_id]
+            points[device_id.decode('utf-8')] = list(zip(
+                device['latitude_d'].tolist(),
+                device['longitude_d'].tolist()
+            ))
+        print(
+            'Ending run {} with {} paths'.format(
+                run_count,
+                len(points)
+            )
+        )
+        runs.append(points)
+    return runs
+
+
 def process_run(in_stream, run_count):
     """Returns the points in a run."""
     points = collections.defaultdict(lambda: [])
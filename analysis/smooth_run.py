@@ -0,0 +1,104 @@
+"""Smooths the location estimates from a recorded run. Run this from the root
+directory as python -m analysis.smooth_run <log file>.
+"""
+import argparse
+import csv
+import numpy
+import sys
+import time
+
+from control import location_smoother
+
+
+def make_parser():
+    """Builds and returns an argument parser."""
+    parser = argparse.ArgumentParser(
+        description='Runs the Kalman filter and RTS smoother over a log file'
+        ' and writes the filtered and smoothed estimates as CSV.'
+    )
+
+    parser.add_argument(
+        'log',
+        help='The log file, e.g. /data/sparkfun-2016-08-22.log.',
+    )
+
+    parser.add_argument(
+        '--output',
+        dest='output',
+        help='The CSV file to write. Defaults to stdout.',
+        default=None,
+    )
+
+    parser.add_argument(
+        '--process-noise',
+        dest='process_noise',
+        help='The diagonal of the process noise, either one value for every'
+        ' state variable or four comma separated values for x, y, heading'
+        ' and speed.',
+        default='1.0',
+    )
+
+    return parser
+
+
+def main():
+    """Main function."""
+    parser = make_parser()
+    args = parser.parse_args()
+
+    diagonal = [float(value) for value in args.process_noise.split(',')]
+    if len(diagonal) == 1:
+        diagonal = diagonal * location_smoother.STATE_SIZE
+    if len(diagonal) != location_smoother.STATE_SIZE:
+        parser.error('--process-noise needs 1 or 4 values')
+
+    start = time.time()
+    run = location_smoother.read_log_file(args.log)
+    read_s = time.time() - start
+    if len(run['timestamp_s']) == 0:
+        print('No measurements in {}'.format(args.log), file=sys.stderr)
+        sys.exit(1)
+
+    start = time.time()
+    smoothed = location_smoother.smooth(run, numpy.diag(diagonal))
+    smooth_s = time.time() - start
+    print(
+        'Read {} measurements in {:.3} s, smoothed in {:.3} s'.format(
+            len(run['timestamp_s']),
+            read_s,
+            smooth_s
+        ),
+        file=sys.stderr
+    )
+
+    out_stream = sys.stdout
+    if args.output is not None:
+        out_stream = open(args.output, 'w', newline='')
+    try:
+        writer = csv.writer(out_stream)
+        writer.writerow((
+            'timestamp_s',
+            'filtered_x_m',
+            'filtered_y_m',
+            'filtered_heading_d',
+            'filtered_speed_m_s',
+            'smoothed_x_m',
+            'smoothed_y_m',
+            'smoothed_heading_d',
+            'smoothed_speed_m_s',
+        ))
+        for timestamp_s, filtered, estimates in zip(
+                smoothed['timestamp_s'],
+                smoothed['filtered']['estimates'],
+                smoothed['estimates']
+        ):
+            writer.writerow(
+                [timestamp_s] + filtered.tolist() + estimates.tolist()
+            )
+    finally:
+        if out_stream is not sys.stdout:
+            out_stream.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Sweeps the location filter noise parameters over a recorded run and reports
+the best settings. Run this from the root directory as
+python -m analysis.tune_noise <log file> --compass-noise 20,45,90 ...
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+
+from control import location_smoother
+from control import noise_tuning
+
+
+def make_parser():
+    """Builds and returns an argument parser."""
+    parser = argparse.ArgumentParser(
+        description='Sweeps every combination of the given noise parameter'
+        ' values over a log file and reports the best configurations.'
+    )
+
+    parser.add_argument(
+        'log',
+        help='The log file, e.g. /data/sparkfun-2016-08-22.log.',
+    )
+
+    for name in noise_tuning.PARAMETERS:
+        parser.add_argument(
+            '--{}'.format(name.replace('_', '-')),
+            dest=name,
+            help='Comma separated values to try. Defaults to {}.'.format(
+                noise_tuning.DEFAULTS[name]
+            ),
+            default=None,
+        )
+
+    parser.add_argument(
+        '--score',
+        dest='score',
+        help='How to score configurations: nll for the innovation negative'
+        ' log likelihood, or nis for how close the normalized innovation'
+        ' squared is to 1.',
+        choices=(
+            noise_tuning.SCORE_NEGATIVE_LOG_LIKELIHOOD,
+            noise_tuning.SCORE_NIS,
+        ),
+        default=noise_tuning.SCORE_NEGATIVE_LOG_LIKELIHOOD,
+    )
+
+    parser.add_argument(
+        '--processes',
+        dest='processes',
+        help='The number of processes to use.',
+        default=multiprocessing.cpu_count(),
+        type=int,
+    )
+
+    parser.add_argument(
+        '--chunk-size',
+        dest='chunk_size',
+        help='The number of configurations to evaluate at once.',
+        default=noise_tuning.DEFAULT_CHUNK_SIZE,
+        type=int,
+    )
+
+    parser.add_argument(
+        '--top',
+        dest='top',
+        help='The number of configurations to report.',
+        default=10,
+        type=int,
+    )
+
+    return parser
+
+
+def main():
+    """Main function."""
+    args = make_parser().parse_args()
+
+    values = {}
+    for name in noise_tuning.PARAMETERS:
+        if getattr(args, name) is not None:
+            values[name] = [
+                float(value) for value in getattr(args, name).split(',')
+            ]
+    configurations = noise_tuning.grid(**values)
+
+    run = location_smoother.read_log_file(args.log)
+    if len(run['timestamp_s']) == 0:
+        print('No measurements in {}'.format(args.log), file=sys.stderr)
+        sys.exit(1)
+
+    print(
+        'Sweeping {} configurations over {} measurements'.format(
+            len(configurations),
+            len(run['timestamp_s'])
+        )
+    )
+    start = time.time()
+    results = noise_tuning.sweep(
+        run,
+        configurations,
+        processes=args.processes,
+        chunk_size=args.chunk_size
+    )
+    print('Took {:.1f} s'.format(time.time() - start))
+
+    default_results = noise_tuning.evaluate(
+        run,
+        noise_tuning.default_configuration()
+    )
+    print(
+        'Current settings: score {:.4f}, NIS {:.3f}'.format(
+            noise_tuning.score(default_results, args.score)[0],
+            default_results['nis'][0]
+        )
+    )
+    for score, nis, parameters in noise_tuning.best(
+            configurations,
+            results,
+            args.top,
+            args.score
+    ):
+        print('Score {:.4f}, NIS {:.3f}'.format(score, nis))
+        for name in noise_tuning.PARAMETERS:
+            print('    {} = {}'.format(name, parameters[name]))
+
+
+if __name__ == '__main__':
+    main()
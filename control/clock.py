@@ -0,0 +1,53 @@
+"""Clocks for Command and the location filter. Simulations swap in a
+VirtualClock so that they don't depend on how fast the machine is.
+"""
+
+import time
+
+
+class Clock(object):
+    """Wall clock time."""
+
+    @staticmethod
+    def time():
+        """Returns the current time in seconds."""
+        return time.time()
+
+    @staticmethod
+    def sleep(seconds):
+        """Sleeps for some seconds."""
+        time.sleep(seconds)
+
+    @staticmethod
+    def wait(event, seconds):
+        """Waits until a threading.Event is set or some seconds pass. Returns
+        True if the event is set.
+        """
+        return event.wait(seconds)
+
+
+class VirtualClock(object):
+    """Clock that only advances when someone sleeps on it."""
+
+    def __init__(self, start_s=None):
+        if start_s is None:
+            start_s = 0.0
+        self._time_s = start_s
+
+    def time(self):
+        """Returns the current time in seconds."""
+        return self._time_s
+
+    def sleep(self, seconds):
+        """Advances the clock, without waiting."""
+        if seconds > 0.0:
+            self._time_s += seconds
+
+    def wait(self, event, seconds):
+        """Returns True right away if the event is set. Otherwise, advances
+        the clock and returns False.
+        """
+        if event.is_set():
+            return True
+        self.sleep(seconds)
+        return False
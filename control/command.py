@@ -2,18 +2,19 @@
 
 import datetime
 import math
-import queue
 import random
 import sys
 import threading
 import time
 import traceback
 
+from control import run_log
+from control.clock import Clock
 from control.telemetry import Telemetry
+from messaging import broker
 from messaging import config
-from messaging.message_consumer import consume_messages
+from messaging import latency
 from messaging.async_logger import AsyncLogger
-from messaging.async_producers import CommandForwardProducer
 
 
 try:
@@ -37,6 +38,8 @@ class Command(threading.Thread):  # pylint: disable=too-many-instance-attributes
     NEUTRAL_TIME_2_S = 0.25
     NEUTRAL_TIME_3_S = 1.0
     STRAIGHT_TIME_S = 8.0
+    # How often to check for commands and inverted starts when not driving
+    IDLE_PERIOD_S = 0.25
 
     def __init__(
             self,
@@ -44,8 +47,9 @@ class Command(threading.Thread):  # pylint: disable=too-many-instance-attributes
             driver,
             waypoint_generator,
             sleep_time_milliseconds=None,
+            clock=None
     ):
-        """Create the Command thread."""
+        """Create the Command thread. clock defaults to the wall clock."""
         super(Command, self).__init__()
         self.name = self.__class__.__name__
 
@@ -55,35 +59,35 @@ class Command(threading.Thread):  # pylint: disable=too-many-instance-attributes
         else:
             self._sleep_time_seconds = sleep_time_milliseconds / 1000.0
         self._driver = driver
+        if clock is None:
+            clock = Clock()
+        self._clock = clock
         self._logger = AsyncLogger()
-        self._forwarder = CommandForwardProducer()
         self._run = True
         self._run_course = False
         self._waypoint_generator = waypoint_generator
 
-        self._sleep_time = None
-        self._wake_time = None
         self._start_time = None
+        # The loop wakes up early when a command arrives, or while running
+        # the course, when a reading updates the location filter, instead of
+        # waiting out the whole period
+        self._wakeup = threading.Event()
+        self._last_wake_s = None
+        self._wake_monotonic_s = None
+        self._latency = latency.LatencyRecorder()
+        self._run_log = run_log.RunLog()
 
         self._camera = picamera.PiCamera()
 
         # If the car is on the starting line (not started yet)
         self._on_starting_line = True
 
-        self._commands = queue.Queue()
-        def callback(message):
-            self._commands.put(message)
-            # I never could figure out how to do multi consumer exchanges, and
-            # I only need it for two consumers... so, just forward the message
-            # on to the one place it needs to go
-            self._forwarder.forward(message)
-
-        consume = lambda: consume_messages(config.COMMAND_EXCHANGE, callback)
-        self._thread = threading.Thread(target=consume)
-        self._thread.name = '{}:consume_messages'.format(
-            self.__class__.__name__
+        # Other consumers, e.g. Sup800fTelemetry, subscribe to the same
+        # exchange
+        self._commands = broker.subscribe(
+            config.COMMAND_EXCHANGE,
+            event=self._wakeup
         )
-        self._thread.start()
 
     def _handle_message(self, command):
         """Handles command messages, e.g. 'start' or 'stop'."""
@@ -135,17 +139,27 @@ class Command(threading.Thread):  # pylint: disable=too-many-instance-attributes
         elif command == 'calibrate-compass':
             self.calibrate_compass(10)
 
-    def _wait(self):
-        """We just define this function separately so that it's easy to patch
-        when testing.
+    def _wait(self, period_s=None):
+        """Waits until a command arrives, a reading updates the location
+        filter while running the course, or period_s has passed since the
+        last wake up, whichever comes first. period_s defaults to the control
+        period.
         """
-        self._sleep_time = time.time()
-        if self._wake_time is not None:
-            time_awake = self._sleep_time - self._wake_time
+        if period_s is None:
+            period_s = self._sleep_time_seconds
+        if self._last_wake_s is not None:
+            timeout_s = max(
+                self._last_wake_s + period_s - self._clock.time(),
+                0.0
+            )
         else:
-            time_awake = 0.0
-        time.sleep(max(self._sleep_time_seconds - time_awake, 0.0))
-        self._wake_time = time.time()
+            timeout_s = period_s
+        deadline_monotonic_s = latency.now_s() + timeout_s
+        if not self._clock.wait(self._wakeup, timeout_s):
+            self._latency.record(latency.JITTER, deadline_monotonic_s)
+        self._wakeup.clear()
+        self._last_wake_s = self._clock.time()
+        self._wake_monotonic_s = latency.now_s()
 
     def run(self):
         """Run in a thread, controls the RC car."""
@@ -165,9 +179,9 @@ class Command(threading.Thread):  # pylint: disable=too-many-instance-attributes
 
                         def inverted_start():
                             while self._telemetry.is_inverted():
-                                time.sleep(0.25)
+                                self._clock.sleep(0.25)
                             self._logger.info('Starting in 3 seconds')
-                            time.sleep(3)
+                            self._clock.sleep(3)
                             if not self._run_course:
                                 self._handle_message('start')
                             else:
@@ -175,38 +189,34 @@ class Command(threading.Thread):  # pylint: disable=too-many-instance-attributes
 
                         threading.Thread(target=inverted_start).start()
 
-                    self._wait()
+                    self._wait(self.IDLE_PERIOD_S)
 
                 if not self._run:
                     return
+                self._wake_monotonic_s = None
 
                 # If we are on the starting line
                 if self._on_starting_line:
                     self._on_starting_line = False
-                    self._logger.info(
-                        'Driving straight for {} seconds'.format(
-                            self.STRAIGHT_TIME_S
-                        )
-                    )
-                    straight_iterator = self._straight_iterator()
+                    start_iterator = self._start_iterator()
                     while (
                             self._run
                             and self._run_course
-                            and next(straight_iterator)
+                            and next(start_iterator)
                     ):
-                        telemetry = self._telemetry.get_data()
-                        if self._waypoint_generator.reached(
-                                telemetry['x_m'],
-                                telemetry['y_m']
-                        ):
-                            self._logger.info('Reached waypoint')
-                            self._waypoint_generator.next()
-                        self._driver.drive(1.0, 0.0)
+                        self._latency.record(
+                            latency.ACTUATION,
+                            self._wake_monotonic_s
+                        )
                         self._wait()
 
                 self._logger.info('Running course iteration')
                 run_iterator = self._run_iterator()
                 while self._run and self._run_course and next(run_iterator):
+                    self._latency.record(
+                        latency.ACTUATION,
+                        self._wake_monotonic_s
+                    )
                     while not self._commands.empty():
                         self._handle_message(self._commands.get())
                     self._wait()
@@ -247,18 +257,38 @@ class Command(threading.Thread):  # pylint: disable=too-many-instance-attributes
                         # course again, then stop the pause
                         if not self._run or self._run_course:
                             break
-                        time.sleep(0.5)
+                        self._clock.sleep(0.5)
 
                     self.run_course()
                     self._logger.warning('Restarting after pause')
                     error_count = 0
 
+    def _start_iterator(self):
+        """Drives straight off of the starting line."""
+        self._logger.info(
+            'Driving straight for {} seconds'.format(
+                self.STRAIGHT_TIME_S
+            )
+        )
+        straight_iterator = self._straight_iterator()
+        while next(straight_iterator):
+            telemetry = self._telemetry.get_data()
+            if self._waypoint_generator.reached(
+                    telemetry['x_m'],
+                    telemetry['y_m']
+            ):
+                self._logger.info('Reached waypoint')
+                self._waypoint_generator.next()
+            self._driver.drive(1.0, 0.0)
+            yield True
+        yield False
+
     def _straight_iterator(self, seconds=None):
         """Runs straight for a little bit."""
         if seconds == None:
             seconds = self.STRAIGHT_TIME_S
-        start_s = time.time()
-        while time.time() - start_s < seconds:
+        start_s = self._clock.time()
+        while self._clock.time() - start_s < seconds:
             yield True
         yield False
 
@@ -269,11 +299,12 @@ class Command(threading.Thread):  # pylint: disable=too-many-instance-attributes
             if (
                     self._telemetry.is_stopped()
                     and self._start_time is not None
-                    and time.time() - self._start_time > 2.0
+                    and self._clock.time() - self._start_time > 2.0
             ):
                 self._logger.info(
                     'RC car is not moving according to speed history, reversing'
                 )
+                self._run_log.write_event(run_log.STUCK)
 
                 unstuck_iterator = self._unstuck_yourself_iterator(1.0)
 
@@ -281,12 +312,12 @@ class Command(threading.Thread):  # pylint: disable=too-many-instance-attributes
                     yield True
 
                 # Force the car to drive for a little while
-                start = time.time()
+                start = self._clock.time()
                 self._start_time = start
                 while (
                         self._run
                         and self._run_course
-                        and time.time() < start + 2.0
+                        and self._clock.time() < start + 2.0
                         and next(course_iterator)
                 ):
                     yield True
@@ -308,10 +339,9 @@ class Command(threading.Thread):  # pylint: disable=too-many-instance-attributes
             )
 
             self._logger.debug(
-                'Distance to goal {waypoint}: {distance}'.format(
-                    waypoint=[round(i, 3) for i in current_waypoint],
-                    distance=round(distance_m, 3),
-                )
+                'Distance to goal {}: {}',
+                lambda: [round(i, 3) for i in current_waypoint],
+                lambda: round(distance_m, 3)
             )
             # We let the waypoint generator tell us if a waypoint has been
             # reached so that it can do fancy algorithms, like "rabbit chase"
@@ -342,10 +372,9 @@ class Command(threading.Thread):  # pylint: disable=too-many-instance-attributes
             heading_d = telemetry['heading_d']
 
             self._logger.debug(
-                'My heading: {my_heading}, goal heading: {goal_heading}'.format(
-                    my_heading=round(heading_d, 3),
-                    goal_heading=round(degrees, 3),
-                )
+                'My heading: {}, goal heading: {}',
+                lambda: round(heading_d, 3),
+                lambda: round(degrees, 3)
             )
 
             diff_d = Telemetry.difference_d(degrees, heading_d)
@@ -414,15 +443,15 @@ class Command(threading.Thread):  # pylint: disable=too-many-instance-attributes
             self._logger.warn("Can't configure compass while running")
             return
 
-        start = time.time()
+        start = self._clock.time()
         self._driver.drive(0.5, 1.0)
         try:
             while (
                     self._run
                     and not self._run_course
-                    and time.time() < start + seconds
+                    and self._clock.time() < start + seconds
             ):
-                time.sleep(0.1)
+                self._clock.sleep(0.1)
         except:  # pylint: disable=bare-except
             pass
         self._driver.drive(0.0, 0.0)
@@ -433,12 +462,20 @@ class Command(threading.Thread):  # pylint: disable=too-many-instance-attributes
 
     def run_course(self):
         """Starts the RC car running the course."""
+        if not self._run_course:
+            self._run_log.write_event(run_log.START)
+            # Readings only need to wake the loop while driving, otherwise
+            # it would wake at the full sensor rate while idle
+            self._telemetry.add_update_event(self._wakeup)
         self._run_course = True
-        self._start_time = time.time()
+        self._start_time = self._clock.time()
 
     def stop(self):
         """Stops the RC car from running the course."""
         self._driver.drive(0.0, 0.0)
+        if self._run_course:
+            self._run_log.write_event(run_log.STOP)
+            self._telemetry.remove_update_event(self._wakeup)
         self._run_course = False
 
     def reset(self):
@@ -451,6 +488,7 @@ class Command(threading.Thread):  # pylint: disable=too-many-instance-attributes
     def kill(self):
         """Kills the thread."""
         self._run = False
+        self._wakeup.set()
 
     def is_running_course(self):
         """Returns True if we're currently navigating the course."""
@@ -462,18 +500,18 @@ class Command(threading.Thread):  # pylint: disable=too-many-instance-attributes
         # reverse, then neutral, then reverse again (which will actually drive
         # the car in reverse)
 
-        start = time.time()
-        while time.time() < start + self.NEUTRAL_TIME_1_S:
+        start = self._clock.time()
+        while self._clock.time() < start + self.NEUTRAL_TIME_1_S:
             self._driver.drive(0.0, 0.0)
             yield True
 
-        start = time.time()
-        while time.time() < start + self.REVERSE_TIME_S:
+        start = self._clock.time()
+        while self._clock.time() < start + self.REVERSE_TIME_S:
             self._driver.drive(-0.5, 0.0)
             yield True
 
-        start = time.time()
-        while time.time() < start + self.NEUTRAL_TIME_2_S:
+        start = self._clock.time()
+        while self._clock.time() < start + self.NEUTRAL_TIME_2_S:
             self._driver.drive(0.0, 0.0)
             yield True
 
@@ -497,14 +535,14 @@ class Command(threading.Thread):  # pylint: disable=too-many-instance-attributes
         else:
             turn_direction = -1.0
 
-        start = time.time()
-        while time.time() < start + seconds:
+        start = self._clock.time()
+        while self._clock.time() < start + seconds:
             self._driver.drive(-.5, turn_direction)
             yield True
 
         # Pause for a bit; jamming from reverse to drive is a bad idea
-        start = time.time()
-        while time.time() < start + self.NEUTRAL_TIME_3_S:
+        start = self._clock.time()
+        while self._clock.time() < start + self.NEUTRAL_TIME_3_S:
             self._driver.drive(0.0, 0.0)
             yield True
 
@@ -512,5 +550,5 @@ class Command(threading.Thread):  # pylint: disable=too-many-instance-attributes
 
     def _stop_recording(self):
         """Stops recording after a little while."""
-        time.sleep(5)
+        self._clock.sleep(5)
         self._camera.stop_recording()
@@ -0,0 +1,256 @@
+"""Hard and soft iron calibration for the magnetometer.
+
+Readings from a perfect magnetometer that is rotated in a level plane lie on
+a circle centered on the origin. Hard iron (magnetized parts of the car)
+shifts the center, and soft iron (anything that bends the field) stretches
+the circle into an ellipse. The calibration fits an ellipse to readings
+taken while driving in circles, then corrects each reading by subtracting
+the center and applying a symmetric 2x2 matrix that maps the ellipse back to
+a circle.
+"""
+
+import json
+import math
+import numpy
+
+# pylint: disable=no-member
+
+# These initial measurements are from a calibration observation
+DEFAULT_OFFSETS = (-11.87, -5.97)
+DEFAULT_MAGNITUDE_MEAN = 353.310
+DEFAULT_MAGNITUDE_STD_DEV = 117.918
+DEFAULT_CAPACITY = 4096
+# Fewer readings than this can't say much about the offsets or the spread
+MIN_OFFSET_SAMPLES = 10
+# Smallest usable spread of the squared magnitudes. Dividing by anything
+# smaller makes every reading look like an outlier.
+MIN_MAGNITUDE_STD_DEV = 1e-3
+
+
+class FluxSamples(object):
+    """Preallocated buffer of x and y flux readings. Once it's full, the
+    oldest readings are overwritten.
+    """
+
+    def __init__(self, capacity=None):
+        if capacity is None:
+            capacity = DEFAULT_CAPACITY
+        self._samples = numpy.zeros((capacity, 2))
+        self._count = 0
+
+    def __len__(self):
+        return min(self._count, len(self._samples))
+
+    def append(self, flux_x, flux_y):
+        """Adds a reading."""
+        index = self._count % len(self._samples)
+        self._samples[index, 0] = flux_x
+        self._samples[index, 1] = flux_y
+        self._count += 1
+
+    def clear(self):
+        """Drops all of the readings."""
+        self._count = 0
+
+    def samples(self):
+        """Returns an N by 2 array of the readings, in no particular order.
+        This is a view of the buffer, so don't hold on to it.
+        """
+        return self._samples[:len(self)]
+
+
+def fit_ellipse(samples):
+    """Fits an ellipse to an N by 2 array of readings. Returns the center and
+    a symmetric 2x2 matrix that maps readings centered on it onto a circle
+    with the same area as the ellipse. Raises ValueError if the readings
+    don't describe an ellipse, e.g. if the car didn't turn all the way
+    around.
+    """
+    if len(samples) < 5:
+        raise ValueError(
+            'Need at least 5 readings to fit an ellipse, got {}'.format(
+                len(samples)
+            )
+        )
+    # Scale the readings so that the least squares problem is well
+    # conditioned
+    mean = samples.mean(axis=0)
+    scale = max(float(numpy.abs(samples - mean).max()), 1e-9)
+    x = (samples[:, 0] - mean[0]) / scale
+    y = (samples[:, 1] - mean[1]) / scale
+
+    # a x^2 + b xy + c y^2 + d x + e y = 1
+    design = numpy.column_stack((x * x, x * y, y * y, x, y))
+    (a, b, c, d, e), _, rank, _ = numpy.linalg.lstsq(
+        design,
+        numpy.ones(len(samples)),
+        rcond=-1
+    )
+    if rank < 5:
+        raise ValueError('Readings are degenerate')
+
+    quadratic = numpy.array(((a, b * 0.5), (b * 0.5, c)))
+    eigenvalues = numpy.linalg.eigvalsh(quadratic)
+    if eigenvalues.min() <= 0.0:
+        raise ValueError('Readings do not describe an ellipse')
+    center = numpy.linalg.solve(quadratic, (-d * 0.5, -e * 0.5))
+    # Moving to the center gives u' Q u = 1 + c' Q c
+    level = 1.0 + center.dot(quadratic).dot(center)
+    if level <= 0.0:
+        raise ValueError('Readings do not describe an ellipse')
+
+    eigenvalues, eigenvectors = numpy.linalg.eigh(quadratic / level)
+    semi_axes = 1.0 / numpy.sqrt(eigenvalues)
+    radius = math.sqrt(semi_axes[0] * semi_axes[1])
+    transform = eigenvectors.dot(
+        numpy.diag(numpy.sqrt(eigenvalues) * radius)
+    ).dot(eigenvectors.T)
+    return center * scale + mean, transform
+
+
+class CompassCalibration(object):
+    """Corrects magnetometer readings and tracks the distribution of the
+    squared magnitude of the corrected readings, which is used to reject
+    readings that are disturbed by something nearby.
+    """
+
+    def __init__(
+            self,
+            offsets=None,
+            transform=None,
+            magnitude_mean=None,
+            magnitude_std_dev=None,
+            magnitude_count=None
+    ):
+        if offsets is None:
+            offsets = DEFAULT_OFFSETS
+        if transform is None:
+            transform = ((1.0, 0.0), (0.0, 1.0))
+        if magnitude_mean is None:
+            magnitude_mean = DEFAULT_MAGNITUDE_MEAN
+        if magnitude_std_dev is None:
+            magnitude_std_dev = DEFAULT_MAGNITUDE_STD_DEV
+        if magnitude_count is None:
+            magnitude_count = 1
+        self.offsets = tuple(float(value) for value in offsets)
+        self.transform = tuple(
+            tuple(float(value) for value in row) for row in transform
+        )
+        # Welford's running statistics
+        self._count = magnitude_count
+        self._mean = magnitude_mean
+        self._m2 = magnitude_std_dev ** 2 * magnitude_count
+
+    @property
+    def magnitude_mean(self):
+        """The mean squared magnitude of corrected readings."""
+        return self._mean
+
+    @property
+    def magnitude_std_dev(self):
+        """The standard deviation of the squared magnitude of corrected
+        readings.
+        """
+        return math.sqrt(self._m2 / self._count)
+
+    def correct(self, flux_x, flux_y):
+        """Returns the corrected x and y flux for a reading."""
+        x = flux_x - self.offsets[0]
+        y = flux_y - self.offsets[1]
+        (t_xx, t_xy), (t_yx, t_yy) = self.transform
+        return t_xx * x + t_xy * y, t_yx * x + t_yy * y
+
+    def update_magnitude(self, magnitude):
+        """Adds a squared magnitude to the running statistics."""
+        self._count += 1
+        delta = magnitude - self._mean
+        self._mean += delta / self._count
+        self._m2 += delta * (magnitude - self._mean)
+
+    @classmethod
+    def fit(cls, samples):
+        """Calibrates from an N by 2 array of readings. Raises ValueError if
+        they can't be fit.
+        """
+        center, transform = fit_ellipse(samples)
+        corrected = (samples - center).dot(transform.T)
+        return cls._from_corrected(center, transform, corrected)
+
+    @classmethod
+    def fit_offsets(cls, samples):
+        """Calibrates only the hard iron offsets from the middle of the
+        range of the readings. This works with fewer readings than a full
+        fit. Raises ValueError if there are too few readings.
+        """
+        if len(samples) < MIN_OFFSET_SAMPLES:
+            raise ValueError(
+                'Need at least {} readings to fit offsets, got {}'.format(
+                    MIN_OFFSET_SAMPLES,
+                    len(samples)
+                )
+            )
+        center = (samples.min(axis=0) + samples.max(axis=0)) * 0.5
+        return cls._from_corrected(center, None, samples - center)
+
+    @classmethod
+    def _from_corrected(cls, center, transform, corrected):
+        """Makes a calibration with the magnitude statistics of the
+        corrected readings. Raises ValueError if the magnitudes don't vary
+        at all, because that means the readings were degenerate.
+        """
+        magnitudes = (corrected * corrected).sum(axis=1)
+        std_dev = float(magnitudes.std())
+        if not std_dev > 0.0:
+            raise ValueError(
+                'Magnitude standard deviation is {}'.format(std_dev)
+            )
+        # A near perfect fit is fine, but later readings still need a
+        # usable spread
+        return cls(
+            center,
+            transform,
+            float(magnitudes.mean()),
+            max(std_dev, MIN_MAGNITUDE_STD_DEV),
+            len(magnitudes)
+        )
+
+    def to_dict(self):
+        """Returns the calibration as a JSON serializable dict."""
+        return {
+            'offsets': list(self.offsets),
+            'transform': [list(row) for row in self.transform],
+            'magnitude_mean': self.magnitude_mean,
+            'magnitude_std_dev': self.magnitude_std_dev,
+            'magnitude_count': self._count,
+        }
+
+    def save(self, file_name):
+        """Saves the calibration to a JSON file."""
+        with open(file_name, 'w') as file_:
+            json.dump(self.to_dict(), file_)
+
+    @classmethod
+    def load(cls, file_name):
+        """Loads a calibration that was saved with save. Raises
+        EnvironmentError if the file can't be read and ValueError if it's
+        invalid.
+        """
+        with open(file_name) as file_:
+            values = json.load(file_)
+        try:
+            calibration = cls(
+                values['offsets'],
+                values['transform'],
+                values['magnitude_mean'],
+                values['magnitude_std_dev'],
+                values['magnitude_count']
+            )
+        except (KeyError, TypeError) as exc:
+            raise ValueError('Invalid calibration: {}'.format(exc))
+        if not calibration.magnitude_std_dev > 0.0:
+            raise ValueError(
+                'Invalid calibration: magnitude standard deviation {}'.format(
+                    calibration.magnitude_std_dev
+                )
+            )
+        return calibration
@@ -0,0 +1,135 @@
+"""Prepared course boundaries for fast point containment checks.
+
+Telemetry checks every GPS fix against the course polygon and every inner
+obstacle. Instead of walking every edge of every polygon, each polygon is
+split into horizontal bands at its vertices. Every edge that spans a band is
+stored with that band, so a containment check only needs a binary search
+for the band and one vectorized crossing test over the few edges in it. The
+inner obstacles are bucketed into a grid by their bounding boxes, so only
+the obstacles near a point are tested at all.
+"""
+
+import bisect
+import collections
+import math
+import numpy
+
+# pylint: disable=no-member
+
+
+class PreparedPolygon(object):
+    """A simple polygon that has been prepared for containment checks."""
+
+    def __init__(self, points):
+        if len(points) < 3:
+            raise ValueError(
+                'A polygon needs at least 3 points, got {}'.format(len(points))
+            )
+        vertices = numpy.array(points, dtype=float)
+        self.min_x, self.min_y = vertices.min(axis=0).tolist()
+        self.max_x, self.max_y = vertices.max(axis=0).tolist()
+
+        starts = vertices
+        ends = numpy.roll(vertices, -1, axis=0)
+        # Horizontal edges never cross a horizontal ray
+        sloped = starts[:, 1] != ends[:, 1]
+        starts = starts[sloped]
+        ends = ends[sloped]
+        low_y = numpy.minimum(starts[:, 1], ends[:, 1])
+        high_y = numpy.maximum(starts[:, 1], ends[:, 1])
+        # x at a given y is start_x + (y - start_y) * x_per_y
+        x_per_y = (ends[:, 0] - starts[:, 0]) / (ends[:, 1] - starts[:, 1])
+
+        # Band i covers [band_y[i], band_y[i + 1])
+        self._band_y = sorted(set(vertices[:, 1].tolist()))
+        self._bands = []
+        for low, high in zip(self._band_y, self._band_y[1:]):
+            edges = (low_y <= low) & (high_y >= high)
+            self._bands.append((
+                starts[edges, 0],
+                starts[edges, 1],
+                x_per_y[edges],
+            ))
+
+    def contains(self, point):
+        """Returns True if the point is inside of the polygon. Points that
+        are exactly on a non-horizontal edge count as inside.
+        """
+        x, y = point
+        if not (
+                self.min_x <= x <= self.max_x
+                and self.min_y <= y < self.max_y
+        ):
+            return False
+        band = bisect.bisect_right(self._band_y, y) - 1
+        start_x, start_y, x_per_y = self._bands[band]
+        edge_x = start_x + (y - start_y) * x_per_y
+        if (edge_x == x).any():
+            return True
+        # Count the edges that cross a ray going right from the point
+        return numpy.count_nonzero(x < edge_x) % 2 == 1
+
+
+class CourseIndex(object):
+    """The course boundary and inner obstacles, prepared for checking if a
+    point is on the course.
+    """
+
+    def __init__(self, course, inner, cell_size_m=None):
+        """Prepares the course. course is the list of points of the course
+        boundary, which may be empty if there is no boundary, and inner is a
+        list of obstacle polygons. cell_size_m is the size of the grid cells
+        for looking up obstacles, and defaults to a size that gives a few
+        obstacles per cell.
+        """
+        self._course = None
+        if len(course) > 0:
+            self._course = PreparedPolygon(course)
+
+        self._obstacles = [PreparedPolygon(polygon) for polygon in inner]
+        self._cells = collections.defaultdict(lambda: [])
+        self._cell_size_m = 1.0
+        if len(self._obstacles) == 0:
+            return
+
+        if cell_size_m is None:
+            min_x = min(obstacle.min_x for obstacle in self._obstacles)
+            min_y = min(obstacle.min_y for obstacle in self._obstacles)
+            max_x = max(obstacle.max_x for obstacle in self._obstacles)
+            max_y = max(obstacle.max_y for obstacle in self._obstacles)
+            area_m_2 = max(max_x - min_x, 1.0) * max(max_y - min_y, 1.0)
+            cell_size_m = math.sqrt(area_m_2 / len(self._obstacles))
+        self._cell_size_m = cell_size_m
+
+        for obstacle in self._obstacles:
+            for cell_x in range(
+                    self._cell(obstacle.min_x),
+                    self._cell(obstacle.max_x) + 1
+            ):
+                for cell_y in range(
+                        self._cell(obstacle.min_y),
+                        self._cell(obstacle.max_y) + 1
+                ):
+                    self._cells[(cell_x, cell_y)].append(obstacle)
+
+    def _cell(self, value_m):
+        """Returns the grid cell index for a coordinate."""
+        return int(math.floor(value_m / self._cell_size_m))
+
+    def in_obstacle(self, point):
+        """Returns True if the point is inside any inner obstacle."""
+        cell = (self._cell(point[0]), self._cell(point[1]))
+        if cell not in self._cells:
+            return False
+        for obstacle in self._cells[cell]:
+            if obstacle.contains(point):
+                return True
+        return False
+
+    def contains(self, point):
+        """Returns True if the point is inside the course boundary and not
+        inside any of the inner obstacles.
+        """
+        if self._course is not None and not self._course.contains(point):
+            return False
+        return not self.in_obstacle(point)
@@ -1,5 +1,10 @@
 """Drives the Tamiya Grasshopper."""
 
+import os
+import time
+
+from control.run_log import RunLog
+from messaging import latency
 from messaging.async_logger import AsyncLogger
 
 THROTTLE_GPIO_PIN = 18
@@ -14,30 +19,34 @@ STEERING_DIFF = 300
 STEERING_LEFT_US = STEERING_NEUTRAL_US - STEERING_DIFF
 STEERING_RIGHT_US = STEERING_NEUTRAL_US + STEERING_DIFF
 
+PI_BLASTER_FILE_NAME = '/dev/pi-blaster'
+
 
 class Driver(object):
     """Class that implements the Driver interface."""
 
-    def __init__(self, telemetry):
+    def __init__(self, telemetry, blaster_file_name=None):
+        """blaster_file_name defaults to the pi-blaster FIFO. Any writable
+        file or FIFO can stand in for it when testing.
+        """
+        if blaster_file_name is None:
+            blaster_file_name = PI_BLASTER_FILE_NAME
         self._telemetry = telemetry
         self._logger = AsyncLogger()
         self._throttle = 0.0
         self._steering = 0.0
         self._max_throttle = 1.0
+        self._latency = latency.LatencyRecorder()
+        self._run_log = RunLog()
 
-        with open('/dev/pi-blaster', 'w') as blaster:
-            blaster.write(
-                '{pin}={throttle}\n'.format(
-                    pin=THROTTLE_GPIO_PIN,
-                    throttle=self._get_throttle(0.0)
-                )
-            )
-            blaster.write(
-                '{pin}={steering}\n'.format(
-                    pin=STEERING_GPIO_PIN,
-                    steering=self._get_steering(0.0)
-                )
-            )
+        # The control loop drives up to 50 times a second, so keep the
+        # file open and only write when the pulse widths change
+        self._blaster_file_name = blaster_file_name
+        self._blaster_fd = None
+        self._pulse_widths = None
+        self._last_write_time = None
+
+        self._write(self._get_throttle(0.0), self._get_steering(0.0))
 
     def drive(self, throttle_percentage, steering_percentage):
         """Sends a command to the RC car. Throttle should be a float between
@@ -51,19 +60,17 @@ class Driver(object):
             steering_percentage
         )
         self._logger.debug(
-           'throttle = {throttle}, turn = {turn}'.format(
-               throttle=throttle_percentage,
-               turn=steering_percentage,
-            )
+            'throttle = {}, turn = {}',
+            throttle_percentage,
+            steering_percentage
         )
         self._throttle = throttle_percentage
         self._steering = steering_percentage
 
         self._logger.debug(
-            'Throttle: {}, steering: {}'.format(
-                throttle_percentage,
-                steering_percentage
-            )
+            'Throttle: {}, steering: {}',
+            throttle_percentage,
+            steering_percentage
         )
 
         if throttle_percentage > 0.0:
@@ -72,19 +79,74 @@ class Driver(object):
             # Reverse is slower than forward, so allow 2x
             throttle = max(-2 * self._max_throttle, throttle_percentage, -1.0)
 
-        with open('/dev/pi-blaster', 'w') as blaster:
-            blaster.write(
-                '{pin}={throttle}\n'.format(
-                    pin=THROTTLE_GPIO_PIN,
-                    throttle=self._get_throttle(throttle)
-                )
-            )
-            blaster.write(
-                '{pin}={steering}\n'.format(
-                    pin=STEERING_GPIO_PIN,
-                    steering=self._get_steering(steering_percentage)
-                )
+        if self._write(
+                self._get_throttle(throttle),
+                self._get_steering(steering_percentage)
+        ):
+            self._latency.record(
+                latency.DRIVE,
+                self._telemetry.get_reading_monotonic_s()
             )
+            self._run_log.write_command(throttle, steering_percentage)
+
+    def _write(self, throttle, steering):
+        """Writes the pulse widths to pi-blaster in one write, unless they
+        are the same as the last ones written. Returns True if they were
+        written.
+        """
+        if (throttle, steering) == self._pulse_widths:
+            return False
+        line = '{throttle_pin}={throttle}\n{steering_pin}={steering}\n'
+        line = line.format(
+            throttle_pin=THROTTLE_GPIO_PIN,
+            throttle=throttle,
+            steering_pin=STEERING_GPIO_PIN,
+            steering=steering
+        ).encode()
+
+        # If pi-blaster was restarted, the old file descriptor is dead, so
+        # reopen it once
+        for attempt in range(2):
+            try:
+                if self._blaster_fd is None:
+                    self._blaster_fd = os.open(
+                        self._blaster_file_name,
+                        os.O_WRONLY | os.O_APPEND
+                    )
+                os.write(self._blaster_fd, line)
+                break
+            except OSError as exc:
+                self.close()
+                if attempt > 0:
+                    # Leave the pulse widths unknown so that the next call
+                    # tries again
+                    self._pulse_widths = None
+                    self._logger.error(
+                        'Unable to write to {}: {}'.format(
+                            self._blaster_file_name,
+                            exc
+                        )
+                    )
+                    return False
+
+        self._pulse_widths = (throttle, steering)
+        self._last_write_time = time.time()
+        return True
+
+    def close(self):
+        """Closes pi-blaster. The next drive command reopens it."""
+        if self._blaster_fd is not None:
+            try:
+                os.close(self._blaster_fd)
+            except OSError:
+                pass
+            self._blaster_fd = None
+
+    def get_last_write_time(self):
+        """Returns when the pulse widths were last written, or None if they
+        never have been.
+        """
+        return self._last_write_time
 
     def get_throttle(self):
         """Returns the current throttle."""
@@ -37,6 +37,11 @@ class ExtensionWaypointGenerator(SimpleWaypointGenerator):
         super(ExtensionWaypointGenerator, self).next()
         self._extension_waypoint = self._get_extended_waypoint()
 
+    def reset(self):
+        """Resets the waypoints."""
+        super(ExtensionWaypointGenerator, self).reset()
+        self._extension_waypoint = self._get_extended_waypoint()
+
     def reached(self, x_m, y_m):
         """Returns True if the current waypoint has been reached."""
         if super(ExtensionWaypointGenerator, self).reached(x_m, y_m):
@@ -2,72 +2,133 @@
 
 import math
 import numpy
-import time
+import threading
+
+from control.clock import Clock
 
 # pylint: disable=no-member
 
 
+class _StateHistory(object):
+    """Preallocated ring buffer of past filter states, along with the
+    measurements that produced them, so that a delayed measurement can be
+    applied at the time it was taken and the newer measurements replayed.
+    Entries are kept in time order; position 0 is the oldest.
+    """
+
+    def __init__(self, capacity):
+        self.times_s = numpy.zeros(capacity)
+        self.estimates = numpy.zeros((capacity, 4, 1))
+        self.covariances = numpy.zeros((capacity, 4, 4))
+        self.measurements = numpy.zeros((capacity, 4, 1))
+        self.noises = numpy.zeros((capacity, 4, 4))
+        self.turn_rates_d_s = numpy.zeros(capacity)
+        # None for entries that only record a state, like the initial one
+        self.observers = [None] * capacity
+        self._start = 0
+        self.count = 0
+
+    def slot(self, position):
+        """Returns the index in the arrays of a position."""
+        return (self._start + position) % len(self.times_s)
+
+    def find(self, time_s):
+        """Returns the position of the newest entry at or before time_s, or
+        -1 if all of the entries are newer.
+        """
+        position = self.count - 1
+        while position >= 0 and self.times_s[self.slot(position)] > time_s:
+            position -= 1
+        return position
+
+    def insert(self, position):
+        """Makes room for an entry at position, shifting the newer entries
+        up. If the buffer is full, the oldest entry is dropped. Returns the
+        new position.
+        """
+        if self.count == len(self.times_s):
+            self._start = self.slot(1)
+            self.count -= 1
+            position -= 1
+        for source_position in range(self.count - 1, position - 1, -1):
+            source = self.slot(source_position)
+            destination = self.slot(source_position + 1)
+            self.times_s[destination] = self.times_s[source]
+            self.estimates[destination] = self.estimates[source]
+            self.covariances[destination] = self.covariances[source]
+            self.measurements[destination] = self.measurements[source]
+            self.noises[destination] = self.noises[source]
+            self.turn_rates_d_s[destination] = self.turn_rates_d_s[source]
+            self.observers[destination] = self.observers[source]
+        self.count += 1
+        return position
+
+
 class LocationFilter(object):
-    """Kalman filter for the location of the vehicle."""
+    """Kalman filter for the location of the vehicle. Updates share
+    preallocated buffers and the state history, so the public methods hold
+    a lock. It's a plain with block instead of @synchronized, which costs
+    more than the update itself in the simulator.
+    """
     MAX_SPEED_M_S = 11.0 * 5280 / 60 / 60 / 3.2808399  # 11 MPH
 
     GPS_OBSERVER_MATRIX = numpy.eye(4)  # H
     # Sometimes the web telemetry doesn't report heading and speed, so these
     # matrices ignore them
-    GPS_NO_HEADING_OBSERVER_MATRIX = numpy.matrix([
+    GPS_NO_HEADING_OBSERVER_MATRIX = numpy.array([
         [1, 0, 0, 0],
         [0, 1, 0, 0],
         [0, 0, 0, 0],
         [0, 0, 0, 1]
-    ])
-    GPS_NO_SPEED_OBSERVER_MATRIX = numpy.matrix([
+    ], dtype=float)
+    GPS_NO_SPEED_OBSERVER_MATRIX = numpy.array([
         [1, 0, 0, 0],
         [0, 1, 0, 0],
         [0, 0, 1, 0],
         [0, 0, 0, 0]
-    ])
-    GPS_NO_HEADING_SPEED_OBSERVER_MATRIX = numpy.matrix([
+    ], dtype=float)
+    GPS_NO_HEADING_SPEED_OBSERVER_MATRIX = numpy.array([
         [1, 0, 0, 0],
         [0, 1, 0, 0],
         [0, 0, 0, 0],
         [0, 0, 0, 0]
-    ])
-    HEADING_SPEED_OBSERVER_MATRIX = numpy.matrix([
+    ], dtype=float)
+    HEADING_SPEED_OBSERVER_MATRIX = numpy.array([
         [0, 0, 0, 0],
         [0, 0, 0, 0],
         [0, 0, 1, 0],
         [0, 0, 0, 1]
-    ])
-    COMPASS_OBSERVER_MATRIX = numpy.matrix([  # H
+    ], dtype=float)
+    COMPASS_OBSERVER_MATRIX = numpy.array([  # H
         [0, 0, 0, 0],
         [0, 0, 0, 0],
         [0, 0, 1, 0],
         [0, 0, 0, 0]
-    ])
-    SPEED_ESTIMATION_OBSERVER_MATRIX = numpy.matrix([  # H
+    ], dtype=float)
+    SPEED_ESTIMATION_OBSERVER_MATRIX = numpy.array([  # H
         [0, 0, 0, 0],
         [0, 0, 0, 0],
         [0, 0, 0, 0],
         [0, 0, 0, 1]
-    ])
+    ], dtype=float)
 
 
-    GPS_MEASUREMENT_NOISE = numpy.matrix([  # R
+    GPS_MEASUREMENT_NOISE = numpy.array([  # R
         [0, 0, 0, 0],  # x_m will be filled in by the GPS accuracy
         [0, 0, 0, 0],  # y_m will be filled in by the GPS accuracy
         [0, 0, 5, 0],  # This degrees value is a guess
         [0, 0, 0, MAX_SPEED_M_S * 0.1]  # This speed value is a guess
-    ])
-    COMPASS_MEASUREMENT_NOISE = numpy.matrix([  # R
+    ], dtype=float)
+    COMPASS_MEASUREMENT_NOISE = numpy.array([  # R
         [0, 0, 0, 0],
         [0, 0, 0, 0],
         # This degrees value is a guess. It's kept artificially high because
         # I've observed a lot of local interference as I drove around before.
         [0, 0, 45, 0],
         [0, 0, 0, 0]
-    ])
+    ], dtype=float)
     # From the speed estimation, based on input throttle
-    SPEED_ESTIMATION_MEASUREMENT_NOISE = numpy.matrix([  # R
+    SPEED_ESTIMATION_MEASUREMENT_NOISE = numpy.array([  # R
         [0, 0, 0, 0],
         [0, 0, 0, 0],
         [0, 0, 0, 0],
@@ -77,45 +138,69 @@ class LocationFilter(object):
         # observations, but presumably it will take a few GPS measurements
         # before the speed updates, so maybe it will be more accurate at first?
         [0, 0, 0, 2.0]
-    ])
-    HEADING_SPEED_MEASUREMENT_NOISE = numpy.matrix([  # R
+    ], dtype=float)
+    HEADING_SPEED_MEASUREMENT_NOISE = numpy.array([  # R
         # These values are a guess, but because they are coming from GPS
         # readings that are out of bounds, they are set artificially high
         [0, 0, 0, 0],
         [0, 0, 0, 0],
         [0, 0, 20, 0],
         [0, 0, 0, MAX_SPEED_M_S * 0.5]
-    ])
+    ], dtype=float)
+
+    # Number of past states kept for delayed measurements. Compass readings
+    # come in at about 10 Hz, so this covers a few seconds.
+    HISTORY_LENGTH = 64
+    # Measurements with timestamps older than this, or in the future, are
+    # assumed to come from a clock that doesn't agree with ours and are
+    # applied as if they were taken when they arrived
+    MAX_MEASUREMENT_DELAY_S = 2.0
 
     # http://robotsforroboticists.com/kalman-filtering/ is a great reference
-    def __init__(self, x_m, y_m, heading_d=None):
+    def __init__(self, x_m, y_m, heading_d=None, clock=None):
         if heading_d is None:
             heading_d = 0.0
-        self._estimates = numpy.matrix(
+        if clock is None:
+            clock = Clock()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._estimates = numpy.array(
             # x m, y m, heading d, speed m/s
-            [x_m, y_m, heading_d, 0.0]
-        ).transpose()  # x
+            [[x_m], [y_m], [heading_d], [0.0]]
+        )  # x
 
         # This will be populated as the filter runs
         # TODO: Ideally, this should be initialized to those values, for right
         # now, identity matrix is fine
-        self._covariance_matrix = numpy.matrix([  # P
-            [1, 0, 0, 0],
-            [0, 1, 0, 0],
-            [0, 0, 1, 0],
-            [0, 0, 0, 1],
-        ])
+        self._covariance_matrix = numpy.identity(4)  # P
         # TODO: Tune this parameter for maximum performance
-        self._process_noise = numpy.matrix([  # Q
-            [1, 0, 0, 0],
-            [0, 1, 0, 0],
-            [0, 0, 1, 0],
-            [0, 0, 0, 1],
-        ])
-
-        self._last_observation_s = time.time()
+        self._process_noise = numpy.identity(4)  # Q
+
+        # The GPS and compass noise are filled in for each reading, so each
+        # filter needs its own copies instead of modifying the class values
+        self._gps_noise = self.GPS_MEASUREMENT_NOISE.copy()
+        self._compass_noise = self.COMPASS_MEASUREMENT_NOISE.copy()
+
+        # Buffers for the Kalman update, so that updates don't allocate
+        self._identity = numpy.identity(4)
+        self._transition = numpy.identity(4)  # A
+        self._measurements = numpy.zeros((4, 1))  # z
+        self._innovation = numpy.zeros((4, 1))  # z - H * x
+        self._innovation_covariance = numpy.zeros((4, 4))  # H * P * H' + R
+        self._kalman_gain = numpy.zeros((4, 4))  # K
+        self._buffer_4x4 = numpy.zeros((4, 4))
+        self._buffer_4x4_2 = numpy.zeros((4, 4))
+        self._buffer_4x1 = numpy.zeros((4, 1))
+        # Maps id(observer matrix) to (observer matrix, transpose)
+        self._observer_transposes = {}
+
+        self._last_observation_s = self._clock.time()
         self._estimated_turn_rate_d_s = 0.0
 
+        self._history = _StateHistory(self.HISTORY_LENGTH)
+        self._history.insert(0)
+        self._store(0, self._last_observation_s)
+
     def update_gps(
             self,
             x_m,
@@ -123,111 +208,219 @@ class LocationFilter(object):
             x_accuracy_m,
             y_accuracy_m,
             heading_d,
-            speed_m_s
+            speed_m_s,
+            timestamp_s=None
     ):
-        """Update the state estimation using the provided GPS measurement."""
-        self.GPS_MEASUREMENT_NOISE[0].itemset(0, x_accuracy_m)
-        self.GPS_MEASUREMENT_NOISE[1].itemset(1, y_accuracy_m)
-
-        now = time.time()
-        time_diff_s = now - self._last_observation_s
-        self._last_observation_s = now
-
-        if heading_d is None:
-            heading_d = 0.0
-            if speed_m_s is None:
-                matrix = self.GPS_NO_HEADING_SPEED_OBSERVER_MATRIX
+        """Update the state estimation using the provided GPS measurement.
+        If timestamp_s is provided, the measurement is applied at the time it
+        was taken and newer measurements are replayed on top of it.
+        """
+        with self._lock:
+            self._gps_noise[0, 0] = x_accuracy_m
+            self._gps_noise[1, 1] = y_accuracy_m
+
+            if heading_d is None:
+                heading_d = 0.0
+                if speed_m_s is None:
+                    matrix = self.GPS_NO_HEADING_SPEED_OBSERVER_MATRIX
+                    speed_m_s = 0.0
+                else:
+                    matrix = self.GPS_NO_HEADING_OBSERVER_MATRIX
+            elif speed_m_s is None:
+                matrix = self.GPS_NO_SPEED_OBSERVER_MATRIX
                 speed_m_s = 0.0
             else:
-                matrix = self.GPS_NO_HEADING_OBSERVER_MATRIX
-        elif speed_m_s is None:
-            matrix = self.GPS_NO_SPEED_OBSERVER_MATRIX
-            speed_m_s = 0.0
-        else:
-            matrix = self.GPS_OBSERVER_MATRIX
-
-        measurements = numpy.matrix(
-            [x_m, y_m, heading_d, speed_m_s]
-        ).transpose()  # z
-
-        self._update(
-            measurements,
-            matrix,
-            self.GPS_MEASUREMENT_NOISE,
-            time_diff_s
-        )
+                matrix = self.GPS_OBSERVER_MATRIX
+
+            self._observe(
+                self._set_measurements(x_m, y_m, heading_d, speed_m_s),
+                matrix,
+                self._gps_noise,
+                timestamp_s
+            )
 
     def update_heading_and_speed(self, heading_d, speed_m_s):
         """Updates the heading and speed based on GPS readings. This should be
         used for out of bounds measurements, where while the coordinates
         positions may be bad, the heading and speed are usually good.
         """
-        if heading_d is None or speed_m_s is None:
-            return
-        now = time.time()
-        time_diff_s = now - self._last_observation_s
-        self._last_observation_s = now
-
-        measurements = numpy.matrix(
-            [0, 0, heading_d, speed_m_s]
-        ).transpose()  # z
-
-        self._update(
-            measurements,
-            self.HEADING_SPEED_OBSERVER_MATRIX,
-            self.HEADING_SPEED_MEASUREMENT_NOISE,
-            time_diff_s
-        )
+        with self._lock:
+            if heading_d is None or speed_m_s is None:
+                return
+            self._observe(
+                self._set_measurements(0.0, 0.0, heading_d, speed_m_s),
+                self.HEADING_SPEED_OBSERVER_MATRIX,
+                self.HEADING_SPEED_MEASUREMENT_NOISE,
+                None
+            )
 
     def update_compass(self, compass_d, confidence):
         """Update the heading estimation."""
-        measurements = numpy.matrix(
-            [0.0, 0.0, compass_d, 0.0]
-        ).transpose()  # z
-
-        now = time.time()
-        time_diff_s = now - self._last_observation_s
-        self._last_observation_s = now
-
-        self.COMPASS_MEASUREMENT_NOISE[2].itemset(
-            2,
-            45 + 45 * (1.0 - confidence)
-        )
-        self._update(
-            measurements,
-            self.COMPASS_OBSERVER_MATRIX,
-            self.COMPASS_MEASUREMENT_NOISE,
-            time_diff_s
-        )
+        with self._lock:
+            self._compass_noise[2, 2] = 45 + 45 * (1.0 - confidence)
+            self._observe(
+                self._set_measurements(0.0, 0.0, compass_d, 0.0),
+                self.COMPASS_OBSERVER_MATRIX,
+                self._compass_noise,
+                None
+            )
 
     def update_dead_reckoning(self):
         """Update the dead reckoning position estimate."""
-        now = time.time()
-        time_diff_s = now - self._last_observation_s
-        self._last_observation_s = now
+        with self._lock:
+            now = self._clock.time()
+            time_diff_s = now - self._last_observation_s
+            self._last_observation_s = now
 
-        self._prediction_step(time_diff_s)
+            self._prediction_step(time_diff_s)
 
     def manual_throttle(self, speed_m_s):
         """Update the estimated speed based on throttle input."""
-        measurements = numpy.matrix(
-            [0.0, 0.0, 0.0, speed_m_s]
-        ).transpose()  # z
+        with self._lock:
+            self._observe(
+                self._set_measurements(0.0, 0.0, 0.0, speed_m_s),
+                self.SPEED_ESTIMATION_OBSERVER_MATRIX,
+                self.SPEED_ESTIMATION_MEASUREMENT_NOISE,
+                None
+            )
 
-        now = time.time()
-        time_diff_s = now - self._last_observation_s
-        self._last_observation_s = now
+    def manual_steering(self, turn_d_s):
+        """Update the estimated turn rate based on steering input."""
+        with self._lock:
+            self._estimated_turn_rate_d_s = turn_d_s
 
-        self._update(
+    def _observe(
+            self,
             measurements,
-            self.SPEED_ESTIMATION_OBSERVER_MATRIX,
-            self.SPEED_ESTIMATION_MEASUREMENT_NOISE,
-            time_diff_s
+            observer_matrix,
+            measurement_noise,
+            timestamp_s
+    ):
+        """Applies a measurement taken at timestamp_s, or now if that's None,
+        and predicts the state forward to now. The caller must hold the lock
+        for the whole rewind and replay.
+        """
+        now = self._clock.time()
+        if timestamp_s is None \
+                or timestamp_s > now \
+                or timestamp_s < now - self.MAX_MEASUREMENT_DELAY_S:
+            timestamp_s = now
+        history = self._history
+
+        if timestamp_s >= self._last_observation_s:
+            self._update(
+                measurements,
+                observer_matrix,
+                measurement_noise,
+                timestamp_s - self._last_observation_s
+            )
+            self._last_observation_s = timestamp_s
+            position = history.insert(history.count)
+            self._record(
+                position,
+                timestamp_s,
+                measurements,
+                observer_matrix,
+                measurement_noise
+            )
+            self._predict_to(now)
+            return
+
+        # Rewind to the newest state before the measurement. Measurements
+        # that are older than the whole history are applied to the oldest
+        # state.
+        position = history.find(timestamp_s)
+        if position < 0:
+            position = 0
+            timestamp_s = history.times_s[history.slot(0)]
+        slot = history.slot(position)
+        self._estimates[:] = history.estimates[slot]
+        self._covariance_matrix[:] = history.covariances[slot]
+        self._last_observation_s = history.times_s[slot]
+        turn_rate_d_s = self._estimated_turn_rate_d_s
+        # The measurement splits the interval before the next entry, so it
+        # uses the same turn rate
+        if position + 1 < history.count:
+            self._estimated_turn_rate_d_s = \
+                history.turn_rates_d_s[history.slot(position + 1)]
+
+        position = history.insert(position + 1)
+        self._record(
+            position,
+            timestamp_s,
+            measurements,
+            observer_matrix,
+            measurement_noise
         )
+        for replay_position in range(position, history.count):
+            slot = history.slot(replay_position)
+            self._estimated_turn_rate_d_s = history.turn_rates_d_s[slot]
+            self._update(
+                history.measurements[slot],
+                history.observers[slot],
+                history.noises[slot],
+                history.times_s[slot] - self._last_observation_s
+            )
+            self._last_observation_s = history.times_s[slot]
+            self._store(replay_position, self._last_observation_s)
 
-    def manual_steering(self, turn_d_s):
-        """Update the estimated turn rate based on steering input."""
-        self._estimated_turn_rate_d_s = turn_d_s
+        self._estimated_turn_rate_d_s = turn_rate_d_s
+        self._predict_to(now)
+
+    def _record(
+            self,
+            position,
+            time_s,
+            measurements,
+            observer_matrix,
+            measurement_noise
+    ):
+        """Saves a measurement in the history. The state is saved after the
+        measurement is applied.
+        """
+        history = self._history
+        slot = history.slot(position)
+        history.measurements[slot] = measurements
+        history.observers[slot] = observer_matrix
+        history.noises[slot] = measurement_noise
+        history.turn_rates_d_s[slot] = self._estimated_turn_rate_d_s
+        self._store(position, time_s)
+
+    def _store(self, position, time_s):
+        """Saves the current state in the history."""
+        history = self._history
+        slot = history.slot(position)
+        history.times_s[slot] = time_s
+        history.estimates[slot] = self._estimates
+        history.covariances[slot] = self._covariance_matrix
+
+    def _predict_to(self, time_s):
+        """Runs the prediction step up to time_s, if it's newer than the
+        state.
+        """
+        if time_s > self._last_observation_s:
+            self._prediction_step(time_s - self._last_observation_s)
+            self._last_observation_s = time_s
+
+    def _set_measurements(self, x_m, y_m, heading_d, speed_m_s):
+        """Fills in and returns the measurement buffer."""
+        measurements = self._measurements
+        measurements[0, 0] = x_m
+        measurements[1, 0] = y_m
+        measurements[2, 0] = heading_d
+        measurements[3, 0] = speed_m_s
+        return measurements
+
+    def _observer_transpose(self, observer_matrix):
+        """Returns the cached transpose of an observer matrix."""
+        cached = self._observer_transposes.get(id(observer_matrix))
+        if cached is None or cached[0] is not observer_matrix:
+            cached = (
+                observer_matrix,
+                numpy.ascontiguousarray(observer_matrix.transpose())
+            )
+            self._observer_transposes[id(observer_matrix)] = cached
+        return cached[1]
 
     def _update(
             self,
@@ -240,96 +433,106 @@ class LocationFilter(object):
         # Prediction step
         transition = self._prediction_step(time_diff_s)
 
+        covariance = self._covariance_matrix
+        buffer_4x4 = self._buffer_4x4
+        buffer_4x4_2 = self._buffer_4x4_2
+        observer_transpose = self._observer_transpose(observer_matrix)
+
         # Update uncertainty
         # P = A * P * A' + Q
-        self._covariance_matrix = \
-            transition * self._covariance_matrix * transition.transpose() \
-            + self._process_noise
+        numpy.dot(transition, covariance, out=buffer_4x4)
+        numpy.dot(buffer_4x4, transition.transpose(), out=covariance)
+        numpy.add(covariance, self._process_noise, out=covariance)
 
         # Compute the Kalman gain
         # K = P * H' * inv(H * P * H' + R)
-        hphtr = (
-            observer_matrix
-            * self._covariance_matrix
-            * observer_matrix.transpose()
-            + measurement_noise
-        )
-        try:
-            hphtri = hphtr.getI()
-        except numpy.linalg.linalg.LinAlgError:
-            for diagonal_index in range(len(hphtr)):
-                diagonal_value = hphtr[diagonal_index].item(diagonal_index)
-                if diagonal_value == 0.0:
-                    hphtr[diagonal_index].itemset(diagonal_index, 0.00001)
-            hphtri = hphtr.getI()
-
-        kalman_gain = \
-                self._covariance_matrix * observer_matrix.transpose() * hphtri
+        hphtr = self._innovation_covariance
+        numpy.dot(observer_matrix, covariance, out=buffer_4x4)
+        numpy.dot(buffer_4x4, observer_transpose, out=hphtr)
+        numpy.add(hphtr, measurement_noise, out=hphtr)
+        # Observers that ignore a state variable leave a zero row and column,
+        # which makes the matrix singular
+        for diagonal_index in range(4):
+            if hphtr[diagonal_index, diagonal_index] == 0.0:
+                hphtr[diagonal_index, diagonal_index] = 0.00001
+
+        # Solve K * S = P * H' instead of inverting S = H * P * H' + R
+        pht = numpy.dot(covariance, observer_transpose, out=buffer_4x4)
+        kalman_gain = self._kalman_gain
+        kalman_gain[:] = numpy.linalg.solve(
+            hphtr.transpose(),
+            pht.transpose()
+        ).transpose()
 
         # Determine innovation or residual and update our estimate
         # x = x + K * (z - H * x)
-        zhx = measurements - observer_matrix * self._estimates
-        heading_d = zhx[2].item(0)
+        zhx = self._innovation
+        numpy.dot(observer_matrix, self._estimates, out=zhx)
+        numpy.subtract(numpy.asarray(measurements), zhx, out=zhx)
+        heading_d = zhx[2, 0]
         while heading_d > 180.0:
             heading_d -= 360.0
         while heading_d <= -180.0:
             heading_d += 360.0
-        zhx[2].itemset(0, heading_d)
+        zhx[2, 0] = heading_d
 
-        self._estimates = self._estimates + kalman_gain * zhx
-        from control.telemetry import Telemetry
-        heading_d = Telemetry.wrap_degrees(self._estimates[2].item(0))
-        self._estimates[2].itemset(0, heading_d)
+        numpy.dot(kalman_gain, zhx, out=self._buffer_4x1)
+        numpy.add(self._estimates, self._buffer_4x1, out=self._estimates)
+        self._estimates[2, 0] = self._wrap_degrees(self._estimates[2, 0])
 
         # Update the covariance
         # P = (I - K * H) * P
-        self._covariance_matrix = (
-            numpy.identity(len(kalman_gain)) - kalman_gain * observer_matrix
-        ) * self._covariance_matrix
-
-        assert len(self._estimates) == 4 and len(self._estimates[0]) == 1, \
-            'Estimates should be size 4x1 but is {}x{} after update'.format(
-                len(self._estimates),
-                len(self._estimates[0])
-            )
+        numpy.dot(kalman_gain, observer_matrix, out=buffer_4x4_2)
+        numpy.subtract(self._identity, buffer_4x4_2, out=buffer_4x4_2)
+        numpy.dot(buffer_4x4_2, covariance, out=buffer_4x4)
+        covariance[:] = buffer_4x4
 
     def _prediction_step(self, time_diff_s):
         """Runs the prediction step and returns the transition matrix."""
         # x = A * x + B
-        heading_r = math.radians(self.estimated_heading())
-        from control.telemetry import Telemetry
-        x_delta, y_delta = Telemetry.rotate_radians_clockwise(
-            (0.0, time_diff_s),
-            heading_r
-        )
-        speed_m_s = self.estimated_speed()
-        transition = numpy.matrix([  # A
-            [1.0, 0.0, 0.0, x_delta],
-            [0.0, 1.0, 0.0, y_delta],
-            [0.0, 0.0, 1.0, 0.0],
-            [0.0, 0.0, 0.0, 1.0]
-        ])
+        estimates = self._estimates
+        heading_d = estimates[2, 0]
+        # This is rotating (0, time_diff_s) clockwise by the heading
+        heading_r = math.radians(heading_d)
+        x_delta = time_diff_s * math.sin(heading_r)
+        y_delta = time_diff_s * math.cos(heading_r)
+        transition = self._transition  # A
+        transition[0, 3] = x_delta
+        transition[1, 3] = y_delta
 
         # Update heading estimate based on steering
-        new_heading = Telemetry.wrap_degrees(
-            self.estimated_heading()
-            + self._estimated_turn_rate_d_s * time_diff_s
+        estimates[2, 0] = self._wrap_degrees(
+            heading_d + self._estimated_turn_rate_d_s * time_diff_s
         )
-        self._estimates.itemset(2, new_heading)
 
         # TODO: Add acceleration values
 
-        self._estimates = transition * self._estimates
+        # The transition only adds the speed times the deltas to x and y
+        speed_m_s = estimates[3, 0]
+        estimates[0, 0] += x_delta * speed_m_s
+        estimates[1, 0] += y_delta * speed_m_s
         return transition
 
+    @staticmethod
+    def _wrap_degrees(degrees):
+        """Wraps a degree value that's too high or too low. This is the same
+        as Telemetry.wrap_degrees, which can't be imported here without a
+        circular import.
+        """
+        dividend = int(degrees) // 360
+        return (degrees + (dividend + 1) * 360.0) % 360.0
+
     def estimated_location(self):
         """Returns the estimated true location in x and y meters."""
-        return (self._estimates[0].item(0), self._estimates[1].item(0))
+        with self._lock:
+            return (self._estimates.item(0), self._estimates.item(1))
 
     def estimated_heading(self):
         """Returns the estimated true heading in degrees."""
-        return self._estimates[2].item(0)
+        with self._lock:
+            return self._estimates.item(2)
 
     def estimated_speed(self):
         """Returns the estimated speed in meters per second."""
-        return self._estimates[3].item(0)
+        with self._lock:
+            return self._estimates.item(3)
@@ -0,0 +1,352 @@
+"""Offline Kalman filter and Rauch-Tung-Striebel smoother for recorded runs.
+
+LocationFilter only runs forward in real time. For post-race analysis, this
+module reads the GPS, compass and drive command messages out of a log file
+into NumPy arrays, runs the same filter forward over all of them in one call
+and then runs the RTS backward pass, so every estimate also uses the
+measurements that came after it. The result is a much smoother track that can
+be used as a reference when tuning the process noise.
+"""
+
+import datetime
+import json
+import math
+import numpy
+
+from control.location_filter import LocationFilter
+from control.telemetry import BASE_MAX_TURN_RATE_D_S
+from control.telemetry import MAX_SPEED_M_S
+from control.telemetry import PROJECTION
+
+# pylint: disable=no-member
+
+# Indices into the state vector
+X_M = 0
+Y_M = 1
+HEADING_D = 2
+SPEED_M_S = 3
+STATE_SIZE = 4
+
+
+def _log_timestamp(line):
+    """Returns the timestamp of a log line, or None if the line doesn't start
+    with one, e.g. if it's part of a multiline message.
+    """
+    # 2016-08-22 09:57:28,343:DEBUG ...
+    if len(line) < 24 or line[4] != '-' or line[19] != ',':
+        return None
+    try:
+        date_time = datetime.datetime(
+            int(line[0:4]),
+            int(line[5:7]),
+            int(line[8:10]),
+            int(line[11:13]),
+            int(line[14:16]),
+            int(line[17:19]),
+        )
+        millis = int(line[20:23])
+    except ValueError:
+        return None
+    return date_time.timestamp() + millis / 1000.0
+
+
+def _parse_drive(line):
+    """Parses the throttle and steering out of a Driver log line."""
+    # throttle = 0.5, turn = -0.25
+    throttle_part, steering_part = line[line.find('throttle = '):].split(',')
+    return (
+        float(throttle_part.split('=')[1]),
+        float(steering_part.split('=')[1])
+    )
+
+
+def _turn_rate_d_s(throttle, steering):
+    """Returns the turn rate that Telemetry tells the location filter for a
+    drive command.
+    """
+    if throttle == 0.0:
+        return 0.0
+    return steering * BASE_MAX_TURN_RATE_D_S
+
+
+def read_log(lines):
+    """Reads the GPS, compass and drive command messages from log lines.
+    Returns a dictionary of arrays with one row per measurement:
+    timestamp_s (N,), measurements (N, 4), observed (N, 4) booleans for which
+    state variables each measurement observes, noise (N, 4) with the diagonal
+    of the measurement noise and turn_rate_d_s (N,) with the turn rate from
+    the most recent drive command.
+    """
+    timestamps = []
+    measurements = []
+    observed = []
+    noise = []
+    turn_rates = []
+    turn_rate_d_s = 0.0
+    # The GPS coordinates are converted to meters all at once at the end
+    gps_rows = []
+    latitudes_d = []
+    longitudes_d = []
+
+    gps_noise = LocationFilter.GPS_MEASUREMENT_NOISE.diagonal()
+    compass_noise = LocationFilter.COMPASS_MEASUREMENT_NOISE.diagonal()
+
+    for line in lines:
+        if '"device_id"' in line:
+            if '"latitude_d"' in line:
+                kind = 'gps'
+            elif '"compass_d"' in line:
+                kind = 'compass'
+            else:
+                continue
+        elif 'throttle = ' in line:
+            kind = 'drive'
+        else:
+            continue
+
+        timestamp_s = _log_timestamp(line)
+        if timestamp_s is None:
+            continue
+
+        if kind == 'drive':
+            turn_rate_d_s = _turn_rate_d_s(*_parse_drive(line))
+            continue
+
+        message = json.loads(line[line.find('{'):line.rfind('}') + 1])
+        # Telemetry also logs its own estimates with a device ID, and those
+        # aren't measurements
+        if message.get('device_id') == 'estimate':
+            continue
+        if kind == 'gps' and 'accuracy_m' not in message:
+            continue
+        if kind == 'compass' and 'compass_d' not in message:
+            continue
+        if kind == 'gps':
+            heading_d = message.get('heading_d')
+            speed_m_s = message.get('speed_m_s')
+            # Telemetry drops these too
+            if speed_m_s is not None and speed_m_s >= MAX_SPEED_M_S:
+                continue
+            gps_rows.append(len(measurements))
+            latitudes_d.append(message['latitude_d'])
+            longitudes_d.append(message['longitude_d'])
+            measurements.append((
+                0.0,
+                0.0,
+                0.0 if heading_d is None else heading_d,
+                0.0 if speed_m_s is None else speed_m_s,
+            ))
+            observed.append((
+                True,
+                True,
+                heading_d is not None,
+                speed_m_s is not None
+            ))
+            noise.append((
+                message['accuracy_m'],
+                message['accuracy_m'],
+                gps_noise[HEADING_D],
+                gps_noise[SPEED_M_S]
+            ))
+        else:
+            measurements.append((0.0, 0.0, message['compass_d'], 0.0))
+            observed.append((False, False, True, False))
+            noise.append((
+                0.0,
+                0.0,
+                compass_noise[HEADING_D]
+                + compass_noise[HEADING_D] * (1.0 - message['confidence']),
+                0.0
+            ))
+        timestamps.append(timestamp_s)
+        turn_rates.append(turn_rate_d_s)
+
+    measurements = numpy.array(measurements, dtype=float).reshape(
+        (-1, STATE_SIZE)
+    )
+    x_m, y_m = PROJECTION.to_m(latitudes_d, longitudes_d)
+    measurements[gps_rows, X_M] = x_m
+    measurements[gps_rows, Y_M] = y_m
+
+    return {
+        'timestamp_s': numpy.array(timestamps, dtype=float),
+        'measurements': measurements,
+        'observed': numpy.array(observed, dtype=bool).reshape(
+            (-1, STATE_SIZE)
+        ),
+        'noise': numpy.array(noise, dtype=float).reshape((-1, STATE_SIZE)),
+        'turn_rate_d_s': numpy.array(turn_rates, dtype=float),
+    }
+
+
+def read_log_file(file_name):
+    """Reads the measurements from a log file. See read_log."""
+    with open(file_name) as file_:
+        return read_log(file_)
+
+
+def _wrap_difference_d(difference_d):
+    """Wraps a difference in degrees to (-180, 180]."""
+    while difference_d > 180.0:
+        difference_d -= 360.0
+    while difference_d <= -180.0:
+        difference_d += 360.0
+    return difference_d
+
+
+def _wrap_degrees(degrees):
+    """Wraps a degree value to [0, 360)."""
+    return (degrees + (int(degrees) // 360 + 1) * 360.0) % 360.0
+
+
+def filter_forward(run, process_noise=None, initial_estimates=None):
+    """Runs the location filter forward over a run from read_log. This uses
+    the same model as LocationFilter: every measurement first runs the
+    prediction step for the time since the previous measurement and then
+    updates the observed state variables.
+
+    Returns a dictionary with the filtered estimates (N, 4) and covariances
+    (N, 4, 4), the predicted estimates and covariances before each update,
+    and the transition matrices (N, 4, 4) used by each prediction.
+    """
+    if process_noise is None:
+        process_noise = numpy.identity(STATE_SIZE)
+    process_noise = numpy.asarray(process_noise, dtype=float)
+
+    timestamps = run['timestamp_s']
+    measurements = run['measurements']
+    noise = run['noise']
+    turn_rates = run['turn_rate_d_s']
+    count = len(timestamps)
+
+    if initial_estimates is None:
+        initial_estimates = numpy.zeros(STATE_SIZE)
+        gps_rows = numpy.flatnonzero(run['observed'][:, X_M])
+        if len(gps_rows) > 0:
+            initial_estimates[X_M:Y_M + 1] = measurements[gps_rows[0], X_M:Y_M + 1]
+    estimates = numpy.array(initial_estimates, dtype=float)
+    covariance = numpy.identity(STATE_SIZE)
+
+    time_diffs_s = numpy.diff(numpy.concatenate((timestamps[:1], timestamps)))
+    predicted_estimates = numpy.empty((count, STATE_SIZE))
+    predicted_covariances = numpy.empty((count, STATE_SIZE, STATE_SIZE))
+    filtered_estimates = numpy.empty((count, STATE_SIZE))
+    filtered_covariances = numpy.empty((count, STATE_SIZE, STATE_SIZE))
+    transitions = numpy.empty((count, STATE_SIZE, STATE_SIZE))
+    transitions[:] = numpy.identity(STATE_SIZE)
+
+    observed = run['observed'].tolist()
+    covariance_buffer = numpy.empty((STATE_SIZE, STATE_SIZE))
+
+    for index in range(count):
+        time_diff_s = time_diffs_s[index]
+
+        # Prediction step
+        # x = A * x + B
+        heading_d = estimates[HEADING_D]
+        heading_r = math.radians(heading_d)
+        x_delta = time_diff_s * math.sin(heading_r)
+        y_delta = time_diff_s * math.cos(heading_r)
+        transition = transitions[index]  # A
+        transition[X_M, SPEED_M_S] = x_delta
+        transition[Y_M, SPEED_M_S] = y_delta
+        estimates[HEADING_D] = _wrap_degrees(
+            heading_d + turn_rates[index] * time_diff_s
+        )
+        estimates[X_M] += x_delta * estimates[SPEED_M_S]
+        estimates[Y_M] += y_delta * estimates[SPEED_M_S]
+        # P = A * P * A' + Q
+        numpy.dot(transition, covariance, out=covariance_buffer)
+        covariance = predicted_covariances[index]
+        numpy.dot(covariance_buffer, transition.T, out=covariance)
+        covariance += process_noise
+        predicted_estimates[index] = estimates
+
+        # Update step. The measurement noise is diagonal, so updating with
+        # one observed variable at a time is the same as the usual update
+        # but doesn't need any matrix inversions.
+        covariance = filtered_covariances[index]
+        covariance[:] = predicted_covariances[index]
+        for variable in range(STATE_SIZE):
+            if not observed[index][variable]:
+                continue
+            # K = P * H' / (H * P * H' + R)
+            kalman_gain = covariance[:, variable] / (
+                covariance[variable, variable] + noise[index, variable]
+            )
+            # x = x + K * (z - H * x)
+            innovation = measurements[index, variable] - estimates[variable]
+            if variable == HEADING_D:
+                innovation = _wrap_difference_d(innovation)
+            estimates += kalman_gain * innovation
+            # P = (I - K * H) * P
+            numpy.multiply(
+                kalman_gain[:, numpy.newaxis],
+                covariance[variable],
+                out=covariance_buffer
+            )
+            covariance -= covariance_buffer
+        estimates[HEADING_D] = _wrap_degrees(estimates[HEADING_D])
+
+        filtered_estimates[index] = estimates
+
+    return {
+        'timestamp_s': timestamps,
+        'estimates': filtered_estimates,
+        'covariances': filtered_covariances,
+        'predicted_estimates': predicted_estimates,
+        'predicted_covariances': predicted_covariances,
+        'transitions': transitions,
+    }
+
+
+def smooth(run, process_noise=None, initial_estimates=None):
+    """Runs the forward filter and the Rauch-Tung-Striebel backward pass over
+    a run from read_log. Returns a dictionary with the smoothed estimates
+    (N, 4) and covariances (N, 4, 4), and the forward pass results under
+    'filtered'.
+    """
+    filtered = filter_forward(run, process_noise, initial_estimates)
+    filtered_estimates = filtered['estimates']
+    filtered_covariances = filtered['covariances']
+    predicted_estimates = filtered['predicted_estimates']
+    predicted_covariances = filtered['predicted_covariances']
+    count = len(filtered_estimates)
+
+    smoothed_estimates = filtered_estimates.copy()
+    smoothed_covariances = filtered_covariances.copy()
+    if count > 1:
+        # The smoother gains only depend on the forward pass, so compute them
+        # all at once
+        # C_k = P_k|k * A_k+1' * inv(P_k+1|k)
+        pat = numpy.einsum(
+            'nij,nkj->nik',
+            filtered_covariances[:-1],
+            filtered['transitions'][1:]
+        )
+        gains = numpy.linalg.solve(
+            predicted_covariances[1:].transpose((0, 2, 1)),
+            pat.transpose((0, 2, 1))
+        ).transpose((0, 2, 1))
+
+        for index in range(count - 2, -1, -1):
+            gain = gains[index]
+            # x_k|n = x_k|k + C_k * (x_k+1|n - x_k+1|k)
+            difference = \
+                smoothed_estimates[index + 1] - predicted_estimates[index + 1]
+            difference[HEADING_D] = _wrap_difference_d(difference[HEADING_D])
+            estimates = smoothed_estimates[index]
+            estimates += gain.dot(difference)
+            estimates[HEADING_D] = _wrap_degrees(estimates[HEADING_D])
+            # P_k|n = P_k|k + C_k * (P_k+1|n - P_k+1|k) * C_k'
+            smoothed_covariances[index] += gain.dot(
+                smoothed_covariances[index + 1]
+                - predicted_covariances[index + 1]
+            ).dot(gain.T)
+
+    return {
+        'timestamp_s': filtered['timestamp_s'],
+        'estimates': smoothed_estimates,
+        'covariances': smoothed_covariances,
+        'filtered': filtered,
+    }
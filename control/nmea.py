@@ -0,0 +1,276 @@
+"""Parses NMEA sentences from the GPS module."""
+
+import datetime
+import functools
+
+from control.sup800f import checksum
+
+KNOTS_TO_M_S = 0.514444444
+KM_H_TO_M_S = 1000.0 / 3600.0
+SECONDS_PER_DAY = 24 * 60 * 60
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+class RmcMessage(object):
+    """RMC: Recommended minimum specific GNSS data."""
+    __slots__ = (
+        'timestamp_s',
+        'latitude_d',
+        'longitude_d',
+        'speed_m_s',
+        'course_d',
+    )
+
+    def __init__(self, timestamp_s, latitude_d, longitude_d, speed_m_s, course_d):
+        self.timestamp_s = timestamp_s
+        self.latitude_d = latitude_d
+        self.longitude_d = longitude_d
+        self.speed_m_s = speed_m_s
+        self.course_d = course_d
+
+
+class GgaMessage(object):
+    """GGA: Global positioning system fix data."""
+    __slots__ = (
+        'seconds_of_day',
+        'latitude_d',
+        'longitude_d',
+        'quality',
+        'satellites_used',
+        'hdop',
+        'altitude_m',
+    )
+
+    def __init__(
+            self,
+            seconds_of_day,
+            latitude_d,
+            longitude_d,
+            quality,
+            satellites_used,
+            hdop,
+            altitude_m
+    ):
+        self.seconds_of_day = seconds_of_day
+        self.latitude_d = latitude_d
+        self.longitude_d = longitude_d
+        self.quality = quality
+        self.satellites_used = satellites_used
+        self.hdop = hdop
+        self.altitude_m = altitude_m
+
+
+class GsaMessage(object):
+    """GSA: GNSS DOP and active satellites."""
+    __slots__ = (
+        'automatic',
+        'fix_type',
+        'satellites_used',
+        'pdop',
+        'hdop',
+        'vdop',
+    )
+
+    def __init__(self, automatic, fix_type, satellites_used, pdop, hdop, vdop):
+        self.automatic = automatic
+        self.fix_type = fix_type
+        self.satellites_used = satellites_used
+        self.pdop = pdop
+        self.hdop = hdop
+        self.vdop = vdop
+
+
+class VtgMessage(object):
+    """VTG: Course over ground and ground speed."""
+    __slots__ = ('course_d', 'speed_m_s')
+
+    def __init__(self, course_d, speed_m_s):
+        self.course_d = course_d
+        self.speed_m_s = speed_m_s
+
+
+class GsvMessage(object):
+    """GSV: GNSS satellites in view. satellites is a list of (id, elevation,
+    azimuth, SNR dB) tuples; the SNR is None for satellites not being
+    tracked.
+    """
+    __slots__ = (
+        'message_count',
+        'message_number',
+        'satellites_in_view',
+        'satellites',
+    )
+
+    def __init__(
+            self,
+            message_count,
+            message_number,
+            satellites_in_view,
+            satellites
+    ):
+        self.message_count = message_count
+        self.message_number = message_number
+        self.satellites_in_view = satellites_in_view
+        self.satellites = satellites
+
+
+def valid_checksum(sentence):
+    """Returns True if the sentence has a *hh checksum that matches."""
+    asterisk = sentence.rfind('*')
+    if asterisk == -1:
+        return False
+    try:
+        expected = int(sentence[asterisk + 1:asterisk + 3], 16)
+    except ValueError:
+        return False
+    return checksum(sentence[1:asterisk].encode('ascii')) == expected
+
+
+def _fields(sentence, count):
+    """Splits a sentence into fields, dropping the checksum. Raises
+    ValueError if there are fewer than count fields.
+    """
+    asterisk = sentence.rfind('*')
+    if asterisk == -1:
+        asterisk = len(sentence.rstrip())
+    fields = sentence[:asterisk].split(',')
+    if len(fields) < count:
+        raise ValueError('Too few fields in {}'.format(sentence.rstrip()))
+    return fields
+
+
+def _degrees(value, hemisphere):
+    """Converts a ddmm.mmmm or dddmm.mmmm value to degrees."""
+    if value == '':
+        raise ValueError('Position fix unavailable')
+    value = float(value)
+    degrees = int(value * 0.01)
+    degrees += (value - degrees * 100) / 60.0
+    if hemisphere in ('S', 'W'):
+        return -degrees
+    return degrees
+
+
+def _seconds_of_day(time_):
+    """Converts a hhmmss.sss value to seconds since midnight."""
+    return (
+        int(time_[0:2]) * 3600
+        + int(time_[2:4]) * 60
+        + float(time_[4:])
+    )
+
+
+@functools.lru_cache(maxsize=4)
+def _day_epoch_s(date):
+    """Converts a ddmmyy value to the Unix timestamp of midnight UTC. The date
+    only changes once a day, so this is cached.
+    """
+    ordinal = datetime.date(
+        int(date[4:6]) + 2000,
+        int(date[2:4]),
+        int(date[0:2])
+    ).toordinal()
+    return (ordinal - EPOCH_ORDINAL) * SECONDS_PER_DAY
+
+
+def parse_rmc(sentence):
+    """Parses an RMC sentence."""
+    # $GPRMC,111636.932,A,2447.0949,N,12100.5223,E,000.0,000.0,030407,003.9,W,A*12
+    fields = _fields(sentence, 10)
+    if fields[2] == 'V':
+        raise ValueError('Navigation receiver warning')
+    return RmcMessage(
+        _day_epoch_s(fields[9]) + _seconds_of_day(fields[1]),
+        _degrees(fields[3], fields[4]),
+        _degrees(fields[5], fields[6]),
+        float(fields[7]) * KNOTS_TO_M_S,
+        float(fields[8] or 0.0)
+    )
+
+
+def parse_gga(sentence):
+    """Parses a GGA sentence."""
+    # $GPGGA,hhmmss.sss,ddmm.mmmm,a,dddmm.mmmm,a,x,xx,x.x,x.x,M,,,,xxxx*hh
+    fields = _fields(sentence, 10)
+    quality = int(fields[6] or 0)
+    if quality == 0:
+        raise ValueError('Position fix unavailable')
+    return GgaMessage(
+        _seconds_of_day(fields[1]),
+        _degrees(fields[2], fields[3]),
+        _degrees(fields[4], fields[5]),
+        quality,
+        int(fields[7]),
+        float(fields[8]),
+        float(fields[9])
+    )
+
+
+def parse_gsa(sentence):
+    """Parses a GSA sentence."""
+    # $GPGSA,A,x,xx,xx,xx,xx,xx,xx,xx,xx,xx,xx,xx,xx,x.x,x.x,x.x*hh
+    # NMEA 4.1 appends a system ID field, so index from the front
+    fields = _fields(sentence, 18)
+    return GsaMessage(
+        fields[1] == 'A',
+        int(fields[2]),
+        sum(1 for id_ in fields[3:15] if id_ != ''),
+        float(fields[15]),
+        float(fields[16]),
+        float(fields[17])
+    )
+
+
+def parse_vtg(sentence):
+    """Parses a VTG sentence."""
+    # $GPVTG,x.x,T,x.x,M,x.x,N,x.x,K,a*hh
+    fields = _fields(sentence, 8)
+    if len(fields) > 9 and fields[9] == 'N':
+        raise ValueError('Data not valid')
+    return VtgMessage(float(fields[1]), float(fields[7]) * KM_H_TO_M_S)
+
+
+def parse_gsv(sentence):
+    """Parses a GSV sentence."""
+    # $GPGSV,3,1,12,05,54,069,45,12,44,061,44,21,07,184,46,22,78,289,47*72
+    fields = _fields(sentence, 4)
+    satellites = []
+    for index in range(4, len(fields) - 3, 4):
+        id_, elevation, azimuth, snr = fields[index:index + 4]
+        satellites.append((
+            int(id_),
+            int(elevation or 0),
+            int(azimuth or 0),
+            int(snr) if snr != '' else None
+        ))
+    return GsvMessage(
+        int(fields[1]),
+        int(fields[2]),
+        int(fields[3]),
+        satellites
+    )
+
+
+# Sentences are dispatched on the type after the talker id, so that both
+# GPS only ($GP) and multi-constellation ($GN) sentences are handled
+PARSERS = {
+    'RMC': parse_rmc,
+    'GGA': parse_gga,
+    'GSA': parse_gsa,
+    'VTG': parse_vtg,
+    'GSV': parse_gsv,
+}
+
+
+def parse(sentence, validate=True):
+    """Parses an NMEA sentence. Returns None for sentence types that aren't
+    handled. Raises ValueError if the checksum doesn't match or if the
+    sentence doesn't have valid data. The checksum check can be skipped with
+    validate=False if the sentence has already been checked.
+    """
+    parser = PARSERS.get(sentence[3:6])
+    if parser is None or not sentence.startswith('$G'):
+        return None
+    if validate and not valid_checksum(sentence):
+        raise ValueError('Invalid checksum for {}'.format(sentence.rstrip()))
+    return parser(sentence)
@@ -0,0 +1,295 @@
+"""Tunes the LocationFilter noise parameters against recorded runs.
+
+Every configuration of noise parameters is run through the location filter
+model at the same time: the states are stored as an (N_configs, 4) array and
+the covariances as an (N_configs, 4, 4) array, so each measurement is applied
+to every configuration with a handful of NumPy operations. Configurations are
+scored on their innovations. A well tuned filter has innovations that are
+consistent with the covariance it predicts, so the normalized innovation
+squared (NIS) averages 1 per observed variable, and the innovation likelihood
+is as high as possible.
+"""
+
+import itertools
+import multiprocessing
+import numpy
+
+from control.location_filter import LocationFilter
+from control.location_smoother import HEADING_D
+from control.location_smoother import SPEED_M_S
+from control.location_smoother import STATE_SIZE
+from control.location_smoother import X_M
+from control.location_smoother import Y_M
+
+# pylint: disable=invalid-name
+# pylint: disable=no-member
+
+# The columns of a configurations array
+PARAMETERS = (
+    'process_noise_x_m',
+    'process_noise_y_m',
+    'process_noise_heading_d',
+    'process_noise_speed_m_s',
+    'gps_accuracy_scale',
+    'gps_heading_noise',
+    'gps_speed_noise',
+    'compass_noise',
+)
+DEFAULTS = {
+    # LocationFilter uses the identity matrix for the process noise
+    'process_noise_x_m': 1.0,
+    'process_noise_y_m': 1.0,
+    'process_noise_heading_d': 1.0,
+    'process_noise_speed_m_s': 1.0,
+    'gps_accuracy_scale': 1.0,
+    'gps_heading_noise': LocationFilter.GPS_MEASUREMENT_NOISE[2, 2],
+    'gps_speed_noise': LocationFilter.GPS_MEASUREMENT_NOISE[3, 3],
+    'compass_noise': LocationFilter.COMPASS_MEASUREMENT_NOISE[2, 2],
+}
+
+SCORE_NEGATIVE_LOG_LIKELIHOOD = 'nll'
+SCORE_NIS = 'nis'
+
+DEFAULT_BURN_IN = 10
+DEFAULT_CHUNK_SIZE = 500
+
+_worker_run = None
+
+
+def default_configuration():
+    """Returns the current LocationFilter settings as a configuration."""
+    return numpy.array([DEFAULTS[name] for name in PARAMETERS])
+
+
+def grid(**values):
+    """Returns a configurations array with every combination of the given
+    parameter values, e.g. grid(compass_noise=(20, 45, 90)). Parameters that
+    aren't given keep their default value.
+    """
+    for name in values:
+        if name not in DEFAULTS:
+            raise ValueError('Unknown parameter: {}'.format(name))
+    axes = [
+        values[name] if name in values else (DEFAULTS[name],)
+        for name in PARAMETERS
+    ]
+    return numpy.array(list(itertools.product(*axes)), dtype=float).reshape(
+        (-1, len(PARAMETERS))
+    )
+
+
+def _measurement_noise(run, configurations):
+    """Returns how to compute the measurement noise for every configuration.
+    The noise for a variable is factors[measurement, variable] times
+    gps_columns[variable] or compass_columns[variable], which have one entry
+    per configuration.
+    """
+    noise = run['noise']
+    is_gps = run['observed'][:, X_M]
+    column = lambda name: configurations[:, PARAMETERS.index(name)]
+    zeros = numpy.zeros(len(configurations))
+
+    factors = numpy.zeros(noise.shape)
+    factors[is_gps, X_M] = noise[is_gps, X_M]
+    factors[is_gps, Y_M] = noise[is_gps, Y_M]
+    factors[is_gps, HEADING_D] = 1.0
+    factors[is_gps, SPEED_M_S] = 1.0
+    # read_log scales the compass noise by the confidence of each reading
+    factors[~is_gps, HEADING_D] = \
+        noise[~is_gps, HEADING_D] / DEFAULTS['compass_noise']
+
+    gps_columns = numpy.array((
+        column('gps_accuracy_scale'),
+        column('gps_accuracy_scale'),
+        column('gps_heading_noise'),
+        column('gps_speed_noise'),
+    ))
+    compass_columns = numpy.array((
+        zeros,
+        zeros,
+        column('compass_noise'),
+        zeros,
+    ))
+    return is_gps.tolist(), factors, gps_columns, compass_columns
+
+
+def evaluate(run, configurations, initial_estimates=None, burn_in=None):
+    """Runs the location filter over a run from location_smoother.read_log
+    once for every configuration. Measurements in the first burn_in samples
+    update the filters but aren't scored.
+
+    Returns a dictionary of (N_configs,) arrays: nis is the average
+    normalized innovation squared per observed variable, and
+    negative_log_likelihood is the average negative log likelihood of the
+    innovations, without the constant term.
+    """
+    if burn_in is None:
+        burn_in = DEFAULT_BURN_IN
+    configurations = numpy.atleast_2d(numpy.asarray(configurations, float))
+    config_count = len(configurations)
+
+    timestamps = run['timestamp_s']
+    measurements = run['measurements']
+    turn_rates = run['turn_rate_d_s']
+    observed = run['observed'].tolist()
+    is_gps, factors, gps_columns, compass_columns = \
+        _measurement_noise(run, configurations)
+    process_noise = configurations[:, 0:STATE_SIZE]
+    diagonal = numpy.arange(STATE_SIZE)
+
+    if initial_estimates is None:
+        initial_estimates = numpy.zeros(STATE_SIZE)
+        gps_rows = numpy.flatnonzero(run['observed'][:, X_M])
+        if len(gps_rows) > 0:
+            initial_estimates[X_M:Y_M + 1] = measurements[gps_rows[0], X_M:Y_M + 1]
+    estimates = numpy.tile(
+        numpy.asarray(initial_estimates, dtype=float),
+        (config_count, 1)
+    )
+    covariances = numpy.tile(numpy.identity(STATE_SIZE), (config_count, 1, 1))
+
+    nis_total = numpy.zeros(config_count)
+    log_likelihood_total = numpy.zeros(config_count)
+    scored_count = 0
+
+    time_diffs_s = numpy.diff(numpy.concatenate((timestamps[:1], timestamps)))
+    for index in range(len(timestamps)):
+        time_diff_s = time_diffs_s[index]
+
+        # Prediction step
+        # x = A * x + B
+        heading_r = numpy.radians(estimates[:, HEADING_D])
+        x_delta = time_diff_s * numpy.sin(heading_r)
+        y_delta = time_diff_s * numpy.cos(heading_r)
+        estimates[:, HEADING_D] += turn_rates[index] * time_diff_s
+        estimates[:, HEADING_D] %= 360.0
+        estimates[:, X_M] += x_delta * estimates[:, SPEED_M_S]
+        estimates[:, Y_M] += y_delta * estimates[:, SPEED_M_S]
+        # P = A * P * A' + Q. A is the identity except for the speed column
+        # of the x and y rows, so this only needs to update those rows and
+        # columns.
+        covariances[:, X_M, :] += \
+            x_delta[:, numpy.newaxis] * covariances[:, SPEED_M_S, :]
+        covariances[:, Y_M, :] += \
+            y_delta[:, numpy.newaxis] * covariances[:, SPEED_M_S, :]
+        covariances[:, :, X_M] += \
+            x_delta[:, numpy.newaxis] * covariances[:, :, SPEED_M_S]
+        covariances[:, :, Y_M] += \
+            y_delta[:, numpy.newaxis] * covariances[:, :, SPEED_M_S]
+        covariances[:, diagonal, diagonal] += process_noise
+
+        # Update step, one observed variable at a time
+        scored = index >= burn_in
+        columns = gps_columns if is_gps[index] else compass_columns
+        for variable in range(STATE_SIZE):
+            if not observed[index][variable]:
+                continue
+            innovation_variance = covariances[:, variable, variable] \
+                + factors[index, variable] * columns[variable]
+            kalman_gain = \
+                covariances[:, :, variable] / innovation_variance[:, numpy.newaxis]
+            innovation = measurements[index, variable] - estimates[:, variable]
+            if variable == HEADING_D:
+                innovation = (innovation + 180.0) % 360.0 - 180.0
+            estimates += kalman_gain * innovation[:, numpy.newaxis]
+            covariances -= \
+                kalman_gain[:, :, numpy.newaxis] \
+                * covariances[:, variable:variable + 1, :]
+
+            if scored:
+                nis = innovation * innovation / innovation_variance
+                nis_total += nis
+                log_likelihood_total += \
+                    0.5 * (numpy.log(innovation_variance) + nis)
+                scored_count += 1
+        estimates[:, HEADING_D] %= 360.0
+
+    scored_count = max(scored_count, 1)
+    return {
+        'nis': nis_total / scored_count,
+        'negative_log_likelihood': log_likelihood_total / scored_count,
+    }
+
+
+def score(results, method=None):
+    """Returns the scores of evaluated configurations; lower is better."""
+    if method is None:
+        method = SCORE_NEGATIVE_LOG_LIKELIHOOD
+    if method == SCORE_NEGATIVE_LOG_LIKELIHOOD:
+        return results['negative_log_likelihood']
+    if method == SCORE_NIS:
+        return numpy.abs(results['nis'] - 1.0)
+    raise ValueError('Unknown score method: {}'.format(method))
+
+
+def _set_worker_run(run, initial_estimates, burn_in):
+    """Stores the run in a worker process, so that it's only sent once."""
+    global _worker_run  # pylint: disable=global-statement
+    _worker_run = (run, initial_estimates, burn_in)
+
+
+def _evaluate_chunk(configurations):
+    """Evaluates a chunk of configurations in a worker process."""
+    run, initial_estimates, burn_in = _worker_run
+    return evaluate(run, configurations, initial_estimates, burn_in)
+
+
+def sweep(
+        run,
+        configurations,
+        processes=None,
+        chunk_size=None,
+        initial_estimates=None,
+        burn_in=None
+):
+    """Evaluates the configurations in chunks. Smaller chunks fit in the CPU
+    cache better. If processes is greater than 1, the chunks are spread
+    across a multiprocessing pool. Returns the same dictionary as evaluate.
+    """
+    if chunk_size is None:
+        chunk_size = DEFAULT_CHUNK_SIZE
+    configurations = numpy.atleast_2d(numpy.asarray(configurations, float))
+    chunks = [
+        configurations[start:start + chunk_size]
+        for start in range(0, len(configurations), chunk_size)
+    ]
+
+    if processes is not None and processes > 1:
+        pool = multiprocessing.Pool(
+            processes,
+            initializer=_set_worker_run,
+            initargs=(run, initial_estimates, burn_in)
+        )
+        try:
+            chunk_results = pool.map(_evaluate_chunk, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        chunk_results = [
+            evaluate(run, chunk, initial_estimates, burn_in)
+            for chunk in chunks
+        ]
+
+    return {
+        key: numpy.concatenate([result[key] for result in chunk_results])
+        for key in ('nis', 'negative_log_likelihood')
+    }
+
+
+def best(configurations, results, count=None, method=None):
+    """Returns the best configurations as a list of (score, nis, parameters
+    dictionary) tuples, best first.
+    """
+    if count is None:
+        count = 10
+    scores = score(results, method)
+    order = numpy.argsort(scores, kind='mergesort')[:count]
+    return [
+        (
+            scores[index],
+            results['nis'][index],
+            dict(zip(PARAMETERS, configurations[index].tolist()))
+        )
+        for index in order
+    ]
@@ -0,0 +1,71 @@
+"""Projection between latitude and longitude and meters on a local plane."""
+
+import math
+import numpy
+
+# pylint: disable=no-member
+
+# The Earth is assumed to be a sphere
+EQUATORIAL_RADIUS_M = 6378.1370 * 1000
+M_PER_D_LATITUDE = EQUATORIAL_RADIUS_M * 2.0 * math.pi / 360.0
+
+
+class LocalTangentPlane(object):
+    """Converts latitude and longitude to x and y offsets in meters from an
+    origin, and back. Meters per degree longitude is calculated once for the
+    origin latitude. The course is only a few hundred meters across, so the
+    scale changes by less than 0.01% over it, and course points and GPS fixes
+    go through the same scale.
+    """
+
+    def __init__(self, origin_latitude_d, origin_longitude_d):
+        self.origin_latitude_d = origin_latitude_d
+        self.origin_longitude_d = origin_longitude_d
+        self.m_per_d_longitude = self.calculate_m_per_d_longitude(
+            origin_latitude_d
+        )
+
+    @staticmethod
+    def calculate_m_per_d_longitude(latitude_d):
+        """Calculates the number of meters per degree longitude at a given
+        latitude.
+        """
+        return M_PER_D_LATITUDE * math.cos(math.radians(latitude_d))
+
+    def latitude_to_y_m(self, latitude_d):
+        """Returns the y offset in meters for a latitude."""
+        return M_PER_D_LATITUDE * (latitude_d - self.origin_latitude_d)
+
+    def longitude_to_x_m(self, longitude_d, latitude_d):  # pylint: disable=unused-argument
+        """Returns the x offset in meters for a longitude. The latitude isn't
+        needed, but is kept so that callers don't depend on the scale.
+        """
+        return self.m_per_d_longitude * (longitude_d - self.origin_longitude_d)
+
+    def y_m_to_latitude(self, y_m):
+        """Returns the inverse of latitude_to_y_m."""
+        return y_m / M_PER_D_LATITUDE + self.origin_latitude_d
+
+    def x_m_to_longitude(self, x_m, latitude_d):  # pylint: disable=unused-argument
+        """Returns the inverse of longitude_to_x_m."""
+        return x_m / self.m_per_d_longitude + self.origin_longitude_d
+
+    def to_m(self, latitudes_d, longitudes_d):
+        """Converts arrays of latitudes and longitudes to arrays of x and y
+        offsets in meters.
+        """
+        latitudes_d = numpy.asarray(latitudes_d, dtype=float)
+        longitudes_d = numpy.asarray(longitudes_d, dtype=float)
+        x_m = self.m_per_d_longitude * (longitudes_d - self.origin_longitude_d)
+        y_m = M_PER_D_LATITUDE * (latitudes_d - self.origin_latitude_d)
+        return x_m, y_m
+
+    def to_degrees(self, x_m, y_m):
+        """Converts arrays of x and y offsets in meters to arrays of latitudes
+        and longitudes.
+        """
+        latitudes_d = numpy.asarray(y_m, dtype=float) / M_PER_D_LATITUDE \
+            + self.origin_latitude_d
+        longitudes_d = numpy.asarray(x_m, dtype=float) \
+            / self.m_per_d_longitude + self.origin_longitude_d
+        return latitudes_d, longitudes_d
@@ -0,0 +1,307 @@
+"""Structured run log that analysis scripts can memory map.
+
+The text log has to be read line by line and scraped for JSON, which is slow
+for long logs. The run log is a directory with one file per stream of
+fixed size little endian records:
+    gps.bin            one record per GPS reading
+    compass.bin        one record per compass reading
+    accelerometer.bin  one record per accelerometer reading
+    command.bin        one record per drive command sent to the car
+    event.bin          run start and stop events
+Each event record has the number of records in every stream when it was
+written, so the records of a run are a contiguous slice of each stream. The
+layouts are in COLUMNS, and numpy.memmap can read the files directly.
+"""
+
+import os
+import struct
+import threading
+import time
+
+import numpy
+
+from messaging.singleton_mixin import SingletonMixin
+
+GPS = 'gps'
+COMPASS = 'compass'
+ACCELEROMETER = 'accelerometer'
+COMMAND = 'command'
+EVENT = 'event'
+STREAMS = (GPS, COMPASS, ACCELEROMETER, COMMAND)
+
+START = 1
+STOP = 2
+# The car wasn't moving according to the speed history
+STUCK = 3
+
+DEVICE_ID_SIZE = 16
+
+COLUMNS = {
+    GPS: (
+        ('time_s', 'd'),
+        ('latitude_d', 'd'),
+        ('longitude_d', 'd'),
+        ('accuracy_m', 'd'),
+        ('heading_d', 'd'),
+        ('speed_m_s', 'd'),
+        ('device_id', '{}s'.format(DEVICE_ID_SIZE)),
+    ),
+    COMPASS: (
+        ('time_s', 'd'),
+        ('compass_d', 'd'),
+        ('confidence', 'd'),
+        ('device_id', '{}s'.format(DEVICE_ID_SIZE)),
+    ),
+    ACCELEROMETER: (
+        ('time_s', 'd'),
+        ('acceleration_g_x', 'd'),
+        ('acceleration_g_y', 'd'),
+        ('acceleration_g_z', 'd'),
+        ('device_id', '{}s'.format(DEVICE_ID_SIZE)),
+    ),
+    COMMAND: (
+        ('time_s', 'd'),
+        ('throttle', 'd'),
+        ('steering', 'd'),
+    ),
+    EVENT: (
+        ('time_s', 'd'),
+        ('event', 'q'),
+    ) + tuple(('{}_row'.format(stream), 'q') for stream in STREAMS),
+}
+
+
+def _dtype(columns):
+    """Returns the NumPy dtype of records with these columns."""
+    types = {'d': '<f8', 'q': '<i8'}
+    return numpy.dtype([
+        (name, types.get(code, 'S' + code[:-1])) for name, code in columns
+    ])
+
+
+def _struct(columns):
+    """Returns the Struct of records with these columns."""
+    return struct.Struct('<' + ''.join(code for _, code in columns))
+
+
+DTYPES = dict((name, _dtype(columns)) for name, columns in COLUMNS.items())
+_STRUCTS = dict((name, _struct(columns)) for name, columns in COLUMNS.items())
+
+
+def file_name(directory, stream):
+    """Returns the file name of a stream in a run log."""
+    return os.path.join(directory, '{}.bin'.format(stream))
+
+
+def _number(value):
+    """Returns a reading value as a float, with NaN for missing values."""
+    if value is None:
+        return float('nan')
+    return float(value)
+
+
+def _device_id(reading):
+    """Returns the device ID of a reading as bytes, truncated without
+    splitting a character.
+    """
+    device_id = str(reading.get('device_id', '')).encode('utf-8')
+    if len(device_id) > DEVICE_ID_SIZE:
+        device_id = device_id[:DEVICE_ID_SIZE].decode('utf-8', 'ignore') \
+            .encode('utf-8')
+    return device_id
+
+
+class RunLog(SingletonMixin):
+    """Appends records to the run log. Nothing is written until open is
+    called, so tests and tools that don't open it pay almost nothing.
+    """
+
+    def __init__(self):
+        super(RunLog, self).__init__()
+        # SingletonMixin calls __init__ every time the singleton is requested
+        if getattr(self, '_lock', None) is not None:
+            return
+        self._lock = threading.Lock()
+        self._file_descriptors = None
+        self._rows = None
+
+    def open(self, directory):
+        """Starts writing to a run log directory, appending to any records
+        that are already there.
+        """
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        with self._lock:
+            self._close()
+            self._file_descriptors = {}
+            self._rows = {}
+            for stream in STREAMS + (EVENT,):
+                file_descriptor = os.open(
+                    file_name(directory, stream),
+                    os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                    0o644
+                )
+                # Drop any record that was only partially written before a
+                # crash so that later records stay aligned
+                size = os.fstat(file_descriptor).st_size
+                record_size = _STRUCTS[stream].size
+                if size % record_size != 0:
+                    os.ftruncate(file_descriptor, size - size % record_size)
+                self._file_descriptors[stream] = file_descriptor
+                self._rows[stream] = size // record_size
+
+    def close(self):
+        """Stops writing to the run log."""
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        """Closes the files. Must be called with the lock held."""
+        if self._file_descriptors is not None:
+            for file_descriptor in self._file_descriptors.values():
+                os.close(file_descriptor)
+        self._file_descriptors = None
+        self._rows = None
+
+    def _write(self, stream, *values):
+        """Appends a record to a stream in one write."""
+        if self._file_descriptors is None:
+            return
+        record = _STRUCTS[stream].pack(*values)
+        with self._lock:
+            if self._file_descriptors is None:
+                return
+            os.write(self._file_descriptors[stream], record)
+            self._rows[stream] += 1
+
+    def write_reading(self, reading, time_s=None):
+        """Appends a GPS, compass or accelerometer reading. Other messages
+        are ignored. time_s defaults to now.
+        """
+        if self._file_descriptors is None:
+            return
+        if time_s is None:
+            time_s = time.time()
+        if 'latitude_d' in reading:
+            self._write(
+                GPS,
+                time_s,
+                _number(reading['latitude_d']),
+                _number(reading['longitude_d']),
+                _number(reading.get('accuracy_m')),
+                _number(reading.get('heading_d')),
+                _number(reading.get('speed_m_s')),
+                _device_id(reading)
+            )
+        elif 'compass_d' in reading:
+            self._write(
+                COMPASS,
+                time_s,
+                _number(reading['compass_d']),
+                _number(reading.get('confidence')),
+                _device_id(reading)
+            )
+        elif 'acceleration_g_x' in reading:
+            self._write(
+                ACCELEROMETER,
+                time_s,
+                _number(reading['acceleration_g_x']),
+                _number(reading.get('acceleration_g_y')),
+                _number(reading.get('acceleration_g_z')),
+                _device_id(reading)
+            )
+
+    def write_command(self, throttle, steering, time_s=None):
+        """Appends a drive command. time_s defaults to now."""
+        if self._file_descriptors is None:
+            return
+        if time_s is None:
+            time_s = time.time()
+        self._write(COMMAND, time_s, throttle, steering)
+
+    def write_event(self, event, time_s=None):
+        """Appends an event, e.g. START or STOP, with the current number of
+        records in every stream. time_s defaults to now.
+        """
+        if self._file_descriptors is None:
+            return
+        if time_s is None:
+            time_s = time.time()
+        with self._lock:
+            if self._file_descriptors is None:
+                return
+            record = _STRUCTS[EVENT].pack(
+                time_s,
+                event,
+                *(self._rows[stream] for stream in STREAMS)
+            )
+            os.write(self._file_descriptors[EVENT], record)
+            self._rows[EVENT] += 1
+
+
+def load_stream(directory, stream):
+    """Memory maps all of the records in a stream. Columns can be read by
+    name, e.g. load_stream(directory, GPS)['latitude_d'].
+    """
+    dtype = DTYPES[stream]
+    try:
+        count = os.path.getsize(file_name(directory, stream)) // dtype.itemsize
+    except OSError:
+        count = 0
+    if count == 0:
+        # numpy can't map empty files
+        return numpy.empty(0, dtype=dtype)
+    return numpy.memmap(
+        file_name(directory, stream),
+        dtype=dtype,
+        mode='r',
+        shape=(count,)
+    )
+
+
+def load_runs(directory):
+    """Returns a list of runs from the event index. Each run is a dictionary
+    with the start_s and stop_s times, and for every stream, the slice of
+    its records from that run. stop_s is None if the run never stopped.
+    """
+    runs = []
+    run = None
+    for event in load_stream(directory, EVENT):
+        if event['event'] == START:
+            if run is not None:
+                # Started again without stopping, e.g. after a crash
+                _end_run(run, event)
+                runs.append(run)
+            run = {'start_s': float(event['time_s']), 'stop_s': None}
+            for stream in STREAMS:
+                run[stream] = int(event['{}_row'.format(stream)])
+        elif event['event'] == STOP and run is not None:
+            _end_run(run, event)
+            runs.append(run)
+            run = None
+
+    if run is not None:
+        for stream in STREAMS:
+            run[stream] = slice(run[stream], None)
+        runs.append(run)
+    return runs
+
+
+def _end_run(run, event):
+    """Turns the start rows of a run into slices that end at an event."""
+    run['stop_s'] = float(event['time_s'])
+    for stream in STREAMS:
+        run[stream] = slice(run[stream], int(event['{}_row'.format(stream)]))
+
+
+def load_run(directory, stream, run_index):
+    """Memory maps the records in a stream from one run."""
+    return load_stream(directory, stream)[
+        load_runs(directory)[run_index][stream]
+    ]
+
+
+def load_events(directory, event):
+    """Returns the times of every event of one type, e.g. STUCK."""
+    events = load_stream(directory, EVENT)
+    return events['time_s'][events['event'] == event]
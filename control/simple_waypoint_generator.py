@@ -16,7 +16,6 @@ import copy
 import json
 import math
 import os
-import re
 import threading
 
 from control.telemetry import Telemetry
@@ -86,6 +85,9 @@ class SimpleWaypointGenerator(object):
     def next(self):
         """Goes to the next waypoint."""
         self._current_waypoint_index += 1
+        # Otherwise, if this waypoint was reached by getting within 1m, the
+        # stale distance makes the next waypoint count as reached right away
+        self._last_distance_m = float('inf')
 
     def done(self):
         """Returns True if the course is done and there are no remaining
@@ -96,6 +98,7 @@ class SimpleWaypointGenerator(object):
     def reset(self):
         """Resets the waypoints."""
         self._current_waypoint_index = 0
+        self._last_distance_m = float('inf')
 
     def _handle_message(self, message):
         """Handles a message from the waypoint exchange."""
@@ -155,17 +158,4 @@ class SimpleWaypointGenerator(object):
         # Unlike all of the other tag names, "coordinates" is not capitalized
         coordinates = get_child(line_string, 'coordinates')
 
-        waypoints = []
-        text = coordinates.text.strip()
-        for csv in re.split(r'\s', text):
-            (
-                longitude,
-                latitude,
-                altitude  # pylint: disable=unused-variable
-            ) = csv.split(',')
-
-            waypoints.append((
-                Telemetry.longitude_to_m_offset(float(longitude), float(latitude)),
-                Telemetry.latitude_to_m_offset(float(latitude))
-            ))
-        return waypoints
+        return Telemetry.kml_coordinates_to_m(coordinates.text)
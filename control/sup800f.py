@@ -1,7 +1,8 @@
 """Functions for communicating with the SUP800F GPS module."""
 import collections
-import functools
+import math
 import struct
+import weakref
 
 
 HEADER_FORMAT = ''.join((
@@ -49,56 +50,295 @@ BinaryMessage = collections.namedtuple(  # pylint: disable=invalid-name
     ))
 )
 
+NAVIGATION_FORMAT = ''.join((
+    '!',  # network format (big-endian)
+    'xxxx', # The message will have 4 header bytes
+    'x',  # message id, A8
+    'B',  # fix mode, 0 = none, 1 = 2D, 2 = 3D, 3 = 3D + DGPS
+    'B',  # number of satellites in view
+    'H',  # GPS week
+    'I',  # time of week, 0.01 s
+    'i',  # latitude, 1e-7 degrees
+    'i',  # longitude, 1e-7 degrees
+    'I',  # ellipsoid altitude, 0.01 m
+    'I',  # mean sea level altitude, 0.01 m
+    'H',  # GDOP, 0.01
+    'H',  # PDOP, 0.01
+    'H',  # HDOP, 0.01
+    'H',  # VDOP, 0.01
+    'H',  # TDOP, 0.01
+    'i',  # ECEF X, 0.01 m
+    'i',  # ECEF Y, 0.01 m
+    'i',  # ECEF Z, 0.01 m
+    'i',  # ECEF velocity X, 0.01 m/s
+    'i',  # ECEF velocity Y, 0.01 m/s
+    'i',  # ECEF velocity Z, 0.01 m/s
+    'xxx', # and 3 checksum bytes
+))
+NavigationMessage = collections.namedtuple(  # pylint: disable=invalid-name
+    'NavigationMessage',
+    ' '.join((
+        'fix_mode', 'satellites',
+        'timestamp_s',
+        'latitude_d', 'longitude_d',
+        'hdop',
+        'speed_m_s', 'heading_d',
+    ))
+)
+# GPS time started at 1980-01-06 and doesn't have leap seconds
+GPS_EPOCH_S = 315964800
+GPS_LEAP_SECONDS = 18
+
+START_OF_SEQUENCE = b'\xA0\xA1'
+END_OF_SEQUENCE = b'\r\n'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+TAIL_SIZE = struct.calcsize(TAIL_FORMAT)
+DEFAULT_TIMEOUT_BYTES = 10000000
+# NMEA sentences are at most 82 characters
+MAX_NMEA_LENGTH = 82
+# The longest SUP800F binary messages are a few hundred bytes, so longer
+# payload lengths come from false headers in binary data
+MAX_PAYLOAD_LENGTH = 512
+
+
+def checksum(payload):
+    """Computes the checksum of a message payload."""
+    value = 0
+    for byte in payload:
+        value ^= byte
+    return value
 
 
 def format_message(payload):
     """Formats a message for the SUP800F."""
-    checksum = functools.reduce(lambda a, b: a ^ b, payload, 0)
     return (
         struct.pack(HEADER_FORMAT, 0xA0, 0xA1, len(payload))
         + payload
-        + struct.pack(TAIL_FORMAT, checksum, 0x0D, 0x0A)
+        + struct.pack(TAIL_FORMAT, checksum(payload), 0x0D, 0x0A)
     )
 
 
-def get_message(ser, timeout_bytes=None):
-    """Returns a single message."""
-    # Keep consuming bytes until we see the header message
+class FrameDecoder(object):
+    """Splits a stream of bytes from the SUP800F into binary frames. Bytes
+    are fed in whatever sized chunks are available and complete frames are
+    taken out one at a time, so the decoder can be shared by readers that
+    take turns.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._start = 0
+        self.checksum_errors = 0
+
+    def feed(self, data):
+        """Adds bytes read from the module."""
+        if self._start > 0:
+            del self._buffer[:self._start]
+            self._start = 0
+        self._buffer += data
+
+    def reset(self):
+        """Drops any buffered bytes, e.g. after a mode change."""
+        del self._buffer[:]
+        self._start = 0
+
+    def _frame_end(self, start):
+        """Checks for a binary frame that starts at start. Returns the index
+        just past the end of the frame, None if more bytes are needed, or -1
+        if the frame is invalid.
+        """
+        buffer_ = self._buffer
+        if len(buffer_) - start < HEADER_SIZE:
+            return None
+        payload_length = (buffer_[start + 2] << 8) | buffer_[start + 3]
+        if payload_length > MAX_PAYLOAD_LENGTH:
+            # Don't wait for tens of kilobytes to check a false header
+            self.checksum_errors += 1
+            return -1
+        end = start + HEADER_SIZE + payload_length + TAIL_SIZE
+        if len(buffer_) < end:
+            return None
+
+        payload = memoryview(buffer_)[start + HEADER_SIZE:end - TAIL_SIZE]
+        valid = (
+            buffer_[end - 2:end] == END_OF_SEQUENCE
+            and buffer_[end - TAIL_SIZE] == checksum(payload)
+        )
+        payload.release()
+        if not valid:
+            self.checksum_errors += 1
+            return -1
+        return end
+
+    def _skip_to_end(self, partial):
+        """Skips everything that was searched, keeping a trailing partial
+        start of a message.
+        """
+        self._start = len(self._buffer)
+        if len(self._buffer) > 0 and self._buffer[-1] == partial:
+            self._start -= 1
+
+    def next_frame(self):
+        """Returns the next complete frame, including the header and tail,
+        or None if more bytes are needed. Frames with a bad checksum or
+        tail are skipped.
+        """
+        buffer_ = self._buffer
+        while True:
+            start = buffer_.find(START_OF_SEQUENCE, self._start)
+            if start == -1:
+                # Keep a trailing 0xA0 in case it starts the next header
+                self._skip_to_end(0xA0)
+                return None
+            self._start = start
+            end = self._frame_end(start)
+            if end is None:
+                return None
+            if end == -1:
+                # This was probably a false header, so resync after it
+                self._start = start + 1
+                continue
+
+            self._start = end
+            return bytes(buffer_[start:end])
+
+
+class StreamDemultiplexer(FrameDecoder):
+    """Splits a stream of bytes that has both NMEA sentences and binary
+    frames, so the module doesn't need to be switched between modes to read
+    both.
+    """
+
+    def next_message(self):
+        """Returns the next NMEA sentence as a str, the next binary frame as
+        bytes, or None if more bytes are needed. Whichever starts first in
+        the stream is returned first.
+        """
+        buffer_ = self._buffer
+        while True:
+            binary_start = buffer_.find(START_OF_SEQUENCE, self._start)
+            nmea_start = buffer_.find(b'$', self._start)
+            if binary_start == -1 and nmea_start == -1:
+                self._skip_to_end(0xA0)
+                return None
+
+            if nmea_start == -1 or (-1 < binary_start < nmea_start):
+                self._start = binary_start
+                end = self._frame_end(binary_start)
+                if end is None:
+                    return None
+                if end == -1:
+                    self._start = binary_start + 1
+                    continue
+                self._start = end
+                return bytes(buffer_[binary_start:end])
+
+            self._start = nmea_start
+            end = buffer_.find(END_OF_SEQUENCE, nmea_start)
+            search_end = len(buffer_) if end == -1 else end
+            if (
+                    buffer_.find(b'$', nmea_start + 1, search_end) != -1
+                    or -1 < binary_start < search_end
+            ):
+                # The sentence was cut off by the start of another message
+                self._start = nmea_start + 1
+                continue
+            if end == -1:
+                if len(buffer_) - nmea_start <= MAX_NMEA_LENGTH:
+                    return None
+                # Not a sentence, just a stray $ in binary data
+                self._start = nmea_start + 1
+                continue
+            end += len(END_OF_SEQUENCE)
+            sentence = _nmea_sentence(buffer_[nmea_start:end])
+            if sentence is None or end - nmea_start > MAX_NMEA_LENGTH:
+                self.checksum_errors += 1
+                self._start = nmea_start + 1
+                continue
+            self._start = end
+            return sentence
+
+
+def _nmea_sentence(data):
+    """Decodes an NMEA sentence, returning None if it isn't valid."""
+    try:
+        sentence = data.decode('ascii')
+    except UnicodeDecodeError:
+        return None
+    # The SUP800F always sends a checksum, so sentences without one were cut
+    # off or corrupted
+    asterisk = sentence.rfind('*')
+    if asterisk == -1 or len(sentence) - asterisk != 5:
+        return None
+    try:
+        expected = int(sentence[asterisk + 1:-2], 16)
+    except ValueError:
+        return None
+    if checksum(data[1:asterisk]) != expected:
+        return None
+    return sentence
+
+
+# One decoder per serial port, so that bytes read past the end of a frame
+# aren't lost between readers
+_DECODERS = weakref.WeakKeyDictionary()
+
+
+def get_decoder(ser):
+    """Returns the frame decoder for a serial port."""
+    if ser not in _DECODERS:
+        _DECODERS[ser] = StreamDemultiplexer()
+    return _DECODERS[ser]
+
+
+def _read(ser, next_message, timeout_bytes):
+    """Yields messages from next_message, reading more from the serial port
+    whenever it needs more bytes.
+    """
     if timeout_bytes is None:
-        timeout_bytes = 10000000
-    skipped_bytes = 0
+        timeout_bytes = DEFAULT_TIMEOUT_BYTES
+    decoder = get_decoder(ser)
+    read_bytes = 0
     while True:
-        if skipped_bytes > timeout_bytes:
-            raise ValueError('No binary header found')
-
-        part = ser.read(1)
-        skipped_bytes += 1
-        if part != b'\xA0':
+        message = next_message(decoder)
+        if message is not None:
+            read_bytes = 0
+            yield message
             continue
 
-        part = ser.read(1)
-        skipped_bytes += 1
-        if part != b'\xA1':
-            continue
+        if read_bytes > timeout_bytes:
+            raise ValueError('No message found')
+        # inWaiting is the pyserial 2.7 spelling; 3.0 still provides it
+        data = ser.read(max(ser.inWaiting(), 1))
+        read_bytes += max(len(data), 1)
+        decoder.feed(data)
 
-        part = ser.read(2)
-        skipped_bytes += 2
 
-        payload_length = struct.unpack('!H', part)[0]
-        rest = ser.read(payload_length + 3)
-        skipped_bytes += payload_length + 3
+def read_frames(ser, timeout_bytes=None):
+    """Yields binary frames from a serial port. Reads take whatever bytes are
+    waiting instead of one byte at a time. Raises ValueError if more than
+    timeout_bytes are read without finding a frame.
+    """
+    return _read(ser, StreamDemultiplexer.next_frame, timeout_bytes)
+
+
+def read_messages(ser, timeout_bytes=None):
+    """Yields NMEA sentences as strs and binary frames as bytes from a
+    serial port, in the order that they arrive.
+    """
+    return _read(ser, StreamDemultiplexer.next_message, timeout_bytes)
 
-        if rest[-2:] != b'\r\n':
-            print(r"Message didn't end in \r\n")
-        return b'\xA0\xA1' + struct.pack('!H', payload_length) + rest
+
+def get_message(ser, timeout_bytes=None):
+    """Returns a single message."""
+    return next(read_frames(ser, timeout_bytes))
 
 
 def parse_binary(binary_message):
     """Parses a binary message (temperature, accelerometer, magnetometer, and
     pressure) from the SUP800F module.
     """
-    # TODO: I guess the SUP800F also returns navigation data messages? Ignore
-    # them for now, but this shouldn't be called
+    # Navigation data messages are handled by parse_navigation
     if binary_message[4] == 0xA8:
         return None
     if binary_message[4] != 0xCF:
@@ -106,6 +346,46 @@ def parse_binary(binary_message):
     return BinaryMessage(*struct.unpack(BINARY_FORMAT, binary_message))
 
 
+def parse_navigation(binary_message):
+    """Parses a navigation data message (position, velocity and time) from
+    the SUP800F module.
+    """
+    if binary_message[4] != 0xA8:
+        raise EnvironmentError('Invalid id while parsing navigation message')
+    (
+        fix_mode, satellites, week, time_of_week, latitude, longitude,
+        _ellipsoid_altitude, _sea_level_altitude,
+        _gdop, _pdop, hdop, _vdop, _tdop,
+        _x, _y, _z, velocity_x, velocity_y, velocity_z
+    ) = struct.unpack(NAVIGATION_FORMAT, binary_message)
+
+    latitude_d = latitude * 1e-7
+    longitude_d = longitude * 1e-7
+    # Rotate the ECEF velocity into east and north components
+    latitude_r = math.radians(latitude_d)
+    longitude_r = math.radians(longitude_d)
+    east = (
+        -math.sin(longitude_r) * velocity_x
+        + math.cos(longitude_r) * velocity_y
+    )
+    north = (
+        -math.sin(latitude_r) * math.cos(longitude_r) * velocity_x
+        - math.sin(latitude_r) * math.sin(longitude_r) * velocity_y
+        + math.cos(latitude_r) * velocity_z
+    )
+    return NavigationMessage(
+        fix_mode,
+        satellites,
+        GPS_EPOCH_S + week * 7 * 24 * 60 * 60 + time_of_week * 0.01
+        - GPS_LEAP_SECONDS,
+        latitude_d,
+        longitude_d,
+        hdop * 0.01,
+        math.sqrt(east ** 2 + north ** 2) * 0.01,
+        math.degrees(math.atan2(east, north)) % 360.0
+    )
+
+
 def switch_to_nmea_mode(ser):
     """Switches to the NMEA message mode."""
     _change_mode(ser, 1)
@@ -120,6 +400,8 @@ def _change_mode(ser, mode):
     """Change reporting mode between NMEA messages or binary (temperature,
     accelerometer and magnetometer) mode.
     """
+    # Anything buffered is from the old mode
+    get_decoder(ser).reset()
     for _ in range(3):
         mode_message = struct.pack(MODE_FORMAT, 9, mode, 0)
         ser.write(format_message(mode_message))
@@ -150,8 +432,9 @@ def check_response(ser, limit=None):
             count += 1
             return count <= limit
 
+    frames = read_frames(ser)
     while check():
-        data = get_message(ser)
+        data = next(frames)
         try:
             length, message_id, _ack_id = ( # pylint: disable=unused-variable
                 struct.unpack(response_format, data)
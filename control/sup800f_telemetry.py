@@ -9,22 +9,24 @@ compass_d for compass readings. Optional parameters are time_s,
 accelerometer_m_s_s, and magnetometer.
 """
 
-import datetime
 import math
-import numpy
-import pytz
 import threading
 import time
 
-from control.sup800f import get_message
+from control import nmea
+from control.compass_calibration import CompassCalibration
+from control.compass_calibration import FluxSamples
+from control.compass_calibration import MIN_MAGNITUDE_STD_DEV
 from control.sup800f import parse_binary
+from control.sup800f import parse_navigation
+from control.sup800f import read_messages
 from control.sup800f import switch_to_binary_mode
-from control.sup800f import switch_to_nmea_mode
 from control.telemetry import Telemetry
+from messaging import broker
+from messaging import latency
 from messaging import config
 from messaging.async_logger import AsyncLogger
 from messaging.async_producers import TelemetryProducer
-from messaging.message_consumer import consume_messages
 
 
 # Below this speed, the GPS module uses the compass to compute heading, if the
@@ -35,8 +37,10 @@ COMPASS_SPEED_CUTOFF_M_S = COMPASS_SPEED_CUTOFF_KM_HOUR * 1000.0 / 3600.0
 
 class Sup800fTelemetry(threading.Thread):
     """Reader of GPS module that implements the TelemetryData interface."""
-    def __init__(self, serial):
-        """Create the TelemetryData thread."""
+    def __init__(self, serial, calibration_file_name=None):
+        """Create the TelemetryData thread. The compass calibration is
+        loaded from and saved to calibration_file_name, if it's given.
+        """
         super(Sup800fTelemetry, self).__init__()
         self.name = self.__class__.__name__
 
@@ -45,13 +49,20 @@ class Sup800fTelemetry(threading.Thread):
         self._logger = AsyncLogger()
         self._run = True
         self._iterations = 0
-        # These initial measurements are from a calibration observation
-        self._compass_offsets = (-11.87, -5.97)
-        self._magnitude_mean = 353.310
-        self._magnitude_std_dev = 117.918
+        self._calibration_file_name = calibration_file_name
+        self._compass_calibration = CompassCalibration()
+        if calibration_file_name is not None:
+            try:
+                self._compass_calibration = CompassCalibration.load(
+                    calibration_file_name
+                )
+            except (EnvironmentError, ValueError) as exc:
+                self._logger.info(
+                    'Not loading compass calibration: {}'.format(exc)
+                )
+        self._flux_samples = FluxSamples()
 
         self._calibrate_compass_end_time = None
-        self._nmea_mode = True
         self._last_compass_heading_d = 0.0
         self._dropped_compass_messages = 0
         self._dropped_threshold = 10
@@ -65,24 +76,21 @@ class Sup800fTelemetry(threading.Thread):
             if message == 'calibrate-compass':
                 self.calibrate_compass(10)
 
-        consume = lambda: consume_messages(
-            config.COMMAND_FORWARDED_EXCHANGE,
-            handle_message
-        )
-        thread = threading.Thread(target=consume)
-        thread.name = '{}:consume_messages:{}'.format(
-            self.__class__.__name__,
-            config.COMMAND_FORWARDED_EXCHANGE
-        )
-        thread.start()
+        broker.subscribe(config.COMMAND_EXCHANGE, handle_message)
 
     def run(self):
         """Run in a thread, hands raw telemetry readings to telemetry
         instance.
         """
         failed_to_switch_mode = False
+        switched_mode = False
         while self._run:
             try:
+                # Binary mode has both the navigation data and the sensor
+                # readings, so the module only needs to be switched once
+                if not switched_mode:
+                    switch_to_binary_mode(self._serial)
+                    switched_mode = True
                 self._run_inner()
             except EnvironmentError as env:
                 self._logger.debug('Failed to switch mode: {}'.format(env))
@@ -91,13 +99,7 @@ class Sup800fTelemetry(threading.Thread):
                     import traceback
                     self._logger.debug(traceback.format_exc())
                 # Maybe resetting the module mode will help
-                try:
-                    if self._nmea_mode:
-                        switch_to_nmea_mode(self._serial)
-                    else:
-                        switch_to_binary_mode(self._serial)
-                except:
-                    pass
+                switched_mode = False
             except Exception as exc:  # pylint: disable=broad-except
                 self._logger.warn(
                     'Telemetry data caught exception: {}'.format(
@@ -107,138 +109,107 @@ class Sup800fTelemetry(threading.Thread):
 
     def _run_inner(self):
         """Inner part of run."""
-        binary_count = 0
-        while self._run:
-            if self._calibrate_compass_end_time is not None:
-                self._calibrate_compass()
-
-            # NMEA mode
-            if self._nmea_mode:
-                if self._get_gprc():
-                    switch_to_binary_mode(self._serial)
-                    self._nmea_mode = False
-            else:
-                if self._get_binary():
-                    binary_count += 1
-                    if binary_count >= 3:
-                        switch_to_nmea_mode(self._serial)
-                        self._nmea_mode = True
-                        binary_count = 0
-
-    def _get_gprc(self):
-        """Gets and processes a single GPRC message."""
-        # This blocks until a new message is received
-        line = self._serial.readline()
         try:
-            line = line.decode('utf-8')
-        except:
-            raise EnvironmentError('Not a UTF-8 message')
-
-        if line.startswith('$GPRMC'):
-            self._handle_gprmc(line)
-            return True
-        elif line.startswith('$GPGSA'):
-            self._handle_gpgsa(line)
-            return True
-        return False
-
-    def _get_binary(self):
-        """Gets and processes a single binary message."""
-        try:
-            message = get_message(self._serial, 1000)
+            for message in read_messages(self._serial, 1000):
+                if not self._run:
+                    return
+                if (
+                        self._calibrate_compass_end_time is not None
+                        and time.time() >= self._calibrate_compass_end_time
+                ):
+                    self._finish_compass_calibration()
+                self._handle_message(message, latency.now_s())
         except ValueError:
-            self._logger.error('No binary message received')
-            return False
-
-        parsed = parse_binary(message)
-        if parsed is None:
-            return False
-        self._handle_binary(parsed)
-        return True
+            self._logger.error('No message received')
 
-    @staticmethod
-    def _timestamp(dt):
-        """Computes the Unix timestamp from a datetime object. This is needed
-        because Python < 3.2 doesn't have .timestamp built in.
+    def _handle_message(self, message, monotonic_s=None):
+        """Handles a single NMEA sentence or binary frame. monotonic_s is
+        when it was read.
         """
-        return (dt - datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)) \
-            / datetime.timedelta(seconds=1)
+        if isinstance(message, str):
+            try:
+                # The demultiplexer drops sentences without a valid checksum
+                sentence = nmea.parse(message, validate=False)
+            except ValueError:
+                return
+            if isinstance(sentence, nmea.RmcMessage):
+                self._handle_rmc(sentence, monotonic_s)
+            elif isinstance(sentence, (nmea.GsaMessage, nmea.GgaMessage)):
+                self._hdop = sentence.hdop
+            return
+
+        if message[4] == 0xA8:
+            self._handle_navigation(parse_navigation(message), monotonic_s)
+        elif message[4] == 0xCF:
+            self._handle_binary(parse_binary(message), monotonic_s)
 
     def _handle_gprmc(self, gprmc_message):
         """Handles GPRMC (recommended minimum specific GNSS data) messages."""
-        parts = gprmc_message.split(',')
-        latitude_str = parts[3]
-        longitude_str = parts[5]
+        self._handle_rmc(nmea.parse_rmc(gprmc_message))
 
-        decimal_index = latitude_str.find('.')
-        latitude_degrees = float(latitude_str[:decimal_index - 2])
-        latitude_minutes = float(latitude_str[decimal_index - 2:])
-
-        decimal_index = longitude_str.find('.')
-        longitude_degrees = float(longitude_str[:decimal_index - 2])
-        longitude_minutes = float(longitude_str[decimal_index - 2:])
-
-        latitude = latitude_degrees + latitude_minutes / 60.0
-        longitude = longitude_degrees + longitude_minutes / 60.0
-        if parts[4] == 'S':
-            latitude = -latitude
-        if parts[6] == 'W':
-            longitude = -longitude
-        speed_knots = float(parts[7])
-        speed_m_s = speed_knots * 0.514444444
-        course = float(parts[8])
+    def _handle_rmc(self, rmc_message, monotonic_s=None):
+        """Handles parsed RMC messages."""
+        course = rmc_message.course_d
         # Below a certain speed, the module uses the compass to determine
         # course, which is not calibrated, so we need to use our own value.
-        if speed_m_s < COMPASS_SPEED_CUTOFF_M_S:
+        if rmc_message.speed_m_s < COMPASS_SPEED_CUTOFF_M_S:
             course = self._last_compass_heading_d
 
-        time_ = parts[1]
-        hours = int(time_[0:2])
-        minutes = int(time_[2:4])
-        seconds = float(time_[4:])
-        date = parts[9]
-        day = int(date[0:2])
-        month = int(date[2:4])
-        year = int(date[4:]) + 2000
-        # datetime doesn't do float seconds, so we need to fudge it later
-        datetime_ = datetime.datetime(
-            year,
-            month,
-            day,
-            hours,
-            minutes,
-            0,
-            tzinfo=pytz.utc
-        )
-        timestamp_s = self._timestamp(datetime_) + seconds
-
         self._telemetry.gps_reading(
-            latitude,
-            longitude,
+            rmc_message.latitude_d,
+            rmc_message.longitude_d,
             self._hdop * 5.0,  # This is a guess. Smaller HDOP is more precise.
             course,
-            speed_m_s,
-            timestamp_s,
-            'sup800f'
+            rmc_message.speed_m_s,
+            rmc_message.timestamp_s,
+            'sup800f',
+            monotonic_s=monotonic_s
         )
 
     def _handle_gpgsa(self, gpgsa_message):
         """Handles GSA (GNSS DOP and active satellites) messages."""
-        # $GPGSA,A,3,23,03,26,09,27,16,22,31,,,,,1.9,1.1,1.5*31\r\n
-        # type, mode M=manual or A=automatic, fix type 1=N/A 2=2D 3=3D,
-        # satellites used 1-12, PDOP, HDOP, VDOP + checksum
-        parts = gpgsa_message.split(',')
-        #pdop = float(parts[-3])
-        hdop = float(parts[-2])
-        #vdop = float(parts[-1].split('*')[0])
-        self._hdop = hdop
+        self._hdop = nmea.parse_gsa(gpgsa_message).hdop
+
+    def _handle_navigation(self, navigation_message, monotonic_s=None):
+        """Handles binary navigation data messages."""
+        if navigation_message.fix_mode == 0:
+            return
+        self._hdop = navigation_message.hdop
+        course = navigation_message.heading_d
+        # Below a certain speed, the heading from the velocity is mostly
+        # noise, so use our own value
+        if navigation_message.speed_m_s < COMPASS_SPEED_CUTOFF_M_S:
+            course = self._last_compass_heading_d
 
-    def _handle_binary(self, message):
+        self._telemetry.gps_reading(
+            navigation_message.latitude_d,
+            navigation_message.longitude_d,
+            self._hdop * 5.0,  # This is a guess. Smaller HDOP is more precise.
+            course,
+            navigation_message.speed_m_s,
+            navigation_message.timestamp_s,
+            'sup800f',
+            monotonic_s=monotonic_s
+        )
+
+    def _handle_binary(self, message, monotonic_s=None):
         """Handles properietary SUP800F binary messages."""
         if message is None:
             return
-        flux_x = float(message.magnetic_flux_ut_x - self._compass_offsets[0])
-        flux_y = float(message.magnetic_flux_ut_y - self._compass_offsets[1])
+        if self._calibrate_compass_end_time is not None:
+            # We should be driving in circles, so the readings are only
+            # used for calibration
+            self._flux_samples.append(
+                message.magnetic_flux_ut_x,
+                message.magnetic_flux_ut_y
+            )
+            return
+
+        calibration = self._compass_calibration
+        flux_x, flux_y = calibration.correct(
+            message.magnetic_flux_ut_x,
+            message.magnetic_flux_ut_y
+        )
         if flux_x == 0.0:
             # TODO: Figure out what to do here
             return
@@ -249,8 +220,10 @@ class Sup800fTelemetry(threading.Thread):
         )
         magnitude = flux_x ** 2 + flux_y ** 2
         std_devs_away = abs(
-            self._magnitude_mean - magnitude
-        ) / self._magnitude_std_dev
+            calibration.magnitude_mean - magnitude
+        ) / max(calibration.magnitude_std_dev, MIN_MAGNITUDE_STD_DEV)
+        # Rejected readings count too, otherwise the spread would shrink
+        calibration.update_magnitude(magnitude)
         # In a normal distribution, 95% of readings should be within 2 std devs
         if std_devs_away > 2.0:
             self._dropped_compass_messages += 1
@@ -275,14 +248,16 @@ class Sup800fTelemetry(threading.Thread):
         self._telemetry.compass_reading(
             self._last_compass_heading_d,
             confidence,
-            'sup800f'
+            'sup800f',
+            monotonic_s=monotonic_s
         )
 
         self._telemetry.accelerometer_reading(
             message.acceleration_g_x,
             message.acceleration_g_y,
             message.acceleration_g_z,
-            'sup800f'
+            'sup800f',
+            monotonic_s=monotonic_s
         )
 
     def kill(self):
@@ -292,67 +267,55 @@ class Sup800fTelemetry(threading.Thread):
     def calibrate_compass(self, seconds):
         """Requests that the car calibrate the compasss."""
         if self._calibrate_compass_end_time is None:
+            self._logger.info('Calibrating compass')
+            self._flux_samples.clear()
             self._calibrate_compass_end_time = time.time() + seconds
         else:
             self._logger.warn('Compass is already being calibrated')
 
-    def _calibrate_compass(self):
-        """Calibrates the compass."""
-        self._logger.info('Calibrating compass; setting to binary mode')
-        switch_to_binary_mode(self._serial)
-        self._nmea_mode = False
-        for _ in range(10):
-            self._serial.readline()
-
-        maxes = [-float('inf')] * 2
-        mins = [float('inf')] * 2
-        flux_readings = []
-        # We should be driving for this long
-        while time.time() < self._calibrate_compass_end_time:
-            data = get_message(self._serial)
+    def _finish_compass_calibration(self):
+        """Fits the compass calibration to the readings that were collected
+        while calibrating.
+        """
+        self._calibrate_compass_end_time = None
+        samples = self._flux_samples.samples()
+        try:
+            calibration = CompassCalibration.fit(samples)
+        except ValueError as ve:
+            self._logger.warn(
+                'Unable to fit compass readings, only using offsets: {}'.format(
+                    ve
+                )
+            )
             try:
-                binary = parse_binary(data)
+                calibration = CompassCalibration.fit_offsets(samples)
             except ValueError as ve:
-                self._logger.info(
-                    'Unable to parse binary message {}: {}'.format(
-                        data,
-                        ve
-                    )
+                self._logger.warn(
+                    'Unable to fit compass offsets, keeping the previous'
+                    ' calibration: {}'.format(ve)
                 )
-                continue
-            # TODO: This should never be None, see comment in sup800f.py
-            if binary is None:
-                continue
-            flux_values = (
-                binary.magnetic_flux_ut_x,
-                binary.magnetic_flux_ut_y,
-            )
-            maxes = [max(a, b) for a, b in zip(maxes, flux_values)]
-            mins = [min(a, b) for a, b in zip(mins, flux_values)]
-            flux_readings.append(flux_values)
+                return
+        self._compass_calibration = calibration
 
-        self._compass_offsets = [
-            (max_ + min_) * 0.5 for max_, min_ in zip(maxes, mins)
-        ]
         self._logger.info(
-            'Compass calibrated, offsets are {}'.format(
-                [round(i, 2) for i in self._compass_offsets]
+            'Compass calibrated from {} readings, offsets are {},'
+            ' transform is {}'.format(
+                len(samples),
+                [round(i, 2) for i in calibration.offsets],
+                [[round(i, 3) for i in row] for row in calibration.transform]
             )
         )
-        total_magnitudes = numpy.array([
-            (x - self._compass_offsets[0]) ** 2 +
-            (y - self._compass_offsets[1]) ** 2
-            for x, y in flux_readings
-        ])
-        self._magnitude_mean = total_magnitudes.mean()
-        self._magnitude_std_dev = total_magnitudes.std()
         self._logger.info(
             'Magnitudes mean: {}, standard deviation: {}'.format(
-                round(self._magnitude_mean, 3),
-                round(self._magnitude_std_dev, 3)
+                round(calibration.magnitude_mean, 3),
+                round(calibration.magnitude_std_dev, 3)
             )
         )
 
-        self._calibrate_compass_end_time = None
-        switch_to_nmea_mode(self._serial)
-        self._nmea_mode = True
+        if self._calibration_file_name is not None:
+            try:
+                calibration.save(self._calibration_file_name)
+            except EnvironmentError as env:
+                self._logger.warn(
+                    'Unable to save compass calibration: {}'.format(env)
+                )
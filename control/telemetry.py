@@ -7,11 +7,18 @@ import json
 import math
 import os
 import re
+import numpy
 import threading
 
+from control import projection
+from control.course_index import CourseIndex
 from control.location_filter import LocationFilter
+from control.run_log import RunLog
 from control.synchronized import synchronized
+from control.telemetry_snapshot import TelemetrySnapshot
 from messaging import config
+from messaging import latency
+from messaging import telemetry_codec
 from messaging.message_consumer import consume_messages
 from messaging.async_logger import AsyncLogger
 
@@ -29,6 +36,11 @@ STEERING_CHANGE_PER_S = 1.0 / FULL_TURN_TIME_S
 ZERO_TO_TOP_S = 5.0
 THROTTLE_CHANGE_PER_S = 1.0 / ZERO_TO_TOP_S
 MAX_SPEED_M_S = 4.5
+# Converts between latitude and longitude and x_m and y_m offsets
+PROJECTION = projection.LocalTangentPlane(CENTRAL_LATITUDE, CENTRAL_LONGITUDE)
+# Values for Tamiya Grasshopper, from observation. This is at .5 throttle, but
+# we turn faster at higher speeds.
+BASE_MAX_TURN_RATE_D_S = 150.0
 
 
 class Telemetry(object):
@@ -36,12 +48,12 @@ class Telemetry(object):
     the current command direction, anomalous value filtering and interpolation
     to provide more accurate readings than just raw data dumps.
     """
-    EQUATORIAL_RADIUS_M = 6378.1370 * 1000
-    M_PER_D_LATITUDE = EQUATORIAL_RADIUS_M * 2.0 * math.pi / 360.0
+    EQUATORIAL_RADIUS_M = projection.EQUATORIAL_RADIUS_M
+    M_PER_D_LATITUDE = projection.M_PER_D_LATITUDE
     HISTORICAL_SPEED_READINGS_COUNT = 10
     HISTORICAL_ACCELEROMETER_READINGS_COUNT = 5
 
-    def __init__(self, kml_file_name=None):
+    def __init__(self, kml_file_name=None, snapshot_file_name=None):
         self._data = {}
         self._logger = AsyncLogger()
         self._speed_history = collections.deque()
@@ -57,12 +69,39 @@ class Telemetry(object):
         self._target_steering = 0.0
         self._target_throttle = 0.0
 
+        # When the newest reading that updated the location filter was
+        # taken, for latency tracking
+        self._latency = latency.LatencyRecorder()
+        self._run_log = RunLog()
+        self._reading_monotonic_s = None
+        # Set whenever a reading updates the location filter, so that the
+        # control loop can wake up right away instead of polling
+        self._update_events = []
+
+        # Readers that don't need dead reckoning updates, like the monitor,
+        # read this instead of contending on the lock
+        self._snapshot = None
+        if snapshot_file_name is not None:
+            try:
+                self._snapshot = TelemetrySnapshot(snapshot_file_name)
+            except EnvironmentError as exc:
+                self._logger.warn(
+                    'Unable to share telemetry snapshot in {}: {}'.format(
+                        snapshot_file_name,
+                        exc
+                    )
+                )
+        if self._snapshot is None:
+            self._snapshot = TelemetrySnapshot()
+        self._publish_snapshot()
+
         self._ignored_points = collections.defaultdict(lambda: 0)
         self._ignored_points_thresholds = collections.defaultdict(lambda: 10)
 
         consume = lambda: consume_messages(
             config.TELEMETRY_EXCHANGE,
-            self._handle_message
+            self._handle_message,
+            raw=True
         )
         thread = threading.Thread(target=consume)
         thread.name = '{}:consume_messages:{}'.format(
@@ -72,6 +111,7 @@ class Telemetry(object):
         thread.start()
 
         self._course_m = None
+        self._course_index = None
         try:
             if kml_file_name is not None:
                 self.load_kml_from_file_name(kml_file_name)
@@ -117,21 +157,49 @@ class Telemetry(object):
         values['heading_d'] = self._location_filter.estimated_heading()
         x_m, y_m = self._location_filter.estimated_location()
         values['x_m'], values['y_m'] = x_m, y_m
-        latitude = self.offset_y_m_to_latitude(y_m)
-        self._logger.debug(
-            'Estimates: {}'.format(
-                json.dumps({
-                    'latitude_d': self.offset_y_m_to_latitude(y_m),
-                    'longitude_d': self.offset_x_m_to_longitude(x_m, latitude),
-                    'heading_d': values['heading_d'],
-                    'device_id': 'estimate'
-                })
-            )
-        )
+
+        def estimates():
+            """Returns the estimates as JSON for logging."""
+            latitude = self.offset_y_m_to_latitude(y_m)
+            return json.dumps({
+                'latitude_d': latitude,
+                'longitude_d': self.offset_x_m_to_longitude(x_m, latitude),
+                'heading_d': values['heading_d'],
+                'device_id': 'estimate'
+            })
+
+        self._logger.debug('Estimates: {}', estimates)
         values['throttle'] = self._estimated_throttle
         values['steering'] = self._estimated_steering
+        self._snapshot.write(
+            x_m,
+            y_m,
+            values['heading_d'],
+            values['speed_m_s'],
+            values['throttle'],
+            values['steering']
+        )
         return values
 
+    def get_snapshot(self):
+        """Returns the most recently published estimates without taking the
+        lock or updating the dead reckoning. The returned dictionary has
+        x_m, y_m, heading_d, speed_m_s, throttle, steering and timestamp_s.
+        """
+        return self._snapshot.read()
+
+    def _publish_snapshot(self):
+        """Publishes the current estimates to the snapshot."""
+        x_m, y_m = self._location_filter.estimated_location()
+        self._snapshot.write(
+            x_m,
+            y_m,
+            self._location_filter.estimated_heading(),
+            self._location_filter.estimated_speed(),
+            self._estimated_throttle,
+            self._estimated_steering
+        )
+
     @synchronized
     def process_drive_command(self, throttle, steering):
         """Process a drive command. When the command module tells the car to do
@@ -146,11 +214,31 @@ class Telemetry(object):
         self._target_throttle = throttle
 
     def _handle_message(self, message):
-        """Stores telemetry data from messages received from some source."""
-        original_message = message
-        message = json.loads(original_message)
-        if 'speed_m_s' in message and message['speed_m_s'] <= MAX_SPEED_M_S:
-            self._speed_history.append(message['speed_m_s'])
+        """Stores telemetry data from messages received from some source.
+        Messages can be binary telemetry records or JSON strings.
+        """
+        raw_message = message
+        message = telemetry_codec.decode(raw_message)
+        monotonic_s = message.pop('monotonic_s', None)
+        self._latency.record(latency.CONSUMER, monotonic_s)
+        # Record before handling, because handling adds the GPS offsets
+        self._run_log.write_reading(message)
+
+        def original_message():
+            """Returns the message as JSON for logging. The analysis scripts
+            parse the JSON out of the log, so always log JSON, regardless of
+            the wire format.
+            """
+            if telemetry_codec.is_binary(raw_message):
+                return json.dumps(message)
+            elif isinstance(raw_message, bytes):
+                return raw_message.decode('utf-8')
+            return raw_message
+
+        # iPhone sometimes produces null if there is no speed fix yet
+        speed_m_s = message.get('speed_m_s')
+        if speed_m_s is not None and speed_m_s <= MAX_SPEED_M_S:
+            self._speed_history.append(speed_m_s)
             while len(self._speed_history) > self.HISTORICAL_SPEED_READINGS_COUNT:
                 self._speed_history.popleft()
 
@@ -160,6 +248,8 @@ class Telemetry(object):
                 message['compass_d'],
                 message['confidence']
             )
+            self._filter_updated(monotonic_s)
+            self._publish_snapshot()
             self._logger.debug(original_message)
 
         elif 'acceleration_g_z' in message:
@@ -171,19 +261,51 @@ class Telemetry(object):
             self._logger.debug(original_message)
 
         elif 'latitude_d' in message:
-            if message['speed_m_s'] < MAX_SPEED_M_S:
+            # Log before handling, because handling adds the offsets
+            self._logger.debug(original_message)
+            if speed_m_s is None or speed_m_s < MAX_SPEED_M_S:
                 self._handle_gps_message(message)
+                self._filter_updated(monotonic_s)
+                self._publish_snapshot()
 
             self._data = message
-            self._logger.debug(original_message)
 
         elif 'load_waypoints' in message:
             self.load_kml_from_file_name(message['load_waypoints'])
 
         else:
-            self._logger.debug(
-                'Unexpected message: {}'.format(original_message)
-            )
+            self._logger.debug('Unexpected message: {}', original_message)
+
+    def _filter_updated(self, monotonic_s):
+        """Records that a reading taken at monotonic_s updated the location
+        filter and wakes up anyone waiting for updates.
+        """
+        for event in self._update_events:
+            event.set()
+        if monotonic_s is None:
+            return
+        self._latency.record(latency.FILTER, monotonic_s)
+        self._reading_monotonic_s = monotonic_s
+
+    def add_update_event(self, event):
+        """Adds a threading.Event to set whenever a reading updates the
+        location filter.
+        """
+        # Replace the list instead of modifying it, because the consumer
+        # thread iterates over it
+        self._update_events = self._update_events + [event]
+
+    def remove_update_event(self, event):
+        """Stops setting an event that was added with add_update_event."""
+        self._update_events = [
+            other for other in self._update_events if other is not event
+        ]
+
+    def get_reading_monotonic_s(self):
+        """Returns when the newest reading that updated the location filter
+        was taken, from latency.now_s, or None if that's not known.
+        """
+        return self._reading_monotonic_s
 
     def _handle_gps_message(self, message):
         """Handles a GPS telemetry message."""
@@ -210,8 +332,9 @@ class Telemetry(object):
                 # think any of my sources report both right now.
                 message['accuracy_m'],
                 message['accuracy_m'],
-                message['heading_d'],
-                message['speed_m_s']
+                message.get('heading_d'),
+                message.get('speed_m_s'),
+                message.get('timestamp_s')
             )
         else:
             self._ignored_points[device] += 1
@@ -225,9 +348,7 @@ class Telemetry(object):
                 self._ignored_points[device] = 0
                 self._ignored_points_thresholds[device] += 10
             else:
-                self._logger.debug(
-                    'Ignoring out of bounds point: {}'.format(point_m)
-                )
+                self._logger.debug('Ignoring out of bounds point: {}', point_m)
 
             # In general, I've found that speed and heading readings tend
             # to be fairly accurate, even if the actual coordinates are
@@ -245,9 +366,8 @@ class Telemetry(object):
                         )
                     else:
                         self._logger.debug(
-                            'Ignoring too high of speed value: {}'.format(
-                                speed_m_s
-                            )
+                            'Ignoring too high of speed value: {}',
+                            speed_m_s
                         )
 
     @synchronized
@@ -285,6 +405,13 @@ class Telemetry(object):
         else:
             with open(kml_file_name) as stream:
                 self._course_m = self._load_kml_from_stream(stream)
+        if self._course_m is None:
+            self._course_index = None
+        else:
+            self._course_index = CourseIndex(
+                self._course_m['course'],
+                self._course_m['inner']
+            )
 
     def _update_estimated_drive(self):
         """Updates the estimations of the drive state, e.g. the current
@@ -298,9 +425,6 @@ class Telemetry(object):
             self._location_filter.manual_throttle(
                 self._estimated_throttle * MAX_SPEED_M_S
             )
-        # Values for Tamiya Grasshopper, from observation. This is at .5
-        # throttle, but we turn faster at higher speeds.
-        BASE_MAX_TURN_RATE_D_S = 150.0
         # We always update the steering change, because we don't have sensors
         # to get estimates for it from other sources for our Kalman filter
         if self._estimated_throttle > 0:
@@ -316,6 +440,17 @@ class Telemetry(object):
 
     def _load_kml_from_stream(self, kml_stream):
         """Loads the course boundaries from a KML file."""
+        course = Telemetry.course_from_kml_stream(kml_stream)
+        if course is None:
+            self._logger.warn('Not a KML file')
+        return course
+
+    @staticmethod
+    def course_from_kml_stream(kml_stream):
+        """Loads the course boundaries from a KML file. Returns a dict with
+        the course boundary points under 'course' and a list of inner
+        obstacle polygons under 'inner', or None if it's not a KML file.
+        """
         course = collections.defaultdict(lambda: [])
 
         def get_child(element, tag_name):
@@ -327,7 +462,6 @@ class Telemetry(object):
 
         root = parser.parse(kml_stream).getroot()
         if 'kml' not in root.tag:
-            self._logger.warn('Not a KML file')
             return None
 
         document = get_child(root, 'Document')
@@ -344,19 +478,7 @@ class Telemetry(object):
             bound = get_child(polygon, 'outerBoundaryIs')
             ring = get_child(bound, 'LinearRing')
             coordinates = get_child(ring, 'coordinates')
-            waypoints = []
-            text = coordinates.text.strip()
-            for csv in re.split(r'\s', text):
-                (
-                    longitude,
-                    latitude,
-                    altitude  # pylint: disable=unused-variable
-                ) = csv.split(',')
-
-                waypoints.append((
-                    Telemetry.longitude_to_m_offset(float(longitude), float(latitude)),
-                    Telemetry.latitude_to_m_offset(float(latitude)),
-                ))
+            waypoints = Telemetry.kml_coordinates_to_m(coordinates.text)
 
             if str(placemark.name).startswith('course'):
                 course['course'] = waypoints
@@ -366,14 +488,9 @@ class Telemetry(object):
         return course
 
     def _m_point_in_course(self, point_m):
-        if self._course_m is None:
+        if self._course_index is None:
             return True
-        if not self.point_in_polygon(point_m, self._course_m['course']):
-            return False
-        for inner in self._course_m['inner']:
-            if self.point_in_polygon(point_m, inner):
-                return False
-        return True
+        return self._course_index.contains(point_m)
 
     @staticmethod
     def rotate_radians_clockwise(point, radians):
@@ -405,32 +522,14 @@ class Telemetry(object):
     @classmethod
     def latitude_to_m_per_d_longitude(cls, latitude_d, cache=None):
         """Returns the number of meters per degree longitude at a given
-        latitude.
+        latitude. The value is always calculated exactly, so cache is
+        ignored. Coordinate offsets use the projection's scale for the
+        central latitude instead.
         """
-        def calculate(latitude_d):
-            """Calculates the number of meters per degree longitude at a
-            given latitude.
-            """
-            radius_m = \
-                math.cos(math.radians(latitude_d)) * cls.EQUATORIAL_RADIUS_M
-            circumference_m = 2.0 * math.pi * radius_m
-            return circumference_m / 360.0
-
-        if cache is not None and cache:
-            return calculate(latitude_d)
-
-        if 'cache' not in Telemetry.latitude_to_m_per_d_longitude.__dict__:
-            Telemetry.latitude_to_m_per_d_longitude.__dict__['cache'] = [
-                latitude_d,
-                calculate(latitude_d)
-            ]
-
-        cache = Telemetry.latitude_to_m_per_d_longitude.cache
-        if cache is not None and latitude_d - 0.1 < cache[0] < latitude_d + 0.1:
-            return cache[1]
-        cache[0] = latitude_d
-        cache[1] = calculate(latitude_d)
-        return cache[1]
+        # pylint: disable=unused-argument
+        return projection.LocalTangentPlane.calculate_m_per_d_longitude(
+            latitude_d
+        )
 
     @classmethod
     def distance_m(
@@ -536,28 +635,38 @@ class Telemetry(object):
             diff_d = 360.0 - diff_d
         return diff_d
 
-    @classmethod
-    def latitude_to_m_offset(cls, latitude_d):
+    @staticmethod
+    def latitude_to_m_offset(latitude_d):
         """Returns the offset in meters for a given coordinate."""
-        y_m = cls.m_per_d_latitude() * (latitude_d - CENTRAL_LATITUDE)
-        return y_m
+        return PROJECTION.latitude_to_y_m(latitude_d)
 
-    @classmethod
-    def longitude_to_m_offset(cls, longitude_d, latitude_d):
+    @staticmethod
+    def longitude_to_m_offset(longitude_d, latitude_d):
         """Returns the offset in meters for a given coordinate."""
-        x_m = cls.latitude_to_m_per_d_longitude(latitude_d) * (longitude_d - CENTRAL_LONGITUDE)
-        return x_m
+        return PROJECTION.longitude_to_x_m(longitude_d, latitude_d)
 
-    @classmethod
-    def offset_y_m_to_latitude(cls, y_m):
+    @staticmethod
+    def offset_y_m_to_latitude(y_m):
         """Returns the inverse of latitude_to_m_offset."""
-        return y_m / cls.m_per_d_latitude() + CENTRAL_LATITUDE
+        return PROJECTION.y_m_to_latitude(y_m)
 
-    @classmethod
-    def offset_x_m_to_longitude(cls, x_m, latitude_d):
+    @staticmethod
+    def offset_x_m_to_longitude(x_m, latitude_d):
         """Returns the inverse of longitude_to_m_offset."""
-        distance = cls.latitude_to_m_per_d_longitude(latitude_d)
-        return x_m / distance + CENTRAL_LONGITUDE
+        return PROJECTION.x_m_to_longitude(x_m, latitude_d)
+
+    @staticmethod
+    def kml_coordinates_to_m(text):
+        """Converts the text of a KML coordinates element, which has
+        whitespace separated longitude,latitude,altitude triples, to a list
+        of (x_m, y_m) points.
+        """
+        coordinates = numpy.array(
+            re.split(r'[\s,]+', text.strip()),
+            dtype=float
+        ).reshape((-1, 3))
+        x_m, y_m = PROJECTION.to_m(coordinates[:, 1], coordinates[:, 0])
+        return list(zip(x_m.tolist(), y_m.tolist()))
 
     @staticmethod
     def distance_to_waypoint(heading_d_1, heading_d_2, distance_travelled):
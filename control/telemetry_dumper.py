@@ -1,41 +1,48 @@
-"""Dumps telemetry data to the websocket handler for broadcast to all
-clients.
+"""Dumps telemetry data to the telemetry stream for broadcast to all
+websocket clients.
 """
 
 import threading
-import time
+
+from monitor.telemetry_stream import MAX_INTERVAL_S
 
 
 class TelemetryDumper(threading.Thread):
-    """Dumps telemetry data to the websocket handler for broadcast to all
-    clients.
+    """Dumps telemetry data to the telemetry stream for broadcast to all
+    websocket clients. Telemetry is published whenever a reading updates the
+    location filter, and at least every sleep_seconds.
     """
 
     def __init__(
         self,
         telemetry,
         waypoint_generator,
-        web_socket_handler,
+        telemetry_stream,
         sleep_seconds=None
     ):
         super(TelemetryDumper, self).__init__()
         self.name = self.__class__.__name__
         self._telemetry = telemetry
         self._waypoint_generator = waypoint_generator
-        self._web_socket_handler = web_socket_handler
+        self._telemetry_stream = telemetry_stream
         if sleep_seconds is None:
-            self._sleep_seconds = 0.5
+            # Publish twice as often as the slowest client rate, so that
+            # timing jitter doesn't make slow clients skip a frame
+            self._sleep_seconds = MAX_INTERVAL_S * 0.5
         else:
             self._sleep_seconds = sleep_seconds
+        self._updated = threading.Event()
+        self._telemetry.add_update_event(self._updated)
         self._run = True
 
     def run(self):
         """Runs in a thread."""
         while self._run:
             try:
-                time.sleep(self._sleep_seconds)
+                self._updated.wait(self._sleep_seconds)
+                self._updated.clear()
                 # TODO(2015-01-04) Include waypoint and raw sensor data too
-                data = self._telemetry.get_data()
+                data = self._telemetry.get_snapshot()
                 data['throttle'] = self._telemetry._target_throttle  # pylint: disable=protected-access
                 data['steering'] = self._telemetry._target_steering  # pylint: disable=protected-access
                 data['compass_calibrated'] = 'unknown'
@@ -44,10 +51,11 @@ class TelemetryDumper(threading.Thread):
                 data['waypoint_x_m'] = x_m
                 data['waypoint_y_m'] = y_m
 
-                self._web_socket_handler.broadcast_telemetry(data)
+                self._telemetry_stream.publish(data)
             except:  # pylint: disable=bare-except
                 pass
 
     def kill(self):
         """Stops the thread."""
         self._run = False
+        self._updated.set()
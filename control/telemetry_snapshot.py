@@ -0,0 +1,127 @@
+"""Lock free snapshot of the most recent telemetry estimates.
+
+Telemetry publishes its estimates here after every filter update, and readers
+such as the web monitor copy them out without taking the Telemetry lock. The
+record is protected by a sequence counter (a seqlock): the writer makes the
+counter odd before writing and even again afterwards, and readers retry if
+the counter was odd or changed while they were copying.
+
+The record lives in an mmap. If a file name is given, other processes can map
+the same file and read the record with the layout in RECORD_FORMAT, e.g. in
+Rust as a struct of a u64 followed by seven f64 values.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+
+RECORD_FORMAT = ''.join((
+    '=',  # native byte order, standard sizes, no padding
+    'Q',  # sequence number, odd while the record is being written
+    'd',  # x_m
+    'd',  # y_m
+    'd',  # heading_d
+    'd',  # speed_m_s
+    'd',  # throttle
+    'd',  # steering
+    'd',  # timestamp_s, when the estimates were published
+))
+FIELDS = (
+    'x_m',
+    'y_m',
+    'heading_d',
+    'speed_m_s',
+    'throttle',
+    'steering',
+    'timestamp_s',
+)
+
+_SEQUENCE = struct.Struct(RECORD_FORMAT[:2])
+_VALUES = struct.Struct('=' + RECORD_FORMAT[2:])
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+
+class TelemetrySnapshot(object):
+    """Seqlock protected, mmap backed record of the latest estimates."""
+
+    def __init__(self, file_name=None, create=None):
+        """Maps the snapshot. Without a file name, the snapshot is only
+        shared between threads. With a file name, the file is created and
+        truncated if create is True, and otherwise must already exist.
+        """
+        if create is None:
+            create = True
+        self._file_name = file_name
+        self._write_lock = threading.Lock()
+        if file_name is None:
+            self._buffer = mmap.mmap(-1, RECORD_SIZE)
+        else:
+            flags = os.O_RDWR
+            if create:
+                flags |= os.O_CREAT
+            file_descriptor = os.open(file_name, flags, 0o644)
+            try:
+                if create:
+                    os.ftruncate(file_descriptor, 0)
+                    os.ftruncate(file_descriptor, RECORD_SIZE)
+                self._buffer = mmap.mmap(file_descriptor, RECORD_SIZE)
+            finally:
+                os.close(file_descriptor)
+
+    def write(
+            self,
+            x_m,
+            y_m,
+            heading_d,
+            speed_m_s,
+            throttle,
+            steering,
+            timestamp_s=None
+    ):
+        """Publishes new estimates."""
+        if timestamp_s is None:
+            timestamp_s = time.time()
+        with self._write_lock:
+            sequence = _SEQUENCE.unpack_from(self._buffer, 0)[0]
+            _SEQUENCE.pack_into(self._buffer, 0, sequence + 1)
+            try:
+                _VALUES.pack_into(
+                    self._buffer,
+                    _SEQUENCE.size,
+                    x_m,
+                    y_m,
+                    heading_d,
+                    speed_m_s,
+                    throttle,
+                    steering,
+                    timestamp_s
+                )
+            finally:
+                # Always leave the sequence even, or readers will spin forever
+                _SEQUENCE.pack_into(self._buffer, 0, sequence + 2)
+
+    def read_values(self):
+        """Returns a consistent tuple of the values in FIELDS order."""
+        while True:
+            before = _SEQUENCE.unpack_from(self._buffer, 0)[0]
+            if before & 1:
+                # A write is in progress
+                time.sleep(0)
+                continue
+            values = _VALUES.unpack_from(self._buffer, _SEQUENCE.size)
+            if _SEQUENCE.unpack_from(self._buffer, 0)[0] == before:
+                return values
+
+    def read(self):
+        """Returns a consistent dictionary of the most recent estimates."""
+        return dict(zip(FIELDS, self.read_values()))
+
+    def sequence(self):
+        """Returns the sequence number, which increases with every write."""
+        return _SEQUENCE.unpack_from(self._buffer, 0)[0]
+
+    def close(self):
+        """Unmaps the snapshot."""
+        self._buffer.close()
@@ -1,13 +1,24 @@
 """Benchmarks the parts of the system."""
 
+import datetime
+import json
+import math
+import pytz
+import random
 import time
 
+from control import nmea
 from control.command import Command
+from control.course_index import CourseIndex
 from control.simple_waypoint_generator import SimpleWaypointGenerator
 from control.location_filter import LocationFilter
+from control.telemetry import CENTRAL_LATITUDE
+from control.telemetry import CENTRAL_LONGITUDE
+from control.telemetry import PROJECTION
 from control.telemetry import Telemetry
 from control.test.dummy_driver import DummyDriver
 from control.test.dummy_logger import DummyLogger
+from messaging import telemetry_codec
 
 # pylint: disable=invalid-name
 # pylint: disable=protected-access
@@ -36,7 +47,7 @@ def benchmark_location_filter_update_compass():
     iterations = 100
     start = time.time()
     for _ in range(iterations):
-        location_filter.update_compass(20.0)
+        location_filter.update_compass(20.0, 1.0)
     end = time.time()
     print(
         '{} iterations of LocationFilter.update_compass, each took {:.5}'.format(
@@ -92,12 +103,187 @@ def benchmark_command_run_course_iterator():
     )
 
 
+def benchmark_telemetry_codec():
+    """Benchmark encoding and decoding telemetry messages as JSON and as
+    binary records.
+    """
+    iterations = 10000
+    reading = (40.091244, -105.185276, 5.0, 180.0, 2.5, 1471885048.5, 'sup800f')
+    for name, encoder, decoder in (
+            ('JSON', telemetry_codec.JsonEncoder, json.loads),
+            ('binary', telemetry_codec.BinaryEncoder, telemetry_codec.decode),
+    ):
+        start = time.time()
+        for _ in range(iterations):
+            decoder(encoder.gps(*reading))  # pylint: disable=star-args
+        end = time.time()
+        print(
+            '{} iterations of {} GPS encode and decode, each took {:.5}'.format(
+                iterations,
+                name,
+                (end - start) / float(iterations)
+            )
+        )
+
+
+def benchmark_course_index():
+    """Benchmark checking if points are in a detailed course, by walking
+    every polygon and with the prepared course index.
+    """
+    rand = random.Random(0)
+    course = [
+        (
+            200.0 * math.cos(2.0 * math.pi * i / 400),
+            200.0 * math.sin(2.0 * math.pi * i / 400)
+        )
+        for i in range(400)
+    ]
+    inner = []
+    for _ in range(50):
+        center_x, center_y = rand.uniform(-120, 120), rand.uniform(-120, 120)
+        inner.append([
+            (
+                center_x + 5.0 * math.cos(2.0 * math.pi * i / 20),
+                center_y + 5.0 * math.sin(2.0 * math.pi * i / 20)
+            )
+            for i in range(20)
+        ])
+    points = [
+        (rand.uniform(-220, 220), rand.uniform(-220, 220))
+        for _ in range(200)
+    ]
+
+    def point_in_course(point):
+        """The old way of checking points."""
+        if not Telemetry.point_in_polygon(point, course):
+            return False
+        for polygon in inner:
+            if Telemetry.point_in_polygon(point, polygon):
+                return False
+        return True
+
+    index = CourseIndex(course, inner)
+    for name, contains in (
+            ('point_in_polygon', point_in_course),
+            ('CourseIndex', index.contains),
+    ):
+        start = time.time()
+        for point in points:
+            contains(point)
+        end = time.time()
+        print(
+            '{} course checks with {}, each took {:.5}'.format(
+                len(points),
+                name,
+                (end - start) / float(len(points))
+            )
+        )
+
+
+def benchmark_projection():
+    """Benchmark converting coordinates to meters one at a time and as
+    arrays.
+    """
+    rand = random.Random(0)
+    count = 10000
+    latitudes_d = [CENTRAL_LATITUDE + rand.uniform(-0.01, 0.01) for _ in range(count)]
+    longitudes_d = [CENTRAL_LONGITUDE + rand.uniform(-0.01, 0.01) for _ in range(count)]
+
+    def scalar():
+        """Converts one point at a time."""
+        for latitude_d, longitude_d in zip(latitudes_d, longitudes_d):
+            (
+                PROJECTION.longitude_to_x_m(longitude_d, latitude_d),
+                PROJECTION.latitude_to_y_m(latitude_d)
+            )
+
+    for name, convert in (
+            ('scalar', scalar),
+            ('array', lambda: PROJECTION.to_m(latitudes_d, longitudes_d)),
+    ):
+        start = time.time()
+        convert()
+        end = time.time()
+        print(
+            '{} {} coordinate conversions, each took {:.5}'.format(
+                count,
+                name,
+                (end - start) / float(count)
+            )
+        )
+
+
+def _split_parse_gprmc(gprmc_message):
+    """The split and pytz datetime parsing that Sup800fTelemetry used to
+    do, kept for comparison.
+    """
+    parts = gprmc_message.split(',')
+    latitude_str = parts[3]
+    longitude_str = parts[5]
+
+    decimal_index = latitude_str.find('.')
+    latitude = float(latitude_str[:decimal_index - 2]) \
+        + float(latitude_str[decimal_index - 2:]) / 60.0
+    decimal_index = longitude_str.find('.')
+    longitude = float(longitude_str[:decimal_index - 2]) \
+        + float(longitude_str[decimal_index - 2:]) / 60.0
+    if parts[4] == 'S':
+        latitude = -latitude
+    if parts[6] == 'W':
+        longitude = -longitude
+    speed_m_s = float(parts[7]) * 0.514444444
+    course = float(parts[8])
+
+    time_ = parts[1]
+    date = parts[9]
+    datetime_ = datetime.datetime(
+        int(date[4:]) + 2000,
+        int(date[2:4]),
+        int(date[0:2]),
+        int(time_[0:2]),
+        int(time_[2:4]),
+        0,
+        tzinfo=pytz.utc
+    )
+    timestamp_s = (
+        (datetime_ - datetime.datetime(1970, 1, 1, tzinfo=pytz.utc))
+        / datetime.timedelta(seconds=1)
+    ) + float(time_[4:])
+    return latitude, longitude, speed_m_s, course, timestamp_s
+
+
+def benchmark_nmea():
+    """Benchmark parsing GPRMC sentences."""
+    sentence = '$GPRMC,111636.932,A,2447.0949,N,12100.5223,E,000.0,000.0,030407,003.9,W,A*12\r\n'
+    iterations = 10000
+    for name, parse in (
+            ('split', _split_parse_gprmc),
+            ('nmea.parse', nmea.parse),
+            ('unvalidated nmea.parse', lambda line: nmea.parse(line, False)),
+    ):
+        start = time.time()
+        for _ in range(iterations):
+            parse(sentence)
+        end = time.time()
+        print(
+            '{} iterations of {} GPRMC parsing, each took {:.5}'.format(
+                iterations,
+                name,
+                (end - start) / float(iterations)
+            )
+        )
+
+
 def main():
     """Runs all the benchmarks."""
     benchmark_location_filter_update_gps()
     benchmark_location_filter_update_compass()
     benchmark_location_filter_update_dead_reckoning()
     benchmark_command_run_course_iterator()
+    benchmark_telemetry_codec()
+    benchmark_course_index()
+    benchmark_projection()
+    benchmark_nmea()
 
 if __name__ == '__main__':
     main()
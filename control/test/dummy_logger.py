@@ -1,31 +1,33 @@
 """Dummy class for Logger interface. A real Logger should have four methods:
-    debug(self, message)
-    info(self, message)
-    warning(self, message)
-    error(self, message)
+    debug(self, message, *args)
+    info(self, message, *args)
+    warning(self, message, *args)
+    error(self, message, *args)
 """
 
+from messaging.async_logger import format_message
+
 # pylint: disable=no-self-use
 
 
 class DummyLogger(object):
     """Implementation of Logger interface for testing."""
-    def debug(self, message):
+    def debug(self, message, *args):
         """Debug message."""
         pass
 
-    def info(self, message):
+    def info(self, message, *args):
         """Info message."""
-        print(message)
+        print(format_message(message, args))
 
-    def warning(self, message):
+    def warning(self, message, *args):
         """Warning message."""
-        print(message)
+        print(format_message(message, args))
 
-    def warn(self, message):
+    def warn(self, message, *args):
         """Warning message."""
-        print(message)
+        print(format_message(message, args))
 
-    def error(self, message):
+    def error(self, message, *args):
         """Error message."""
-        print(message)
+        print(format_message(message, args))
@@ -2,14 +2,19 @@
 methods:
     get_raw_data(self)
     get_data(self)
+    get_snapshot(self)
     process_drive_command(self, throttle, turn)
     is_stopped(self)
+    is_inverted(self)
     handle_message(self, data_dict)
+    add_update_event(self, event)
+    remove_update_event(self, event)
+    get_reading_monotonic_s(self)
 """
 
 import math
-import time
 
+from control.clock import Clock
 from control.telemetry import Telemetry
 from messaging.async_logger import AsyncLogger
 
@@ -20,14 +25,26 @@ class DummyTelemetry(object):
     """Rough simulation of telemetry data."""
     MAX_SPEED_M_S = 4.7  # From observation
 
-    def __init__(self, first_way_point):
+    TURN_D_S = 30.0
+
+    def __init__(self, first_way_point, clock=None, location_filter=None):
+        """If a location filter is provided, the estimates come from running
+        readings passed to handle_message through it. Otherwise, the position
+        is dead reckoned from the drive commands.
+        """
         self._x_m, self._y_m = first_way_point
         self._logger = AsyncLogger()
         self._x_m -= 1000
         self._heading = 0.0
-        self._last_command_time = time.time()
+        if clock is None:
+            clock = Clock()
+        self._clock = clock
+        self._location_filter = location_filter
+        self._last_command_time = self._clock.time()
+        self._last_update_time = self._last_command_time
         self._throttle = 0.0
         self._turn = 0.0
+        self._update_events = []
 
         self.update_count = 1000
 
@@ -37,6 +54,16 @@ class DummyTelemetry(object):
 
     def get_data(self):
         """Returns the estimated telemetry data."""
+        if self._location_filter is not None:
+            self._location_filter.update_dead_reckoning()
+            x_m, y_m = self._location_filter.estimated_location()
+            return {
+                'heading_d': self._location_filter.estimated_heading(),
+                'x_m': x_m,
+                'y_m': y_m,
+                'accelerometer_m_s_s': [],
+                'speed_m_s': self._location_filter.estimated_speed(),
+            }
         self._update_position()
         values = {
             'heading_d': self._heading,
@@ -47,19 +74,39 @@ class DummyTelemetry(object):
         }
         return values
 
+    def get_snapshot(self):
+        """Returns the most recent estimates without updating them."""
+        return {
+            'heading_d': self._heading,
+            'x_m': self._x_m,
+            'y_m': self._y_m,
+            'speed_m_s': self._throttle * self.MAX_SPEED_M_S,
+            'throttle': self._throttle,
+            'steering': self._turn,
+            'timestamp_s': self._last_command_time,
+        }
+
     def process_drive_command(self, throttle, turn):
         """Processes a drive command sent out by the command module."""
         self._throttle = throttle
         self._turn = turn
+        self._last_command_time = self._clock.time()
+        if self._location_filter is not None:
+            self._location_filter.manual_throttle(
+                throttle * self.MAX_SPEED_M_S
+            )
+            self._location_filter.manual_steering(turn * self.TURN_D_S)
 
     def _update_position(self):
         """Updates the position using dead reckoning."""
         self.update_count -= 1
 
-        diff_time_s = 1.0
+        now = self._clock.time()
+        diff_time_s = now - self._last_update_time
+        self._last_update_time = now
 
         if self._throttle > 0.0:
-            self._heading += self._turn * 30.0
+            self._heading += self._turn * self.TURN_D_S * diff_time_s
             self._heading = Telemetry.wrap_degrees(self._heading)
 
             step_m = diff_time_s * self._throttle * self.MAX_SPEED_M_S
@@ -73,8 +120,42 @@ class DummyTelemetry(object):
         """Returns True if the car is stopped."""
         return False
 
+    def is_inverted(self):  # pylint: disable=no-self-use
+        """Returns True if the car is upside down."""
+        return False
+
     def handle_message(self, data_dict):
-        """Handles recent data from the Telemetry module. For the dummy class,
-        we ignore messages.
+        """Handles recent data from the Telemetry module. Messages are ignored
+        unless there's a location filter.
         """
-        pass
+        if self._location_filter is None:
+            return
+        if 'compass_d' in data_dict:
+            self._location_filter.update_compass(data_dict['compass_d'], 1.0)
+        elif 'x_m' in data_dict:
+            self._location_filter.update_gps(
+                data_dict['x_m'],
+                data_dict['y_m'],
+                data_dict['x_accuracy_m'],
+                data_dict['y_accuracy_m'],
+                data_dict['gps_d'],
+                data_dict['speed_m_s']
+            )
+        for event in self._update_events:
+            event.set()
+
+    def add_update_event(self, event):
+        """Adds a threading.Event to set whenever a reading updates the
+        location filter.
+        """
+        self._update_events = self._update_events + [event]
+
+    def remove_update_event(self, event):
+        """Stops setting an event that was added with add_update_event."""
+        self._update_events = [
+            other for other in self._update_events if other is not event
+        ]
+
+    def get_reading_monotonic_s(self):  # pylint: disable=no-self-use
+        """Readings aren't stamped, so this is always None."""
+        return None
@@ -13,6 +13,8 @@ import math
 import threading
 import time
 
+from control.telemetry import Telemetry
+
 
 class DummyTelemetryData(threading.Thread):
     """Dummy class that implements the TelemetryData interface."""
@@ -51,12 +53,13 @@ class DummyTelemetryData(threading.Thread):
         self._x_m = 0.0
         self._y_m = 0.0
         self._heading_d = 0.0
+        self._speed_m_s = 0.0
+        self._compass_bias_d = 0.0
 
     def run(self):
         """Run in a thread, hands raw telemetry readings to telemetry
         instance.
         """
-        from control.telemetry import Telemetry
         # Normally, you'd have a loop that periodically checks for new readings
         # or that blocks until readings are received
         while self._run:
@@ -64,53 +67,63 @@ class DummyTelemetryData(threading.Thread):
                 time.sleep(self._sleep_time_s)
             except Exception:  # pylint: disable=broad-except
                 pass
+            self.step(self._sleep_time_s)
+            self.send_reading()
 
-            speed_m_s = 0.0
-            if self._driver is not None:
-                speed_m_s = self._driver.get_throttle() * self.MAX_SPEED_M_S
-                point_m = (0.0, speed_m_s * self._sleep_time_s)
-                offset_m = Telemetry.rotate_radians_clockwise(
-                    point_m,
-                    math.radians(self._heading_d)
-                )
-                self._x_m += offset_m[0]
-                self._y_m += offset_m[1]
+    def step(self, time_diff_s):
+        """Moves the simulated car according to the driver's commands."""
+        self._speed_m_s = 0.0
+        if self._driver is None:
+            return
+        self._speed_m_s = self._driver.get_throttle() * self.MAX_SPEED_M_S
+        point_m = (0.0, self._speed_m_s * time_diff_s)
+        offset_m = Telemetry.rotate_radians_clockwise(
+            point_m,
+            math.radians(self._heading_d)
+        )
+        self._x_m += offset_m[0]
+        self._y_m += offset_m[1]
 
-                self._heading_d += \
-                    self._driver.get_turn() * self.TURN_D_S * self._sleep_time_s
-                self._heading_d = Telemetry.wrap_degrees(self._heading_d)
+        self._heading_d += \
+            self._driver.get_turn() * self.TURN_D_S * time_diff_s
+        self._heading_d = Telemetry.wrap_degrees(self._heading_d)
 
-            self._iterations += 1
-            if self._iterations % 5 == 0:
-                gps_d = Telemetry.wrap_degrees(
-                    self._random.normalvariate(
-                        self._heading_d,
-                        self.SIGMA_GPS_D
-                    )
+    def send_reading(self):
+        """Sends a noisy reading of the simulated car to the telemetry.
+        Every fifth reading is from the GPS, and the rest are from the
+        compass.
+        """
+        self._iterations += 1
+        if self._iterations % 5 == 0:
+            gps_d = Telemetry.wrap_degrees(
+                self._random.normalvariate(
+                    self._heading_d,
+                    self.SIGMA_GPS_D
                 )
-                self._telemetry.handle_message({
-                    'x_m': self._random.normalvariate(self._x_m, self.SIGMA_M),
-                    'y_m': self._random.normalvariate(self._y_m, self.SIGMA_M),
-                    'x_accuracy_m': self.SIGMA_M,
-                    'y_accuracy_m': self.SIGMA_M,
-                    'speed_m_s': self._random.normalvariate(
-                        speed_m_s,
-                        self.SIGMA_M_S
-                    ),
-                    'gps_d': gps_d,
-                    'accelerometer_m_s_s': (0.0, 0.0, 9.8),
-                })
-            else:
-                compass_d = Telemetry.wrap_degrees(
-                    self._random.normalvariate(
-                        self._heading_d,
-                        self.SIGMA_COMPASS_D
-                    )
+            )
+            self._telemetry.handle_message({
+                'x_m': self._random.normalvariate(self._x_m, self.SIGMA_M),
+                'y_m': self._random.normalvariate(self._y_m, self.SIGMA_M),
+                'x_accuracy_m': self.SIGMA_M,
+                'y_accuracy_m': self.SIGMA_M,
+                'speed_m_s': self._random.normalvariate(
+                    self._speed_m_s,
+                    self.SIGMA_M_S
+                ),
+                'gps_d': gps_d,
+                'accelerometer_m_s_s': (0.0, 0.0, 9.8),
+            })
+        else:
+            compass_d = Telemetry.wrap_degrees(
+                self._random.normalvariate(
+                    self._heading_d + self._compass_bias_d,
+                    self.SIGMA_COMPASS_D
                 )
-                self._telemetry.handle_message({
-                    'compass_d': compass_d,
-                    'accelerometer_m_s_s': (0.0, 0.0, 9.8),
-                })
+            )
+            self._telemetry.handle_message({
+                'compass_d': compass_d,
+                'accelerometer_m_s_s': (0.0, 0.0, 9.8),
+            })
 
     def kill(self):
         """Stops any data collection."""
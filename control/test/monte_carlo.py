@@ -0,0 +1,165 @@
+"""Monte Carlo evaluation of navigation strategies in the simulator.
+
+Each trial drives a lap of a course with a randomized GPS noise, compass
+bias and start pose. Every strategy is run against the same trials, so
+differences between strategies come from the strategies and not from luck.
+Trials are spread across a multiprocessing pool; every worker loads the
+course and builds its waypoint generator once, then reuses it for each of
+its trials.
+"""
+
+import collections
+import multiprocessing
+import numpy
+import random
+
+from control.test.simulator import Simulation
+from control.course_index import CourseIndex
+from control.extension_waypoint_generator import ExtensionWaypointGenerator
+from control.simple_waypoint_generator import SimpleWaypointGenerator
+from control.telemetry import Telemetry
+
+# pylint: disable=invalid-name
+# pylint: disable=no-member
+
+STRATEGIES = collections.OrderedDict((
+    ('simple', SimpleWaypointGenerator),
+    ('extension', ExtensionWaypointGenerator),
+))
+
+# The ranges that trials are drawn from
+GPS_SIGMA_M_RANGE = (1.0, 4.0)
+COMPASS_BIAS_SIGMA_D = 5.0
+START_OFFSET_SIGMA_M = 1.0
+START_HEADING_SIGMA_D = 10.0
+
+DEFAULT_PERCENTILES = (50, 90, 99)
+
+Trial = collections.namedtuple(
+    'Trial',
+    (
+        'seed',
+        'gps_sigma_m',
+        'compass_bias_d',
+        'start_offset_m',
+        'start_heading_offset_d',
+    )
+)
+
+_worker_state = None
+
+
+def random_trials(count, seed=None):
+    """Returns count randomized trials."""
+    rand = random.Random(seed)
+    return [
+        Trial(
+            rand.getrandbits(32),
+            rand.uniform(*GPS_SIGMA_M_RANGE),
+            rand.gauss(0.0, COMPASS_BIAS_SIGMA_D),
+            (
+                rand.gauss(0.0, START_OFFSET_SIGMA_M),
+                rand.gauss(0.0, START_OFFSET_SIGMA_M),
+            ),
+            rand.gauss(0.0, START_HEADING_SIGMA_D),
+        )
+        for _ in range(count)
+    ]
+
+
+def load_course_index(kml_file_name):
+    """Returns a CourseIndex for the course boundaries in a KML file, or None
+    if it doesn't have any.
+    """
+    directory = 'paths/'
+    if not kml_file_name.startswith(directory):
+        kml_file_name = directory + kml_file_name
+    with open(kml_file_name) as stream:
+        course = Telemetry.course_from_kml_stream(stream)
+    if course is None:
+        return None
+    return CourseIndex(course['course'], course['inner'])
+
+
+def _set_worker_state(kml_file_name, strategy, timeout_s):
+    """Loads the course in a worker process, so that it's only done once."""
+    global _worker_state  # pylint: disable=global-statement
+    waypoints = SimpleWaypointGenerator.get_waypoints_from_file_name(
+        kml_file_name
+    )
+    _worker_state = (
+        STRATEGIES[strategy](waypoints),
+        load_course_index(kml_file_name),
+        timeout_s,
+    )
+
+
+def _run_trial(trial):
+    """Runs one trial in a worker process."""
+    waypoint_generator, course_index, timeout_s = _worker_state
+    return Simulation(
+        waypoint_generator,
+        trial.seed,
+        course_index=course_index,
+        gps_sigma_m=trial.gps_sigma_m,
+        compass_bias_d=trial.compass_bias_d,
+        start_offset_m=trial.start_offset_m,
+        start_heading_offset_d=trial.start_heading_offset_d
+    ).run(timeout_s)
+
+
+def evaluate(kml_file_name, strategy, trials, processes=None, timeout_s=None):
+    """Runs every trial with a strategy from STRATEGIES in a multiprocessing
+    pool. processes defaults to the number of CPUs. Returns a list of
+    SimulationResults in the same order as the trials.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError('Unknown strategy: {}'.format(strategy))
+    # The simulator doesn't bind any message sockets, so workers can run
+    # side by side, even on the car
+    pool = multiprocessing.Pool(
+        processes,
+        initializer=_set_worker_state,
+        initargs=(kml_file_name, strategy, timeout_s)
+    )
+    try:
+        return pool.map(_run_trial, trials)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def summarize(results, percentiles=None):
+    """Aggregates SimulationResults. Returns a dict with the fraction of runs
+    that finished and that hit an obstacle, and lists of the given
+    percentiles of the lap time of finished runs, the maximum cross track
+    error and the number of collisions. Lap time percentiles are None if no
+    run finished.
+    """
+    if percentiles is None:
+        percentiles = DEFAULT_PERCENTILES
+    finished = numpy.array([result.finished for result in results])
+    collisions = numpy.array([result.collisions for result in results])
+    lap_times_s = numpy.array(
+        [result.elapsed_s for result in results if result.finished]
+    )
+
+    def percentile_list(values):
+        """Returns the percentiles of values as a list."""
+        if len(values) == 0:
+            return [None] * len(percentiles)
+        return numpy.percentile(values, percentiles).tolist()
+
+    return {
+        'runs': len(results),
+        'finished_fraction': float(finished.mean()) if len(results) else 0.0,
+        'collision_fraction': (
+            float((collisions > 0).mean()) if len(results) else 0.0
+        ),
+        'percentiles': list(percentiles),
+        'lap_time_s': percentile_list(lap_times_s),
+        'max_cross_track_m': percentile_list(
+            [result.max_cross_track_m for result in results]
+        ),
+        'collisions': percentile_list(collisions),
+    }
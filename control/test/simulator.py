@@ -1,54 +1,398 @@
-"""Simulates the car with telemetry."""
+"""Deterministic closed loop simulation of the car driving a course.
 
+Command, the location filter and the telemetry share a VirtualClock, so the
+simulation runs in discrete steps as fast as the machine allows instead of
+in wall time. Each step runs one iteration of Command's control loop, moves
+a simple vehicle model according to the driver's commands, and feeds noisy
+GPS and compass readings from the model back into the location filter. For
+a given seed, every run drives exactly the same path. Run this from the root
+directory as
+python -m control.test.simulator --kml sparkfun-avc-2016.kml --runs 10
+"""
+
+import argparse
+import collections
+import math
+import random
 import time
 
+# Patch out the logger
+from messaging import async_logger
+from control.test.dummy_logger import DummyLogger
+
+
+class QuietLogger(DummyLogger):
+    """Only prints warnings and errors, so that runs aren't drowned out by
+    the waypoint messages.
+    """
+    def info(self, message, *args):
+        """Info message."""
+        pass
+
+async_logger.AsyncLogger = QuietLogger
+
+# Patch out the message consumers. Otherwise every simulation binds the
+# command and waypoint exchange sockets, so parallel simulations delete each
+# other's sockets, and running one on the car deletes the live ones.
+from control import command as command_module
+from control import simple_waypoint_generator
+from messaging import broker
+
+
+def consume_no_messages(message_type, callback, raw=None):  # pylint: disable=unused-argument
+    """Returns immediately instead of binding the exchange socket."""
+    pass
+
+
+class UnboundBroker(object):
+    """Hands out subscriptions that aren't bound to an exchange socket, so
+    they never receive any messages.
+    """
+    @staticmethod
+    def subscribe(
+            exchange_name,
+            callback=None,
+            max_size=None,
+            policy=None,
+            event=None
+    ):
+        """Returns a Subscription that isn't bound to a socket."""
+        return broker.Subscription(
+            '{}:subscriber'.format(exchange_name),
+            callback,
+            max_size,
+            policy,
+            event
+        )
+
+command_module.broker = UnboundBroker
+simple_waypoint_generator.consume_messages = consume_no_messages
+
+from control.clock import VirtualClock
 from control.command import Command
+from control.extension_waypoint_generator import ExtensionWaypointGenerator
+from control.location_filter import LocationFilter
 from control.simple_waypoint_generator import SimpleWaypointGenerator
+from control.telemetry import MAX_SPEED_M_S
+from control.telemetry import Telemetry
 from control.test.dummy_driver import DummyDriver
-from control.test.dummy_logger import DummyLogger
 from control.test.dummy_telemetry import DummyTelemetry
+from control.test.dummy_telemetry_data import DummyTelemetryData
 
-# pylint: disable=missing-docstring
-# pylint: disable=no-self-use
 # pylint: disable=protected-access
-# pylint: disable=too-few-public-methods
 
+# Command's control loop runs every 20 ms, and the sensors report every 200 ms
+DEFAULT_STEP_S = 0.02
+DEFAULT_SENSOR_STEP_S = 0.2
+DEFAULT_TIMEOUT_S = 600.0
+# The car starts this far behind the first waypoint, pointed at it
+START_DISTANCE_M = 10.0
 
-def main():
-    """Main function."""
-    logger = DummyLogger()
-    box = [(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)]
-    waypoint_generator = SimpleWaypointGenerator(
-        SimpleWaypointGenerator.get_waypoints_from_file_name(
-            'control/paths/solid-state-depot.kmz'
-        )
+SimulationResult = collections.namedtuple(
+    'SimulationResult',
+    (
+        'finished',
+        'elapsed_s',
+        'waypoints_reached',
+        'distance_m',
+        'mean_error_m',
+        'max_error_m',
+        'max_cross_track_m',
+        'collisions',
     )
-    waypoint_generator._waypoints.clear()
-    for x, y in ((x_ * .005 + 10, y_ * .005 + 10) for x_, y_ in box):
-        waypoint_generator._waypoints.append((x, y))
+)
+
+
+def distance_to_segment_m(point_m, start_m, end_m):
+    """Returns the distance from a point to a line segment."""
+    x_m = point_m[0] - start_m[0]
+    y_m = point_m[1] - start_m[1]
+    segment_x_m = end_m[0] - start_m[0]
+    segment_y_m = end_m[1] - start_m[1]
+    length_m_2 = segment_x_m ** 2 + segment_y_m ** 2
+    fraction = 0.0
+    if length_m_2 > 0.0:
+        fraction = (x_m * segment_x_m + y_m * segment_y_m) / length_m_2
+        fraction = min(max(fraction, 0.0), 1.0)
+    return math.sqrt(
+        (x_m - fraction * segment_x_m) ** 2
+        + (y_m - fraction * segment_y_m) ** 2
+    )
+
+
+class CourseTracker(object):
+    """Measures how well a lap follows the course: the maximum cross track
+    error from the leg that the car is driving, and, if a CourseIndex is
+    given, the number of times that the car drives into an inner obstacle.
+    """
+
+    def __init__(self, start_m, waypoints, course_index=None):
+        self._start_m = start_m
+        self._waypoints = waypoints
+        self._course_index = course_index
+        self._in_obstacle = False
+        self.max_cross_track_m = 0.0
+        self.collisions = 0
+
+    def add(self, point_m, waypoint_index):
+        """Adds the next point of the lap. waypoint_index is the index of the
+        waypoint that the car is driving to, so the leg starts at the
+        waypoint before it, or at the start for the first waypoint.
+        """
+        if waypoint_index < len(self._waypoints):
+            self.max_cross_track_m = max(
+                self.max_cross_track_m,
+                distance_to_segment_m(
+                    point_m,
+                    (
+                        self._waypoints[waypoint_index - 1]
+                        if waypoint_index > 0
+                        else self._start_m
+                    ),
+                    self._waypoints[waypoint_index]
+                )
+            )
+
+        if self._course_index is not None:
+            was_in_obstacle = self._in_obstacle
+            self._in_obstacle = self._course_index.in_obstacle(point_m)
+            if self._in_obstacle and not was_in_obstacle:
+                self.collisions += 1
+
+
+class Simulation(object):  # pylint: disable=too-many-instance-attributes
+    """Runs Command against a simulated car."""
+
+    def __init__(
+            self,
+            waypoint_generator,
+            seed=None,
+            step_s=None,
+            sensor_step_s=None,
+            course_index=None,
+            gps_sigma_m=None,
+            compass_bias_d=None,
+            start_offset_m=None,
+            start_heading_offset_d=None
+    ):
+        """The waypoint generator is reset at the start of every run, so one
+        generator can be reused for many runs. If a CourseIndex is given,
+        the run counts how many times the car drives into an inner obstacle.
+        The GPS noise, compass bias and start pose offsets default to a
+        perfectly placed car with DummyTelemetryData's noise.
+        """
+        if step_s is None:
+            step_s = DEFAULT_STEP_S
+        if sensor_step_s is None:
+            sensor_step_s = DEFAULT_SENSOR_STEP_S
+        if gps_sigma_m is None:
+            gps_sigma_m = DummyTelemetryData.SIGMA_M
+        if compass_bias_d is None:
+            compass_bias_d = 0.0
+        if start_offset_m is None:
+            start_offset_m = (0.0, 0.0)
+        if start_heading_offset_d is None:
+            start_heading_offset_d = 0.0
+        self._waypoint_generator = waypoint_generator
+        self._seed = seed
+        self._step_s = step_s
+        self._sensor_step_s = sensor_step_s
+        self._course_index = course_index
+        self._gps_sigma_m = gps_sigma_m
+        self._compass_bias_d = compass_bias_d
+        self._start_offset_m = start_offset_m
+        self._start_heading_offset_d = start_heading_offset_d
+
+    def run(self, timeout_s=None):  # pylint: disable=too-many-locals
+        """Drives the course until it's done or until timeout_s of simulated
+        time has passed. Returns a SimulationResult.
+        """
+        if timeout_s is None:
+            timeout_s = DEFAULT_TIMEOUT_S
+        waypoint_generator = self._waypoint_generator
+        waypoint_generator.reset()
+        waypoints = waypoint_generator._waypoints
+        clock = VirtualClock()
+        x_m, y_m, heading_d = self._start()
+        start_m = (x_m, y_m)
 
-    telemetry = DummyTelemetry(
-        logger,
-        waypoint_generator.get_current_waypoint(
-            waypoint_generator._waypoints[0][0],
-            waypoint_generator._waypoints[0][1]
+        # The filter starts at the intended pose, not where the car really is
+        telemetry = DummyTelemetry(
+            (x_m, y_m),
+            clock,
+            LocationFilter(x_m, y_m, heading_d, clock)
         )
+        driver = DummyDriver(telemetry)
+        telemetry_data = DummyTelemetryData(
+            telemetry,
+            None,
+            random.Random(self._seed),
+            self._sensor_step_s * 1000.0
+        )
+        # Drive at the real car's top speed instead of the dummy's
+        telemetry_data.MAX_SPEED_M_S = MAX_SPEED_M_S
+        telemetry_data.SIGMA_M = self._gps_sigma_m
+        telemetry_data._compass_bias_d = self._compass_bias_d
+        telemetry_data._driver = driver
+        telemetry_data._x_m = x_m + self._start_offset_m[0]
+        telemetry_data._y_m = y_m + self._start_offset_m[1]
+        telemetry_data._heading_d = Telemetry.wrap_degrees(
+            heading_d + self._start_heading_offset_d
+        )
+
+        command = Command(
+            telemetry,
+            driver,
+            waypoint_generator,
+            self._step_s * 1000.0,
+            clock
+        )
+
+        tracker = CourseTracker(start_m, waypoints, self._course_index)
+        distance_m = 0.0
+        error_total_m = 0.0
+        max_error_m = 0.0
+        steps = 0
+        next_reading_s = self._sensor_step_s
+        command.run_course()
+        for iterator in (command._start_iterator(), command._run_iterator()):
+            while (
+                    command.is_running_course()
+                    and clock.time() < timeout_s
+                    and next(iterator)
+            ):
+                clock.sleep(self._step_s)
+                previous_m = (telemetry_data._x_m, telemetry_data._y_m)
+                telemetry_data.step(self._step_s)
+                point_m = (telemetry_data._x_m, telemetry_data._y_m)
+                distance_m += math.sqrt(
+                    (point_m[0] - previous_m[0]) ** 2
+                    + (point_m[1] - previous_m[1]) ** 2
+                )
+                if clock.time() >= next_reading_s:
+                    next_reading_s += self._sensor_step_s
+                    telemetry_data.send_reading()
+
+                estimated_x_m, estimated_y_m = \
+                    telemetry._location_filter.estimated_location()
+                error_m = math.sqrt(
+                    (estimated_x_m - point_m[0]) ** 2
+                    + (estimated_y_m - point_m[1]) ** 2
+                )
+                error_total_m += error_m
+                max_error_m = max(max_error_m, error_m)
+                steps += 1
+
+                tracker.add(
+                    point_m,
+                    waypoint_generator._current_waypoint_index
+                )
+
+        return SimulationResult(
+            waypoint_generator.done(),
+            clock.time(),
+            waypoint_generator._current_waypoint_index,
+            distance_m,
+            error_total_m / steps if steps > 0 else 0.0,
+            max_error_m,
+            tracker.max_cross_track_m,
+            tracker.collisions
+        )
+
+    def _start(self):
+        """Returns the starting position and heading, behind the first
+        waypoint and pointed at it.
+        """
+        waypoints = self._waypoint_generator._waypoints
+        first_x_m, first_y_m = waypoints[0]
+        if len(waypoints) > 1:
+            heading_d = Telemetry.relative_degrees(
+                first_x_m,
+                first_y_m,
+                waypoints[1][0],
+                waypoints[1][1]
+            )
+        else:
+            heading_d = 0.0
+        offset_x_m, offset_y_m = Telemetry.rotate_degrees_clockwise(
+            (0.0, START_DISTANCE_M),
+            heading_d
+        )
+        return first_x_m - offset_x_m, first_y_m - offset_y_m, heading_d
+
+
+def make_parser():
+    """Builds and returns an argument parser."""
+    parser = argparse.ArgumentParser(
+        description='Simulates the car driving a course.'
+    )
+
+    parser.add_argument(
+        '--kml',
+        dest='kml_file',
+        help='The KML course file to drive, relative to the paths directory.',
+        default='sparkfun-avc-2016.kml',
+    )
+
+    parser.add_argument(
+        '--runs',
+        dest='runs',
+        help='The number of runs.',
+        default=1,
+        type=int,
+    )
+
+    parser.add_argument(
+        '--seed',
+        dest='seed',
+        help='The seed for the first run. Each run after it adds 1.',
+        default=0,
+        type=int,
+    )
+
+    parser.add_argument(
+        '--extension',
+        dest='extension',
+        help='Use the extension waypoint generator.',
+        action='store_true',
+        default=False,
     )
-    driver = DummyDriver(telemetry, logger)
 
-    command = Command(
-        telemetry,
-        driver,
-        waypoint_generator,
-        logger,
-        sleep_time_milliseconds=1,
+    return parser
+
+
+def main():
+    """Main function."""
+    args = make_parser().parse_args()
+
+    waypoints = SimpleWaypointGenerator.get_waypoints_from_file_name(
+        args.kml_file
     )
-    command.run_course()
-    command.start()
+    if args.extension:
+        waypoint_generator = ExtensionWaypointGenerator(waypoints)
+    else:
+        waypoint_generator = SimpleWaypointGenerator(waypoints)
+
+    for run in range(args.runs):
+        simulation = Simulation(waypoint_generator, args.seed + run)
+        start = time.time()
+        result = simulation.run()
+        wall_s = time.time() - start
+        print(
+            'Seed {}: {} {}/{} waypoints in {:.1f} s, drove {:.1f} m, mean'
+            ' error {:.2f} m, max error {:.2f} m, {:.0f}x real time'.format(
+                args.seed + run,
+                'finished' if result.finished else 'timed out,',
+                result.waypoints_reached,
+                len(waypoints),
+                result.elapsed_s,
+                result.distance_m,
+                result.mean_error_m,
+                result.max_error_m,
+                result.elapsed_s / wall_s
+            )
+        )
 
-    while not waypoint_generator.done():
-        time.sleep(0.1)
-    command.kill()
 
 if __name__ == '__main__':
     main()
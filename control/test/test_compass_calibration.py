@@ -0,0 +1,142 @@
+"""Tests the compass calibration."""
+
+import math
+import numpy
+import os
+import random
+import tempfile
+import unittest
+
+from control.compass_calibration import CompassCalibration
+from control.compass_calibration import FluxSamples
+from control.compass_calibration import fit_ellipse
+
+# pylint: disable=no-member
+
+
+def _distorted_readings(count, rand):
+    """Makes readings of a 20 uT field seen through hard and soft iron. Returns
+    the headings and the readings.
+    """
+    soft_iron = numpy.array(((1.3, 0.2), (0.2, 0.8)))
+    hard_iron = numpy.array((-11.87, -5.97))
+    headings_r = numpy.array([rand.uniform(0, 2 * math.pi) for _ in range(count)])
+    field = numpy.column_stack((numpy.cos(headings_r), numpy.sin(headings_r))) * 20.0
+    readings = field.dot(soft_iron.T) + hard_iron
+    readings += numpy.array([
+        (rand.gauss(0, 0.1), rand.gauss(0, 0.1)) for _ in range(count)
+    ])
+    return headings_r, readings
+
+
+class TestCompassCalibration(unittest.TestCase):
+    """Tests the compass calibration."""
+
+    def test_fit(self):
+        """The fit should undo hard and soft iron distortion."""
+        rand = random.Random(0)
+        headings_r, readings = _distorted_readings(500, rand)
+        center, transform = fit_ellipse(readings)
+        self.assertTrue(numpy.allclose(center, (-11.87, -5.97), atol=0.05))
+        self.assertTrue(numpy.allclose(transform, transform.T))
+
+        calibration = CompassCalibration.fit(readings)
+        offset = None
+        for heading_r, reading in zip(headings_r, readings):
+            x, y = calibration.correct(*reading)
+            # Corrected readings should lie on a circle
+            self.assertAlmostEqual(
+                (x * x + y * y) / calibration.magnitude_mean,
+                1.0,
+                places=1
+            )
+            # and angles should be preserved up to a constant rotation
+            error = math.atan2(y, x) - heading_r
+            error = math.atan2(math.sin(error), math.cos(error))
+            if offset is None:
+                offset = error
+            self.assertLess(abs(error - offset), math.radians(2.0))
+
+        # Too few readings or readings along a line can't be fit
+        self.assertRaises(ValueError, fit_ellipse, readings[:3])
+        line = numpy.column_stack((numpy.arange(10.0), numpy.arange(10.0)))
+        self.assertRaises(ValueError, fit_ellipse, line)
+
+        offsets_only = CompassCalibration.fit_offsets(line)
+        self.assertEqual(offsets_only.offsets, (4.5, 4.5))
+
+        # Too few readings or readings with no spread can't be used
+        self.assertRaises(
+            ValueError,
+            CompassCalibration.fit_offsets,
+            line[:2]
+        )
+        square = numpy.array(((1.0, 0.0), (-1.0, 0.0), (0.0, 1.0), (0.0, -1.0)))
+        self.assertRaises(
+            ValueError,
+            CompassCalibration.fit_offsets,
+            numpy.vstack((square, square, square))
+        )
+
+    def test_magnitude_statistics(self):
+        """Running statistics should match the batch statistics."""
+        rand = random.Random(1)
+        magnitudes = [rand.gauss(300.0, 50.0) for _ in range(1000)]
+        calibration = CompassCalibration(
+            magnitude_mean=magnitudes[0],
+            magnitude_std_dev=0.0
+        )
+        for magnitude in magnitudes[1:]:
+            calibration.update_magnitude(magnitude)
+        self.assertAlmostEqual(
+            calibration.magnitude_mean,
+            numpy.mean(magnitudes)
+        )
+        self.assertAlmostEqual(
+            calibration.magnitude_std_dev,
+            numpy.std(magnitudes)
+        )
+
+    def test_save_load(self):
+        """Calibrations should survive a round trip through a file."""
+        rand = random.Random(2)
+        _, readings = _distorted_readings(100, rand)
+        calibration = CompassCalibration.fit(readings)
+        file_name = tempfile.mktemp()
+        try:
+            calibration.save(file_name)
+            loaded = CompassCalibration.load(file_name)
+            self.assertEqual(loaded.to_dict(), calibration.to_dict())
+            self.assertEqual(
+                loaded.correct(1.0, 2.0),
+                calibration.correct(1.0, 2.0)
+            )
+
+            with open(file_name, 'w') as file_:
+                file_.write('{}')
+            self.assertRaises(ValueError, CompassCalibration.load, file_name)
+
+            # A zero spread would reject every reading
+            CompassCalibration(magnitude_std_dev=0.0).save(file_name)
+            self.assertRaises(ValueError, CompassCalibration.load, file_name)
+        finally:
+            os.remove(file_name)
+        self.assertRaises(EnvironmentError, CompassCalibration.load, file_name)
+
+    def test_flux_samples(self):
+        """The buffer should keep the most recent readings."""
+        samples = FluxSamples(4)
+        self.assertEqual(len(samples.samples()), 0)
+        for index in range(6):
+            samples.append(index, -index)
+        self.assertEqual(len(samples), 4)
+        self.assertEqual(
+            sorted(samples.samples()[:, 0].tolist()),
+            [2.0, 3.0, 4.0, 5.0]
+        )
+        samples.clear()
+        self.assertEqual(len(samples), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
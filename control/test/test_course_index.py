@@ -0,0 +1,107 @@
+"""Tests the prepared course index."""
+
+import math
+import random
+import unittest
+
+from control.course_index import CourseIndex
+from control.course_index import PreparedPolygon
+from control.telemetry import Telemetry
+
+
+def _star(center, points, inner_radius, outer_radius, rand):
+    """Makes a star shaped polygon with randomly perturbed points."""
+    polygon = []
+    for index in range(points * 2):
+        radius = outer_radius if index % 2 == 0 else inner_radius
+        radius *= rand.uniform(0.8, 1.2)
+        angle = math.pi * index / points
+        polygon.append((
+            center[0] + radius * math.cos(angle),
+            center[1] + radius * math.sin(angle)
+        ))
+    return polygon
+
+
+class TestCourseIndex(unittest.TestCase):
+    """Tests the prepared course index."""
+
+    def test_prepared_polygon(self):
+        """Tests the same cases as Telemetry.point_in_polygon."""
+        diamond = PreparedPolygon(((1, 0), (0, -1), (-1, 0), (0, 1)))
+        for point in ((1, 1), (-1, 1), (-1, -1), (1, -1)):
+            self.assertFalse(diamond.contains(point))
+        self.assertTrue(diamond.contains((0, 0)))
+
+        # -------------
+        # |  *  *  *  |
+        # |*/-\ * /-\*|
+        # |/ * \-/ * \|
+        polygon = PreparedPolygon(
+            ((0, 0), (0, 4), (8, 4), (8, 0), (6, 2), (4, 0), (2, 2))
+        )
+        inside = ((1, 1), (2, 3), (4, 3), (6, 3), (7, 1))
+        outside = (
+            (2, 1), (6, 1), (8.1, 0.1), (8.1, 3.9), (-1, -1), (100, 0),
+            (0, 100), (100, 100), (-100, -100), (-100, 100), (100, -100)
+        )
+        for point in inside:
+            self.assertTrue(polygon.contains(point))
+        for point in outside:
+            self.assertFalse(polygon.contains(point))
+
+        self.assertRaises(ValueError, PreparedPolygon, ((0, 0), (1, 1)))
+
+    def test_matches_point_in_polygon(self):
+        """Prepared polygons should agree with Telemetry.point_in_polygon."""
+        rand = random.Random(1)
+        for _ in range(5):
+            points = _star((0.0, 0.0), rand.randint(3, 50), 20.0, 50.0, rand)
+            polygon = PreparedPolygon(points)
+            for _ in range(200):
+                point = (rand.uniform(-60, 60), rand.uniform(-60, 60))
+                self.assertEqual(
+                    polygon.contains(point),
+                    Telemetry.point_in_polygon(point, points),
+                    'Mismatch for {}'.format(point)
+                )
+
+    def test_course_index(self):
+        """Tests the course with inner obstacles."""
+        rand = random.Random(2)
+        course = _star((0.0, 0.0), 40, 180.0, 200.0, rand)
+        inner = [
+            _star(
+                (rand.uniform(-120, 120), rand.uniform(-120, 120)),
+                rand.randint(3, 8),
+                2.0,
+                6.0,
+                rand
+            )
+            for _ in range(30)
+        ]
+        for cell_size_m in (None, 1.0, 1000.0):
+            index = CourseIndex(course, inner, cell_size_m)
+            for _ in range(1000):
+                point = (rand.uniform(-220, 220), rand.uniform(-220, 220))
+                expected = Telemetry.point_in_polygon(point, course) and not any(
+                    Telemetry.point_in_polygon(point, polygon)
+                    for polygon in inner
+                )
+                self.assertEqual(index.contains(point), expected)
+
+        # Without a course boundary, only the obstacles are out of bounds
+        index = CourseIndex((), inner[0:1])
+        self.assertTrue(index.contains((1000.0, 1000.0)))
+        self.assertFalse(index.in_obstacle((1000.0, 1000.0)))
+        obstacle = PreparedPolygon(inner[0])
+        center = (
+            (obstacle.min_x + obstacle.max_x) * 0.5,
+            (obstacle.min_y + obstacle.max_y) * 0.5
+        )
+        self.assertTrue(index.in_obstacle(center))
+        self.assertFalse(index.contains(center))
+
+
+if __name__ == '__main__':
+    unittest.main()
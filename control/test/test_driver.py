@@ -0,0 +1,82 @@
+"""Tests the Driver class."""
+
+# pylint: disable=protected-access
+
+import os
+import shutil
+import tempfile
+import unittest
+
+# Patch out the logger
+from messaging import async_logger
+from control.test.dummy_logger import DummyLogger
+async_logger.AsyncLogger = DummyLogger
+
+from control.driver import Driver
+from control.test.dummy_telemetry import DummyTelemetry
+
+
+class TestDriver(unittest.TestCase):
+    """Tests the Driver class."""
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._file_name = os.path.join(self._directory, 'pi-blaster')
+        self._telemetry = DummyTelemetry((0.0, 0.0))
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _written(self):
+        """Returns the lines written so far."""
+        with open(self._file_name) as file_:
+            return file_.read().splitlines()
+
+    def test_suppress_unchanged(self):
+        """Only changed pulse widths should be written, in one write."""
+        with open(self._file_name, 'w'):
+            pass
+        driver = Driver(self._telemetry, self._file_name)
+        self.assertEqual(self._written(), ['18=0.15', '4=0.165'])
+        first_write_time = driver.get_last_write_time()
+        self.assertIsNotNone(first_write_time)
+
+        driver.drive(0.0, 0.0)
+        # Changes too small to survive rounding are suppressed too
+        driver.drive(0.0001, 0.0)
+        self.assertEqual(len(self._written()), 2)
+        self.assertEqual(driver.get_last_write_time(), first_write_time)
+
+        driver.drive(1.0, -1.0)
+        self.assertEqual(
+            self._written()[2:],
+            ['18=0.2', '4=0.135']
+        )
+        # Drive commands still reach telemetry for dead reckoning
+        self.assertEqual(self._telemetry._throttle, 1.0)
+        driver.close()
+
+    def test_reopen(self):
+        """The file should be reopened after errors."""
+        driver = Driver(self._telemetry, os.path.join(self._directory, 'x'))
+        self.assertIsNone(driver.get_last_write_time())
+
+        os.mkfifo(self._file_name)
+        reader = os.open(self._file_name, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            driver._blaster_file_name = self._file_name
+            driver.drive(0.5, 0.0)
+            self.assertEqual(os.read(reader, 100), b'18=0.175\n4=0.165\n')
+
+            # Simulate pi-blaster restarting
+            os.close(reader)
+            reader = os.open(self._file_name, os.O_RDONLY | os.O_NONBLOCK)
+            driver.drive(0.5, 0.5)
+            self.assertEqual(os.read(reader, 100), b'18=0.175\n4=0.18\n')
+        finally:
+            os.close(reader)
+            driver.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,8 +3,10 @@
 import math
 import numpy
 import random
+import threading
 import unittest
 
+from control.clock import VirtualClock
 from control.location_filter import LocationFilter
 from control.telemetry import Telemetry
 
@@ -12,6 +14,86 @@ from control.telemetry import Telemetry
 # pylint: disable=protected-access
 # pylint: disable=too-many-public-methods
 
+# x_m, y_m, x_accuracy_m, y_accuracy_m, heading_d, speed_m_s
+GPS_READING = (10.0, 20.0, 1.0, 1.0, 45.0, 2.0)
+
+
+class ReferenceFilter(object):
+    """The original Kalman update, with an explicit inverse and no buffers,
+    to check that the optimized filter still matches it. The only intended
+    difference is that the compass noise is a float.
+    """
+
+    def __init__(self, x_m, y_m, heading_d):
+        self.estimates = numpy.array([[x_m], [y_m], [heading_d], [0.0]])
+        self.covariance = numpy.identity(4)
+        self.turn_rate_d_s = 0.0
+
+    def update(self, measurements, observer_matrix, noise, time_diff_s):
+        """Runs the prediction step and the Kalman update."""
+        observer_matrix = numpy.asarray(observer_matrix, dtype=float)
+        transition = self.predict(time_diff_s)
+        self.covariance = \
+            transition.dot(self.covariance).dot(transition.T) \
+            + numpy.identity(4)
+        hphtr = observer_matrix.dot(self.covariance).dot(observer_matrix.T) \
+            + noise
+        for index in range(4):
+            if hphtr[index, index] == 0.0:
+                hphtr[index, index] = 0.00001
+        kalman_gain = self.covariance.dot(observer_matrix.T).dot(
+            numpy.linalg.inv(hphtr)
+        )
+        innovation = numpy.array(measurements, dtype=float).reshape(4, 1) \
+            - observer_matrix.dot(self.estimates)
+        while innovation[2, 0] > 180.0:
+            innovation[2, 0] -= 360.0
+        while innovation[2, 0] <= -180.0:
+            innovation[2, 0] += 360.0
+        self.estimates = self.estimates + kalman_gain.dot(innovation)
+        self.estimates[2, 0] = Telemetry.wrap_degrees(self.estimates[2, 0])
+        self.covariance = (
+            numpy.identity(4) - kalman_gain.dot(observer_matrix)
+        ).dot(self.covariance)
+
+    def predict(self, time_diff_s):
+        """Runs the prediction step and returns the transition matrix."""
+        x_delta, y_delta = Telemetry.rotate_radians_clockwise(
+            (0.0, time_diff_s),
+            math.radians(self.estimates[2, 0])
+        )
+        transition = numpy.array([
+            [1.0, 0.0, 0.0, x_delta],
+            [0.0, 1.0, 0.0, y_delta],
+            [0.0, 0.0, 1.0, 0.0],
+            [0.0, 0.0, 0.0, 1.0]
+        ])
+        self.estimates[2, 0] = Telemetry.wrap_degrees(
+            self.estimates[2, 0] + self.turn_rate_d_s * time_diff_s
+        )
+        self.estimates = transition.dot(self.estimates)
+        return transition
+
+
+def run_while_dead_reckoning(location_filter, function):
+    """Calls function while another thread keeps running dead reckoning on
+    the filter, like the command thread does.
+    """
+    stop = threading.Event()
+
+    def dead_reckon():
+        """Runs dead reckoning until stopped."""
+        while not stop.is_set():
+            location_filter.update_dead_reckoning()
+
+    thread = threading.Thread(target=dead_reckon)
+    thread.start()
+    try:
+        function()
+    finally:
+        stop.set()
+        thread.join()
+
 
 class TestLocationFilter(unittest.TestCase):
     """Tests the location Kalman filter."""
@@ -173,3 +255,279 @@ class TestLocationFilter(unittest.TestCase):
                 0.0  # Tick isn't used for GPS
             )
             check_estimates()
+
+    def test_delayed_measurement(self):
+        """A delayed measurement should give the same estimates as if it had
+        arrived when it was taken.
+        """
+        in_order_clock = VirtualClock(1000.0)
+        delayed_clock = VirtualClock(1000.0)
+        in_order = LocationFilter(0.0, 0.0, 0.0, in_order_clock)
+        delayed = LocationFilter(0.0, 0.0, 0.0, delayed_clock)
+
+        in_order_clock.sleep(0.5)
+        delayed_clock.sleep(0.5)
+        in_order.update_gps(*GPS_READING, timestamp_s=1000.5)
+        for compass_d in (50.0, 55.0):
+            in_order_clock.sleep(0.15)
+            delayed_clock.sleep(0.15)
+            in_order.update_compass(compass_d, 1.0)
+            delayed.update_compass(compass_d, 1.0)
+        # The GPS reading arrives 400 ms after it was taken
+        in_order_clock.sleep(0.1)
+        delayed_clock.sleep(0.1)
+        delayed.update_gps(*GPS_READING, timestamp_s=1000.5)
+        in_order.update_dead_reckoning()
+
+        for estimated, expected in zip(
+            delayed.estimated_location(),
+            in_order.estimated_location()
+        ):
+            self.assertAlmostEqual(estimated, expected)
+        self.assertAlmostEqual(
+            delayed.estimated_heading(),
+            in_order.estimated_heading()
+        )
+        self.assertAlmostEqual(
+            delayed.estimated_speed(),
+            in_order.estimated_speed()
+        )
+        self.assertTrue(
+            numpy.allclose(
+                delayed._covariance_matrix,
+                in_order._covariance_matrix
+            )
+        )
+
+    def test_history_overflow(self):
+        """Old states should be dropped once the history is full."""
+        clock = VirtualClock(1000.0)
+        location_filter = LocationFilter(0.0, 0.0, 0.0, clock)
+        for _ in range(location_filter.HISTORY_LENGTH * 2):
+            clock.sleep(0.01)
+            location_filter.update_compass(10.0, 1.0)
+
+        history = location_filter._history
+        self.assertEqual(history.count, location_filter.HISTORY_LENGTH)
+        oldest_s = history.times_s[history.slot(0)]
+        self.assertGreater(oldest_s, 1000.0)
+
+        # Older than the history, so it's applied to the oldest state
+        location_filter.update_gps(*GPS_READING, timestamp_s=1000.0)
+        self.assertEqual(history.count, location_filter.HISTORY_LENGTH)
+        times_s = [
+            history.times_s[history.slot(position)]
+            for position in range(history.count)
+        ]
+        self.assertEqual(times_s, sorted(times_s))
+        self.assertEqual(location_filter._last_observation_s, clock.time())
+
+        # Timestamps from clocks that don't agree are applied now
+        location_filter.update_gps(*GPS_READING, timestamp_s=1.0)
+        location_filter.update_gps(*GPS_READING, timestamp_s=1e12)
+        self.assertEqual(
+            history.times_s[history.slot(history.count - 1)],
+            clock.time()
+        )
+
+    def test_matches_reference(self):
+        """The optimized filter should match the original implementation."""
+        rng = random.Random(6)
+        clock = VirtualClock(1000.0)
+        location_filter = LocationFilter(10.0, 20.0, 30.0, clock)
+        reference = ReferenceFilter(10.0, 20.0, 30.0)
+
+        for _ in range(300):
+            kind = rng.randrange(6)
+            # Steering only sets the turn rate
+            time_diff_s = 0.0 if kind == 4 else rng.uniform(0.0, 0.3)
+            clock.sleep(time_diff_s)
+            if kind == 0:
+                accuracy_m = rng.uniform(1.0, 10.0)
+                heading_d = rng.choice((None, rng.uniform(0.0, 360.0)))
+                speed_m_s = rng.choice((None, rng.uniform(0.0, 5.0)))
+                x_m = rng.uniform(0.0, 100.0)
+                y_m = rng.uniform(0.0, 100.0)
+                location_filter.update_gps(
+                    x_m,
+                    y_m,
+                    accuracy_m,
+                    accuracy_m,
+                    heading_d,
+                    speed_m_s
+                )
+                observer_matrix = numpy.diag((
+                    1.0,
+                    1.0,
+                    0.0 if heading_d is None else 1.0,
+                    0.0 if speed_m_s is None else 1.0
+                ))
+                noise = numpy.diag((
+                    accuracy_m,
+                    accuracy_m,
+                    LocationFilter.GPS_MEASUREMENT_NOISE[2, 2],
+                    LocationFilter.GPS_MEASUREMENT_NOISE[3, 3]
+                ))
+                reference.update(
+                    (x_m, y_m, heading_d or 0.0, speed_m_s or 0.0),
+                    observer_matrix,
+                    noise,
+                    time_diff_s
+                )
+            elif kind == 1:
+                compass_d = rng.uniform(0.0, 360.0)
+                confidence = rng.uniform(0.0, 1.0)
+                location_filter.update_compass(compass_d, confidence)
+                reference.update(
+                    (0.0, 0.0, compass_d, 0.0),
+                    LocationFilter.COMPASS_OBSERVER_MATRIX,
+                    numpy.diag((0.0, 0.0, 45 + 45 * (1.0 - confidence), 0.0)),
+                    time_diff_s
+                )
+            elif kind == 2:
+                heading_d = rng.uniform(0.0, 360.0)
+                speed_m_s = rng.uniform(0.0, 5.0)
+                location_filter.update_heading_and_speed(heading_d, speed_m_s)
+                reference.update(
+                    (0.0, 0.0, heading_d, speed_m_s),
+                    LocationFilter.HEADING_SPEED_OBSERVER_MATRIX,
+                    LocationFilter.HEADING_SPEED_MEASUREMENT_NOISE,
+                    time_diff_s
+                )
+            elif kind == 3:
+                speed_m_s = rng.uniform(0.0, 5.0)
+                location_filter.manual_throttle(speed_m_s)
+                reference.update(
+                    (0.0, 0.0, 0.0, speed_m_s),
+                    LocationFilter.SPEED_ESTIMATION_OBSERVER_MATRIX,
+                    LocationFilter.SPEED_ESTIMATION_MEASUREMENT_NOISE,
+                    time_diff_s
+                )
+            elif kind == 4:
+                turn_d_s = rng.uniform(-30.0, 30.0)
+                location_filter.manual_steering(turn_d_s)
+                reference.turn_rate_d_s = turn_d_s
+            else:
+                location_filter.update_dead_reckoning()
+                reference.predict(time_diff_s)
+
+            numpy.testing.assert_allclose(
+                location_filter._estimates.ravel(),
+                reference.estimates.ravel(),
+                rtol=0.0,
+                atol=1e-9
+            )
+            numpy.testing.assert_allclose(
+                location_filter._covariance_matrix,
+                reference.covariance,
+                rtol=0.0,
+                atol=1e-9
+            )
+
+    def assert_same_state(self, location_filter, expected):
+        """Checks that two filters have the same estimates and covariance."""
+        self.assertTrue(
+            numpy.allclose(location_filter._estimates, expected._estimates)
+        )
+        self.assertTrue(
+            numpy.allclose(
+                location_filter._covariance_matrix,
+                expected._covariance_matrix
+            )
+        )
+
+    def test_concurrent_dead_reckoning(self):
+        """Dead reckoning from another thread shouldn't corrupt updates."""
+        rng = random.Random(7)
+        clock = VirtualClock(1000.0)
+        location_filter = LocationFilter(0.0, 0.0, 0.0, clock)
+        expected = LocationFilter(0.0, 0.0, 0.0, clock)
+
+        for _ in range(50):
+            clock.sleep(0.1)
+            gps = (
+                rng.uniform(-10.0, 10.0),
+                rng.uniform(-10.0, 10.0),
+                1.0,
+                1.0,
+                rng.uniform(0.0, 360.0),
+                rng.uniform(0.0, 3.0)
+            )
+            compass_d = rng.uniform(0.0, 360.0)
+
+            def update(filter_):
+                """Applies the readings."""
+                for _ in range(10):
+                    filter_.update_gps(*gps)
+                    filter_.update_compass(compass_d, 1.0)
+
+            # The clock doesn't move while the other thread runs, so its
+            # dead reckoning shouldn't change anything
+            run_while_dead_reckoning(
+                location_filter,
+                lambda: update(location_filter)
+            )
+            update(expected)
+            self.assert_same_state(location_filter, expected)
+
+    def test_delayed_measurement_while_dead_reckoning(self):
+        """Replaying a delayed measurement shouldn't race with dead
+        reckoning from another thread.
+        """
+        rng = random.Random(8)
+        clock = VirtualClock(1000.0)
+        location_filter = LocationFilter(0.0, 0.0, 0.0, clock)
+        expected = LocationFilter(0.0, 0.0, 0.0, clock)
+
+        for _ in range(50):
+            taken_s = clock.time()
+            compass_d = rng.uniform(0.0, 360.0)
+            for filter_ in (location_filter, expected):
+                filter_.update_compass(compass_d, 1.0)
+            for _ in range(3):
+                clock.sleep(0.1)
+                compass_d = rng.uniform(0.0, 360.0)
+                for filter_ in (location_filter, expected):
+                    filter_.update_dead_reckoning()
+                    filter_.update_compass(compass_d, 1.0)
+            gps = (
+                rng.uniform(-10.0, 10.0),
+                rng.uniform(-10.0, 10.0),
+                1.0,
+                1.0,
+                rng.uniform(0.0, 360.0),
+                rng.uniform(0.0, 3.0)
+            )
+
+            def update(filter_):
+                """Applies the GPS reading from before the compass readings,
+                so that they are replayed.
+                """
+                for _ in range(10):
+                    filter_.update_gps(*gps, timestamp_s=taken_s)
+
+            run_while_dead_reckoning(
+                location_filter,
+                lambda: update(location_filter)
+            )
+            update(expected)
+            self.assert_same_state(location_filter, expected)
+            self.assertEqual(
+                location_filter._last_observation_s,
+                clock.time()
+            )
+
+    def test_compass_noise(self):
+        """Compass noise should be a float per filter, and the class value
+        shouldn't change.
+        """
+        location_filter = LocationFilter(0.0, 0.0, 0.0, VirtualClock(1000.0))
+        location_filter.update_compass(10.0, 0.5)
+        self.assertEqual(location_filter._compass_noise[2, 2], 67.5)
+        self.assertEqual(LocationFilter.COMPASS_MEASUREMENT_NOISE[2, 2], 45.0)
+        location_filter.update_gps(*GPS_READING)
+        self.assertEqual(LocationFilter.GPS_MEASUREMENT_NOISE[0, 0], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+"""Tests the offline location smoother."""
+
+import json
+import numpy
+import random
+import unittest
+from unittest import mock
+
+from control import location_smoother
+from control.location_filter import LocationFilter
+from control.telemetry import Telemetry
+
+# pylint: disable=no-member
+# pylint: disable=protected-access
+
+
+def _make_run(count, seed):
+    """Makes a run with noisy GPS and compass readings of a car driving in a
+    straight line heading east at 2 m/s.
+    """
+    rand = random.Random(seed)
+    timestamps = []
+    measurements = []
+    observed = []
+    noise = []
+    truth = []
+    timestamp_s = 1000.0
+    for index in range(count):
+        timestamp_s += 0.1
+        x_m = 2.0 * (timestamp_s - 1000.0)
+        truth.append((x_m, 0.0))
+        timestamps.append(timestamp_s)
+        if index % 2 == 0:
+            measurements.append((
+                x_m + rand.gauss(0.0, 2.0),
+                rand.gauss(0.0, 2.0),
+                90.0 + rand.gauss(0.0, 3.0),
+                2.0 + rand.gauss(0.0, 0.2)
+            ))
+            observed.append((True, True, True, True))
+            noise.append((
+                4.0,
+                4.0,
+                LocationFilter.GPS_MEASUREMENT_NOISE[2, 2],
+                LocationFilter.GPS_MEASUREMENT_NOISE[3, 3]
+            ))
+        else:
+            measurements.append((0.0, 0.0, 90.0 + rand.gauss(0.0, 5.0), 0.0))
+            observed.append((False, False, True, False))
+            noise.append((0.0, 0.0, 45.0, 0.0))
+    run = {
+        'timestamp_s': numpy.array(timestamps),
+        'measurements': numpy.array(measurements),
+        'observed': numpy.array(observed),
+        'noise': numpy.array(noise),
+        'turn_rate_d_s': numpy.zeros(count),
+    }
+    return run, numpy.array(truth)
+
+
+class TestLocationSmoother(unittest.TestCase):
+    """Tests the offline location smoother."""
+
+    def test_read_log(self):
+        """Tests reading measurements from log lines."""
+        gps = {
+            'latitude_d': 40.0913,
+            'longitude_d': -105.1853,
+            'accuracy_m': 2.5,
+            'heading_d': None,
+            'speed_m_s': 1.5,
+            'timestamp_s': 12.0,
+            'device_id': 'sup800f',
+        }
+        compass = {'compass_d': 123.0, 'confidence': 0.5, 'device_id': 'x'}
+        too_fast = dict(gps, speed_m_s=20.0)
+        estimate = {
+            'latitude_d': 40.0913,
+            'longitude_d': -105.1853,
+            'heading_d': 10.0,
+            'device_id': 'estimate',
+        }
+        lines = [
+            '2016-08-22 09:57:28,343:INFO Received run command\n',
+            '2016-08-22 09:57:28,400:DEBUG {}\n'.format(json.dumps(gps)),
+            '2016-08-22 09:57:28,450:DEBUG Estimates: {}\n'.format(
+                json.dumps(estimate)
+            ),
+            '2016-08-22 09:57:28,500:DEBUG throttle = 0.5, turn = -0.5\n',
+            'Traceback (most recent call last):\n',
+            '2016-08-22 09:57:28,600:DEBUG {}\n'.format(json.dumps(compass)),
+            '2016-08-22 09:57:28,700:DEBUG {}\n'.format(json.dumps(too_fast)),
+            '2016-08-22 09:57:29,000:DEBUG throttle = 0.0, turn = 0.5\n',
+            '2016-08-22 09:57:29,100:DEBUG {}\n'.format(json.dumps(compass)),
+        ]
+        run = location_smoother.read_log(lines)
+
+        self.assertEqual(len(run['timestamp_s']), 3)
+        self.assertAlmostEqual(
+            run['timestamp_s'][1] - run['timestamp_s'][0],
+            0.2,
+            places=3
+        )
+        self.assertAlmostEqual(
+            run['measurements'][0][0],
+            Telemetry.longitude_to_m_offset(-105.1853, 40.0913)
+        )
+        self.assertAlmostEqual(
+            run['measurements'][0][1],
+            Telemetry.latitude_to_m_offset(40.0913)
+        )
+        self.assertEqual(
+            run['observed'].tolist(),
+            [
+                [True, True, False, True],
+                [False, False, True, False],
+                [False, False, True, False],
+            ]
+        )
+        self.assertEqual(run['noise'][0].tolist()[0:2], [2.5, 2.5])
+        self.assertEqual(run['noise'][1][2], 45.0 + 45.0 * 0.5)
+        self.assertEqual(run['turn_rate_d_s'].tolist(), [0.0, -75.0, 0.0])
+
+    def test_filter_forward_matches_location_filter(self):
+        """The forward pass should give the same estimates as running the
+        measurements through LocationFilter.
+        """
+        run, _ = _make_run(200, 1)
+        run['turn_rate_d_s'] = numpy.array(
+            [10.0 * ((index // 20) % 3 - 1) for index in range(200)]
+        )
+        initial_estimates = (0.0, 0.0, 90.0, 0.0)
+        filtered = location_smoother.filter_forward(
+            run,
+            initial_estimates=initial_estimates
+        )
+
+        # The filter also reads the time when it's constructed
+        timestamps = [run['timestamp_s'][0]] + run['timestamp_s'].tolist()
+        clock = mock.Mock()
+        clock.time.side_effect = timestamps
+        location_filter = LocationFilter(0.0, 0.0, 90.0, clock)
+        for index in range(200):
+            location_filter.manual_steering(run['turn_rate_d_s'][index])
+            measurements = run['measurements'][index]
+            noise = run['noise'][index]
+            if run['observed'][index][0]:
+                location_filter.update_gps(
+                    measurements[0],
+                    measurements[1],
+                    noise[0],
+                    noise[1],
+                    measurements[2],
+                    measurements[3]
+                )
+            else:
+                location_filter.update_compass(
+                    measurements[2],
+                    2.0 - noise[2] / 45.0
+                )
+            expected = location_filter._estimates[:, 0]
+            for actual_value, expected_value in zip(
+                    filtered['estimates'][index],
+                    expected
+            ):
+                self.assertAlmostEqual(actual_value, expected_value, 6)
+
+    def test_smooth(self):
+        """Smoothing should be closer to the truth than filtering."""
+        run, truth = _make_run(500, 2)
+        smoothed = location_smoother.smooth(
+            run,
+            process_noise=numpy.identity(4) * 0.1,
+            initial_estimates=(0.0, 0.0, 90.0, 0.0)
+        )
+
+        def rms_error(estimates):
+            """Returns the RMS location error."""
+            errors = estimates[:, 0:2] - truth
+            return numpy.sqrt((errors ** 2).sum(axis=1).mean())
+
+        filtered_error = rms_error(smoothed['filtered']['estimates'])
+        smoothed_error = rms_error(smoothed['estimates'])
+        self.assertLess(smoothed_error, filtered_error * 0.85)
+        self.assertEqual(smoothed['estimates'].shape, (500, 4))
+        self.assertTrue((smoothed['estimates'][:, 2] >= 0.0).all())
+        self.assertTrue((smoothed['estimates'][:, 2] < 360.0).all())
+        # The last estimate has no future measurements to smooth with
+        self.assertTrue(numpy.array_equal(
+            smoothed['estimates'][-1],
+            smoothed['filtered']['estimates'][-1]
+        ))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+"""Tests the Monte Carlo evaluation."""
+
+import unittest
+
+# Importing the simulator patches out the logger, so it goes first
+from control.test.simulator import Simulation
+from control.test.simulator import SimulationResult
+from control.test import monte_carlo
+from control.simple_waypoint_generator import SimpleWaypointGenerator
+
+
+def _result(finished, elapsed_s, max_cross_track_m, collisions):
+    """Returns a SimulationResult with the fields that summarize uses."""
+    return SimulationResult(
+        finished,
+        elapsed_s,
+        0,
+        0.0,
+        0.0,
+        0.0,
+        max_cross_track_m,
+        collisions
+    )
+
+
+class TestMonteCarlo(unittest.TestCase):
+    """Tests the Monte Carlo evaluation."""
+
+    def test_random_trials(self):
+        """Trials should be reproducible from the seed."""
+        trials = monte_carlo.random_trials(10, 1)
+        self.assertEqual(len(trials), 10)
+        self.assertEqual(trials, monte_carlo.random_trials(10, 1))
+        self.assertNotEqual(trials, monte_carlo.random_trials(10, 2))
+        for trial in trials:
+            self.assertGreaterEqual(
+                trial.gps_sigma_m,
+                monte_carlo.GPS_SIGMA_M_RANGE[0]
+            )
+            self.assertLessEqual(
+                trial.gps_sigma_m,
+                monte_carlo.GPS_SIGMA_M_RANGE[1]
+            )
+
+    def test_summarize(self):
+        """Tests aggregating results."""
+        results = [
+            _result(True, 60.0, 1.0, 0),
+            _result(True, 80.0, 3.0, 2),
+            _result(False, 600.0, 5.0, 0),
+            _result(True, 70.0, 2.0, 0),
+        ]
+        summary = monte_carlo.summarize(results, (0, 50, 100))
+        self.assertEqual(summary['runs'], 4)
+        self.assertEqual(summary['finished_fraction'], 0.75)
+        self.assertEqual(summary['collision_fraction'], 0.25)
+        # Runs that didn't finish don't have a lap time
+        self.assertEqual(summary['lap_time_s'], [60.0, 70.0, 80.0])
+        self.assertEqual(summary['max_cross_track_m'], [1.0, 2.5, 5.0])
+        self.assertEqual(summary['collisions'], [0.0, 0.0, 2.0])
+
+        summary = monte_carlo.summarize(results[2:3], (50,))
+        self.assertEqual(summary['lap_time_s'], [None])
+
+    def test_evaluate(self):
+        """Worker processes should get the same results as running the
+        trials here.
+        """
+        course_index = monte_carlo.load_course_index('sparkfun-avc-2016.kml')
+        self.assertEqual(len(course_index._obstacles), 3)  # pylint: disable=protected-access
+
+        trials = monte_carlo.random_trials(2, 3)
+        results = monte_carlo.evaluate(
+            'solid-state-depot.kml',
+            'simple',
+            trials,
+            processes=2,
+            timeout_s=20.0
+        )
+        self.assertEqual(len(results), 2)
+        waypoint_generator = SimpleWaypointGenerator(
+            SimpleWaypointGenerator.get_waypoints_from_file_name(
+                'solid-state-depot.kml'
+            )
+        )
+        for trial, result in zip(trials, results):
+            expected = Simulation(
+                waypoint_generator,
+                trial.seed,
+                gps_sigma_m=trial.gps_sigma_m,
+                compass_bias_d=trial.compass_bias_d,
+                start_offset_m=trial.start_offset_m,
+                start_heading_offset_d=trial.start_heading_offset_d
+            ).run(20.0)
+            self.assertEqual(result, expected)
+
+        self.assertRaises(
+            ValueError,
+            monte_carlo.evaluate,
+            'solid-state-depot.kml',
+            'unknown',
+            trials
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
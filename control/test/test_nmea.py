@@ -0,0 +1,95 @@
+"""Tests the NMEA sentence parsing."""
+
+import unittest
+
+from control import nmea
+
+# These are the examples from the SkyTraq datasheet
+GPRMC = '$GPRMC,111636.932,A,2447.0949,N,12100.5223,E,000.0,000.0,030407,003.9,W,A*12\r\n'
+GPGGA = '$GPGGA,111636.932,2447.0949,N,12100.5223,E,1,11,0.8,118.2,M,,,,0000*02\r\n'
+GPGSA = '$GPGSA,A,3,23,03,26,09,27,16,22,31,,,,,1.9,1.1,1.5*31\r\n'
+GPVTG = '$GPVTG,000.0,T,,M,000.0,N,000.0,K,A*0D\r\n'
+GPGSV = '$GPGSV,3,1,12,05,54,069,45,12,44,061,44,21,07,184,46,22,78,289,47*72\r\n'
+
+
+class TestNmea(unittest.TestCase):
+    """Tests the NMEA sentence parsing."""
+
+    def test_checksum(self):
+        """Tests checksum validation."""
+        for sentence in (GPRMC, GPGGA, GPGSA, GPVTG, GPGSV):
+            self.assertTrue(nmea.valid_checksum(sentence))
+        self.assertFalse(nmea.valid_checksum(GPRMC.replace('*12', '*13')))
+        self.assertFalse(nmea.valid_checksum(GPRMC.replace('*12', '*hh')))
+        self.assertFalse(nmea.valid_checksum(GPRMC.replace('*12', '')))
+        self.assertRaises(ValueError, nmea.parse, GPRMC.replace('A*12', 'D*12'))
+
+    def test_rmc(self):
+        """Tests RMC parsing."""
+        rmc = nmea.parse(GPRMC)
+        self.assertIsInstance(rmc, nmea.RmcMessage)
+        self.assertAlmostEqual(rmc.latitude_d, 24 + 47.0949 / 60.0)
+        self.assertAlmostEqual(rmc.longitude_d, 121 + 0.5223 / 60.0)
+        self.assertEqual(rmc.speed_m_s, 0.0)
+        self.assertEqual(rmc.course_d, 0.0)
+        # 2007-04-03 11:16:36.932 UTC
+        self.assertAlmostEqual(rmc.timestamp_s, 1175598996.932, 3)
+        self.assertFalse(hasattr(rmc, '__dict__'))
+
+        # Multi-constellation sentences and the other hemispheres
+        gnrmc = nmea.parse(
+            '$GNRMC,235959.000,A,4005.4290,S,10511.1050,W,9.719,180.0,311216,,,A*79\r\n'
+        )
+        self.assertAlmostEqual(gnrmc.latitude_d, -(40 + 5.429 / 60.0))
+        self.assertAlmostEqual(gnrmc.longitude_d, -(105 + 11.105 / 60.0))
+        self.assertAlmostEqual(gnrmc.speed_m_s, 5.0, 3)
+        self.assertAlmostEqual(gnrmc.timestamp_s, 1483228799.0)
+
+        no_fix = '$GPRMC,111636.932,V,,,,,,,030407,,,N*47\r\n'
+        self.assertTrue(nmea.valid_checksum(no_fix))
+        self.assertRaises(ValueError, nmea.parse, no_fix)
+
+    def test_other_sentences(self):
+        """Tests GGA, GSA, VTG and GSV parsing."""
+        gga = nmea.parse(GPGGA)
+        self.assertAlmostEqual(gga.latitude_d, 24 + 47.0949 / 60.0)
+        self.assertAlmostEqual(gga.seconds_of_day, 40596.932)
+        self.assertEqual(gga.quality, 1)
+        self.assertEqual(gga.satellites_used, 11)
+        self.assertEqual(gga.hdop, 0.8)
+        self.assertEqual(gga.altitude_m, 118.2)
+
+        gsa = nmea.parse(GPGSA)
+        self.assertTrue(gsa.automatic)
+        self.assertEqual(gsa.fix_type, 3)
+        self.assertEqual(gsa.satellites_used, 8)
+        self.assertEqual((gsa.pdop, gsa.hdop, gsa.vdop), (1.9, 1.1, 1.5))
+
+        # NMEA 4.1 appends a system ID
+        gsa = nmea.parse(
+            '$GNGSA,A,3,80,71,73,79,69,,,,,,,,1.83,1.09,1.47,2*09\r\n'
+        )
+        self.assertEqual(gsa.satellites_used, 5)
+        self.assertEqual((gsa.pdop, gsa.hdop, gsa.vdop), (1.83, 1.09, 1.47))
+
+        vtg = nmea.parse(GPVTG)
+        self.assertEqual((vtg.course_d, vtg.speed_m_s), (0.0, 0.0))
+
+        gsv = nmea.parse(GPGSV)
+        self.assertEqual(gsv.message_count, 3)
+        self.assertEqual(gsv.message_number, 1)
+        self.assertEqual(gsv.satellites_in_view, 12)
+        self.assertEqual(len(gsv.satellites), 4)
+        self.assertEqual(gsv.satellites[-1], (22, 78, 289, 47))
+
+        self.assertIsNone(nmea.parse('$PSTI,004,001,1,34.7,121.6,-48.2,99912,29.4*08\r\n'))
+
+    def test_short_sentences(self):
+        """Sentences that were cut off should raise ValueError."""
+        for sentence in (GPRMC, GPGGA, GPGSA, GPVTG, GPGSV):
+            short = sentence[:sentence.find(',', 7)] + '\r\n'
+            self.assertRaises(ValueError, nmea.parse, short, validate=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""Tests the location filter noise tuning."""
+
+import numpy
+import unittest
+
+from control import location_smoother
+from control import noise_tuning
+from control.test.test_location_smoother import _make_run
+
+# pylint: disable=no-member
+# pylint: disable=protected-access
+
+
+class TestNoiseTuning(unittest.TestCase):
+    """Tests the location filter noise tuning."""
+
+    def test_grid(self):
+        """Tests building configurations."""
+        configurations = noise_tuning.grid(
+            compass_noise=(20.0, 45.0, 90.0),
+            process_noise_x_m=(0.1, 1.0)
+        )
+        self.assertEqual(
+            configurations.shape,
+            (6, len(noise_tuning.PARAMETERS))
+        )
+        column = noise_tuning.PARAMETERS.index('compass_noise')
+        self.assertEqual(
+            sorted(set(configurations[:, column].tolist())),
+            [20.0, 45.0, 90.0]
+        )
+        column = noise_tuning.PARAMETERS.index('gps_speed_noise')
+        self.assertTrue(
+            (
+                configurations[:, column]
+                == noise_tuning.DEFAULTS['gps_speed_noise']
+            ).all()
+        )
+        self.assertTrue(numpy.array_equal(
+            noise_tuning.grid()[0],
+            noise_tuning.default_configuration()
+        ))
+        self.assertRaises(ValueError, noise_tuning.grid, bogus=(1.0,))
+
+    def test_evaluate_matches_filter(self):
+        """The innovation statistics should match the ones from the location
+        filter model in location_smoother.
+        """
+        run, _ = _make_run(100, 3)
+        initial_estimates = (0.0, 0.0, 90.0, 0.0)
+        results = noise_tuning.evaluate(
+            run,
+            noise_tuning.default_configuration(),
+            initial_estimates=initial_estimates,
+            burn_in=0
+        )
+
+        filtered = location_smoother.filter_forward(
+            run,
+            initial_estimates=initial_estimates
+        )
+        nis_total = 0.0
+        log_likelihood_total = 0.0
+        observed_count = 0
+        for index in range(len(run['timestamp_s'])):
+            indices = numpy.flatnonzero(run['observed'][index])
+            innovation = run['measurements'][index, indices] \
+                - filtered['predicted_estimates'][index, indices]
+            innovation[indices == 2] = \
+                (innovation[indices == 2] + 180.0) % 360.0 - 180.0
+            hphtr = filtered['predicted_covariances'][index][indices][:, indices] \
+                + numpy.diag(run['noise'][index, indices])
+            nis_total += innovation.dot(numpy.linalg.solve(hphtr, innovation))
+            log_likelihood_total += 0.5 * numpy.log(numpy.linalg.det(hphtr))
+            observed_count += len(indices)
+        log_likelihood_total += 0.5 * nis_total
+
+        self.assertAlmostEqual(results['nis'][0], nis_total / observed_count)
+        self.assertAlmostEqual(
+            results['negative_log_likelihood'][0],
+            log_likelihood_total / observed_count
+        )
+
+    def test_sweep(self):
+        """Batched, chunked and parallel sweeps should agree, and the GPS
+        noise that the run was made with should score best.
+        """
+        run, _ = _make_run(300, 4)
+        configurations = noise_tuning.grid(
+            gps_accuracy_scale=(0.1, 1.0, 10.0),
+            process_noise_x_m=(0.01, 1.0),
+            process_noise_y_m=(0.01, 1.0),
+            process_noise_speed_m_s=(0.01,)
+        )
+        results = noise_tuning.evaluate(run, configurations)
+        for chunk_size, processes in ((5, None), (4, 2)):
+            other_results = noise_tuning.sweep(
+                run,
+                configurations,
+                processes=processes,
+                chunk_size=chunk_size
+            )
+            for key in ('nis', 'negative_log_likelihood'):
+                self.assertTrue(
+                    numpy.allclose(results[key], other_results[key])
+                )
+
+        best = noise_tuning.best(configurations, results, count=3)
+        self.assertEqual(len(best), 3)
+        self.assertEqual(best[0][2]['gps_accuracy_scale'], 1.0)
+        scores = [score for score, _, _ in best]
+        self.assertEqual(scores, sorted(scores))
+
+        best = noise_tuning.best(
+            configurations,
+            results,
+            count=len(configurations),
+            method=noise_tuning.SCORE_NIS
+        )
+        self.assertEqual(len(best), len(configurations))
+        self.assertEqual(
+            [abs(nis - 1.0) for _, nis, _ in best],
+            [score for score, _, _ in best]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
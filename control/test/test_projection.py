@@ -0,0 +1,87 @@
+"""Tests the local tangent plane projection."""
+
+import numpy
+import random
+import unittest
+
+from control.projection import LocalTangentPlane
+from control.projection import M_PER_D_LATITUDE
+
+# pylint: disable=no-member
+
+
+class TestProjection(unittest.TestCase):
+    """Tests the local tangent plane projection."""
+
+    def test_round_trip(self):
+        """Converting to meters and back should give the same coordinates."""
+        projection = LocalTangentPlane(40.091244, -105.185276)
+        rand = random.Random(1)
+        for _ in range(100):
+            latitude_d = 40.091244 + rand.uniform(-0.01, 0.01)
+            longitude_d = -105.185276 + rand.uniform(-0.01, 0.01)
+            x_m = projection.longitude_to_x_m(longitude_d, latitude_d)
+            y_m = projection.latitude_to_y_m(latitude_d)
+            self.assertAlmostEqual(projection.y_m_to_latitude(y_m), latitude_d)
+            self.assertAlmostEqual(
+                projection.x_m_to_longitude(x_m, latitude_d),
+                longitude_d
+            )
+
+        self.assertEqual(projection.latitude_to_y_m(40.091244), 0.0)
+        self.assertEqual(projection.longitude_to_x_m(-105.185276, 40.0), 0.0)
+        self.assertAlmostEqual(
+            projection.latitude_to_y_m(41.091244),
+            M_PER_D_LATITUDE
+        )
+
+    def test_m_per_d_longitude(self):
+        """The scale is calculated for the origin latitude."""
+        self.assertAlmostEqual(
+            LocalTangentPlane(0.0, 0.0).m_per_d_longitude,
+            M_PER_D_LATITUDE
+        )
+        self.assertAlmostEqual(
+            LocalTangentPlane(90.0, 0.0).m_per_d_longitude,
+            0.0
+        )
+        projection = LocalTangentPlane(40.08, -105.0)
+        self.assertEqual(
+            projection.m_per_d_longitude,
+            LocalTangentPlane.calculate_m_per_d_longitude(40.08)
+        )
+        self.assertEqual(
+            projection.longitude_to_x_m(-104.0, 40.0),
+            projection.longitude_to_x_m(-104.0, 40.1)
+        )
+
+    def test_arrays(self):
+        """Array conversions should match the scalar conversions."""
+        projection = LocalTangentPlane(40.091244, -105.185276)
+        rand = random.Random(2)
+        latitudes_d = [40.0 + rand.uniform(-0.2, 0.2) for _ in range(50)]
+        longitudes_d = [-105.2 + rand.uniform(-0.2, 0.2) for _ in range(50)]
+
+        x_m, y_m = projection.to_m(latitudes_d, longitudes_d)
+        self.assertEqual(x_m.shape, (50,))
+        for index, (latitude_d, longitude_d) in enumerate(
+                zip(latitudes_d, longitudes_d)
+        ):
+            self.assertEqual(
+                x_m[index],
+                projection.longitude_to_x_m(longitude_d, latitude_d)
+            )
+            self.assertEqual(y_m[index], projection.latitude_to_y_m(latitude_d))
+
+        round_trip_latitudes_d, round_trip_longitudes_d = \
+            projection.to_degrees(x_m, y_m)
+        self.assertTrue(numpy.allclose(round_trip_latitudes_d, latitudes_d))
+        self.assertTrue(numpy.allclose(round_trip_longitudes_d, longitudes_d))
+
+        x_m, y_m = projection.to_m([], [])
+        self.assertEqual(len(x_m), 0)
+        self.assertEqual(len(y_m), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+"""Tests the structured run log."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from control import run_log
+from control.run_log import RunLog
+
+GPS_READING = {
+    'latitude_d': 40.0,
+    'longitude_d': -105.0,
+    'accuracy_m': 5.0,
+    'heading_d': None,
+    'speed_m_s': 1.5,
+    'timestamp_s': 1000.0,
+    'device_id': 'phone',
+}
+
+
+class TestRunLog(unittest.TestCase):
+    """Tests the structured run log."""
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        RunLog().close()
+        shutil.rmtree(self._directory)
+
+    def test_layout(self):
+        """The NumPy and struct layouts should match."""
+        for stream, columns in run_log.COLUMNS.items():
+            self.assertEqual(
+                run_log.DTYPES[stream].itemsize,
+                run_log._STRUCTS[stream].size  # pylint: disable=protected-access
+            )
+            self.assertEqual(
+                run_log.DTYPES[stream].names,
+                tuple(name for name, _ in columns)
+            )
+
+    def test_closed(self):
+        """Nothing should be written until the log is opened."""
+        RunLog().write_reading(GPS_READING)
+        RunLog().write_event(run_log.START)
+        self.assertEqual(len(os.listdir(self._directory)), 0)
+        self.assertEqual(len(run_log.load_runs(self._directory)), 0)
+        self.assertEqual(
+            len(run_log.load_stream(self._directory, run_log.GPS)),
+            0
+        )
+
+    def test_runs(self):
+        """Each run should map to a slice of the records."""
+        log = RunLog()
+        log.open(self._directory)
+        log.write_reading(GPS_READING, 1.0)
+        log.write_event(run_log.START, 2.0)
+        log.write_reading(dict(GPS_READING, latitude_d=41.0), 3.0)
+        log.write_reading(
+            {'compass_d': 90.0, 'confidence': 1.0, 'device_id': 'sup800f'},
+            3.5
+        )
+        log.write_command(1.0, -0.5, 4.0)
+        log.write_event(run_log.STUCK, 4.5)
+        log.write_event(run_log.STOP, 5.0)
+        log.write_event(run_log.START, 6.0)
+        log.write_reading(
+            {
+                'acceleration_g_x': 0.1,
+                'acceleration_g_y': 0.2,
+                'acceleration_g_z': 1.0,
+                'device_id': 'sup800f',
+            },
+            7.0
+        )
+        # Unknown messages are ignored
+        log.write_reading({'load_waypoints': 'course.kml'})
+        log.close()
+
+        runs = run_log.load_runs(self._directory)
+        self.assertEqual(len(runs), 2)
+        self.assertEqual((runs[0]['start_s'], runs[0]['stop_s']), (2.0, 5.0))
+        self.assertEqual(runs[0][run_log.GPS], slice(1, 2))
+        self.assertIsNone(runs[1]['stop_s'])
+        self.assertEqual(runs[1][run_log.ACCELEROMETER], slice(0, None))
+
+        gps = run_log.load_run(self._directory, run_log.GPS, 0)
+        self.assertIsInstance(gps.base, numpy.memmap)
+        self.assertEqual(gps['latitude_d'].tolist(), [41.0])
+        self.assertEqual(gps['device_id'].tolist(), [b'phone'])
+        self.assertTrue(numpy.isnan(gps['heading_d'][0]))
+        compass = run_log.load_run(self._directory, run_log.COMPASS, 0)
+        self.assertEqual(compass['compass_d'].tolist(), [90.0])
+        command = run_log.load_run(self._directory, run_log.COMMAND, 0)
+        self.assertEqual(command[['throttle', 'steering']].tolist(), [(1.0, -0.5)])
+        self.assertEqual(
+            len(run_log.load_run(self._directory, run_log.COMMAND, 1)),
+            0
+        )
+        accelerometer = run_log.load_run(
+            self._directory,
+            run_log.ACCELEROMETER,
+            1
+        )
+        self.assertEqual(accelerometer['acceleration_g_z'].tolist(), [1.0])
+        self.assertEqual(
+            run_log.load_events(self._directory, run_log.STUCK).tolist(),
+            [4.5]
+        )
+
+    def test_long_device_id(self):
+        """Long device IDs should be truncated on a character boundary."""
+        log = RunLog()
+        log.open(self._directory)
+        # The 16th byte is the middle of an e acute
+        log.write_reading(
+            dict(GPS_READING, device_id='phones-' + '\u00e9' * 5),
+            1.0
+        )
+        log.close()
+        gps = run_log.load_stream(self._directory, run_log.GPS)
+        device_id = gps[0]['device_id']
+        self.assertLessEqual(len(device_id), run_log.DEVICE_ID_SIZE)
+        self.assertEqual(device_id.decode('utf-8'), 'phones-' + '\u00e9' * 4)
+
+    def test_reopen(self):
+        """Reopening should append after the last whole record."""
+        log = RunLog()
+        log.open(self._directory)
+        log.write_reading(GPS_READING, 1.0)
+        log.close()
+        # Simulate a crash in the middle of a write
+        with open(run_log.file_name(self._directory, run_log.GPS), 'ab') as file_:
+            file_.write(b'\x00' * 3)
+
+        log.open(self._directory)
+        log.write_event(run_log.START, 2.0)
+        log.write_reading(dict(GPS_READING, latitude_d=41.0), 3.0)
+        log.close()
+
+        gps = run_log.load_stream(self._directory, run_log.GPS)
+        self.assertEqual(gps['latitude_d'].tolist(), [40.0, 41.0])
+        self.assertEqual(
+            run_log.load_run(self._directory, run_log.GPS, 0)['time_s'].tolist(),
+            [3.0]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
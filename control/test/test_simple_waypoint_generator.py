@@ -170,6 +170,15 @@ class TestSimpleWaypointGenerator(unittest.TestCase):
             )
         )
 
+        # Getting within 1m shouldn't leave a stale distance behind that
+        # makes the next waypoint count as reached right away
+        waypoint_generator.reset()
+        waypoint_generator._waypoints = ((0, 0), (0, 5))
+        self.assertFalse(waypoint_generator.reached(0.0, -2.0))
+        self.assertTrue(waypoint_generator.reached(0.0, -0.5))
+        waypoint_generator.next()
+        self.assertFalse(waypoint_generator.reached(0.0, -0.4))
+
     def test_next(self):
         """Tests the next waypoint method."""
         waypoint_generator = self.make_generator()
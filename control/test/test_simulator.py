@@ -0,0 +1,171 @@
+"""Tests the closed loop simulation."""
+
+import time
+import unittest
+
+# Importing the simulator patches out the logger, so it goes first
+from control.test.simulator import CourseTracker
+from control.test.simulator import Simulation
+from control.test.simulator import distance_to_segment_m
+from control.clock import VirtualClock
+from control.command import Command
+from control.course_index import CourseIndex
+from control.extension_waypoint_generator import ExtensionWaypointGenerator
+from control.simple_waypoint_generator import SimpleWaypointGenerator
+from control.test.dummy_driver import DummyDriver
+from control.test import monte_carlo
+from control.test.dummy_telemetry import DummyTelemetry
+from messaging import broker
+from messaging import config
+
+# pylint: disable=protected-access
+
+
+class TestSimulator(unittest.TestCase):
+    """Tests the closed loop simulation."""
+
+    def test_clock(self):
+        """The virtual clock should only advance when slept on."""
+        clock = VirtualClock(10.0)
+        self.assertEqual(clock.time(), 10.0)
+        clock.sleep(0.5)
+        clock.sleep(-1.0)
+        self.assertEqual(clock.time(), 10.5)
+
+    def test_wait(self):
+        """Command should wake up early for new readings while running the
+        course and otherwise wait out the rest of its period.
+        """
+        clock = VirtualClock()
+        telemetry = DummyTelemetry((0.0, 0.0), clock)
+        waypoint_generator = SimpleWaypointGenerator([(0.0, 0.0)])
+        command = Command(
+            telemetry,
+            DummyDriver(telemetry),
+            waypoint_generator,
+            100.0,
+            clock
+        )
+        command._wait()
+        self.assertAlmostEqual(clock.time(), 0.1)
+
+        # Time spent awake counts against the period
+        clock.sleep(0.03)
+        command._wait()
+        self.assertAlmostEqual(clock.time(), 0.2)
+
+        # Readings don't wake up the idle loop
+        self.assertEqual(telemetry._update_events, [])
+
+        command.run_course()
+        for event in telemetry._update_events:
+            event.set()
+        command._wait()
+        self.assertAlmostEqual(clock.time(), 0.2)
+        self.assertFalse(command._wakeup.is_set())
+
+        command._wait()
+        self.assertAlmostEqual(clock.time(), 0.3)
+
+        command.stop()
+        self.assertEqual(telemetry._update_events, [])
+
+    def test_no_sockets(self):
+        """Simulations shouldn't bind the exchange sockets."""
+        clock = VirtualClock()
+        telemetry = DummyTelemetry((0.0, 0.0), clock)
+        Command(
+            telemetry,
+            DummyDriver(telemetry),
+            SimpleWaypointGenerator([(0.0, 0.0)]),
+            100.0,
+            clock
+        )
+        self.assertNotIn(config.COMMAND_EXCHANGE, broker._exchanges)
+
+    def test_distance_to_segment(self):
+        """Tests the cross track distance."""
+        self.assertEqual(distance_to_segment_m((1, 1), (0, 0), (2, 0)), 1.0)
+        self.assertEqual(distance_to_segment_m((5, 4), (0, 0), (2, 0)), 5.0)
+        self.assertEqual(distance_to_segment_m((-3, 4), (0, 0), (2, 0)), 5.0)
+        self.assertEqual(distance_to_segment_m((3, 4), (0, 0), (0, 0)), 5.0)
+
+    def test_course_tracker(self):
+        """Driving exactly along the legs shouldn't count any collisions or
+        cross track error, and driving through an obstacle is one collision.
+        """
+        kml_file_name = 'sparkfun-avc-2016.kml'
+        waypoints = SimpleWaypointGenerator.get_waypoints_from_file_name(
+            kml_file_name
+        )
+        start_m = (waypoints[0][0] - 10.0, waypoints[0][1])
+        tracker = CourseTracker(
+            start_m,
+            waypoints,
+            monte_carlo.load_course_index(kml_file_name)
+        )
+        legs = zip([start_m] + waypoints[:-1], waypoints)
+        for index, (leg_start_m, leg_end_m) in enumerate(legs):
+            for step in range(100):
+                fraction = step / 100.0
+                tracker.add(
+                    (
+                        leg_start_m[0]
+                        + fraction * (leg_end_m[0] - leg_start_m[0]),
+                        leg_start_m[1]
+                        + fraction * (leg_end_m[1] - leg_start_m[1]),
+                    ),
+                    index
+                )
+        self.assertEqual(tracker.collisions, 0)
+        self.assertLess(tracker.max_cross_track_m, 1e-6)
+
+        square = [(4.0, -1.0), (6.0, -1.0), (6.0, 1.0), (4.0, 1.0)]
+        tracker = CourseTracker(
+            (0.0, 0.0),
+            [(10.0, 0.0)],
+            CourseIndex([], [square])
+        )
+        for x_m in range(11):
+            tracker.add((float(x_m), 0.5), 0)
+        self.assertEqual(tracker.collisions, 1)
+        self.assertEqual(tracker.max_cross_track_m, 0.5)
+
+    def test_deterministic(self):
+        """Runs with the same seed should drive the same path."""
+        waypoints = SimpleWaypointGenerator.get_waypoints_from_file_name(
+            'solid-state-depot.kml'
+        )
+        for waypoint_generator in (
+                SimpleWaypointGenerator(waypoints),
+                ExtensionWaypointGenerator(waypoints),
+        ):
+            first = Simulation(waypoint_generator, 1).run()
+            self.assertTrue(first.finished)
+            self.assertEqual(first.waypoints_reached, len(waypoints))
+            self.assertLess(first.mean_error_m, 5.0)
+            self.assertGreater(first.distance_m, 100.0)
+
+            self.assertEqual(Simulation(waypoint_generator, 1).run(), first)
+            self.assertNotEqual(Simulation(waypoint_generator, 2).run(), first)
+
+            timed_out = Simulation(waypoint_generator, 1).run(timeout_s=10.0)
+            self.assertFalse(timed_out.finished)
+            self.assertAlmostEqual(timed_out.elapsed_s, 10.0, delta=0.05)
+
+    def test_speed(self):
+        """A simulated lap should run much faster than real time."""
+        waypoints = SimpleWaypointGenerator.get_waypoints_from_file_name(
+            'solid-state-depot.kml'
+        )
+        simulation = Simulation(SimpleWaypointGenerator(waypoints), 1)
+        start = time.time()
+        result = simulation.run()
+        wall_s = time.time() - start
+        self.assertTrue(result.finished)
+        # About 500x on a desktop; leave plenty of room for slow machines
+        self.assertGreater(result.elapsed_s / wall_s, 100.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
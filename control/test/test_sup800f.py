@@ -0,0 +1,240 @@
+"""Tests the SUP800F binary frame decoding."""
+
+import math
+import random
+import struct
+import unittest
+
+from control.sup800f import FrameDecoder
+from control.sup800f import StreamDemultiplexer
+from control.sup800f import check_response
+from control.sup800f import format_message
+from control.sup800f import get_message
+from control.sup800f import parse_binary
+from control.sup800f import parse_navigation
+from control.sup800f import read_frames
+from control.sup800f import read_messages
+
+
+class DummySerial(object):
+    """Serial port that returns canned data in random sized chunks. Only
+    provides the pyserial 2.7 interface.
+    """
+
+    def __init__(self, data, seed=0):
+        self._data = data
+        self._random = random.Random(seed)
+        self.reads = 0
+
+    def inWaiting(self):  # pylint: disable=invalid-name,missing-docstring
+        return min(self._random.randint(0, 50), len(self._data))
+
+    def read(self, size=1):  # pylint: disable=missing-docstring
+        self.reads += 1
+        data = self._data[:size]
+        self._data = self._data[size:]
+        return data
+
+
+def _binary_message(values):
+    """Makes a binary sensor message."""
+    return format_message(
+        struct.pack('!BBx', 0xCF, 0x01) + struct.pack('!ffffffIf', *values)
+    )
+
+
+def navigation_message(latitude_d, longitude_d, speed_m_s, heading_d):
+    """Makes a navigation data message. The velocity is converted to ECEF."""
+    latitude_r = math.radians(latitude_d)
+    longitude_r = math.radians(longitude_d)
+    east = speed_m_s * math.sin(math.radians(heading_d)) * 100
+    north = speed_m_s * math.cos(math.radians(heading_d)) * 100
+    velocity = (
+        -math.sin(longitude_r) * east
+        - math.sin(latitude_r) * math.cos(longitude_r) * north,
+        math.cos(longitude_r) * east
+        - math.sin(latitude_r) * math.sin(longitude_r) * north,
+        math.cos(latitude_r) * north,
+    )
+    return format_message(
+        struct.pack(
+            '!BBBHIiiIIHHHHHiiiiii',
+            0xA8, 2, 9,
+            1913, 31946400,  # 2016-09-07 16:44:06 UTC, with 18 leap seconds
+            int(round(latitude_d * 1e7)), int(round(longitude_d * 1e7)),
+            160000, 159000,
+            190, 150, 110, 130, 100,
+            0, 0, 0,
+            *(int(round(value)) for value in velocity)
+        )
+    )
+
+
+class TestSup800f(unittest.TestCase):
+    """Tests the SUP800F binary frame decoding."""
+
+    def test_frame_decoder(self):
+        """Frames should be found no matter how the bytes are split up."""
+        messages = [
+            format_message(bytes([0x83, index])) for index in range(20)
+        ]
+        stream = b'$GPRMC,garbage\r\n\xA0'.join(messages) + b'\xA0\xA1'
+
+        for seed in range(10):
+            rand = random.Random(seed)
+            decoder = FrameDecoder()
+            frames = []
+            position = 0
+            while position < len(stream):
+                size = rand.randint(1, 10)
+                decoder.feed(stream[position:position + size])
+                position += size
+                frame = decoder.next_frame()
+                while frame is not None:
+                    frames.append(frame)
+                    frame = decoder.next_frame()
+            self.assertEqual(frames, messages)
+
+    def test_bad_frames(self):
+        """Frames with bad checksums or tails should be dropped."""
+        good = format_message(b'\x83\x09')
+        bad_checksum = bytearray(good)
+        bad_checksum[-3] ^= 0xFF
+        bad_tail = bytearray(good)
+        bad_tail[-1] = 0
+        # A header that shows up in the middle of garbage
+        false_header = b'\xA0\xA1\x00\x01'
+
+        decoder = FrameDecoder()
+        decoder.feed(
+            false_header + bytes(bad_checksum) + bytes(bad_tail) + good
+        )
+        self.assertEqual(decoder.next_frame(), good)
+        self.assertEqual(decoder.next_frame(), None)
+        self.assertEqual(decoder.checksum_errors, 3)
+
+        decoder.feed(good[:5])
+        decoder.reset()
+        decoder.feed(good)
+        self.assertEqual(decoder.next_frame(), good)
+
+    def test_false_header_length(self):
+        """A false header with a huge payload length shouldn't hold up the
+        frames behind it.
+        """
+        good = format_message(b'\x83\x09')
+        decoder = FrameDecoder()
+        decoder.feed(b'\xA0\xA1\xFF\xF0' + good)
+        self.assertEqual(decoder.next_frame(), good)
+        self.assertEqual(decoder.checksum_errors, 1)
+
+        demultiplexer = StreamDemultiplexer()
+        demultiplexer.feed(b'\xA0\xA1\xFF\xF0' + good)
+        self.assertEqual(demultiplexer.next_message(), good)
+
+    def test_read_frames(self):
+        """Tests reading frames from a serial port."""
+        values = (0.5, -0.25, 1.0, 10.0, 20.0, -30.0, 101325, 21.5)
+        message = _binary_message(values)
+        ser = DummySerial(b'junk' + message * 100)
+        frames = [frame for _, frame in zip(range(100), read_frames(ser))]
+        self.assertEqual(len(frames), 100)
+        self.assertEqual(tuple(parse_binary(frames[-1])), values)
+        # Reads should be batched instead of one byte at a time
+        self.assertLess(ser.reads, len(message) * 10)
+
+        self.assertRaises(
+            ValueError,
+            get_message,
+            DummySerial(b'\x00' * 2000),
+            1000
+        )
+
+    def test_read_pyserial_2_7(self):
+        """Reading should only need the pyserial 2.7 interface."""
+        message = format_message(b'\x83\x01')
+        ser = DummySerial(message * 3)
+        self.assertFalse(hasattr(ser, 'in_waiting'))
+        self.assertEqual(
+            [frame for _, frame in zip(range(3), read_frames(ser))],
+            [message] * 3
+        )
+
+    def test_demultiplexer(self):
+        """NMEA sentences and binary frames should be split apart."""
+        gprmc = (
+            '$GPRMC,123456.789,A,4005.429,N,10511.105,W,9.719,180.0,030415,'
+            '003.9,W,A*0C\r\n'
+        )
+        gpgsa = '$GPGSA,A,3,23,03,26,09,27,16,22,31,,,,,1.9,1.1,1.5*31\r\n'
+        bad_gpgsa = gpgsa.replace('*31', '*32')
+        binary = _binary_message((0.0, 0.0, 1.0, 36.0, 4.0, 0.0, 1, 20.0))
+        # Binary data can contain $ characters
+        ack = format_message(b'\x83$')
+        messages = [gprmc, binary, gpgsa, ack, gprmc]
+        stream = b''.join(
+            message.encode('ascii') if isinstance(message, str) else message
+            for message in (
+                gprmc, binary, 'garbage', bad_gpgsa, '$GPRMC,1234\r\n', gpgsa,
+                ack, '$GP', gprmc
+            )
+        )
+
+        for seed in range(10):
+            rand = random.Random(seed)
+            demultiplexer = StreamDemultiplexer()
+            found = []
+            position = 0
+            while position < len(stream):
+                size = rand.randint(1, 30)
+                demultiplexer.feed(stream[position:position + size])
+                position += size
+                message = demultiplexer.next_message()
+                while message is not None:
+                    found.append(message)
+                    message = demultiplexer.next_message()
+            self.assertEqual(found, messages)
+
+        ser = DummySerial(stream)
+        self.assertEqual(
+            [message for _, message in zip(range(5), read_messages(ser))],
+            messages
+        )
+
+    def test_parse_navigation(self):
+        """Tests parsing navigation data messages."""
+        message = navigation_message(40.090483, -105.185083, 5.0, 135.0)
+        navigation = parse_navigation(message)
+        self.assertEqual(navigation.fix_mode, 2)
+        self.assertEqual(navigation.satellites, 9)
+        self.assertAlmostEqual(navigation.latitude_d, 40.090483)
+        self.assertAlmostEqual(navigation.longitude_d, -105.185083)
+        self.assertAlmostEqual(navigation.hdop, 1.1)
+        self.assertAlmostEqual(navigation.speed_m_s, 5.0, 2)
+        self.assertAlmostEqual(navigation.heading_d, 135.0, 0)
+        self.assertAlmostEqual(navigation.timestamp_s, 1473266646.0)
+
+        self.assertIsNone(parse_binary(message))
+        self.assertRaises(
+            EnvironmentError,
+            parse_navigation,
+            _binary_message((0.0,) * 6 + (0, 0.0))
+        )
+
+    def test_check_response(self):
+        """Tests waiting for ack and nack responses."""
+        ack = format_message(b'\x83\x09')
+        nack = format_message(b'\x84\x09')
+        other = format_message(b'\xA8' + b'\x00' * 58)
+        self.assertTrue(check_response(DummySerial(other + ack)))
+        self.assertFalse(check_response(DummySerial(other + nack)))
+        self.assertRaises(
+            EnvironmentError,
+            check_response,
+            DummySerial(other * 3 + ack),
+            2
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
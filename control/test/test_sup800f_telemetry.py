@@ -2,6 +2,10 @@
 
 # pylint: disable=protected-access
 
+import math
+import os
+import random
+import tempfile
 import unittest
 
 # Patch out the logger
@@ -14,16 +18,24 @@ from messaging import async_producers
 class DummyTelemetry(object):
     def __init__(self):
         self.message = {}
-    def gps_reading(self, lat, long, accuracy, bearing, speed, timestamp, device_id):
+    def gps_reading(self, lat, long, accuracy, bearing, speed, timestamp, device_id, monotonic_s=None):
         self.message['lat'] = lat
         self.message['long'] = long
         self.message['accuracy'] = accuracy
         self.message['bearing'] = bearing
         self.message['speed'] = speed
         self.message['timestamp'] = timestamp
+    def compass_reading(self, heading, confidence, device_id, monotonic_s=None):
+        self.message['compass'] = heading
+        self.message['confidence'] = confidence
+    def accelerometer_reading(self, x, y, z, device_id, monotonic_s=None):
+        self.message['acceleration'] = (x, y, z)
 async_producers.TelemetryProducer = DummyTelemetry
 
+from control.compass_calibration import CompassCalibration
+from control.sup800f import BinaryMessage
 from control.sup800f_telemetry import Sup800fTelemetry
+from control.test.test_sup800f import navigation_message
 
 
 class TestSup800fTelemetry(unittest.TestCase):
@@ -58,6 +70,91 @@ class TestSup800fTelemetry(unittest.TestCase):
         )
         self.assertEqual(sup800f._hdop, 1.1)
 
+    def test_handle_navigation(self):
+        """Tests that navigation data messages are turned into GPS readings."""
+        sup800f = Sup800fTelemetry(None)
+        sup800f._handle_message(
+            navigation_message(40.090483, -105.185083, 5.0, 270.0)
+        )
+        dummy_telemetry = sup800f._telemetry
+        self.assertAlmostEqual(dummy_telemetry.message['lat'], 40.090483, 6)
+        self.assertAlmostEqual(dummy_telemetry.message['long'], -105.185083, 6)
+        self.assertAlmostEqual(dummy_telemetry.message['bearing'], 270.0, 0)
+        self.assertAlmostEqual(dummy_telemetry.message['speed'], 5.0, 2)
+        self.assertAlmostEqual(sup800f._hdop, 1.1)
+
+        # NMEA sentences go through the same path
+        sup800f._handle_message(
+            '$GPGSA,A,3,23,03,26,09,27,16,22,31,,,,,1.9,1.5,1.5*35\r\n'
+        )
+        self.assertEqual(sup800f._hdop, 1.5)
+
+        # Below the cutoff speed, the compass heading is used
+        sup800f._last_compass_heading_d = 12.0
+        sup800f._handle_message(
+            navigation_message(40.090483, -105.185083, 1.0, 270.0)
+        )
+        self.assertEqual(dummy_telemetry.message['bearing'], 12.0)
+
+    def test_calibrate_compass(self):
+        """Tests calibrating the compass and saving the calibration."""
+        file_name = tempfile.mktemp()
+        try:
+            sup800f = Sup800fTelemetry(None, file_name)
+            sup800f.calibrate_compass(10)
+            rand = random.Random(0)
+            for _ in range(200):
+                angle = rand.uniform(0.0, 6.3)
+                sup800f._handle_binary(BinaryMessage(
+                    0.0, 0.0, 1.0,
+                    30.0 * math.cos(angle) + 5.0,
+                    20.0 * math.sin(angle) - 3.0,
+                    0.0,
+                    101325,
+                    20.0
+                ))
+            sup800f._finish_compass_calibration()
+            self.assertIsNone(sup800f._calibrate_compass_end_time)
+            offsets = sup800f._compass_calibration.offsets
+            self.assertAlmostEqual(offsets[0], 5.0)
+            self.assertAlmostEqual(offsets[1], -3.0)
+
+            # A new instance should pick up the saved calibration
+            reloaded = Sup800fTelemetry(None, file_name)
+            self.assertEqual(
+                reloaded._compass_calibration.to_dict(),
+                sup800f._compass_calibration.to_dict()
+            )
+        finally:
+            os.remove(file_name)
+
+    def test_calibrate_compass_too_few_readings(self):
+        """A failed calibration should keep the previous one."""
+        sup800f = Sup800fTelemetry(None)
+        previous = sup800f._compass_calibration.to_dict()
+        sup800f.calibrate_compass(10)
+        for flux_x, flux_y in ((10.0, 0.0), (-10.0, 0.0)):
+            sup800f._handle_binary(BinaryMessage(
+                0.0, 0.0, 1.0, flux_x, flux_y, 0.0, 101325, 20.0
+            ))
+        sup800f._finish_compass_calibration()
+        self.assertIsNone(sup800f._calibrate_compass_end_time)
+        self.assertEqual(sup800f._compass_calibration.to_dict(), previous)
+
+    def test_handle_binary_zero_std_dev(self):
+        """A calibration with no spread shouldn't break compass readings."""
+        sup800f = Sup800fTelemetry(None)
+        sup800f._compass_calibration = CompassCalibration(
+            offsets=(0.0, 0.0),
+            magnitude_mean=100.0,
+            magnitude_std_dev=0.0
+        )
+        message = BinaryMessage(0.0, 0.0, 1.0, 10.0, 0.0, 0.0, 101325, 20.0)
+        sup800f._handle_binary(message)
+        sup800f._handle_binary(message)
+        self.assertEqual(sup800f._dropped_compass_messages, 0)
+        self.assertEqual(sup800f._telemetry.message['confidence'], 1.0)
+
 
 if __name__ == '__main__':
     unittest.main()
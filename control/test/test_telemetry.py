@@ -470,6 +470,28 @@ different from the current algorithm.'''
             rally_parking_lot[1]
         )
 
+    def test_kml_coordinates_to_m(self):
+        """Tests converting KML coordinates to offsets in meters."""
+        text = '''
+            -105.185276,40.091244,0 -105.18,40.09,1600.5
+            -105.19,40.1,0
+        '''
+        points = Telemetry.kml_coordinates_to_m(text)
+        self.assertEqual(len(points), 3)
+        self.assertEqual(points[0], (0.0, 0.0))
+        for point, (longitude, latitude) in zip(
+                points[1:],
+                ((-105.18, 40.09), (-105.19, 40.1))
+        ):
+            self.assertAlmostEqual(
+                point[0],
+                Telemetry.longitude_to_m_offset(longitude, latitude)
+            )
+            self.assertAlmostEqual(
+                point[1],
+                Telemetry.latitude_to_m_offset(latitude)
+            )
+
     @mock.patch.object(Telemetry, '_m_point_in_course')
     def test_handle_telemetry_message(self, mpic):
         """Tests the handling of telemetry messages received from telemetry
@@ -0,0 +1,66 @@
+"""Tests the TelemetrySnapshot class."""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from control.telemetry_snapshot import FIELDS, TelemetrySnapshot
+
+
+class TestTelemetrySnapshot(unittest.TestCase):
+    """Tests the TelemetrySnapshot class."""
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def test_read_write(self):
+        """Written values should be read back."""
+        snapshot = TelemetrySnapshot()
+        self.assertEqual(snapshot.sequence(), 0)
+        snapshot.write(1.0, 2.0, 3.0, 4.0, 0.5, -0.5, 100.0)
+        self.assertEqual(snapshot.sequence(), 2)
+        self.assertEqual(
+            snapshot.read(),
+            dict(zip(FIELDS, (1.0, 2.0, 3.0, 4.0, 0.5, -0.5, 100.0)))
+        )
+
+    def test_shared_file(self):
+        """Other mappings of the same file should see the writes."""
+        file_name = os.path.join(self._directory, 'snapshot')
+        writer = TelemetrySnapshot(file_name)
+        reader = TelemetrySnapshot(file_name, create=False)
+        writer.write(1.0, 2.0, 3.0, 4.0, 0.5, -0.5, 100.0)
+        self.assertEqual(reader.read_values(), writer.read_values())
+        writer.close()
+        reader.close()
+
+    def test_consistent_reads(self):
+        """Readers should never see a partially written record."""
+        snapshot = TelemetrySnapshot()
+        run = [True]
+
+        def write():
+            """Writes records whose values are all the same."""
+            value = 0.0
+            while run[0]:
+                value += 1.0
+                snapshot.write(*([value] * len(FIELDS)))
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            for _ in range(10000):
+                values = snapshot.read_values()
+                self.assertEqual(len(set(values)), 1)
+        finally:
+            run[0] = False
+            writer.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+"""Tests ingesting readings from phones."""
+
+import json
+import mock
+import unittest
+
+# Patch out the logger
+from messaging import async_logger
+from control.test.dummy_logger import DummyLogger
+async_logger.AsyncLogger = DummyLogger
+
+from control.telemetry import Telemetry
+from control.web_telemetry import readings
+from control.web_telemetry.readings import RateLimiter
+from control.web_telemetry.readings import ReadingIngester
+from messaging import batching
+from messaging import telemetry_codec
+
+GPS_READING = {
+    'latitude_d': 40.0,
+    'longitude_d': -105.0,
+    'accuracy_m': 5.0,
+    'heading_d': None,
+    'speed_m_s': 1.5,
+    'timestamp_s': 1000.0,
+    'device_id': 'phone',
+}
+
+
+class TestWebTelemetryReadings(unittest.TestCase):
+    """Tests ingesting readings from phones."""
+
+    def setUp(self):
+        ReadingIngester().reset()
+
+    def test_validate(self):
+        """Readings should be checked against their schema."""
+        self.assertIs(readings.validate(GPS_READING), readings.GPS_SCHEMA)
+        self.assertIs(
+            readings.validate(
+                {'compass_d': 10, 'confidence': 1.0, 'device_id': 'phone'}
+            ),
+            readings.COMPASS_SCHEMA
+        )
+        for bad in (
+                [],
+                {'device_id': 'phone'},
+                dict(GPS_READING, latitude_d='40'),
+                dict(GPS_READING, accuracy_m=None),
+                dict(GPS_READING, speed_m_s=float('nan')),
+                dict(GPS_READING, speed_m_s=True),
+                dict(GPS_READING, speed_m_s=10 ** 400),
+                dict(GPS_READING, device_id=''),
+        ):
+            self.assertRaises(ValueError, readings.validate, bad)
+
+    def test_rate_limiter(self):
+        """Bursts should be allowed up to the burst size, then the rate."""
+        now = [0.0]
+        limiter = RateLimiter(2.0, 3, lambda: now[0])
+        self.assertEqual([limiter.allow() for _ in range(4)], [True] * 3 + [False])
+        now[0] += 1.0
+        self.assertEqual([limiter.allow() for _ in range(3)], [True] * 2 + [False])
+        now[0] += 100.0
+        self.assertEqual(sum(limiter.allow() for _ in range(10)), 3)
+
+    @mock.patch('control.web_telemetry.readings.TelemetryProducer')
+    def test_ingest(self, producer):
+        """Valid readings should be published together, and the rest
+        counted.
+        """
+        other = dict(GPS_READING, device_id='other', latitude_d=41.0)
+        summary = ReadingIngester().ingest_json(json.dumps([
+            GPS_READING,
+            {'latitude_d': 1.0},
+            other,
+        ]))
+        self.assertFalse(summary['success'])
+        self.assertEqual(summary['accepted'], 2)
+        self.assertEqual(summary['invalid'], 1)
+        producer().publish_readings.assert_called_once_with(
+            [GPS_READING, other]
+        )
+
+        producer.reset_mock()
+        summary = ReadingIngester().ingest_json(json.dumps(GPS_READING))
+        self.assertTrue(summary['success'])
+        producer().publish_readings.assert_called_once_with([GPS_READING])
+
+        self.assertFalse(ReadingIngester().ingest_json('{')['success'])
+
+        # Bursts beyond the limit are dropped
+        ReadingIngester().ingest_json(
+            json.dumps([GPS_READING] * readings.BURST_SIZE)
+        )
+        self.assertEqual(
+            ReadingIngester().counts(),
+            {
+                'phone': {
+                    'accepted': readings.BURST_SIZE,
+                    'invalid': 0,
+                    'rate_limited': 2,
+                },
+                'other': {'accepted': 1, 'invalid': 0, 'rate_limited': 0},
+                'unknown': {'accepted': 0, 'invalid': 2, 'rate_limited': 0},
+            }
+        )
+
+    @mock.patch('control.web_telemetry.readings.TelemetryProducer')
+    def test_huge_integer(self, producer):
+        """Integers too large to be floats should only reject their own
+        reading.
+        """
+        message = '[{}, {{"compass_d": 1{}, "confidence": 1, "device_id": "a"}}]'
+        summary = ReadingIngester().ingest_json(
+            message.format(json.dumps(GPS_READING), '0' * 400)
+        )
+        self.assertEqual(summary['accepted'], 1)
+        self.assertEqual(summary['invalid'], 1)
+        producer().publish_readings.assert_called_once_with([GPS_READING])
+
+    @mock.patch('control.web_telemetry.readings.TelemetryProducer')
+    @mock.patch('control.web_telemetry.readings.MAX_DEVICES', 3)
+    def test_device_limit(self, _):
+        """Only the most recently seen devices should be kept."""
+        for device_id in ('a', 'b', 'c', 'a', 'd'):
+            ReadingIngester().ingest([dict(GPS_READING, device_id=device_id)])
+        counts = ReadingIngester().counts()
+        self.assertEqual(sorted(counts), ['a', 'c', 'd'])
+        self.assertEqual(counts['a']['accepted'], 2)
+
+    @mock.patch('control.web_telemetry.readings.TelemetryProducer')
+    def test_ingest_binary(self, producer):
+        """Binary records and batches of them should be accepted."""
+        gps = telemetry_codec.encode_gps(
+            40.0, -105.0, 5.0, None, 1.5, 1000.0, 'phone'
+        )
+        compass = telemetry_codec.encode_compass(90.0, 1.0, 'phone')
+        summary = ReadingIngester().ingest_binary(batching.pack([gps, compass]))
+        self.assertEqual(summary['accepted'], 2)
+        published = producer().publish_readings.call_args[0][0]
+        self.assertEqual(published[0], GPS_READING)
+        self.assertEqual(published[1]['compass_d'], 90.0)
+
+        summary = ReadingIngester().ingest_binary(gps)
+        self.assertEqual(summary['accepted'], 1)
+        self.assertFalse(ReadingIngester().ingest_binary(b'{}')['success'])
+        self.assertFalse(ReadingIngester().ingest_binary(gps[:5])['success'])
+
+    @mock.patch('control.telemetry.AsyncLogger', DummyLogger)
+    @mock.patch('control.telemetry.consume_messages')
+    @mock.patch.object(Telemetry, '_m_point_in_course', return_value=True)
+    @mock.patch('control.web_telemetry.readings.TelemetryProducer')
+    def test_null_speed_to_telemetry(self, producer, *_):
+        """Phones send null speed until they get a fix, which Telemetry
+        should handle.
+        """
+        reading = dict(GPS_READING, speed_m_s=None)
+        summary = ReadingIngester().ingest_json(json.dumps(reading))
+        self.assertTrue(summary['success'])
+        published = producer().publish_readings.call_args[0][0]
+        self.assertEqual(published, [reading])
+
+        telemetry = Telemetry()
+        telemetry._handle_message(
+            telemetry_codec.encode_gps(
+                published[0]['latitude_d'],
+                published[0]['longitude_d'],
+                published[0]['accuracy_m'],
+                published[0]['heading_d'],
+                published[0]['speed_m_s'],
+                published[0]['timestamp_s'],
+                published[0]['device_id']
+            )
+        )
+        self.assertEqual(len(telemetry._speed_history), 0)
+        self.assertIs(telemetry._data['speed_m_s'], None)
+        self.assertIn('x_m', telemetry._data)
+
+
+if __name__ == '__main__':
+    unittest.main()
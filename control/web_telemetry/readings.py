@@ -0,0 +1,259 @@
+"""Forwards readings from phones to the telemetry exchange.
+
+Phones send one reading or a JSON array of readings per message, or binary
+telemetry records, optionally packed into a batch, over the websocket. All of
+the readings in a message are validated in one pass, rate limited per device,
+and published to the telemetry exchange as one batch.
+"""
+
+import collections
+import json
+import math
+import struct
+import threading
+import time
+
+from messaging import batching
+from messaging import telemetry_codec
+from messaging.async_logger import AsyncLogger
+from messaging.async_producers import TelemetryProducer
+from messaging.singleton_mixin import SingletonMixin
+
+# Phones report GPS about once a second, but they burst readings that were
+# queued while the WiFi was down
+RATE_LIMIT_HZ = 10.0
+BURST_SIZE = 100
+# Clients choose their own device IDs, so only keep state for the most
+# recently seen devices
+MAX_DEVICES = 100
+
+_NUMBER = 'number'
+_OPTIONAL_NUMBER = 'optional number'
+_STRING = 'string'
+
+GPS_SCHEMA = (
+    ('latitude_d', _NUMBER),
+    ('longitude_d', _NUMBER),
+    ('accuracy_m', _NUMBER),
+    ('heading_d', _OPTIONAL_NUMBER),
+    ('speed_m_s', _OPTIONAL_NUMBER),
+    ('timestamp_s', _OPTIONAL_NUMBER),
+    ('device_id', _STRING),
+)
+COMPASS_SCHEMA = (
+    ('compass_d', _NUMBER),
+    ('confidence', _NUMBER),
+    ('device_id', _STRING),
+)
+
+
+def _check_field(reading, name, type_):
+    """Raises ValueError if a field doesn't match its type."""
+    value = reading.get(name)
+    if type_ == _STRING:
+        if not isinstance(value, str) or not value:
+            raise ValueError('{} must be a non-empty string'.format(name))
+        return
+    if value is None and type_ == _OPTIONAL_NUMBER:
+        return
+    # bool is an int, but true isn't a reading
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        raise ValueError('{} must be a finite number'.format(name))
+    try:
+        finite = math.isfinite(value)
+    except OverflowError:
+        # JSON integers can be too large to be floats
+        finite = False
+    if not finite:
+        raise ValueError('{} must be a finite number'.format(name))
+
+
+def validate(reading):
+    """Returns the schema that a reading matches. Raises ValueError if it
+    doesn't match any.
+    """
+    if not isinstance(reading, dict):
+        raise ValueError('Readings must be objects')
+    if 'latitude_d' in reading:
+        schema = GPS_SCHEMA
+    elif 'compass_d' in reading:
+        schema = COMPASS_SCHEMA
+    else:
+        raise ValueError('Unknown reading type')
+    for name, type_ in schema:
+        _check_field(reading, name, type_)
+    return schema
+
+
+def decode_binary(data):
+    """Decodes a binary record, or a batch of them, into readings."""
+    if batching.is_batch(data):
+        records = batching.split(data)
+    else:
+        records = (data,)
+    readings = []
+    for record in records:
+        if not telemetry_codec.is_binary(record):
+            raise ValueError('Binary messages must be telemetry records')
+        readings.append(telemetry_codec.decode(record))
+    return readings
+
+
+class RateLimiter(object):
+    """Token bucket rate limiter."""
+
+    def __init__(self, rate_hz, burst_size, clock=None):
+        """clock defaults to time.time."""
+        if clock is None:
+            clock = time.time
+        self._rate_hz = rate_hz
+        self._burst_size = burst_size
+        self._clock = clock
+        self._tokens = float(burst_size)
+        self._last_s = clock()
+
+    def allow(self):
+        """Returns True if another event is allowed right now."""
+        now = self._clock()
+        self._tokens = min(
+            self._tokens + (now - self._last_s) * self._rate_hz,
+            self._burst_size
+        )
+        self._last_s = now
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        return True
+
+
+class ReadingIngester(SingletonMixin):
+    """Validates, rate limits and publishes readings from phones, and counts
+    what happened to them per device.
+    """
+
+    def __init__(self):
+        super(ReadingIngester, self).__init__()
+        # SingletonMixin calls __init__ every time the singleton is requested
+        if getattr(self, '_devices', None) is not None:
+            return
+        self._lock = threading.Lock()
+        # Maps device IDs to their rate limiter and counts, least recently
+        # seen first
+        self._devices = collections.OrderedDict()
+
+    def ingest_json(self, message):
+        """Ingests a JSON reading or array of readings. Returns the same
+        summary as ingest.
+        """
+        try:
+            readings = json.loads(message)
+        except ValueError as exc:
+            return self._reject(exc)
+        if not isinstance(readings, list):
+            readings = [readings]
+        return self.ingest(readings)
+
+    def ingest_binary(self, data):
+        """Ingests binary telemetry records. Returns the same summary as
+        ingest.
+        """
+        try:
+            readings = decode_binary(data)
+        except (ValueError, UnicodeDecodeError, struct.error) as exc:
+            return self._reject(exc)
+        return self.ingest(readings)
+
+    def ingest(self, readings):
+        """Ingests decoded readings. Returns a dict with the number of
+        accepted, rate limited and invalid readings, and the first error.
+        """
+        accepted = []
+        rate_limited = 0
+        errors = []
+        with self._lock:
+            for reading in readings:
+                try:
+                    validate(reading)
+                except ValueError as exc:
+                    errors.append(str(exc))
+                    device_id = reading.get('device_id') \
+                        if isinstance(reading, dict) else None
+                    if not isinstance(device_id, str):
+                        device_id = 'unknown'
+                    self._count(device_id, 'invalid')
+                    continue
+
+                device_id = reading['device_id']
+                limiter, _ = self._device(device_id)
+                if not limiter.allow():
+                    rate_limited += 1
+                    self._count(device_id, 'rate_limited')
+                    continue
+                self._count(device_id, 'accepted')
+                accepted.append(reading)
+
+        if accepted:
+            TelemetryProducer().publish_readings(accepted)
+        return self._summary(len(accepted), rate_limited, errors)
+
+    def _reject(self, exc):
+        """Counts a message that couldn't be decoded at all."""
+        with self._lock:
+            self._count('unknown', 'invalid')
+        return self._summary(0, 0, [str(exc)])
+
+    def _device(self, device_id):
+        """Returns the rate limiter and counts for a device, forgetting the
+        least recently seen device if there are too many. Must be called
+        with the lock held.
+        """
+        device = self._devices.pop(device_id, None)
+        if device is None:
+            device = (
+                RateLimiter(RATE_LIMIT_HZ, BURST_SIZE),
+                {'accepted': 0, 'invalid': 0, 'rate_limited': 0}
+            )
+            if len(self._devices) >= MAX_DEVICES:
+                self._devices.popitem(last=False)
+        self._devices[device_id] = device
+        return device
+
+    def _count(self, device_id, outcome):
+        """Counts a reading. Must be called with the lock held."""
+        self._device(device_id)[1][outcome] += 1
+
+    @staticmethod
+    def _summary(accepted, rate_limited, errors):
+        """Returns the summary of an ingested message, in the form that the
+        web telemetry page expects from POSTs. Logs any errors.
+        """
+        summary = {
+            'success': not errors,
+            'accepted': accepted,
+            'rate_limited': rate_limited,
+            'invalid': len(errors),
+        }
+        if errors:
+            summary['message'] = errors[0]
+            AsyncLogger().error(
+                'Dropped {} invalid web telemetry readings: {}'.format(
+                    len(errors),
+                    errors[0]
+                )
+            )
+        return summary
+
+    def counts(self):
+        """Returns the number of accepted, invalid and rate limited readings
+        for each recently seen device.
+        """
+        with self._lock:
+            return dict(
+                (device_id, dict(counts))
+                for device_id, (_, counts) in self._devices.items()
+            )
+
+    def reset(self):
+        """Clears the counters and rate limits."""
+        with self._lock:
+            self._devices = collections.OrderedDict()
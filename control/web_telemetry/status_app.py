@@ -1,18 +1,17 @@
 """Status page for the vehicle."""
 
 import cherrypy
-import netifaces
 import os
-import sys
-from ws4py.websocket import WebSocket
-import json
 
+from control.web_telemetry.readings import ReadingIngester
 from control.web_telemetry.web_socket_handler import WebSocketHandler
 from messaging.async_logger import AsyncLogger
-from messaging.async_producers import TelemetryProducer
+from monitor.network import get_host_ip
+from monitor.templates import WEB_TELEMETRY_INDEX_FILE_NAME
+from monitor.templates import read_template
+from monitor.templates import render_web_telemetry_index
 
 STATIC_DIR = 'static-web'
-WEB_TELEMETRY_DIR = 'control' + os.sep + 'web_telemetry' + os.sep
 
 
 class StatusApp(object):
@@ -22,51 +21,7 @@ class StatusApp(object):
         self._telemetry = telemetry
         logger = AsyncLogger()
         self._port = port
-
-        def get_ip(interface):
-            """Returns the IPv4 address of a given interface."""
-            try:
-                addresses = netifaces.ifaddresses(interface)
-                if len(addresses) == 0:
-                    return None
-                if netifaces.AF_INET not in addresses:
-                    return None
-                return addresses[netifaces.AF_INET][0]['addr']
-            except Exception as exc:  # pylint: disable=broad-except
-                logger.warn(
-                    'Exception trying to get interface address: {exc}'.format(
-                        exc=str(exc)
-                    )
-                )
-                return None
-
-        self._host_ip = None
-
-        def interface_preference(interface):
-            """Ordering function that orders wireless adapters first, then
-            physical, then loopback.
-            """
-            if interface.startswith('wlan') or interface == 'en1':
-                return 0
-            if interface.startswith('eth') or interface == 'en0':
-                return 1
-            if interface.startswith('lo'):
-                return 2
-            return 3
-
-        interfaces = sorted(netifaces.interfaces(), key=interface_preference)
-        for iface in interfaces:
-            self._host_ip = get_ip(iface)
-            if self._host_ip is not None:
-                logger.info(
-                    'Web telemetry server listening on {iface}'.format(
-                        iface=iface
-                    )
-                )
-                break
-        if self._host_ip is None:
-            logger.error('No valid host found, listening on loopback')
-            self._host_ip = get_ip('lo')
+        self._host_ip = get_host_ip(logger, 'Web telemetry server')
 
     @staticmethod
     def get_config(web_telemetry_root_dir):
@@ -88,30 +43,12 @@ class StatusApp(object):
         }
 
     @cherrypy.expose
-    def index(self):  # pylint: disable=no-self-use
+    def index(self):
         """Index page."""
-        # This is the worst templating ever, but I don't feel like it's worth
-        # installing a full engine just for this one substitution
-        index_page = None
-        index_file_name = WEB_TELEMETRY_DIR + 'index.html'
-        if sys.version_info.major == 2:
-            with open(index_file_name) as file_:
-                index_page = file_.read().decode('utf-8')
-        else:
-            with open(index_file_name, encoding='utf-8') as file_:
-                index_page = file_.read()
-        return index_page.replace(
-            '${webSocketAddress}',
-            '{host_ip}:{port}/telemetry/ws'.format(
-                host_ip=self._host_ip,
-                port=self._port
-            )
-        ).replace(
-            '${postAddress}',
-            '//{host_ip}:{port}/telemetry/post_telemetry'.format(
-                host_ip=self._host_ip,
-                port=self._port
-            )
+        return render_web_telemetry_index(
+            read_template(WEB_TELEMETRY_INDEX_FILE_NAME),
+            self._host_ip,
+            self._port
         )
 
     @cherrypy.expose
@@ -119,47 +56,20 @@ class StatusApp(object):
         """Dummy method to tell CherryPy to expose the web socket end point."""
         pass
 
+    @cherrypy.expose
+    @cherrypy.tools.json_out()
+    def ingestion_json(self):  # pylint: disable=no-self-use
+        """Returns how many readings from each device were accepted, invalid
+        or rate limited.
+        """
+        return ReadingIngester().counts()
+
     @cherrypy.expose
     @cherrypy.tools.allow(methods=['POST'])
     @cherrypy.tools.json_out()
     def post_telemetry(self, message):  # pylint: disable=no-self-use
         """End point for receiving telemetry readings. Some phones don't support
-        websockets, so just use plain old POST.
+        websockets, so just use plain old POST. The message can be one reading
+        or an array of them.
         """
-        try:
-            message = json.loads(str(message))
-
-            if 'latitude_d' in message:
-                TelemetryProducer().gps_reading(
-                    message['latitude_d'],
-                    message['longitude_d'],
-                    message['accuracy_m'],
-                    message['heading_d'],
-                    message['speed_m_s'],
-                    message['timestamp_s'],
-                    message['device_id'],
-                )
-            elif 'compass_d' in message:
-                TelemetryProducer().compass_reading(
-                    message['compass_d'],
-                    message['confidence'],
-                    message['device_id'],
-                )
-            else:
-                AsyncLogger().error(
-                    'Received unexpected web telemetry message: {}'.format(
-                        message
-                    )
-                )
-
-        except Exception as exc:  # pylint: disable=broad-except
-            AsyncLogger().error(
-                'Invalid POST telemetry message "{}": {} {}'.format(
-                    message,
-                    type(exc),
-                    exc
-                )
-            )
-            return {'success': False, 'message': str(exc)}
-
-        return {'success': True}
+        return ReadingIngester().ingest_json(str(message))
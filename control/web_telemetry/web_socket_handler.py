@@ -1,10 +1,9 @@
 """Websocket handler for sending messages to clients."""
 
 from ws4py.websocket import WebSocket
-import json
 
 from messaging.async_logger import AsyncLogger
-from messaging.async_producers import TelemetryProducer
+from control.web_telemetry.readings import ReadingIngester
 
 
 class WebSocketHandler(WebSocket):  # pylint: disable=no-init
@@ -15,31 +14,9 @@ class WebSocketHandler(WebSocket):  # pylint: disable=no-init
         """Handler for receiving a message on the websocket."""
         try:
             if message.is_binary:
-                # TODO(2016-08-13) Log an error
-                return
-            message = json.loads(str(message))
-            if 'latitude_d' in message:
-                TelemetryProducer().gps_reading(
-                    message['latitude_d'],
-                    message['longitude_d'],
-                    message['accuracy_m'],
-                    message['heading_d'],
-                    message['speed_m_s'],
-                    message['timestamp_s'],
-                    message['device_id'],
-                )
-            elif 'compass_d' in message:
-                TelemetryProducer().compass_reading(
-                    message['compass_d'],
-                    message['confidence'],
-                    message['device_id'],
-                )
+                ReadingIngester().ingest_binary(message.data)
             else:
-                AsyncLogger().error(
-                    'Received unexpected web telemetry message: "{}"'.format(
-                        message
-                    )
-                )
+                ReadingIngester().ingest_json(str(message))
         # We need to catch all exceptions because any that are raised will close
         # the websocket
         except Exception as exc:  # pylint: disable=broad-except
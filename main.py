@@ -1,13 +1,11 @@
 """Main command module that starts the different threads."""
-from ws4py.server.cherrypyserver import WebSocketPlugin
-from ws4py.server.cherrypyserver import WebSocketTool
 import argparse
-import cherrypy
 import datetime
 import logging
 import os
 import serial
 import signal
+import ssl
 import subprocess
 import sys
 import threading
@@ -18,16 +16,15 @@ from control.driver import Driver, STEERING_GPIO_PIN, STEERING_NEUTRAL_US, THROT
 from control.simple_waypoint_generator import SimpleWaypointGenerator
 from control.chase_waypoint_generator import ChaseWaypointGenerator
 from control.extension_waypoint_generator import ExtensionWaypointGenerator
-from control.sup800f import switch_to_nmea_mode
+from control.run_log import RunLog
+from control.sup800f import switch_to_binary_mode
 from control.sup800f_telemetry import Sup800fTelemetry
 from control.telemetry import Telemetry
 from control.telemetry_dumper import TelemetryDumper
-from control.web_telemetry.status_app import StatusApp as WebTelemetryStatusApp
 from messaging import config
 from messaging.async_logger import AsyncLogger, AsyncLoggerReceiver
-from messaging.message_consumer import consume_messages
 from messaging.message_producer import MessageProducer
-from monitor.status_app import StatusApp as MonitorApp
+from monitor.telemetry_stream import TelemetryStream
 from monitor.web_socket_logging_handler import WebSocketLoggingHandler
 
 # pylint: disable=global-statement
@@ -49,14 +46,8 @@ def override_imports_for_non_rpi():
     Driver = lambda *arg: Dummy()
     global Sup800fTelemetry
     Sup800fTelemetry = lambda *arg: Dummy()
-    global switch_to_nmea_mode
-    switch_to_nmea_mode = lambda *arg: Dummy()
-    # Ignore messages
-    drop = lambda message: None
-    drop2 = lambda: consume_messages(config.COMMAND_FORWARDED_EXCHANGE, drop)
-    thread = threading.Thread(target=drop2)
-    thread.name = config.COMMAND_FORWARDED_EXCHANGE
-    thread.start()
+    global switch_to_binary_mode
+    switch_to_binary_mode = lambda *arg: Dummy()
 
 try:
     from control.button import Button
@@ -64,12 +55,25 @@ except SystemError:
     print('Disabling button because not running on Raspberry Pi')
     override_imports_for_non_rpi()
 
+# Shared memory, so that helpers outside of this process can read the
+# telemetry estimates
+TELEMETRY_SNAPSHOT_FILE_NAME = '/dev/shm/sparkfun-avc-telemetry'
+# Compass calibrations are kept across runs, so the car doesn't need to be
+# recalibrated every time it's started
+COMPASS_CALIBRATION_FILE_NAME = os.path.expanduser(
+    '~/.sparkfun-avc-compass-calibration.json'
+)
+
 THREADS = []
 POPEN = None
 DRIVER = None
 EMIT_INITIALIZED = False
 
 
+SSL_CERTIFICATE_FILE_NAME = 'control/web_telemetry/cert.pem'
+SSL_PRIVATE_KEY_FILE_NAME = 'control/web_telemetry/key.pem'
+
+
 class CherryPyServer(threading.Thread):
     """Runs the various web apps in a thread."""
 
@@ -77,6 +81,14 @@ class CherryPyServer(threading.Thread):
         super(CherryPyServer, self).__init__()
         self.name = self.__class__.__name__
 
+        # CherryPy is imported here so that the asyncio server doesn't pay
+        # for loading it
+        import cherrypy
+        from ws4py.server.cherrypyserver import WebSocketPlugin
+        from ws4py.server.cherrypyserver import WebSocketTool
+        from control.web_telemetry.status_app import StatusApp as WebTelemetryStatusApp
+        from monitor.status_app import StatusApp as MonitorApp
+
         # Web monitor
         config = MonitorApp.get_config(os.path.abspath(os.getcwd()))
         status_app = cherrypy.tree.mount(
@@ -88,8 +100,8 @@ class CherryPyServer(threading.Thread):
             'server.socket_host': address,
             'server.socket_port': port,
             'server.ssl_module': 'builtin',
-            'server.ssl_certificate': 'control/web_telemetry/cert.pem',
-            'server.ssl_private_key': 'control/web_telemetry/key.pem',
+            'server.ssl_certificate': SSL_CERTIFICATE_FILE_NAME,
+            'server.ssl_private_key': SSL_PRIVATE_KEY_FILE_NAME,
             'engine.autoreload.on': False,
         })
 
@@ -111,14 +123,35 @@ class CherryPyServer(threading.Thread):
 
     def run(self):
         """Runs the thread and server in a thread."""
+        import cherrypy
         cherrypy.engine.start()
 
     @staticmethod
     def kill():
         """Stops the thread and server."""
+        import cherrypy
         cherrypy.engine.exit()
 
 
+def make_async_server(port, address, telemetry, waypoint_generator):
+    """Returns the asyncio web server, serving HTTPS with the same
+    certificate as CherryPyServer.
+    """
+    from monitor.async_server import AsyncServer
+    ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ssl_context.load_cert_chain(
+        SSL_CERTIFICATE_FILE_NAME,
+        SSL_PRIVATE_KEY_FILE_NAME
+    )
+    return AsyncServer(
+        port,
+        address,
+        telemetry,
+        waypoint_generator,
+        ssl_context
+    )
+
+
 def terminate(signal_number, stack_frame):  # pylint: disable=unused-argument
     """Terminates the program. Used when a signal is received."""
     print(
@@ -134,6 +167,7 @@ def terminate(signal_number, stack_frame):  # pylint: disable=unused-argument
             pass
 
     DRIVER.drive(0.0, 0.0)
+    DRIVER.close()
     time.sleep(0.2)
     try:
         with open('/dev/pi-blaster', 'w') as blaster:
@@ -155,6 +189,9 @@ def terminate(signal_number, stack_frame):  # pylint: disable=unused-argument
     except IOError:
         pass
 
+    RunLog().close()
+    # Send any batched log messages before the consumers are killed
+    AsyncLogger().flush()
     for socket in os.listdir(os.sep.join(('.', 'messaging', 'sockets'))):
         MessageProducer(socket).kill()
     time.sleep(0.1)
@@ -184,30 +221,30 @@ def get_configuration(value, default):
 def start_threads(
         waypoint_generator,
         logger,
-        web_socket_handler,
         max_throttle,
         kml_file_name,
+        async_server=False,
 ):
     """Runs everything."""
     logger.info('Creating Telemetry')
-    telemetry = Telemetry(kml_file_name)
+    telemetry = Telemetry(kml_file_name, TELEMETRY_SNAPSHOT_FILE_NAME)
     telemetry_dumper = TelemetryDumper(
         telemetry,
         waypoint_generator,
-        web_socket_handler
+        TelemetryStream()
     )
     logger.info('Done creating Telemetry')
     global DRIVER
     DRIVER = Driver(telemetry)
     DRIVER.set_max_throttle(max_throttle)
 
-    logger.info('Setting SUP800F to NMEA mode')
+    logger.info('Setting SUP800F to binary mode')
     serial_ = serial.Serial('/dev/ttyAMA0', 115200)
     serial_.setTimeout(1.0)
     for _ in range(10):
         serial_.readline()
     try:
-        switch_to_nmea_mode(serial_)
+        switch_to_binary_mode(serial_)
     except:  # pylint: disable=W0702
         logger.error('Unable to set mode')
     for _ in range(10):
@@ -216,32 +253,43 @@ def start_threads(
 
     # The following objects must be created in order, because of message
     # exchange dependencies:
-    # sup800f_telemetry: reads from command forwarded
-    # command: reads from command, writes to command forwarded
+    # sup800f_telemetry: reads from command
+    # command: reads from command
     # button: writes to command
-    # cherry_py_server: writes to command
+    # web_server: writes to command
     # TODO(2016-08-21) Have something better than sleeps to work around race
     # conditions
     logger.info('Creating threads')
-    sup800f_telemetry = Sup800fTelemetry(serial_)
+    sup800f_telemetry = Sup800fTelemetry(
+        serial_,
+        COMPASS_CALIBRATION_FILE_NAME
+    )
     time.sleep(0.5)
     command = Command(telemetry, DRIVER, waypoint_generator)
     time.sleep(0.5)
     button = Button()
     port = int(get_configuration('PORT', 8080))
     address = get_configuration('ADDRESS', '0.0.0.0')
-    cherry_py_server = CherryPyServer(
-        port,
-        address,
-        telemetry,
-        waypoint_generator
-    )
+    if async_server:
+        web_server = make_async_server(
+            port,
+            address,
+            telemetry,
+            waypoint_generator
+        )
+    else:
+        web_server = CherryPyServer(
+            port,
+            address,
+            telemetry,
+            waypoint_generator
+        )
     time.sleep(0.5)
 
     global THREADS
     THREADS += (
         button,
-        cherry_py_server,
+        web_server,
         command,
         sup800f_telemetry,
         telemetry_dumper,
@@ -257,8 +305,8 @@ def start_threads(
     # stop the command module
     command.stop()
     command.join(100000000000)
-    cherry_py_server.kill()
-    cherry_py_server.join(100000000000)
+    web_server.kill()
+    web_server.join(100000000000)
     button.kill()
     button.join(100000000000)
 
@@ -286,6 +334,22 @@ def make_parser():
         type=str
     )
 
+    parser.add_argument(
+        '--run-log',
+        dest='run_log',
+        help='The directory to write the structured run log to. The analysis'
+        ' scripts can read it much faster than the text log.',
+        default=(
+            '/data/sparkfun-{date}.runlog'.format(
+                date=datetime.datetime.strftime(
+                    now,
+                    '%Y-%m-%d_%H-%M-%S'
+                )
+            )
+        ),
+        type=str
+    )
+
     parser.add_argument(
         '--video',
         dest='video',
@@ -309,6 +373,16 @@ def make_parser():
         action='store_true'
     )
 
+    parser.add_argument(
+        '--log-level',
+        dest='log_level',
+        help='The lowest level to write to the log file. Debug messages'
+        ' are expensive to format, so use info while racing.',
+        choices=('debug', 'info', 'warning', 'error'),
+        default='debug',
+        type=str,
+    )
+
     parser.add_argument(
         '-k',
         '--kml',
@@ -326,6 +400,21 @@ def make_parser():
         type=float,
     )
 
+    parser.add_argument(
+        '--json-telemetry',
+        dest='json_telemetry',
+        help='Send telemetry readings as JSON instead of binary records.',
+        action='store_true'
+    )
+
+    parser.add_argument(
+        '--async-server',
+        dest='async_server',
+        help='Serve the web apps from an asyncio event loop instead of'
+        ' CherryPy. Requires Python 3.7 or newer.',
+        action='store_true'
+    )
+
     parser.add_argument(
         '--chase',
         dest='chase',
@@ -343,6 +432,13 @@ def main():
     parser = make_parser()
     args = parser.parse_args()
 
+    # The async server uses async/await and asyncio.all_tasks
+    if args.async_server and sys.version_info < (3, 7):
+        parser.error('--async-server requires Python 3.7 or newer')
+
+    if args.json_telemetry:
+        config.TELEMETRY_WIRE_FORMAT = config.WIRE_FORMAT_JSON
+
     #try:
     #    global POPEN
     #    POPEN = subprocess.Popen((
@@ -363,7 +459,7 @@ def main():
             os.remove(args.log)
         file_handler = logging.FileHandler(args.log)
         file_handler.setFormatter(formatter)
-        file_handler.setLevel(logging.DEBUG)
+        file_handler.setLevel(getattr(logging, args.log_level.upper()))
         concrete_logger.addHandler(file_handler)
         try:
             last_log = os.path.dirname(args.log) + os.sep + 'last-log.txt'
@@ -374,6 +470,11 @@ def main():
     except Exception as exception:
         logging.warning('Could not create file log: ' + str(exception))
 
+    try:
+        RunLog().open(args.run_log)
+    except Exception as exception:
+        logging.warning('Could not create run log: ' + str(exception))
+
     stdout_handler = logging.StreamHandler(sys.stdout)
     if args.verbose:
         stdout_handler.setLevel(logging.DEBUG)
@@ -392,6 +493,8 @@ def main():
     web_socket_handler.setLevel(logging.INFO)
     web_socket_handler.setFormatter(formatter)
     concrete_logger.addHandler(web_socket_handler)
+    # Don't send messages that none of the handlers will write
+    async_logger.update_level()
 
     logger = AsyncLogger()
 
@@ -424,9 +527,9 @@ def main():
     start_threads(
         waypoint_generator,
         logger,
-        web_socket_handler,
         args.max_throttle,
         kml_file,
+        args.async_server,
     )
 
 
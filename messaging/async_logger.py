@@ -1,6 +1,7 @@
 """Logger that sends messages over Unix domain sockets."""
 
 import json
+import logging
 import threading
 
 from messaging import config
@@ -9,50 +10,101 @@ from messaging.message_producer import MessageProducer
 from messaging.singleton_mixin import SingletonMixin
 
 
+# pylint: disable=global-statement
+# pylint: disable=invalid-name
+
+# Records below this level are never consumed, so AsyncLogger drops them
+# before doing any formatting or sending. AsyncLoggerReceiver keeps this up to
+# date with the level of its logger.
+_effective_level = logging.DEBUG
+
+
+def set_level(level):
+    """Sets the lowest level that will be sent."""
+    global _effective_level
+    _effective_level = level
+
+
+def get_level():
+    """Returns the lowest level that will be sent."""
+    return _effective_level
+
+
 class AsyncLogger(SingletonMixin):
-    """Logger that sends messages over Unix domain sockets."""
+    """Logger that sends messages over Unix domain sockets.
+
+    Messages can be passed lazily, so that callers don't pay for formatting
+    messages for disabled levels. If extra arguments are given, the message is
+    formatted with them using str.format. If the message or any of the
+    arguments are callable, they are called first. For example:
+        logger.debug('Estimates: {}', lambda: json.dumps(estimates))
+    """
 
     def __init__(self):
         super(AsyncLogger, self).__init__()
-        self._producer = MessageProducer(config.LOGS_EXCHANGE)
+        # SingletonMixin calls __init__ every time the singleton is requested,
+        # but there should only be one batching producer
+        if getattr(self, '_producer', None) is not None:
+            return
+        self._producer = MessageProducer(
+            config.LOGS_EXCHANGE,
+            batch_delay_s=config.LOGS_BATCH_DELAY_S
+        )
         self.warning = self.warn
 
-    def debug(self, message):
+    @staticmethod
+    def is_enabled_for(level):
+        """Returns True if messages at the given logging level are sent."""
+        return level >= _effective_level
+
+    def debug(self, message, *args):
         """Forwards messages to debug log."""
-        self._producer.publish(json.dumps({
-            'level': 'debug',
-            'message': message
-        }))
+        if _effective_level <= logging.DEBUG:
+            self._publish('debug', message, args)
 
-    def info(self, message):
+    def info(self, message, *args):
         """Forwards messages to info log."""
-        self._producer.publish(json.dumps({
-            'level': 'info',
-            'message': message
-        }))
+        if _effective_level <= logging.INFO:
+            self._publish('info', message, args)
 
-    def warn(self, message):
+    def warn(self, message, *args):
         """Forwards messages to warn log."""
-        self._producer.publish(json.dumps({
-            'level': 'warn',
-            'message': message
-        }))
+        if _effective_level <= logging.WARNING:
+            self._publish('warn', message, args)
 
-    def error(self, message):
+    def error(self, message, *args):
         """Forwards messages to error log."""
-        self._producer.publish(json.dumps({
-            'level': 'error',
-            'message': message
-        }))
+        if _effective_level <= logging.ERROR:
+            self._publish('error', message, args)
 
-    def critical(self, message):
+    def critical(self, message, *args):
         """Forwards messages to critical log."""
+        if _effective_level <= logging.CRITICAL:
+            self._publish('critical', message, args)
+
+    def flush(self):
+        """Sends any batched messages immediately."""
+        self._producer.flush()
+
+    def _publish(self, level, message, args):
+        """Formats and sends a message."""
         self._producer.publish(json.dumps({
-            'level': 'critical',
-            'message': message
+            'level': level,
+            'message': format_message(message, args)
         }))
 
 
+def format_message(message, args):
+    """Formats a possibly lazy message."""
+    if callable(message):
+        message = message()
+    if args:
+        message = message.format(
+            *(arg() if callable(arg) else arg for arg in args)
+        )
+    return message
+
+
 class AsyncLoggerReceiver(object):
     """Class that handles Unix domain socket messages."""
 
@@ -65,6 +117,8 @@ class AsyncLoggerReceiver(object):
             'error': logger.error,
             'critical': logger.critical,
         }
+        self._logger = logger
+        self.update_level()
         consume = lambda: consume_messages(config.LOGS_EXCHANGE, self._callback)
         self._thread = threading.Thread(target=consume)
         self._thread.name = '{}:consume_messages'.format(
@@ -83,6 +137,17 @@ class AsyncLoggerReceiver(object):
         """Joins the inner thread."""
         self._thread.join()
 
+    def update_level(self):
+        """Tells AsyncLogger the lowest level that any of the logger's
+        handlers will emit, so that lower levels aren't sent at all. This
+        should be called again after handlers are added or changed.
+        """
+        level = self._logger.getEffectiveLevel()
+        handler_levels = [handler.level for handler in self._logger.handlers]
+        if handler_levels:
+            level = max(level, min(handler_levels))
+        set_level(level)
+
     def _callback(self, json_data):
         """Callback that handles log messages."""
         data = json.loads(json_data)
@@ -3,6 +3,8 @@
 import json
 
 from messaging import config
+from messaging import latency
+from messaging import telemetry_codec
 from messaging.message_producer import MessageProducer
 from messaging.singleton_mixin import SingletonMixin
 
@@ -40,7 +42,16 @@ class TelemetryProducer(SingletonMixin):
 
     def __init__(self):
         super(TelemetryProducer, self).__init__()
-        self._producer = MessageProducer(config.TELEMETRY_EXCHANGE)
+        # SingletonMixin calls __init__ every time the singleton is requested,
+        # but there should only be one batching producer
+        if getattr(self, '_producer', None) is not None:
+            return
+        self._producer = MessageProducer(
+            config.TELEMETRY_EXCHANGE,
+            batch_delay_s=config.TELEMETRY_BATCH_DELAY_S
+        )
+        self._encoder = telemetry_codec.get_encoder()
+        self._latency = latency.LatencyRecorder()
 
     def gps_reading(
             self,
@@ -50,58 +61,76 @@ class TelemetryProducer(SingletonMixin):
             heading_d,
             speed_m_s,
             timestamp_s,
-            device_id
+            device_id,
+            monotonic_s=None
+    ):
+        """Sends a GPS reading. monotonic_s is when the reading was taken,
+        from latency.now_s, if it's known.
+        """
+        self._latency.record(latency.PRODUCER, monotonic_s)
+        self._producer.publish(self._encoder.gps(
+            latitude_d,
+            longitude_d,
+            accuracy_m,
+            heading_d,
+            speed_m_s,
+            timestamp_s,
+            device_id,
+            monotonic_s
+        ))
+
+    def compass_reading(
+            self,
+            compass_d,
+            confidence,
+            device_id,
+            monotonic_s=None
     ):
-        """Sends a GPS reading."""
-        self._producer.publish(json.dumps({
-            'latitude_d': latitude_d,
-            'longitude_d': longitude_d,
-            'accuracy_m': accuracy_m,
-            'heading_d': heading_d,
-            'speed_m_s': speed_m_s,
-            'timestamp_s': timestamp_s,
-            'device_id': device_id,
-        }))
-
-    def compass_reading(self, compass_d, confidence, device_id):
         """Sends a compass reading."""
-        self._producer.publish(json.dumps({
-            'compass_d': compass_d,
-            'confidence': confidence,
-            'device_id': device_id,
-        }))
+        self._latency.record(latency.PRODUCER, monotonic_s)
+        self._producer.publish(
+            self._encoder.compass(compass_d, confidence, device_id, monotonic_s)
+        )
+
+    def publish_readings(self, readings):
+        """Sends decoded GPS and compass readings together as one batch."""
+        for reading in readings:
+            if 'latitude_d' in reading:
+                message = self._encoder.gps(
+                    reading['latitude_d'],
+                    reading['longitude_d'],
+                    reading['accuracy_m'],
+                    reading.get('heading_d'),
+                    reading.get('speed_m_s'),
+                    reading.get('timestamp_s'),
+                    reading['device_id']
+                )
+            else:
+                message = self._encoder.compass(
+                    reading['compass_d'],
+                    reading['confidence'],
+                    reading['device_id']
+                )
+            self._producer.publish(message)
+        self._producer.flush()
 
     def accelerometer_reading(
             self,
             acceleration_g_x,
             acceleration_g_y,
             acceleration_g_z,
-            device_id
+            device_id,
+            monotonic_s=None
     ):
         """Sends an accelerometer reading."""
-        self._producer.publish(json.dumps({
-            'acceleration_g_x': acceleration_g_x,
-            'acceleration_g_y': acceleration_g_y,
-            'acceleration_g_z': acceleration_g_z,
-            'device_id': device_id,
-        }))
-
-
-class CommandForwardProducer(SingletonMixin):
-    """Forwards commands to another exchange."""
-    # This is a complete hack. I couldn't figure out how to do multiple
-    # consumers, but I only need it for one producer (command) and I only have
-    # two consumers, so I'll just manually forward them. I know this is fragile
-    # and tightly coupled, because handlers shouldn't need to or know about
-    # forwarding messages.
-    # TODO(skari): Implement multi consumer
-    def __init__(self):
-        super(CommandForwardProducer, self).__init__()
-        self._producer = MessageProducer(config.COMMAND_FORWARDED_EXCHANGE)
-
-    def forward(self, message):
-        """Forwards the message."""
-        self._producer.publish(message)
+        self._latency.record(latency.PRODUCER, monotonic_s)
+        self._producer.publish(self._encoder.accelerometer(
+            acceleration_g_x,
+            acceleration_g_y,
+            acceleration_g_z,
+            device_id,
+            monotonic_s
+        ))
 
 
 class WaypointProducer(SingletonMixin):
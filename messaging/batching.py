@@ -0,0 +1,39 @@
+"""Packs several messages into a single datagram and splits them back apart.
+
+A batch starts with a marker byte followed by each message prefixed with its
+length. 0xB7 can't start a UTF-8 string or a binary telemetry record, so
+batches can be told apart from single messages.
+"""
+
+import struct
+
+BATCH_MARKER = b'\xB7'
+_LENGTH = struct.Struct('!H')
+LENGTH_BYTES = _LENGTH.size
+
+
+def is_batch(datagram):
+    """Returns True if the datagram is a batch of messages."""
+    return datagram[:1] == BATCH_MARKER
+
+
+def pack(messages):
+    """Packs encoded messages into a single datagram."""
+    parts = [BATCH_MARKER]
+    for message in messages:
+        parts.append(_LENGTH.pack(len(message)))
+        parts.append(message)
+    return b''.join(parts)
+
+
+def split(datagram):
+    """Yields the individual messages in a batch."""
+    offset = len(BATCH_MARKER)
+    end = len(datagram)
+    while offset < end:
+        length = _LENGTH.unpack_from(datagram, offset)[0]
+        offset += LENGTH_BYTES
+        if offset + length > end:
+            raise ValueError('Truncated batch')
+        yield datagram[offset:offset + length]
+        offset += length
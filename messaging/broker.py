@@ -0,0 +1,186 @@
+"""Publish/subscribe layer on top of the Unix domain socket exchanges.
+
+Only one socket can be bound per exchange, so the broker binds it once and
+fans every received message out to any number of subscribers. Each subscriber
+has its own bounded queue and a policy for what happens when that queue is
+full. The same message object is handed to every subscriber, so messages are
+not copied per subscriber.
+"""
+
+import collections
+import threading
+
+from messaging.message_consumer import consume_messages
+
+# pylint: disable=invalid-name
+
+DROP_OLDEST = 'drop-oldest'
+BLOCK = 'block'
+DEFAULT_MAX_SIZE = 100
+
+_exchanges = {}
+_exchanges_lock = threading.Lock()
+
+
+class Subscription(object):
+    """A single subscriber to an exchange. If a callback is provided, it is
+    called from a dedicated thread for every message; otherwise, the owner
+    pulls messages with get(). If a threading.Event is provided, it is set
+    whenever a message is queued, so that the owner can wait on several
+    sources at once.
+    """
+
+    def __init__(
+            self,
+            name,
+            callback=None,
+            max_size=None,
+            policy=None,
+            event=None
+    ):
+        if max_size is None:
+            max_size = DEFAULT_MAX_SIZE
+        if policy is None:
+            policy = DROP_OLDEST
+        if policy not in (DROP_OLDEST, BLOCK):
+            raise ValueError('Unknown backpressure policy: {}'.format(policy))
+        if max_size < 1:
+            raise ValueError('Queue size must be positive')
+
+        self._name = name
+        self._callback = callback
+        self._max_size = max_size
+        self._policy = policy
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._event = event
+        self.dropped_count = 0
+
+        self._thread = None
+        if callback is not None:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.name = name
+            self._thread.start()
+
+    def put(self, message):
+        """Queues a message for this subscriber, applying the backpressure
+        policy if the queue is full.
+        """
+        with self._condition:
+            if self._policy == BLOCK:
+                while len(self._queue) >= self._max_size and not self._closed:
+                    self._condition.wait()
+            elif len(self._queue) >= self._max_size:
+                self._queue.popleft()
+                self.dropped_count += 1
+            if self._closed:
+                return
+            self._queue.append(message)
+            self._condition.notify_all()
+        if self._event is not None:
+            self._event.set()
+
+    def get(self, block=None, timeout=None):
+        """Returns the next message. Returns None if there is no message
+        within the timeout, if block is False and the queue is empty, or if
+        the subscription has been closed.
+        """
+        if block is None:
+            block = True
+        with self._condition:
+            while not self._queue:
+                if not block or self._closed:
+                    return None
+                if not self._condition.wait(timeout):
+                    return None
+            message = self._queue.popleft()
+            # Wake up any blocked publisher
+            self._condition.notify_all()
+            return message
+
+    def empty(self):
+        """Returns True if there are no queued messages."""
+        return not self._queue
+
+    def close(self):
+        """Stops delivering messages to this subscriber."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def _run(self):
+        """Delivers messages to the callback."""
+        while True:
+            message = self.get()
+            if message is None:
+                return
+            self._callback(message)
+
+
+class Exchange(object):
+    """Receives messages from an exchange socket and fans them out to all
+    subscribers.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._subscriptions = []
+        self._lock = threading.Lock()
+
+        self._thread = threading.Thread(target=self._consume)
+        self._thread.name = '{}:consume_messages:{}'.format(
+            self.__class__.__name__,
+            name
+        )
+        self._thread.start()
+
+    def subscribe(self, callback=None, max_size=None, policy=None, event=None):
+        """Adds a subscriber and returns its Subscription."""
+        with self._lock:
+            subscription = Subscription(
+                '{}:subscriber:{}'.format(
+                    self._name,
+                    len(self._subscriptions)
+                ),
+                callback,
+                max_size,
+                policy,
+                event
+            )
+            # Copy on write so that dispatching never needs the lock
+            self._subscriptions = self._subscriptions + [subscription]
+        return subscription
+
+    def _dispatch(self, message):
+        """Hands the message to every subscriber."""
+        for subscription in self._subscriptions:
+            subscription.put(message)
+
+    def _consume(self):
+        """Consumes messages until the exchange is shut down."""
+        try:
+            consume_messages(self._name, self._dispatch)
+        finally:
+            with _exchanges_lock:
+                if _exchanges.get(self._name) is self:
+                    del _exchanges[self._name]
+            for subscription in self._subscriptions:
+                subscription.close()
+
+
+def subscribe(
+        exchange_name,
+        callback=None,
+        max_size=None,
+        policy=None,
+        event=None
+):
+    """Subscribes to an exchange, binding its socket if this is the first
+    subscriber in this process. Returns the Subscription.
+    """
+    with _exchanges_lock:
+        if exchange_name not in _exchanges:
+            _exchanges[exchange_name] = Exchange(exchange_name)
+        exchange = _exchanges[exchange_name]
+    return exchange.subscribe(callback, max_size, policy, event)
@@ -1,7 +1,19 @@
 """Configuration values for async communications."""
 
 COMMAND_EXCHANGE = 'command'
-COMMAND_FORWARDED_EXCHANGE = 'command_forwarded'
 LOGS_EXCHANGE = 'logs'
 TELEMETRY_EXCHANGE = 'telemetry'
 WAYPOINT_EXCHANGE = 'waypoint'
+
+WIRE_FORMAT_BINARY = 'binary'
+WIRE_FORMAT_JSON = 'json'
+# Telemetry consumers detect the format of each message, so this only needs to
+# be changed on the producer side, e.g. to read messages while debugging
+TELEMETRY_WIRE_FORMAT = WIRE_FORMAT_BINARY
+
+# Consumers read datagrams into a buffer this big, so batches can't be bigger
+MAX_DATAGRAM_BYTES = 4096
+# Exchanges that coalesce messages into batched datagrams. Commands are never
+# batched so that they are delivered as quickly as possible.
+LOGS_BATCH_DELAY_S = 0.05
+TELEMETRY_BATCH_DELAY_S = 0.005
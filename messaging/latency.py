@@ -0,0 +1,129 @@
+"""Latency histograms for the telemetry pipeline.
+
+Readings are stamped with time.monotonic() when they're read from the
+sensor. Each stage that handles a reading records how long ago that was, so
+the histograms show where the sensor to actuator delay goes:
+    producer: the reading was parsed and published
+    consumer: the telemetry consumer received the reading
+    filter: the location filter was updated with the reading
+    drive: the driver sent a command based on the most recent reading
+Command also records how its control loop behaves:
+    jitter: how late the loop woke up after its deadline passed
+    actuation: how long it took from waking up to sending a drive command
+Everything runs in one process, so the monitor reads the same histograms.
+"""
+
+import threading
+import time
+
+from messaging.singleton_mixin import SingletonMixin
+
+PRODUCER = 'producer'
+CONSUMER = 'consumer'
+FILTER = 'filter'
+DRIVE = 'drive'
+JITTER = 'jitter'
+ACTUATION = 'actuation'
+STAGES = (PRODUCER, CONSUMER, FILTER, DRIVE, JITTER, ACTUATION)
+
+# Upper bounds of the buckets, 1-2-5 steps from 100 us to 10 s. Anything
+# slower goes in an overflow bucket.
+BUCKET_BOUNDS_S = tuple(
+    multiplier * 10.0 ** exponent
+    for exponent in range(-4, 1)
+    for multiplier in (1, 2, 5)
+) + (10.0,)
+
+
+def now_s():
+    """Returns the timestamp to stamp readings with."""
+    return time.monotonic()
+
+
+class LatencyHistogram(object):
+    """Histogram of latencies with fixed logarithmic buckets."""
+
+    def __init__(self):
+        self._counts = [0] * (len(BUCKET_BOUNDS_S) + 1)
+        self.count = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+
+    def record(self, latency_s):
+        """Adds a latency."""
+        bucket = 0
+        # There are only a few buckets, and most latencies are small, so
+        # a linear scan beats bisect
+        while bucket < len(BUCKET_BOUNDS_S) \
+                and latency_s > BUCKET_BOUNDS_S[bucket]:
+            bucket += 1
+        self._counts[bucket] += 1
+        self.count += 1
+        self.total_s += latency_s
+        if latency_s > self.max_s:
+            self.max_s = latency_s
+
+    def percentile(self, fraction):
+        """Returns the upper bound of the bucket that contains the given
+        fraction of latencies, or None if there are no latencies.
+        """
+        if self.count == 0:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bound_s, count in zip(BUCKET_BOUNDS_S, self._counts):
+            seen += count
+            if seen >= target:
+                return bound_s
+        return self.max_s
+
+    def to_dict(self):
+        """Returns the histogram as a JSON serializable dict."""
+        return {
+            'count': self.count,
+            'mean_s': self.total_s / self.count if self.count > 0 else None,
+            'max_s': self.max_s,
+            'p50_s': self.percentile(0.5),
+            'p90_s': self.percentile(0.9),
+            'p99_s': self.percentile(0.99),
+            'bucket_bounds_s': list(BUCKET_BOUNDS_S),
+            'counts': list(self._counts),
+        }
+
+
+class LatencyRecorder(SingletonMixin):
+    """Records latencies for each stage of the pipeline."""
+
+    def __init__(self):
+        super(LatencyRecorder, self).__init__()
+        # SingletonMixin calls __init__ every time the singleton is requested
+        if getattr(self, '_histograms', None) is not None:
+            return
+        self._lock = threading.Lock()
+        self._histograms = dict(
+            (stage, LatencyHistogram()) for stage in STAGES
+        )
+
+    def record(self, stage, reading_s):
+        """Records the time since a reading was stamped. Readings without a
+        stamp are ignored.
+        """
+        if reading_s is None:
+            return
+        latency_s = now_s() - reading_s
+        with self._lock:
+            self._histograms[stage].record(latency_s)
+
+    def to_dict(self):
+        """Returns all of the histograms as a JSON serializable dict."""
+        with self._lock:
+            return dict(
+                (stage, histogram.to_dict())
+                for stage, histogram in self._histograms.items()
+            )
+
+    def reset(self):
+        """Clears all of the histograms."""
+        with self._lock:
+            for stage in STAGES:
+                self._histograms[stage] = LatencyHistogram()
@@ -2,10 +2,19 @@
 
 import os
 import socket
+import struct
 
+from messaging import batching
+from messaging import config
 
-def consume_messages(message_type, callback):
-    """Starts consuming messages."""
+
+def consume_messages(message_type, callback, raw=None):
+    """Starts consuming messages. If raw is True, the callback receives the
+    undecoded datagram bytes instead of a string. Batched datagrams are split
+    so that the callback is called once per message.
+    """
+    if raw is None:
+        raw = False
     sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
     socket_folder = os.sep.join(('.', 'messaging', 'sockets'))
     socket_address = socket_folder + os.sep + message_type
@@ -24,13 +33,25 @@ def consume_messages(message_type, callback):
         return
 
     while True:
-        datagram = sock.recv(4096)
+        datagram = sock.recv(config.MAX_DATAGRAM_BYTES)
         if not datagram:
             break
         if datagram == b'QUIT':
             break
-        message = datagram.decode('utf-8')
-        callback(message)
+        if batching.is_batch(datagram):
+            # Split the whole batch first, so that a truncated or garbage
+            # datagram is dropped instead of killing the consumer
+            try:
+                messages = list(batching.split(datagram))
+            except (ValueError, struct.error):
+                continue
+        else:
+            messages = (datagram,)
+        for message in messages:
+            if raw:
+                callback(message)
+            else:
+                callback(message.decode('utf-8'))
 
     sock.close()
     os.remove(socket_address)
@@ -2,13 +2,20 @@
 
 import os
 import socket
+import threading
 import time
 
+from messaging import batching
+from messaging import config
+
 
 class MessageProducer(object):
-    """Message broker that sends to Unix domain sockets."""
+    """Message broker that sends to Unix domain sockets. If a batch delay is
+    given, messages are coalesced into a single datagram until either the
+    datagram is full or the oldest message has waited for the delay.
+    """
 
-    def __init__(self, message_type):
+    def __init__(self, message_type, batch_delay_s=None, batch_max_bytes=None):
         self._message_type = message_type
         socket_address = os.sep.join(
             ('.', 'messaging', 'sockets', message_type)
@@ -20,12 +27,94 @@ class MessageProducer(object):
         self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
         self._socket.connect(socket_address)
 
+        self._batch_delay_s = batch_delay_s
+        if batch_max_bytes is None:
+            batch_max_bytes = config.MAX_DATAGRAM_BYTES
+        self._batch_max_bytes = min(batch_max_bytes, config.MAX_DATAGRAM_BYTES)
+        self._pending = []
+        self._pending_bytes = len(batching.BATCH_MARKER)
+        self._deadline_s = None
+        self._condition = threading.Condition()
+        self._run = True
+        if batch_delay_s is not None:
+            thread = threading.Thread(target=self._flush_periodically)
+            thread.name = '{}:flush:{}'.format(
+                self.__class__.__name__,
+                message_type
+            )
+            # Pending messages are flushed in kill, so don't keep the process
+            # alive just for this
+            thread.daemon = True
+            thread.start()
+
     def publish(self, message):
-        """Publishes a message."""
-        self._socket.sendall(message.encode('utf-8'))
+        """Publishes a message. Strings are sent UTF-8 encoded, bytes are sent
+        as is.
+        """
+        if not isinstance(message, bytes):
+            message = message.encode('utf-8')
+        if self._batch_delay_s is None:
+            self._socket.sendall(message)
+            return
+
+        size = batching.LENGTH_BYTES + len(message)
+        with self._condition:
+            if self._pending_bytes + size > self._batch_max_bytes:
+                self._flush()
+                if self._pending_bytes + size > self._batch_max_bytes:
+                    # Too big to batch at all
+                    self._socket.sendall(message)
+                    return
+            if not self._pending:
+                self._deadline_s = time.time() + self._batch_delay_s
+                self._condition.notify()
+            self._pending.append(message)
+            self._pending_bytes += size
+
+    def flush(self):
+        """Sends any pending batched messages."""
+        with self._condition:
+            self._flush()
+
+    def _flush(self):
+        """Sends pending messages. Must be called with the lock held."""
+        if not self._pending:
+            return
+        if len(self._pending) == 1:
+            datagram = self._pending[0]
+        else:
+            datagram = batching.pack(self._pending)
+        self._pending = []
+        self._pending_bytes = len(batching.BATCH_MARKER)
+        self._deadline_s = None
+        self._socket.sendall(datagram)
+
+    def _flush_periodically(self):
+        """Flushes batches once their delay has passed."""
+        with self._condition:
+            while self._run:
+                if self._deadline_s is None:
+                    self._condition.wait()
+                    continue
+                remaining_s = self._deadline_s - time.time()
+                if remaining_s > 0.0:
+                    self._condition.wait(remaining_s)
+                    continue
+                try:
+                    self._flush()
+                except socket.error:
+                    # Nobody is listening, so there's nobody to tell
+                    pass
 
     def kill(self):
         """Kills all listening consumers."""
+        with self._condition:
+            self._run = False
+            self._condition.notify()
+            try:
+                self._flush()
+            except socket.error:
+                pass
         try:
             self._socket.sendall(b'QUIT')
         except ConnectionRefusedError:  # pylint: disable=undefined-variable
@@ -0,0 +1,284 @@
+"""Compact binary wire format for telemetry readings.
+
+Telemetry readings used to be sent as JSON strings. Encoding and decoding
+those on the Pi is expensive, so readings can instead be packed into fixed
+layout records. Every record starts with a magic byte, a schema version and a
+type tag, so consumers can tell binary records and JSON strings apart.
+"""
+
+import json
+import struct
+
+from messaging import config
+
+
+# 0xA5 can't start a UTF-8 sequence and isn't '{', so binary records can be
+# detected from the first byte alone
+MAGIC = 0xA5
+# Version 2 added the monotonic time that the reading was taken at
+SCHEMA_VERSION = 2
+
+GPS_TYPE = 1
+COMPASS_TYPE = 2
+ACCELEROMETER_TYPE = 3
+
+HEADER_FORMAT = ''.join((
+    '!',  # network format (big-endian)
+    'B',  # magic
+    'B',  # schema version
+    'B',  # type tag
+))
+GPS_FORMAT = HEADER_FORMAT + ''.join((
+    'd',  # latitude_d
+    'd',  # longitude_d
+    'd',  # accuracy_m
+    'd',  # heading_d, NaN if unknown
+    'd',  # speed_m_s, NaN if unknown
+    'd',  # timestamp_s
+    'd',  # monotonic_s, NaN if unknown
+))
+COMPASS_FORMAT = HEADER_FORMAT + ''.join((
+    'd',  # compass_d
+    'd',  # confidence
+    'd',  # monotonic_s, NaN if unknown
+))
+ACCELEROMETER_FORMAT = HEADER_FORMAT + ''.join((
+    'd',  # acceleration_g_x
+    'd',  # acceleration_g_y
+    'd',  # acceleration_g_z
+    'd',  # monotonic_s, NaN if unknown
+))
+# The device id is appended as UTF-8 after the fixed part of each record
+
+_HEADER = struct.Struct(HEADER_FORMAT)
+_GPS = struct.Struct(GPS_FORMAT)
+_COMPASS = struct.Struct(COMPASS_FORMAT)
+_ACCELEROMETER = struct.Struct(ACCELEROMETER_FORMAT)
+
+_NAN = float('nan')
+
+
+def _to_wire(value):
+    """Converts an optional float to something struct can pack."""
+    return _NAN if value is None else value
+
+
+def _from_wire(value):
+    """Converts NaN back to None."""
+    return None if value != value else value
+
+
+def _add_monotonic(message, monotonic_s):
+    """Adds the monotonic time to a decoded message, if it's known."""
+    if monotonic_s is not None:
+        message['monotonic_s'] = monotonic_s
+    return message
+
+
+def is_binary(message):
+    """Returns True if the message is a binary record."""
+    return isinstance(message, bytes) and len(message) > 0 \
+        and message[0] == MAGIC
+
+
+def encode_gps(
+        latitude_d,
+        longitude_d,
+        accuracy_m,
+        heading_d,
+        speed_m_s,
+        timestamp_s,
+        device_id,
+        monotonic_s=None
+):
+    """Encodes a GPS reading."""
+    return _GPS.pack(
+        MAGIC,
+        SCHEMA_VERSION,
+        GPS_TYPE,
+        latitude_d,
+        longitude_d,
+        accuracy_m,
+        _to_wire(heading_d),
+        _to_wire(speed_m_s),
+        _to_wire(timestamp_s),
+        _to_wire(monotonic_s),
+    ) + device_id.encode('utf-8')
+
+
+def encode_compass(compass_d, confidence, device_id, monotonic_s=None):
+    """Encodes a compass reading."""
+    return _COMPASS.pack(
+        MAGIC,
+        SCHEMA_VERSION,
+        COMPASS_TYPE,
+        compass_d,
+        confidence,
+        _to_wire(monotonic_s),
+    ) + device_id.encode('utf-8')
+
+
+def encode_accelerometer(
+        acceleration_g_x,
+        acceleration_g_y,
+        acceleration_g_z,
+        device_id,
+        monotonic_s=None
+):
+    """Encodes an accelerometer reading."""
+    return _ACCELEROMETER.pack(
+        MAGIC,
+        SCHEMA_VERSION,
+        ACCELEROMETER_TYPE,
+        acceleration_g_x,
+        acceleration_g_y,
+        acceleration_g_z,
+        _to_wire(monotonic_s),
+    ) + device_id.encode('utf-8')
+
+
+def _decode_gps(message):
+    """Decodes a GPS record."""
+    (
+        _magic,  # pylint: disable=unused-variable
+        _version,  # pylint: disable=unused-variable
+        _type,  # pylint: disable=unused-variable
+        latitude_d,
+        longitude_d,
+        accuracy_m,
+        heading_d,
+        speed_m_s,
+        timestamp_s,
+        monotonic_s,
+    ) = _GPS.unpack_from(message)
+    return _add_monotonic({
+        'latitude_d': latitude_d,
+        'longitude_d': longitude_d,
+        'accuracy_m': accuracy_m,
+        'heading_d': _from_wire(heading_d),
+        'speed_m_s': _from_wire(speed_m_s),
+        'timestamp_s': _from_wire(timestamp_s),
+        'device_id': message[_GPS.size:].decode('utf-8'),
+    }, _from_wire(monotonic_s))
+
+
+def _decode_compass(message):
+    """Decodes a compass record."""
+    _, _, _, compass_d, confidence, monotonic_s = _COMPASS.unpack_from(
+        message
+    )
+    return _add_monotonic({
+        'compass_d': compass_d,
+        'confidence': confidence,
+        'device_id': message[_COMPASS.size:].decode('utf-8'),
+    }, _from_wire(monotonic_s))
+
+
+def _decode_accelerometer(message):
+    """Decodes an accelerometer record."""
+    _, _, _, x_g, y_g, z_g, monotonic_s = _ACCELEROMETER.unpack_from(message)
+    return _add_monotonic({
+        'acceleration_g_x': x_g,
+        'acceleration_g_y': y_g,
+        'acceleration_g_z': z_g,
+        'device_id': message[_ACCELEROMETER.size:].decode('utf-8'),
+    }, _from_wire(monotonic_s))
+
+
+_DECODERS = {
+    GPS_TYPE: _decode_gps,
+    COMPASS_TYPE: _decode_compass,
+    ACCELEROMETER_TYPE: _decode_accelerometer,
+}
+
+
+def decode(message):
+    """Decodes a telemetry message into a dictionary. Both binary records and
+    JSON strings (or UTF-8 encoded JSON bytes) are accepted.
+    """
+    if not is_binary(message):
+        if isinstance(message, bytes):
+            message = message.decode('utf-8')
+        return json.loads(message)
+
+    _, version, type_ = _HEADER.unpack_from(message)
+    if version != SCHEMA_VERSION:
+        raise ValueError(
+            'Unsupported telemetry schema version: {}'.format(version)
+        )
+    if type_ not in _DECODERS:
+        raise ValueError('Unknown telemetry record type: {}'.format(type_))
+    return _DECODERS[type_](message)
+
+
+class JsonEncoder(object):
+    """Encodes readings as JSON strings. Useful for debugging, because the
+    messages can be read straight off the socket.
+    """
+
+    @staticmethod
+    def gps(
+            latitude_d,
+            longitude_d,
+            accuracy_m,
+            heading_d,
+            speed_m_s,
+            timestamp_s,
+            device_id,
+            monotonic_s=None
+    ):
+        """Encodes a GPS reading."""
+        return json.dumps(_add_monotonic({
+            'latitude_d': latitude_d,
+            'longitude_d': longitude_d,
+            'accuracy_m': accuracy_m,
+            'heading_d': heading_d,
+            'speed_m_s': speed_m_s,
+            'timestamp_s': timestamp_s,
+            'device_id': device_id,
+        }, monotonic_s))
+
+    @staticmethod
+    def compass(compass_d, confidence, device_id, monotonic_s=None):
+        """Encodes a compass reading."""
+        return json.dumps(_add_monotonic({
+            'compass_d': compass_d,
+            'confidence': confidence,
+            'device_id': device_id,
+        }, monotonic_s))
+
+    @staticmethod
+    def accelerometer(
+            acceleration_g_x,
+            acceleration_g_y,
+            acceleration_g_z,
+            device_id,
+            monotonic_s=None
+    ):
+        """Encodes an accelerometer reading."""
+        return json.dumps(_add_monotonic({
+            'acceleration_g_x': acceleration_g_x,
+            'acceleration_g_y': acceleration_g_y,
+            'acceleration_g_z': acceleration_g_z,
+            'device_id': device_id,
+        }, monotonic_s))
+
+
+class BinaryEncoder(object):
+    """Encodes readings as binary records."""
+    gps = staticmethod(encode_gps)
+    compass = staticmethod(encode_compass)
+    accelerometer = staticmethod(encode_accelerometer)
+
+
+def get_encoder(wire_format=None):
+    """Returns the encoder for a wire format, defaulting to the configured
+    telemetry format.
+    """
+    if wire_format is None:
+        wire_format = config.TELEMETRY_WIRE_FORMAT
+    if wire_format == config.WIRE_FORMAT_JSON:
+        return JsonEncoder
+    if wire_format == config.WIRE_FORMAT_BINARY:
+        return BinaryEncoder
+    raise ValueError('Unknown wire format: {}'.format(wire_format))
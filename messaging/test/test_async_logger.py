@@ -0,0 +1,54 @@
+"""Tests the asynchronous logger."""
+
+import logging
+import unittest
+
+from messaging import async_logger
+
+
+class TestAsyncLogger(unittest.TestCase):
+    """Tests the asynchronous logger."""
+
+    def tearDown(self):
+        async_logger.set_level(logging.DEBUG)
+
+    def test_format_message(self):
+        """Messages can be formatted lazily."""
+        self.assertEqual(async_logger.format_message('plain', ()), 'plain')
+        self.assertEqual(
+            async_logger.format_message('{} and {}', (1, lambda: 2)),
+            '1 and 2'
+        )
+        self.assertEqual(
+            async_logger.format_message(lambda: 'called', ()),
+            'called'
+        )
+        # Braces in unformatted messages should be left alone
+        self.assertEqual(
+            async_logger.format_message('{"a": 1}', ()),
+            '{"a": 1}'
+        )
+
+    def test_update_level(self):
+        """The level should be the lowest level that a handler emits."""
+        logger = logging.Logger('test')
+        logger.setLevel(logging.DEBUG)
+        receiver = async_logger.AsyncLoggerReceiver(logger)
+        self.assertEqual(async_logger.get_level(), logging.DEBUG)
+
+        info_handler = logging.NullHandler()
+        info_handler.setLevel(logging.INFO)
+        logger.addHandler(info_handler)
+        warning_handler = logging.NullHandler()
+        warning_handler.setLevel(logging.WARNING)
+        logger.addHandler(warning_handler)
+        receiver.update_level()
+        self.assertEqual(async_logger.get_level(), logging.INFO)
+
+        logger.setLevel(logging.ERROR)
+        receiver.update_level()
+        self.assertEqual(async_logger.get_level(), logging.ERROR)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Tests the publish/subscribe broker."""
+
+import threading
+import time
+import unittest
+
+from messaging import broker
+from messaging.message_producer import MessageProducer
+
+
+class TestBroker(unittest.TestCase):
+    """Tests the publish/subscribe broker."""
+
+    EXCHANGE = 'test_broker'
+
+    def test_drop_oldest(self):
+        """Full drop-oldest queues should discard the oldest message."""
+        subscription = broker.Subscription('test', max_size=2)
+        for message in ('a', 'b', 'c'):
+            subscription.put(message)
+        self.assertEqual(subscription.dropped_count, 1)
+        self.assertEqual(subscription.get(), 'b')
+        self.assertEqual(subscription.get(), 'c')
+        self.assertIs(subscription.get(block=False), None)
+        self.assertIs(subscription.get(timeout=0.01), None)
+
+    def test_block(self):
+        """Full blocking queues should wait for the subscriber."""
+        subscription = broker.Subscription(
+            'test',
+            max_size=1,
+            policy=broker.BLOCK
+        )
+        subscription.put('a')
+        publisher = threading.Thread(target=lambda: subscription.put('b'))
+        publisher.start()
+        publisher.join(0.05)
+        self.assertTrue(publisher.is_alive())
+
+        self.assertEqual(subscription.get(), 'a')
+        publisher.join(1.0)
+        self.assertFalse(publisher.is_alive())
+        self.assertEqual(subscription.get(), 'b')
+        self.assertEqual(subscription.dropped_count, 0)
+
+    def test_bad_policy(self):
+        """Unknown policies should be rejected."""
+        with self.assertRaises(ValueError):
+            broker.Subscription('test', policy='banana')
+
+    def test_event(self):
+        """Queuing a message should set the subscription's event."""
+        event = threading.Event()
+        subscription = broker.Subscription('test', event=event)
+        self.assertFalse(event.is_set())
+        subscription.put('a')
+        self.assertTrue(event.is_set())
+        self.assertEqual(subscription.get(), 'a')
+
+    def test_fan_out(self):
+        """Every subscriber should receive the same message."""
+        received = []
+        condition = threading.Condition()
+
+        def save_message(message):
+            """Saves the message."""
+            with condition:
+                received.append(message)
+                condition.notify_all()
+
+        broker.subscribe(self.EXCHANGE, save_message)
+        pull = broker.subscribe(self.EXCHANGE)
+
+        # Give the receiver some time to set up
+        time.sleep(0.05)
+        producer = MessageProducer(self.EXCHANGE)
+        producer.publish('banana')
+
+        message = pull.get(timeout=1.0)
+        with condition:
+            if not received:
+                condition.wait(1.0)
+        producer.kill()
+
+        self.assertEqual(message, 'banana')
+        self.assertEqual(received, ['banana'])
+
+
+if __name__ == '__main__':
+    unittest.main()
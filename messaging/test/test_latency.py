@@ -0,0 +1,80 @@
+"""Tests the latency histograms."""
+
+import unittest
+
+from messaging import config
+from messaging import latency
+from messaging import telemetry_codec
+
+
+class TestLatency(unittest.TestCase):
+    """Tests the latency histograms."""
+
+    def test_histogram(self):
+        """Percentiles should be the upper bound of the containing bucket."""
+        histogram = latency.LatencyHistogram()
+        self.assertIsNone(histogram.percentile(0.5))
+        self.assertIsNone(histogram.to_dict()['mean_s'])
+
+        for _ in range(90):
+            histogram.record(0.003)
+        for _ in range(9):
+            histogram.record(0.015)
+        histogram.record(30.0)
+
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.percentile(0.5), 0.005)
+        self.assertEqual(histogram.percentile(0.9), 0.005)
+        self.assertAlmostEqual(histogram.percentile(0.99), 0.02)
+        # Overflowing latencies report the maximum
+        self.assertEqual(histogram.percentile(1.0), 30.0)
+
+        values = histogram.to_dict()
+        self.assertEqual(sum(values['counts']), 100)
+        self.assertEqual(values['counts'][-1], 1)
+        self.assertEqual(values['max_s'], 30.0)
+        self.assertEqual(
+            len(values['counts']),
+            len(values['bucket_bounds_s']) + 1
+        )
+
+    def test_recorder(self):
+        """Unstamped readings should be ignored."""
+        recorder = latency.LatencyRecorder()
+        recorder.reset()
+        recorder.record(latency.PRODUCER, None)
+        recorder.record(latency.PRODUCER, latency.now_s())
+        recorder.record(latency.DRIVE, latency.now_s() - 0.1)
+        values = recorder.to_dict()
+        self.assertEqual(set(values.keys()), set(latency.STAGES))
+        self.assertEqual(values[latency.PRODUCER]['count'], 1)
+        self.assertEqual(values[latency.CONSUMER]['count'], 0)
+        self.assertGreaterEqual(values[latency.DRIVE]['max_s'], 0.1)
+        # It's a singleton
+        self.assertIs(latency.LatencyRecorder(), recorder)
+        recorder.reset()
+        self.assertEqual(recorder.to_dict()[latency.DRIVE]['count'], 0)
+
+    def test_codec_stamp(self):
+        """The stamp should survive both wire formats."""
+        for wire_format in (config.WIRE_FORMAT_BINARY, config.WIRE_FORMAT_JSON):
+            encoder = telemetry_codec.get_encoder(wire_format)
+            message = telemetry_codec.decode(
+                encoder.compass(90.0, 0.5, 'phone', monotonic_s=12.25)
+            )
+            self.assertEqual(message['monotonic_s'], 12.25)
+            message = telemetry_codec.decode(
+                encoder.gps(
+                    40.0, -105.0, 5.0, 180.0, 2.5, 1000.5, 'sup800f',
+                    monotonic_s=1.5
+                )
+            )
+            self.assertEqual(message['monotonic_s'], 1.5)
+            message = telemetry_codec.decode(
+                encoder.accelerometer(0.0, 0.0, 1.0, 'sup800f')
+            )
+            self.assertNotIn('monotonic_s', message)
+
+
+if __name__ == '__main__':
+    unittest.main()
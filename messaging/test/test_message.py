@@ -4,6 +4,7 @@ import threading
 import time
 import unittest
 
+from messaging import batching
 from messaging.message_consumer import consume_messages
 from messaging.message_producer import MessageProducer
 
@@ -50,6 +51,72 @@ class TestMessage(unittest.TestCase):
         producer.kill()
         self.assertEqual(self.message, sent_message)
 
+    def test_batching(self):
+        """Batched messages should be delivered individually and in order."""
+        messages = []
+
+        def consume():
+            """Function to consume messages."""
+            consume_messages(self.EXCHANGE, messages.append)
+
+        consumer = threading.Thread(target=consume)
+        consumer.name = '{}:consume_messages'.format(self.__class__.__name__)
+        consumer.start()
+
+        # Give the receiver some time to set up
+        time.sleep(0.05)
+        producer = MessageProducer(self.EXCHANGE, batch_delay_s=10.0)
+        sent_messages = ['apple', 'banana', 'cherry']
+        for message in sent_messages:
+            producer.publish(message)
+        # Nothing should be sent until the batch is flushed
+        time.sleep(0.05)
+        self.assertEqual(messages, [])
+
+        # Kill flushes the batch before quitting
+        producer.kill()
+        consumer.join(1.0)
+        self.assertFalse(consumer.is_alive())
+        self.assertEqual(messages, sent_messages)
+
+    def test_malformed_batch(self):
+        """Malformed batches should be dropped without stopping the
+        consumer.
+        """
+        messages = []
+
+        def consume():
+            """Function to consume messages."""
+            consume_messages(self.EXCHANGE, messages.append)
+
+        consumer = threading.Thread(target=consume)
+        consumer.name = '{}:consume_messages'.format(self.__class__.__name__)
+        consumer.start()
+
+        # Give the receiver some time to set up
+        time.sleep(0.05)
+        producer = MessageProducer(self.EXCHANGE)
+        batch = batching.pack([b'apple', b'banana'])
+        # Truncated, then a 1 byte length
+        producer.publish(batch[:-1])
+        producer.publish(batch[:1] + b'\x00')
+        producer.publish('cherry')
+        producer.publish('QUIT')
+        consumer.join(1.0)
+        self.assertFalse(consumer.is_alive())
+        producer.kill()
+        self.assertEqual(messages, ['cherry'])
+
+    def test_batch_format(self):
+        """Tests packing and splitting batches."""
+        messages = [b'', b'a', b'\xA5binary', 'd\u00e9j\u00e0'.encode('utf-8')]
+        batch = batching.pack(messages)
+        self.assertTrue(batching.is_batch(batch))
+        self.assertFalse(batching.is_batch(messages[2]))
+        self.assertEqual(list(batching.split(batch)), messages)
+        with self.assertRaises(ValueError):
+            list(batching.split(batch[:-1]))
+
 
 if __name__ == '__main__':
     unittest.main()
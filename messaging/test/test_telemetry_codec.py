@@ -0,0 +1,88 @@
+"""Tests the telemetry wire format."""
+
+import json
+import unittest
+
+from messaging import config
+from messaging import telemetry_codec
+
+
+class TestTelemetryCodec(unittest.TestCase):
+    """Tests the telemetry wire format."""
+
+    def test_round_trip(self):
+        """Binary records should decode to the same dictionaries as JSON."""
+        for wire_format in (config.WIRE_FORMAT_BINARY, config.WIRE_FORMAT_JSON):
+            encoder = telemetry_codec.get_encoder(wire_format)
+            message = telemetry_codec.decode(
+                encoder.gps(40.0, -105.0, 5.0, 180.0, 2.5, 1000.5, 'sup800f')
+            )
+            self.assertEqual(
+                message,
+                {
+                    'latitude_d': 40.0,
+                    'longitude_d': -105.0,
+                    'accuracy_m': 5.0,
+                    'heading_d': 180.0,
+                    'speed_m_s': 2.5,
+                    'timestamp_s': 1000.5,
+                    'device_id': 'sup800f',
+                }
+            )
+
+            message = telemetry_codec.decode(
+                encoder.compass(90.0, 0.5, 'phone')
+            )
+            self.assertEqual(
+                message,
+                {'compass_d': 90.0, 'confidence': 0.5, 'device_id': 'phone'}
+            )
+
+            message = telemetry_codec.decode(
+                encoder.accelerometer(0.1, 0.2, 1.0, 'sup800f')
+            )
+            self.assertEqual(
+                message,
+                {
+                    'acceleration_g_x': 0.1,
+                    'acceleration_g_y': 0.2,
+                    'acceleration_g_z': 1.0,
+                    'device_id': 'sup800f',
+                }
+            )
+
+    def test_missing_values(self):
+        """Phones don't always report heading and speed."""
+        message = telemetry_codec.decode(
+            telemetry_codec.encode_gps(40.0, -105.0, 5.0, None, None, 1.0, 'a')
+        )
+        self.assertIs(message['heading_d'], None)
+        self.assertIs(message['speed_m_s'], None)
+
+    def test_detect_format(self):
+        """JSON strings and bytes should still be accepted."""
+        json_message = json.dumps({'load_waypoints': 'course.kml'})
+        self.assertFalse(telemetry_codec.is_binary(json_message))
+        self.assertFalse(
+            telemetry_codec.is_binary(json_message.encode('utf-8'))
+        )
+        self.assertEqual(
+            telemetry_codec.decode(json_message.encode('utf-8')),
+            {'load_waypoints': 'course.kml'}
+        )
+        self.assertTrue(
+            telemetry_codec.is_binary(
+                telemetry_codec.encode_compass(1.0, 1.0, 'a')
+            )
+        )
+
+    def test_bad_version(self):
+        """Unknown schema versions should be rejected."""
+        message = bytearray(telemetry_codec.encode_compass(1.0, 1.0, 'a'))
+        message[1] = telemetry_codec.SCHEMA_VERSION + 1
+        with self.assertRaises(ValueError):
+            telemetry_codec.decode(bytes(message))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,636 @@
+"""Serves the monitor and the web telemetry apps from one asyncio event
+loop, as an alternative to CherryPyServer.
+
+There's no thread pool and there are no sessions, and pages and static files
+are kept in memory after the first request. HTTP and websocket connections
+are handled on the event loop, so phones sending telemetry don't need a
+thread each. The monitor's log and telemetry streams already have a sender
+thread per client; they hand their frames over to the loop.
+
+Only what the two apps use is implemented: HTTP/1.1 GET and POST with
+keep-alive, URL encoded parameters, and RFC 6455 websockets. Requires Python
+3.7 or newer.
+"""
+
+import asyncio
+import base64
+import collections
+import concurrent.futures
+import hashlib
+import json
+import mimetypes
+import os
+import signal
+import struct
+import subprocess
+import threading
+import urllib.parse
+
+from control.web_telemetry.readings import ReadingIngester
+from messaging.async_logger import AsyncLogger
+from messaging.async_producers import CommandProducer
+from messaging.async_producers import WaypointProducer
+from messaging.latency import LatencyRecorder
+from monitor import templates
+from monitor.log_broadcaster import LogBroadcaster
+from monitor.network import get_host_ip
+from monitor.telemetry_stream import TelemetryStream
+
+STATIC_DIR = 'static-web'
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+MAX_MESSAGE_BYTES = 1024 * 1024
+# How long a stream's sender thread waits for a slow client
+SEND_TIMEOUT_S = 5.0
+WEB_SOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+STATUS_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+Request = collections.namedtuple(
+    'Request',
+    ('method', 'path', 'params', 'headers')
+)
+
+
+class HttpError(Exception):
+    """An error to respond to the client with."""
+
+    def __init__(self, status, headers=None):
+        super(HttpError, self).__init__(STATUS_REASONS[status])
+        self.status = status
+        self.headers = headers if headers is not None else {}
+
+
+def web_socket_accept(key):
+    """Returns the Sec-WebSocket-Accept header value for a handshake key."""
+    digest = hashlib.sha1((key + WEB_SOCKET_GUID).encode('ascii')).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def encode_frame(opcode, payload, mask=None):
+    """Returns a final websocket frame. Servers don't mask their frames, but
+    clients have to.
+    """
+    header = bytearray((0x80 | opcode,))
+    mask_bit = 0x80 if mask is not None else 0
+    length = len(payload)
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 0x10000:
+        header.append(mask_bit | 126)
+        header += struct.pack('!H', length)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack('!Q', length)
+    if mask is not None:
+        header += mask
+        payload = unmask(mask, payload)
+    return bytes(header) + payload
+
+
+def unmask(mask, payload):
+    """XORs the payload with the repeated 4 byte mask."""
+    if not payload:
+        return payload
+    length = len(payload)
+    repeated = (mask * (length // 4 + 1))[:length]
+    return (
+        int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')
+    ).to_bytes(length, 'big')
+
+
+class AsyncWebSocket(object):
+    """A websocket connection on the event loop."""
+
+    def __init__(self, reader, writer, loop):
+        self._reader = reader
+        self._writer = writer
+        self._loop = loop
+        self._closed = False
+
+    async def receive(self):
+        """Returns the next text or binary message as (is_binary, payload),
+        or None once the connection is closed. Pings are answered.
+        """
+        opcode = None
+        fragments = []
+        size = 0
+        while True:
+            first, second = await self._reader.readexactly(2)
+            frame_opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length, = struct.unpack('!H', await self._reader.readexactly(2))
+            elif length == 127:
+                length, = struct.unpack('!Q', await self._reader.readexactly(8))
+            if length > MAX_MESSAGE_BYTES or size + length > MAX_MESSAGE_BYTES:
+                await self.close(1009)
+                return None
+            mask = None
+            if second & 0x80:
+                mask = await self._reader.readexactly(4)
+            payload = await self._reader.readexactly(length)
+            if mask is not None:
+                payload = unmask(mask, payload)
+
+            if frame_opcode == OP_CLOSE:
+                await self.close()
+                return None
+            elif frame_opcode == OP_PING:
+                await self.send_async(payload, OP_PONG)
+                continue
+            elif frame_opcode == OP_PONG:
+                continue
+
+            if frame_opcode != OP_CONTINUATION:
+                opcode = frame_opcode
+            fragments.append(payload)
+            size += length
+            if first & 0x80:
+                return opcode == OP_BINARY, b''.join(fragments)
+
+    async def send_async(self, message, opcode=None):
+        """Sends a message from the event loop. Strings are sent as text."""
+        if self._closed:
+            return
+        if opcode is None:
+            opcode = OP_BINARY
+            if not isinstance(message, bytes):
+                opcode = OP_TEXT
+                message = message.encode('utf-8')
+        self._writer.write(encode_frame(opcode, message))
+        await self._writer.drain()
+
+    def send(self, message):
+        """Sends a message from another thread, waiting until it's handed to
+        the socket. Returns False if it wasn't sent. Clients that don't take
+        a message within SEND_TIMEOUT_S are disconnected instead of
+        buffering frames for them forever. This must not be called from the
+        event loop.
+        """
+        if self._closed:
+            return False
+        try:
+            future = asyncio.run_coroutine_threadsafe(
+                self.send_async(message),
+                self._loop
+            )
+        except RuntimeError:
+            # The loop is closed
+            return False
+        try:
+            future.result(SEND_TIMEOUT_S)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self._abort()
+            return False
+        except (ConnectionError, RuntimeError):
+            return False
+        return True
+
+    def _abort(self):
+        """Drops the connection from another thread. The pending receive
+        then fails, which unregisters the client.
+        """
+        self._closed = True
+        try:
+            self._loop.call_soon_threadsafe(self._writer.transport.abort)
+        except RuntimeError:
+            pass
+
+    async def close(self, code=1000):
+        """Sends a close frame."""
+        if self._closed:
+            return
+        try:
+            await self.send_async(struct.pack('!H', code), OP_CLOSE)
+        except ConnectionError:
+            pass
+        self._closed = True
+
+
+class AsyncServer(threading.Thread):  # pylint: disable=too-many-instance-attributes
+    """Runs the web apps on an asyncio event loop in a thread."""
+
+    def __init__(
+            self,
+            port,
+            address,
+            telemetry,
+            waypoint_generator,
+            ssl_context=None
+    ):
+        super(AsyncServer, self).__init__()
+        self.name = self.__class__.__name__
+        self._address = address
+        self.port = port
+        self._telemetry = telemetry
+        self._waypoint_generator = waypoint_generator
+        self._ssl_context = ssl_context
+        self._logger = AsyncLogger()
+        self._command = CommandProducer()
+        self._host_ip = get_host_ip(self._logger, 'Async web server')
+
+        self._loop = asyncio.new_event_loop()
+        self._listening = threading.Event()
+        self._static_files = {}
+        self._monitor_template = None
+        self._monitor_index = None
+        self._paths_mtime = None
+        self._web_telemetry_index = None
+
+        # CherryPy accepted - for _ in names, and the pages use -
+        self._routes = {
+            '/': (self._index, None),
+            '/telemetry_json': (self._telemetry_json, None),
+            '/latency_json': (self._latency_json, None),
+            '/reset_latency': (self._reset_latency, 'POST'),
+            '/run': (self._simple_command('start', 'run'), 'POST'),
+            '/stop': (self._simple_command('stop', 'stop'), 'POST'),
+            '/reset': (self._simple_command('reset', 'reset'), 'POST'),
+            '/calibrate_compass': (
+                self._simple_command('calibrate_compass', 'calibrate compass'),
+                'POST'
+            ),
+            '/set_max_throttle': (self._set_max_throttle, None),
+            '/set_waypoints': (self._set_waypoints, None),
+            '/shut_down': (self._shut_down, None),
+            '/telemetry': (self._telemetry_index, None),
+            '/telemetry/': (self._telemetry_index, None),
+            '/telemetry/post_telemetry': (self._post_telemetry, 'POST'),
+            '/telemetry/ingestion_json': (self._ingestion_json, None),
+        }
+        self._web_socket_routes = {
+            '/ws': self._monitor_web_socket,
+            '/telemetry/ws': self._telemetry_web_socket,
+        }
+
+    def run(self):
+        """Runs the event loop until the server is killed."""
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(
+            asyncio.start_server(
+                self._handle_connection,
+                self._address,
+                self.port,
+                ssl=self._ssl_context,
+                limit=MAX_HEADER_BYTES
+            )
+        )
+        self.port = server.sockets[0].getsockname()[1]
+        self._listening.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            server.close()
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(
+                asyncio.gather(*tasks, return_exceptions=True)
+            )
+            self._loop.close()
+
+    def wait_for_start(self, timeout_s=None):
+        """Waits until the server is listening. Returns True if it is."""
+        return self._listening.wait(timeout_s)
+
+    def kill(self):
+        """Stops the server."""
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def _handle_connection(self, reader, writer):
+        """Serves requests on a connection until it's closed."""
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HttpError as exc:
+                    writer.write(self._response(exc.status, None, False))
+                    break
+                if request is None:
+                    break
+
+                if request.path in self._web_socket_routes \
+                        and request.headers.get('upgrade', '').lower() \
+                        == 'websocket':
+                    await self._upgrade(request, reader, writer)
+                    break
+
+                keep_alive = request.headers.get('connection', '').lower() \
+                    != 'close'
+                writer.write(await self._respond(request, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        """Reads a request. Returns None if the client closed the
+        connection.
+        """
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as exc:
+            if exc.partial:
+                raise HttpError(400)
+            return None
+        except asyncio.LimitOverrunError:
+            raise HttpError(413)
+
+        lines = head.decode('iso-8859-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ')
+        except ValueError:
+            raise HttpError(400)
+        headers = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        # urlsplit would take the start of a path like //run for a host
+        path, _, query = target.partition('?')
+        params = {}
+        for key, value in urllib.parse.parse_qsl(query):
+            params[key] = value
+
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HttpError(400)
+        if length > MAX_BODY_BYTES:
+            raise HttpError(413)
+        if length > 0:
+            body = await reader.readexactly(length)
+            if headers.get('content-type', '').startswith(
+                    'application/x-www-form-urlencoded'
+            ):
+                for key, value in urllib.parse.parse_qsl(body.decode('utf-8')):
+                    params[key] = value
+
+        # The pages build some URLs from document.location, which leaves a
+        # double slash
+        path = urllib.parse.unquote(path)
+        while '//' in path:
+            path = path.replace('//', '/')
+        return Request(method.upper(), path, params, headers)
+
+    async def _respond(self, request, keep_alive):
+        """Returns the response to a request."""
+        try:
+            path = request.path
+            if path.startswith('/static/') \
+                    or path.startswith('/telemetry/static/'):
+                content_type, body = self._static_file(path)
+                return self._response(200, body, keep_alive, content_type)
+
+            route = self._routes.get(path.replace('-', '_'))
+            if route is None:
+                raise HttpError(404)
+            handler, method = route
+            if method is not None and request.method != method:
+                raise HttpError(405, {'Allow': method})
+            result = handler(request.params)
+            if asyncio.iscoroutine(result):
+                result = await result
+            if isinstance(result, dict):
+                return self._response(
+                    200,
+                    json.dumps(result).encode('utf-8'),
+                    keep_alive,
+                    'application/json'
+                )
+            return self._response(
+                200,
+                result.encode('utf-8'),
+                keep_alive,
+                'text/html;charset=utf-8'
+            )
+        except HttpError as exc:
+            return self._response(exc.status, None, keep_alive, None, exc.headers)
+        except Exception as exc:  # pylint: disable=broad-except
+            self._logger.error(
+                'Error handling {} {}: {} {}'.format(
+                    request.method,
+                    request.path,
+                    type(exc),
+                    exc
+                )
+            )
+            return self._response(500, None, keep_alive)
+
+    @staticmethod
+    def _response(status, body, keep_alive, content_type=None, headers=None):
+        """Returns the bytes of a response."""
+        if body is None:
+            body = STATUS_REASONS[status].encode('utf-8')
+            content_type = 'text/plain'
+        lines = [
+            'HTTP/1.1 {} {}'.format(status, STATUS_REASONS[status]),
+            'Content-Type: {}'.format(content_type),
+            'Content-Length: {}'.format(len(body)),
+            'Connection: {}'.format('keep-alive' if keep_alive else 'close'),
+        ]
+        if headers is not None:
+            for name, value in headers.items():
+                lines.append('{}: {}'.format(name, value))
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('iso-8859-1') + body
+
+    def _static_file(self, path):
+        """Returns the content type and contents of a static file."""
+        if path in self._static_files:
+            return self._static_files[path]
+        relative = path.split('/static/', 1)[1]
+        root = os.path.abspath(STATIC_DIR)
+        file_name = os.path.abspath(os.path.join(root, relative))
+        if not file_name.startswith(root + os.sep) \
+                or not os.path.isfile(file_name):
+            raise HttpError(404)
+        content_type, _ = mimetypes.guess_type(file_name)
+        if content_type is None:
+            content_type = 'application/octet-stream'
+        with open(file_name, 'rb') as file_:
+            self._static_files[path] = (content_type, file_.read())
+        return self._static_files[path]
+
+    async def _upgrade(self, request, reader, writer):
+        """Finishes the websocket handshake and hands the connection off."""
+        key = request.headers.get('sec-websocket-key')
+        if key is None:
+            writer.write(self._response(400, None, False))
+            return
+        writer.write((
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            'Sec-WebSocket-Accept: {}\r\n\r\n'.format(web_socket_accept(key))
+        ).encode('iso-8859-1'))
+        await writer.drain()
+        web_socket = AsyncWebSocket(reader, writer, self._loop)
+        await self._web_socket_routes[request.path](web_socket)
+
+    async def _monitor_web_socket(self, web_socket):
+        """Streams logs and telemetry to a monitor client."""
+        LogBroadcaster().add_client(web_socket)
+        TelemetryStream().add_client(web_socket)
+        try:
+            while True:
+                message = await web_socket.receive()
+                if message is None:
+                    return
+                self._logger.warning(
+                    'Received unexpected message from websocket client'
+                )
+        finally:
+            LogBroadcaster().remove_client(web_socket)
+            TelemetryStream().remove_client(web_socket)
+
+    async def _telemetry_web_socket(self, web_socket):
+        """Receives readings from a phone, as JSON or binary records."""
+        while True:
+            message = await web_socket.receive()
+            if message is None:
+                return
+            is_binary, payload = message
+            try:
+                if is_binary:
+                    ReadingIngester().ingest_binary(payload)
+                else:
+                    ReadingIngester().ingest_json(payload.decode('utf-8'))
+            except Exception as exc:  # pylint: disable=broad-except
+                self._logger.error(
+                    'Error processing web telemetry message: {} {}'.format(
+                        type(exc),
+                        exc
+                    )
+                )
+
+    def _index(self, _):
+        """Monitor index page. It's only rendered again if the list of
+        course files changes.
+        """
+        mtime = os.stat(templates.PATHS_DIR).st_mtime
+        if self._monitor_index is None or mtime != self._paths_mtime:
+            if self._monitor_template is None:
+                self._monitor_template = templates.read_template(
+                    templates.MONITOR_INDEX_FILE_NAME
+                )
+            self._monitor_index = templates.render_monitor_index(
+                self._monitor_template,
+                self._host_ip,
+                self.port
+            )
+            self._paths_mtime = mtime
+        return self._monitor_index
+
+    def _telemetry_index(self, _):
+        """Web telemetry index page."""
+        if self._web_telemetry_index is None:
+            self._web_telemetry_index = templates.render_web_telemetry_index(
+                templates.read_template(
+                    templates.WEB_TELEMETRY_INDEX_FILE_NAME
+                ),
+                self._host_ip,
+                self.port
+            )
+        return self._web_telemetry_index
+
+    def _telemetry_json(self, _):
+        """Returns the telemetry data of the car."""
+        telemetry = self._telemetry.get_snapshot()
+        waypoint_x_m, waypoint_y_m = self._waypoint_generator.get_raw_waypoint()
+        telemetry.update({
+            'waypoint_x_m': waypoint_x_m,
+            'waypoint_y_m': waypoint_y_m,
+        })
+        return telemetry
+
+    @staticmethod
+    def _latency_json(_):
+        """Returns the latency histograms."""
+        return LatencyRecorder().to_dict()
+
+    @staticmethod
+    def _reset_latency(_):
+        """Clears the latency histograms."""
+        LatencyRecorder().reset()
+        return {'success': True}
+
+    def _simple_command(self, method_name, description):
+        """Returns a handler that sends a command without parameters."""
+        def handler(_):
+            """Sends the command."""
+            getattr(self._command, method_name)()
+            self._logger.info(
+                'Received {} command from web'.format(description)
+            )
+            return {'success': True}
+        return handler
+
+    def _set_max_throttle(self, params):
+        """Hands off the maximum throttle to the command exchange."""
+        if 'throttle' not in params:
+            raise HttpError(400)
+        self._logger.info('Received throttle command from web')
+        self._command.set_max_throttle(params['throttle'])
+        return {'success': True}
+
+    async def _set_waypoints(self, params):
+        """Hands off the file to load waypoints to the waypoint exchange."""
+        if 'kml_file_name' not in params:
+            raise HttpError(400)
+        kml_file_name = params['kml_file_name']
+        self._logger.info(
+            'Received set waypoints: {} command from web'.format(
+                kml_file_name
+            )
+        )
+        WaypointProducer().load_kml_file(kml_file_name)
+        # Parsing the course is slow, so keep it off of the event loop
+        await self._loop.run_in_executor(
+            None,
+            self._telemetry.load_kml_from_file_name,
+            kml_file_name
+        )
+        return {'success': True}
+
+    def _shut_down(self, _):
+        """Shuts down the Pi."""
+        self._command.stop()
+        subprocess.Popen(('bash', '-c', 'sleep 10 && sudo shutdown -h now'))
+        os.kill(os.getpid(), signal.SIGINT)
+        return {'success': True}
+
+    @staticmethod
+    def _post_telemetry(params):
+        """Receives one reading, or an array of them, from a phone."""
+        if 'message' not in params:
+            raise HttpError(400)
+        return ReadingIngester().ingest_json(params['message'])
+
+    @staticmethod
+    def _ingestion_json(_):
+        """Returns how many readings from each device were accepted, invalid
+        or rate limited.
+        """
+        return ReadingIngester().counts()
@@ -0,0 +1,106 @@
+"""Broadcasts log messages to websocket clients without blocking the
+logger.
+
+Every client has its own bounded queue that discards the oldest messages
+when it's full, and its own thread that sends everything queued since the
+last frame as one batch:
+    {"type": "logs", "messages": [...], "dropped": 0}
+Clients that fall behind are told how many messages they missed instead of
+slowing down the logger.
+"""
+
+import json
+import threading
+import time
+
+from messaging import broker
+from messaging.singleton_mixin import SingletonMixin
+
+MAX_QUEUED_MESSAGES = 200
+# Wait this long after each frame so that messages are batched
+FRAME_INTERVAL_S = 0.1
+
+
+class LogClient(object):
+    """Sends batches of log messages to one websocket client."""
+
+    def __init__(self, web_socket, frame_interval_s=None):
+        """web_socket only needs a send method."""
+        if frame_interval_s is None:
+            frame_interval_s = FRAME_INTERVAL_S
+        self._web_socket = web_socket
+        self._frame_interval_s = frame_interval_s
+        self._reported_dropped_count = 0
+        self._subscription = broker.Subscription(
+            'log-client',
+            self.send,
+            max_size=MAX_QUEUED_MESSAGES
+        )
+
+    def put(self, message):
+        """Queues a message, discarding the oldest one if the queue is
+        full.
+        """
+        self._subscription.put(message)
+
+    def close(self):
+        """Stops sending to the client."""
+        self._subscription.close()
+
+    def send(self, message):
+        """Sends a message and everything else that's queued as one frame.
+        Returns the frame.
+        """
+        messages = [message]
+        while True:
+            message = self._subscription.get(block=False)
+            if message is None:
+                break
+            messages.append(message)
+
+        dropped_count = self._subscription.dropped_count
+        frame = json.dumps(
+            {
+                'type': 'logs',
+                'messages': messages,
+                'dropped': dropped_count - self._reported_dropped_count,
+            },
+            separators=(',', ':')
+        )
+        self._reported_dropped_count = dropped_count
+        self._web_socket.send(frame)
+        if self._frame_interval_s > 0.0:
+            time.sleep(self._frame_interval_s)
+        return frame
+
+
+class LogBroadcaster(SingletonMixin):
+    """Fans log messages out to every connected websocket client."""
+
+    def __init__(self):
+        super(LogBroadcaster, self).__init__()
+        # SingletonMixin calls __init__ every time the singleton is requested
+        if getattr(self, '_clients', None) is not None:
+            return
+        self._lock = threading.Lock()
+        self._clients = {}
+
+    def add_client(self, web_socket):
+        """Starts sending log messages to a websocket."""
+        client = LogClient(web_socket)
+        with self._lock:
+            self._clients[web_socket] = client
+
+    def remove_client(self, web_socket):
+        """Stops sending log messages to a websocket."""
+        with self._lock:
+            client = self._clients.pop(web_socket, None)
+        if client is not None:
+            client.close()
+
+    def publish(self, message):
+        """Queues a message for every client. Never blocks on the clients."""
+        with self._lock:
+            clients = list(self._clients.values())
+        for client in clients:
+            client.put(message)
@@ -0,0 +1,53 @@
+"""Network helpers for the web servers."""
+
+import netifaces
+
+
+def _interface_preference(interface):
+    """Ordering function that orders wireless adapters first, then
+    physical, then loopback.
+    """
+    if interface.startswith('wlan') or interface == 'en1':
+        return 0
+    if interface.startswith('eth') or interface == 'en0':
+        return 1
+    if interface.startswith('lo'):
+        return 2
+    return 3
+
+
+def get_host_ip(logger, server_name):
+    """Returns the IPv4 address that clients should connect to, preferring
+    wireless interfaces. server_name is used for logging.
+    """
+
+    def get_ip(interface):
+        """Returns the IPv4 address of a given interface."""
+        try:
+            addresses = netifaces.ifaddresses(interface)
+            if len(addresses) == 0:
+                return None
+            if netifaces.AF_INET not in addresses:
+                return None
+            return addresses[netifaces.AF_INET][0]['addr']
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warn(
+                'Exception trying to get interface address: {exc}'.format(
+                    exc=str(exc)
+                )
+            )
+            return None
+
+    interfaces = sorted(netifaces.interfaces(), key=_interface_preference)
+    for iface in interfaces:
+        host_ip = get_ip(iface)
+        if host_ip is not None:
+            logger.info(
+                '{server_name} listening on {iface}'.format(
+                    server_name=server_name,
+                    iface=iface
+                )
+            )
+            return host_ip
+    logger.error('No valid host found, listening on loopback')
+    return get_ip('lo')
@@ -1,20 +1,22 @@
 """Status page for the vehicle."""
 
 import cherrypy
-import netifaces
 import os
 import signal
 import subprocess
-import sys
 
+from monitor.network import get_host_ip
+from monitor.templates import MONITOR_INDEX_FILE_NAME
+from monitor.templates import read_template
+from monitor.templates import render_monitor_index
 from monitor.web_socket_handler import WebSocketHandler
 from messaging.async_logger import AsyncLogger
+from messaging.latency import LatencyRecorder
 from messaging.async_producers import CommandProducer
 from messaging.async_producers import WaypointProducer
 
 
 STATIC_DIR = 'static-web'
-MONITOR_DIR = 'monitor' + os.sep
 
 
 class StatusApp(object):
@@ -26,51 +28,7 @@ class StatusApp(object):
         self._logger = AsyncLogger()
         self._port = port
         self._waypoint_generator = waypoint_generator
-
-        def get_ip(interface):
-            """Returns the IPv4 address of a given interface."""
-            try:
-                addresses = netifaces.ifaddresses(interface)
-                if len(addresses) == 0:
-                    return None
-                if netifaces.AF_INET not in addresses:
-                    return None
-                return addresses[netifaces.AF_INET][0]['addr']
-            except Exception as exc:  # pylint: disable=broad-except
-                self._logger.warn(
-                    'Exception trying to get interface address: {exc}'.format(
-                        exc=str(exc)
-                    )
-                )
-                return None
-
-        self._host_ip = None
-
-        def interface_preference(interface):
-            """Ordering function that orders wireless adapters first, then
-            physical, then loopback.
-            """
-            if interface.startswith('wlan') or interface == 'en1':
-                return 0
-            if interface.startswith('eth') or interface == 'en0':
-                return 1
-            if interface.startswith('lo'):
-                return 2
-            return 3
-
-        interfaces = sorted(netifaces.interfaces(), key=interface_preference)
-        for iface in interfaces:
-            self._host_ip = get_ip(iface)
-            if self._host_ip is not None:
-                self._logger.info(
-                    'Monitor web server listening on {iface}'.format(
-                        iface=iface
-                    )
-                )
-                break
-        if self._host_ip is None:
-            self._logger.error('No valid host found, listening on loopback')
-            self._host_ip = get_ip('lo')
+        self._host_ip = get_host_ip(self._logger, 'Monitor web server')
 
     @staticmethod
     def get_config(monitor_root_dir):
@@ -91,38 +49,19 @@ class StatusApp(object):
         }
 
     @cherrypy.expose
-    def index(self):  # pylint: disable=no-self-use
+    def index(self):
         """Index page."""
-        # This is the worst templating ever, but I don't feel like it's worth
-        # installing a full engine just for this one substitution
-        index_page = None
-        index_file_name = MONITOR_DIR + 'index.html'
-        if sys.version_info.major == 2:
-            with open(index_file_name) as file_:
-                index_page = file_.read().decode('utf-8')
-        else:
-            with open(index_file_name, encoding='utf-8') as file_:
-                index_page = file_.read()
-        return index_page.replace(
-            '${webSocketAddress}',
-            '{host_ip}:{port}/ws'.format(
-                host_ip=self._host_ip,
-                port=self._port
-            )
-        ).replace(
-            '${waypointFileOptions}',
-            '\n'.join((
-                '<option value="{file}">{file}</option>'.format(file=i)
-                for i in os.listdir('paths')
-                if i.endswith('kml') or i.endswith('kmz')
-            ))
+        return render_monitor_index(
+            read_template(MONITOR_INDEX_FILE_NAME),
+            self._host_ip,
+            self._port
         )
 
     @cherrypy.expose
     @cherrypy.tools.json_out()
     def telemetry_json(self):
         """Returns the telemetry data of the car."""
-        telemetry = self._telemetry.get_data(update=False)
+        telemetry = self._telemetry.get_snapshot()
         waypoint_x_m, waypoint_y_m = self._waypoint_generator.get_raw_waypoint()
         telemetry.update({
             'waypoint_x_m': waypoint_x_m,
@@ -130,6 +69,22 @@ class StatusApp(object):
         })
         return telemetry
 
+    @cherrypy.expose
+    @cherrypy.tools.json_out()
+    def latency_json(self):  # pylint: disable=no-self-use
+        """Returns the latency histograms for each stage of the telemetry
+        pipeline.
+        """
+        return LatencyRecorder().to_dict()
+
+    @cherrypy.expose
+    @cherrypy.tools.json_out()
+    def reset_latency(self):
+        """Clears the latency histograms."""
+        self._check_post()
+        LatencyRecorder().reset()
+        return {'success': True}
+
     @cherrypy.expose
     @cherrypy.tools.json_out()
     def run(self):
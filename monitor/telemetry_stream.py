@@ -0,0 +1,193 @@
+"""Streams telemetry to websocket clients as delta frames.
+
+Each frame is a single JSON object with only the fields that changed since
+the last frame sent to that client:
+    {"type": "telemetry-delta", "full": false, "fields": {...}, "removed": []}
+The first frame to a client, and a periodic key frame, have every field and
+"full" set. Every client has a mailbox that only holds the newest
+telemetry, so a slow client skips intermediate frames instead of queueing
+them. Telemetry that arrives before a client is due for a frame is held and
+sent when the interval expires, so the newest telemetry is never skipped.
+Each client's rate adapts between the telemetry rate and
+MIN_RATE_HZ: it backs off when frames are dropped and speeds back up while
+the client keeps up.
+"""
+
+import json
+import threading
+import time
+
+from messaging import broker
+from messaging.singleton_mixin import SingletonMixin
+
+MIN_RATE_HZ = 2.0
+MAX_INTERVAL_S = 1.0 / MIN_RATE_HZ
+# How much the interval shrinks after every frame that the client kept up
+# with, and the smallest interval to double when it falls behind
+SPEED_UP_S = 0.02
+MIN_BACK_OFF_S = 0.05
+KEY_FRAME_INTERVAL_S = 10.0
+# The monitor shows 3 decimal places, so smaller changes aren't worth sending
+PRECISION = 3
+
+
+def _rounded(value):
+    """Rounds floats to the precision that the monitor shows."""
+    if isinstance(value, float):
+        return round(value, PRECISION)
+    return value
+
+
+def delta(previous, current):
+    """Returns the fields of current that differ from previous, and a list
+    of the keys in previous that are missing from current. Floats are
+    compared after rounding.
+    """
+    changed = {}
+    for key, value in current.items():
+        value = _rounded(value)
+        if key not in previous or previous[key] != value:
+            changed[key] = value
+    removed = [key for key in previous if key not in current]
+    return changed, removed
+
+
+def encode_frame(fields, removed, full):
+    """Returns a frame as compact JSON."""
+    return json.dumps(
+        {
+            'type': 'telemetry-delta',
+            'full': full,
+            'fields': fields,
+            'removed': removed,
+        },
+        separators=(',', ':')
+    )
+
+
+class TelemetryClient(object):
+    """Sends delta frames to one websocket client."""
+
+    def __init__(self, web_socket, clock=None):
+        """web_socket only needs a send method. clock is used for the
+        timing and defaults to time.time.
+        """
+        if clock is None:
+            clock = time.time
+        self._web_socket = web_socket
+        self._clock = clock
+        self._sent = {}
+        self._next_send_s = None
+        self._next_key_frame_s = None
+        self._dropped_count = 0
+        self._pending = None
+        self._closed = False
+        self.interval_s = MAX_INTERVAL_S
+        self._subscription = broker.Subscription('telemetry-client', max_size=1)
+        self._thread = threading.Thread(target=self._run)
+        self._thread.name = 'telemetry-client'
+        self._thread.start()
+
+    def put(self, telemetry):
+        """Queues telemetry to send, replacing any that hasn't been sent."""
+        self._subscription.put(telemetry)
+
+    def close(self):
+        """Stops sending to the client."""
+        self._closed = True
+        self._subscription.close()
+
+    def _run(self):
+        """Sends queued telemetry, and held telemetry once it's due."""
+        while not self._closed:
+            timeout_s = None
+            if self._pending is not None:
+                timeout_s = max(self._next_send_s - self._clock(), 0.0)
+            telemetry = self._subscription.get(timeout=timeout_s)
+            if telemetry is not None:
+                self.send(telemetry)
+            elif not self._closed:
+                self.flush()
+
+    def flush(self):
+        """Sends held telemetry if the client is due for a frame. Returns
+        the frame, or None if nothing was sent.
+        """
+        if self._pending is None:
+            return None
+        return self.send(self._pending)
+
+    def send(self, telemetry):
+        """Sends the changes since the last frame if the client is due for
+        one, and otherwise holds the telemetry until it is. Returns the
+        frame, or None if nothing was sent.
+        """
+        now = self._clock()
+        if self._next_send_s is not None and now < self._next_send_s:
+            self._pending = telemetry
+            return None
+        self._pending = None
+
+        # Telemetry was replaced in the mailbox before this client could
+        # take it, so the client is falling behind
+        dropped_count = self._subscription.dropped_count
+        if dropped_count > self._dropped_count:
+            self._dropped_count = dropped_count
+            self.interval_s = min(
+                max(self.interval_s, MIN_BACK_OFF_S) * 2.0,
+                MAX_INTERVAL_S
+            )
+        else:
+            self.interval_s = max(self.interval_s - SPEED_UP_S, 0.0)
+        self._next_send_s = now + self.interval_s
+
+        full = self._next_key_frame_s is None or now >= self._next_key_frame_s
+        if full:
+            self._next_key_frame_s = now + KEY_FRAME_INTERVAL_S
+            fields, removed = delta({}, telemetry)
+        else:
+            fields, removed = delta(self._sent, telemetry)
+            if not fields and not removed:
+                return None
+
+        frame = encode_frame(fields, removed, full)
+        self._web_socket.send(frame)
+        if full:
+            self._sent = fields
+        else:
+            self._sent.update(fields)
+            for key in removed:
+                del self._sent[key]
+        return frame
+
+
+class TelemetryStream(SingletonMixin):
+    """Fans telemetry out to every connected websocket client."""
+
+    def __init__(self):
+        super(TelemetryStream, self).__init__()
+        # SingletonMixin calls __init__ every time the singleton is requested
+        if getattr(self, '_clients', None) is not None:
+            return
+        self._lock = threading.Lock()
+        self._clients = {}
+
+    def add_client(self, web_socket):
+        """Starts streaming to a websocket."""
+        client = TelemetryClient(web_socket)
+        with self._lock:
+            self._clients[web_socket] = client
+
+    def remove_client(self, web_socket):
+        """Stops streaming to a websocket."""
+        with self._lock:
+            client = self._clients.pop(web_socket, None)
+        if client is not None:
+            client.close()
+
+    def publish(self, telemetry):
+        """Sends telemetry to every client that is ready for it."""
+        with self._lock:
+            clients = list(self._clients.values())
+        for client in clients:
+            client.put(telemetry)
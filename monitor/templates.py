@@ -0,0 +1,60 @@
+"""Renders the index pages of the monitor and web telemetry apps."""
+
+import io
+import os
+
+MONITOR_INDEX_FILE_NAME = os.sep.join(('monitor', 'index.html'))
+WEB_TELEMETRY_INDEX_FILE_NAME = os.sep.join(
+    ('control', 'web_telemetry', 'index.html')
+)
+PATHS_DIR = 'paths'
+
+
+def read_template(file_name):
+    """Returns the contents of a template file."""
+    with io.open(file_name, encoding='utf-8') as file_:
+        return file_.read()
+
+
+def kml_file_options():
+    """Returns the HTML options for the course files in the paths
+    directory.
+    """
+    return '\n'.join((
+        '<option value="{file}">{file}</option>'.format(file=i)
+        for i in os.listdir(PATHS_DIR)
+        if i.endswith('kml') or i.endswith('kmz')
+    ))
+
+
+def render_monitor_index(template, host_ip, port):
+    """Returns the monitor index page."""
+    # This is the worst templating ever, but I don't feel like it's worth
+    # installing a full engine just for this one substitution
+    return template.replace(
+        '${webSocketAddress}',
+        '{host_ip}:{port}/ws'.format(
+            host_ip=host_ip,
+            port=port
+        )
+    ).replace(
+        '${waypointFileOptions}',
+        kml_file_options()
+    )
+
+
+def render_web_telemetry_index(template, host_ip, port):
+    """Returns the web telemetry index page."""
+    return template.replace(
+        '${webSocketAddress}',
+        '{host_ip}:{port}/telemetry/ws'.format(
+            host_ip=host_ip,
+            port=port
+        )
+    ).replace(
+        '${postAddress}',
+        '//{host_ip}:{port}/telemetry/post_telemetry'.format(
+            host_ip=host_ip,
+            port=port
+        )
+    )
@@ -0,0 +1,311 @@
+"""Tests the asyncio web server."""
+
+import asyncio
+import base64
+import http.client
+import json
+import mock
+import os
+import socket
+import struct
+import threading
+import time
+import unittest
+
+# Patch out the logger
+from messaging import async_logger
+from control.test.dummy_logger import DummyLogger
+async_logger.AsyncLogger = DummyLogger
+
+from messaging import broker
+from messaging import config
+from monitor import async_server
+from monitor.async_server import AsyncServer
+from monitor.telemetry_stream import TelemetryStream
+
+# pylint: disable=protected-access
+
+
+class DummyTelemetry(object):
+    """Returns a fixed snapshot."""
+
+    def __init__(self):
+        self.kml_file_name = None
+
+    @staticmethod
+    def get_snapshot():
+        """Returns the snapshot."""
+        return {'x_m': 1.0, 'y_m': 2.0}
+
+    def load_kml_from_file_name(self, kml_file_name):
+        """Saves the file name."""
+        self.kml_file_name = kml_file_name
+
+
+class DummyWaypointGenerator(object):
+    """Always returns the same waypoint."""
+
+    @staticmethod
+    def get_raw_waypoint():
+        """Returns the waypoint."""
+        return 10.0, 20.0
+
+
+class StalledTransport(object):
+    """Records whether it was aborted."""
+
+    def __init__(self):
+        self.aborted = False
+
+    def abort(self):
+        """Records the abort."""
+        self.aborted = True
+
+
+class StalledWriter(object):
+    """A stream writer for a client that never reads."""
+
+    def __init__(self):
+        self.frames = []
+        self.drain_cancelled = False
+        self.transport = StalledTransport()
+
+    def write(self, frame):
+        """Saves the frame."""
+        self.frames.append(frame)
+
+    async def drain(self):
+        """Waits forever."""
+        try:
+            await asyncio.sleep(3600.0)
+        except asyncio.CancelledError:
+            self.drain_cancelled = True
+            raise
+
+
+def read_frame(socket_):
+    """Reads an unmasked frame from the server. Returns the opcode and
+    payload.
+    """
+    def read(count):
+        """Reads exactly count bytes."""
+        data = b''
+        while len(data) < count:
+            chunk = socket_.recv(count - len(data))
+            if not chunk:
+                raise EOFError()
+            data += chunk
+        return data
+    first, second = read(2)
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack('!H', read(2))
+    elif length == 127:
+        length, = struct.unpack('!Q', read(8))
+    return first & 0x0F, read(length)
+
+
+class TestAsyncServer(unittest.TestCase):
+    """Tests the asyncio web server."""
+
+    @classmethod
+    def setUpClass(cls):
+        # The server sends commands to this exchange
+        cls.commands = broker.subscribe(config.COMMAND_EXCHANGE)
+        # Give the receiver some time to set up
+        time.sleep(0.05)
+        cls.telemetry = DummyTelemetry()
+        cls.server = AsyncServer(
+            0,
+            '127.0.0.1',
+            cls.telemetry,
+            DummyWaypointGenerator()
+        )
+        cls.server.start()
+        assert cls.server.wait_for_start(5.0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.kill()
+        cls.server.join(5.0)
+
+    def _connect(self):
+        """Returns an HTTP connection to the server."""
+        return http.client.HTTPConnection('127.0.0.1', self.server.port, 5.0)
+
+    def _web_socket(self, path):
+        """Opens a websocket. Returns the socket."""
+        socket_ = socket.create_connection(
+            ('127.0.0.1', self.server.port),
+            5.0
+        )
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        socket_.sendall((
+            'GET {} HTTP/1.1\r\n'
+            'Host: localhost\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            'Sec-WebSocket-Key: {}\r\n'
+            'Sec-WebSocket-Version: 13\r\n\r\n'.format(path, key)
+        ).encode('ascii'))
+        response = b''
+        while not response.endswith(b'\r\n\r\n'):
+            response += socket_.recv(1)
+        self.assertTrue(response.startswith(b'HTTP/1.1 101'))
+        self.assertIn(
+            async_server.web_socket_accept(key).encode('ascii'),
+            response
+        )
+        return socket_
+
+    def test_routes(self):
+        """The server should serve the same routes as CherryPy."""
+        connection = self._connect()
+        try:
+            # Connections are kept alive between requests
+            connection.request('GET', '//telemetry-json')
+            response = connection.getresponse()
+            self.assertEqual(response.status, 200)
+            self.assertEqual(
+                json.loads(response.read().decode('utf-8')),
+                {
+                    'x_m': 1.0,
+                    'y_m': 2.0,
+                    'waypoint_x_m': 10.0,
+                    'waypoint_y_m': 20.0,
+                }
+            )
+
+            connection.request('GET', '/run')
+            response = connection.getresponse()
+            response.read()
+            self.assertEqual(response.status, 405)
+
+            connection.request(
+                'POST',
+                '/set-max-throttle',
+                'throttle=0.5',
+                {'Content-Type': 'application/x-www-form-urlencoded'}
+            )
+            response = connection.getresponse()
+            self.assertEqual(
+                json.loads(response.read().decode('utf-8')),
+                {'success': True}
+            )
+            self.assertEqual(
+                self.commands.get(timeout=1.0),
+                'set-max-throttle=0.5'
+            )
+
+            connection.request('GET', '/static/status.js')
+            response = connection.getresponse()
+            self.assertIn(b'sparkfun.status', response.read())
+            self.assertIn('javascript', response.getheader('Content-Type'))
+
+            connection.request('GET', '/static/../main.py')
+            response = connection.getresponse()
+            response.read()
+            self.assertEqual(response.status, 404)
+
+            connection.request('GET', '/')
+            response = connection.getresponse()
+            page = response.read().decode('utf-8')
+            self.assertIn(':{}/ws'.format(self.server.port), page)
+            self.assertIn('sparkfun-avc-2016.kml', page)
+
+            connection.request('GET', '/telemetry/')
+            response = connection.getresponse()
+            page = response.read().decode('utf-8')
+            self.assertIn(':{}/telemetry/ws'.format(self.server.port), page)
+        finally:
+            connection.close()
+
+    def test_monitor_web_socket(self):
+        """Monitor clients should get telemetry and pongs."""
+        socket_ = self._web_socket('/ws')
+        try:
+            socket_.sendall(
+                async_server.encode_frame(async_server.OP_PING, b'hi', b'abcd')
+            )
+            self.assertEqual(
+                read_frame(socket_),
+                (async_server.OP_PONG, b'hi')
+            )
+
+            TelemetryStream().publish({'x_m': 3.0})
+            opcode, payload = read_frame(socket_)
+            self.assertEqual(opcode, async_server.OP_TEXT)
+            frame = json.loads(payload.decode('utf-8'))
+            self.assertEqual(frame['type'], 'telemetry-delta')
+            self.assertEqual(frame['fields'], {'x_m': 3.0})
+
+            socket_.sendall(
+                async_server.encode_frame(async_server.OP_CLOSE, b'', b'abcd')
+            )
+            self.assertEqual(read_frame(socket_)[0], async_server.OP_CLOSE)
+        finally:
+            socket_.close()
+
+    def test_send_timeout(self):
+        """Clients that stop reading should be dropped instead of buffering
+        frames for them.
+        """
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        writer = StalledWriter()
+        web_socket = async_server.AsyncWebSocket(None, writer, loop)
+        try:
+            with mock.patch.object(async_server, 'SEND_TIMEOUT_S', 0.1):
+                self.assertFalse(web_socket.send('first'))
+            self.assertFalse(web_socket.send('second'))
+            time.sleep(0.05)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(5.0)
+            loop.close()
+        self.assertEqual(len(writer.frames), 1)
+        self.assertTrue(writer.drain_cancelled)
+        self.assertTrue(writer.transport.aborted)
+
+    @mock.patch('control.web_telemetry.readings.TelemetryProducer')
+    def test_telemetry_web_socket(self, producer):
+        """Readings from phones should be forwarded to telemetry."""
+        socket_ = self._web_socket('/telemetry/ws')
+        try:
+            # Send the reading in two fragments
+            reading = json.dumps({
+                'compass_d': 123.0,
+                'confidence': 1.0,
+                'device_id': 'phone',
+            }).encode('utf-8')
+            first = bytearray(
+                async_server.encode_frame(
+                    async_server.OP_TEXT,
+                    reading[:10],
+                    b'abcd'
+                )
+            )
+            first[0] &= 0x7F
+            socket_.sendall(bytes(first))
+            socket_.sendall(
+                async_server.encode_frame(
+                    async_server.OP_CONTINUATION,
+                    reading[10:],
+                    b'efgh'
+                )
+            )
+            # The server has no reply, so close and wait for it to finish
+            socket_.sendall(
+                async_server.encode_frame(async_server.OP_CLOSE, b'', b'abcd')
+            )
+            self.assertEqual(read_frame(socket_)[0], async_server.OP_CLOSE)
+        finally:
+            socket_.close()
+        producer().publish_readings.assert_called_once_with(
+            [json.loads(reading.decode('utf-8'))]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Tests the log broadcaster."""
+
+import json
+import threading
+import unittest
+
+from monitor import log_broadcaster
+from monitor.log_broadcaster import LogClient
+
+
+class SlowSocket(object):
+    """Blocks on every send until it's released."""
+
+    def __init__(self):
+        self.frames = []
+        self.sending = threading.Event()
+        self.release = threading.Event()
+
+    def send(self, frame):
+        """Saves the decoded frame after waiting for the release."""
+        self.sending.set()
+        self.release.wait(5.0)
+        self.frames.append(json.loads(frame))
+
+
+class TestLogBroadcaster(unittest.TestCase):
+    """Tests the log broadcaster."""
+
+    def test_slow_client(self):
+        """Slow clients should get batches and a count of dropped messages
+        without blocking the publisher.
+        """
+        socket = SlowSocket()
+        client = LogClient(socket, 0.0)
+        try:
+            client.put('first')
+            self.assertTrue(socket.sending.wait(1.0))
+
+            # The client is stuck sending, so these shouldn't block
+            count = log_broadcaster.MAX_QUEUED_MESSAGES + 5
+            for index in range(count):
+                client.put(str(index))
+            socket.release.set()
+            client.close()
+            client._subscription._thread.join(1.0)  # pylint: disable=protected-access
+        finally:
+            socket.release.set()
+            client.close()
+
+        self.assertEqual(len(socket.frames), 2)
+        self.assertEqual(socket.frames[0]['messages'], ['first'])
+        self.assertEqual(socket.frames[0]['dropped'], 0)
+        batch = socket.frames[1]
+        self.assertEqual(batch['type'], 'logs')
+        self.assertEqual(batch['dropped'], 5)
+        self.assertEqual(
+            batch['messages'],
+            [str(index) for index in range(5, count)]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
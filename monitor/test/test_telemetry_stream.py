@@ -0,0 +1,134 @@
+"""Tests the telemetry stream."""
+
+# pylint: disable=protected-access
+
+import json
+import time
+import unittest
+
+from monitor import telemetry_stream
+from monitor.telemetry_stream import TelemetryClient
+from monitor.telemetry_stream import delta
+
+
+class RecordingSocket(object):
+    """Records the frames sent to it."""
+
+    def __init__(self):
+        self.frames = []
+
+    def send(self, frame):
+        """Saves the decoded frame."""
+        self.frames.append(json.loads(frame))
+
+
+class TestTelemetryStream(unittest.TestCase):
+    """Tests the telemetry stream."""
+
+    def test_delta(self):
+        """Only changed fields should be in the delta."""
+        self.assertEqual(
+            delta({'x_m': 1.0, 'y_m': 2.0}, {'x_m': 1.0001, 'y_m': 3.0}),
+            ({'y_m': 3.0}, [])
+        )
+        self.assertEqual(
+            delta({'x_m': 1.0, 'gps': 'ok'}, {'x_m': 1.5}),
+            ({'x_m': 1.5}, ['gps'])
+        )
+
+    def test_client(self):
+        """Clients should get a full frame, then only changes."""
+        now = [0.0]
+        socket = RecordingSocket()
+        client = TelemetryClient(socket, lambda: now[0])
+        client.close()
+
+        client.send({'x_m': 1.0, 'y_m': 2.0})
+        self.assertEqual(
+            socket.frames,
+            [{
+                'type': 'telemetry-delta',
+                'full': True,
+                'fields': {'x_m': 1.0, 'y_m': 2.0},
+                'removed': [],
+            }]
+        )
+
+        # Not due yet
+        self.assertIs(client.send({'x_m': 5.0, 'y_m': 2.0}), None)
+
+        # Nothing changed
+        now[0] += client.interval_s
+        self.assertIs(client.send({'x_m': 1.0, 'y_m': 2.0}), None)
+
+        now[0] += client.interval_s
+        client.send({'x_m': 3.0, 'y_m': 2.0})
+        self.assertEqual(socket.frames[-1]['fields'], {'x_m': 3.0})
+        self.assertFalse(socket.frames[-1]['full'])
+
+        now[0] += telemetry_stream.KEY_FRAME_INTERVAL_S
+        client.send({'x_m': 3.0, 'y_m': 2.0})
+        self.assertTrue(socket.frames[-1]['full'])
+        self.assertEqual(len(socket.frames), 3)
+
+    def test_hold(self):
+        """Telemetry that arrives early should be sent once it's due."""
+        now = [0.0]
+        socket = RecordingSocket()
+        client = TelemetryClient(socket, lambda: now[0])
+        client.close()
+
+        client.send({'x_m': 1.0})
+        self.assertIs(client.send({'x_m': 2.0}), None)
+        self.assertIs(client.send({'x_m': 3.0}), None)
+        self.assertIs(client.flush(), None)
+        now[0] += client.interval_s
+        client.flush()
+        self.assertEqual(socket.frames[-1]['fields'], {'x_m': 3.0})
+        # Nothing is held any more
+        now[0] += client.interval_s
+        self.assertIs(client.flush(), None)
+        self.assertEqual(len(socket.frames), 2)
+
+    def test_hold_thread(self):
+        """The sender thread should send the last telemetry even if nothing
+        else arrives.
+        """
+        socket = RecordingSocket()
+        client = TelemetryClient(socket)
+        try:
+            client.put({'x_m': 1.0})
+            time.sleep(0.05)
+            client.put({'x_m': 2.0})
+            time.sleep(telemetry_stream.MAX_INTERVAL_S + 0.1)
+            self.assertEqual(socket.frames[-1]['fields'], {'x_m': 2.0})
+        finally:
+            client.close()
+
+    def test_rate(self):
+        """Clients should speed up while they keep up and back off when
+        they fall behind.
+        """
+        now = [0.0]
+        client = TelemetryClient(RecordingSocket(), lambda: now[0])
+        client.close()
+        for step in range(100):
+            now[0] += 0.5
+            client.send({'step': step})
+        self.assertEqual(client.interval_s, 0.0)
+
+        client._subscription.dropped_count += 1
+        client.send({'step': -1})
+        self.assertEqual(
+            client.interval_s,
+            telemetry_stream.MIN_BACK_OFF_S * 2.0
+        )
+        for _ in range(10):
+            client._subscription.dropped_count += 1
+            now[0] += 1.0
+            client.send({'step': -1})
+        self.assertEqual(client.interval_s, telemetry_stream.MAX_INTERVAL_S)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,10 +2,18 @@
 
 from ws4py.websocket import WebSocket
 
+from monitor.log_broadcaster import LogBroadcaster
+from monitor.telemetry_stream import TelemetryStream
+
 
 class WebSocketHandler(WebSocket):  # pylint: disable=no-init
     """Websocket handler for sending messages to clients."""
 
+    def opened(self):
+        """Handler for when a websocket is opened."""
+        LogBroadcaster().add_client(self)
+        TelemetryStream().add_client(self)
+
     def received_message(self, message): # pylint: disable=no-self-use
         """Handler for receiving a message on the websocket."""
         # TODO(2015-01-04) Use a logger instead of a raw print
@@ -18,4 +26,5 @@ class WebSocketHandler(WebSocket):  # pylint: disable=no-init
 
     def closed(self, code, reason=None):
         """Handler for when a websocket is closed."""
-        # There's nothing to do here for now
+        LogBroadcaster().remove_client(self)
+        TelemetryStream().remove_client(self)
@@ -1,31 +1,20 @@
 """Logging handler for websocket clients."""
 
-import cherrypy
-import json
 import logging
 
+from monitor.log_broadcaster import LogBroadcaster
+
 
 class WebSocketLoggingHandler(logging.Handler):
     """Logging handler for websocket clients."""
 
     def __init__(self):
         super(WebSocketLoggingHandler, self).__init__()
+        self._broadcaster = LogBroadcaster()
 
     def emit(self, record):
-        """Overridden from Handler; actually emit the log entry."""
-        message = self.format(record)
-        cherrypy.engine.publish(
-            'websocket-broadcast',
-            json.dumps({'type': 'log', 'message': message})
-        )
-
-    @staticmethod
-    def broadcast_telemetry(telemetry_data):
-        """Broadcasts telemetry data to all connected clients."""
-        cherrypy.engine.publish(
-            'websocket-broadcast',
-            json.dumps({
-                'type': 'telemetry',
-                'message': json.dumps(telemetry_data)
-            })
-        )
+        """Overridden from Handler; actually emit the log entry. The
+        broadcaster sends it from each client's own thread, so slow clients
+        don't block logging.
+        """
+        self._broadcaster.publish(self.format(record))
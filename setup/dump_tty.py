@@ -3,8 +3,8 @@
 import argparse
 import serial
 
-from control.sup800f import get_message
 from control.sup800f import parse_binary
+from control.sup800f import read_frames
 from control.sup800f import switch_to_binary_mode
 from control.sup800f import switch_to_nmea_mode
 
@@ -69,13 +69,13 @@ def main():
             'temperature: {}',
         ))
 
+        frames = read_frames(ser)
         # The first message back should be an ack, ignore it
-        get_message(ser)
+        next(frames)
         # The next message back is navigation data message, ignore it
-        get_message(ser)
+        next(frames)
 
-        while True:
-            data = get_message(ser)
+        for data in frames:
             if len(data) != 42:
                 continue
             print(data)
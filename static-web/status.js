@@ -57,6 +57,7 @@ sparkfun.status.Status = function(
     this.heading = null;
 
     this.webSocket = null;
+    this.telemetry = {};
     webSocketAddress = (window.location.protocol === 'http:' ? 'ws://' : 'wss://') + webSocketAddress;
     if (!navigator.userAgent.match('Mac OS X') && window.WebSocket) {
         this.webSocket = new WebSocket(webSocketAddress);
@@ -83,11 +84,15 @@ sparkfun.status.Status = function(
     if (this.webSocket) {
         this.webSocket.onmessage = function(evt) {
             var data = JSON.parse(evt.data);
-            if (data.type === 'log') {
-                this.logs.text(
-                    data.message + '\n' + this.logs.text());
-            } else if (data.type === 'telemetry') {
-                this.handleTelemetryMessage(JSON.parse(data.message));
+            if (data.type === 'logs') {
+                // The newest messages go on top
+                var lines = data.messages.slice().reverse();
+                if (data.dropped > 0) {
+                    lines.push('... dropped ' + data.dropped + ' records');
+                }
+                this.logs.text(lines.join('\n') + '\n' + this.logs.text());
+            } else if (data.type === 'telemetry-delta') {
+                this.handleTelemetryDelta(data);
             } else {
                 sparkfun.status.addAlert('Unknown message type: ' + data.type);
             }
@@ -137,6 +142,66 @@ sparkfun.status.Status.prototype.bindButtons = function(buttons, throttle, waypo
 };
 
 
+/**
+ * Periodically fills a table with the latency of each telemetry pipeline
+ * stage.
+ * @param {Object} table
+ */
+sparkfun.status.Status.prototype.watchLatency = function(table) {
+    'use strict';
+    var stages = [
+        'producer', 'consumer', 'filter', 'drive', 'jitter', 'actuation'
+    ];
+    var toMs = function (seconds) {
+        return seconds === null ? '' : (seconds * 1000).toFixed(1);
+    };
+    var url = document.location + '/latency-json';
+    window.setInterval(function () {
+        $.getJSON(url, function(data) {
+            table.find('tr.stage').remove();
+            stages.forEach(function (stage) {
+                var histogram = data[stage];
+                var row = $('<tr class="stage">');
+                [
+                    stage,
+                    histogram.count,
+                    toMs(histogram.p50_s),
+                    toMs(histogram.p90_s),
+                    toMs(histogram.p99_s),
+                    toMs(histogram.max_s)
+                ].forEach(function (value) {
+                    row.append($('<td>').text(value));
+                });
+                table.append(row);
+            });
+        });
+    }, 2000);
+};
+
+
+/**
+ * Applies a telemetry delta frame from the websocket. Frames only have the
+ * fields that changed since the last frame, unless they are full frames.
+ * @param {Object} frame
+ */
+sparkfun.status.Status.prototype.handleTelemetryDelta = function(frame) {
+    'use strict';
+    if (frame.full) {
+        this.telemetry = {};
+    }
+    for (var key in frame.fields) {
+        if (frame.fields.hasOwnProperty(key)) {
+            this.telemetry[key] = frame.fields[key];
+        }
+    }
+    frame.removed.forEach(function (key) {
+        delete this.telemetry[key];
+    }.bind(this));
+    // handleTelemetryMessage modifies the telemetry, so give it a copy
+    this.handleTelemetryMessage($.extend({}, this.telemetry));
+};
+
+
 sparkfun.status.Status.prototype.handleTelemetryMessage = function(telemetry) {
     'use strict';
     // Do some processing here to offload the burden from Python
@@ -2,6 +2,12 @@
 var sparkfun = sparkfun || {};
 sparkfun.telemetry = sparkfun.telemetry || {};
 
+/**
+ * The most readings to queue while the websocket is connecting.
+ * @const {number}
+ */
+sparkfun.telemetry.MAX_PENDING_READINGS = 100;
+
 /**
  * @param {
  *  latitude:Object,
@@ -45,6 +51,7 @@ sparkfun.telemetry.Telemetry = function(
     }
     this.deviceId += '-' + String(Math.round(Math.random() * 10000));
     this.postEndPoint = postAddress;
+    this.pending = [];
     this.webSocket = null;
     webSocketAddress = (window.location.protocol === 'http:' ? 'ws://' : 'wss://') + webSocketAddress;
     this.webSocket = sparkfun.telemetry.openWebSocket(webSocketAddress);
@@ -135,11 +142,12 @@ sparkfun.telemetry.Telemetry.prototype.watch = function(position) {
     'use strict';
     // Support for old phones that don't follow the spec. They should have
     // position.timestamp as instance of DOMTimeStamp.
+    // position.timestamp is in milliseconds, but the server expects seconds
     var timestamp;
     if (typeof(position.timestamp) === 'object') {
-        timestamp = new Date(String(position.timestamp)).getTime();
+        timestamp = new Date(String(position.timestamp)).getTime() / 1000;
     } else {
-        timestamp = String(position.timestamp);
+        timestamp = Number(position.timestamp) / 1000;
     }
 
     // iPhone 1 doesn't have JSON object. Supporting 8 year old phones!
@@ -169,14 +177,7 @@ sparkfun.telemetry.Telemetry.prototype.watch = function(position) {
             device_id: this.deviceId});
     }
 
-    if (this.webSocket) {
-        this.webSocket.send(data);
-    } else {
-        sparkfun.telemetry.poke(
-            this.postEndPoint,
-            {'message': data}
-        );
-    }
+    this.sendReading(data);
     this.latitude.text(position.coords.latitude);
     this.longitude.text(position.coords.longitude);
     this.speed.text(position.coords.speed);
@@ -187,6 +188,42 @@ sparkfun.telemetry.Telemetry.prototype.watch = function(position) {
 };
 
 
+/**
+ * Sends a reading to the server. Readings are queued while the websocket is
+ * connecting, and the backlog is sent as one JSON array once it's open. If
+ * the websocket closes, readings are POSTed instead.
+ * @param {string} data JSON encoded reading
+ */
+sparkfun.telemetry.Telemetry.prototype.sendReading = function(data) {
+    'use strict';
+    this.pending.push(data);
+    if (this.pending.length > sparkfun.telemetry.MAX_PENDING_READINGS) {
+        this.pending.shift();
+    }
+    // Wait for the websocket to connect
+    if (this.webSocket && this.webSocket.readyState === 0) {
+        return;
+    }
+
+    var message;
+    if (this.pending.length === 1) {
+        message = this.pending[0];
+    } else {
+        message = '[' + this.pending.join(',') + ']';
+    }
+    this.pending = [];
+    if (this.webSocket && this.webSocket.readyState === 1) {
+        this.webSocket.send(message);
+    } else {
+        // Fall back to POST if the websocket closed
+        sparkfun.telemetry.poke(
+            this.postEndPoint,
+            {'message': message}
+        );
+    }
+};
+
+
 /**
  * Sends a POST request to the url.
  * @param {string} url